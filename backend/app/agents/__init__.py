@@ -28,3 +28,5 @@ class ChatState(TypedDict):
     chat_history: Annotated[Sequence[BaseMessage], add_messages]
     context: str
     answer: ChatMessage
+    # The rolling summary of the messages folded out of chat_history
+    summary: str
@@ -1,22 +1,47 @@
-from typing import Any, Callable, Union
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from operator import itemgetter
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional, Union
 
-from langchain.chains import create_history_aware_retriever, create_retrieval_chain
+from langchain.chains import create_retrieval_chain
 from langchain.chains.combine_documents import create_stuff_documents_chain
+from langchain_core.callbacks.manager import adispatch_custom_event
+from langchain_core.documents import Document
 from langchain_core.language_models import LanguageModelLike
+from langchain_core.messages import AIMessage
+from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import (
     ChatPromptTemplate,
     MessagesPlaceholder,
     PromptTemplate,
 )
+from langchain_core.runnables import RunnableLambda
 from langchain_core.runnables.config import RunnableConfig
 from langchain_redis import RedisVectorStore
+from langgraph.checkpoint.base import BaseCheckpointSaver
 from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
 from langgraph.graph import START, StateGraph
-from redisvl.query.filter import Tag
+from langgraph.graph.state import CompiledStateGraph
 
-from app.config import get_psql_url
+from app.config import (
+    get_context_packing_config,
+    get_contextualization_config,
+    get_history_config,
+    get_psql_url,
+    get_retrieval_config,
+)
+from app.context_packing import ContextPacker
+from app.contextualization import ContextualizationPolicy, is_same_question
+from app.history import HistoryManager
+from app.response_cache import ResponseCache
+from app.retrieval import HybridRetriever, create_hybrid_retriever
+from app.structured_output import ATTEMPT_METADATA_KEY, ATTEMPT_PARSED_EVENT
+
+from . import ChatMessage, ChatState
 
-from . import ChatState
+logger = logging.getLogger(__name__)
 
 ### Contextualize question ###
 contextualize_q_system_prompt = """
@@ -35,67 +60,369 @@ contextualize_chat_prompt = ChatPromptTemplate.from_messages(
 )
 
 
+# Tags of the LLM calls generating the answer, as opposed to contextualizing the question
+INTRO_ANSWER_TAG = "intro_answer"
+ANSWER_TAG = "answer"
+# The custom event dispatched with {"answer": ...} when an answer is found in the response cache
+CACHED_ANSWER_EVENT = "cached_answer"
+
+
+def get_hostname(config: RunnableConfig) -> str:
+    """Get the hostname the graph is invoked for from the config."""
+    return config["configurable"]["hostname"]
+
+
 class BaseSalesAgent:
     """The base class to create SalesAgents.
 
+    The chains and graph are built once and shared by every conversation. The hostname used to
+    filter the vector store is passed in the config of each invocation.
+
     Init args:
         llm: The LLM to use.
         vector_store: The RedisVectorStore to use.
         intro_prompt: The prompt to use for the AI introductory message.
         qa_prompt: The prompt to use for subsequent responses to human inputs.
+        call_model: The async graph node generating the response. It must use the async methods
+            of the chains so the event loop is not blocked by retrieval and generation.
+        checkpointer: Optional checkpointer to compile the graph with. Defaults to opening a
+            Postgres checkpointer per invocation.
+        intro_llm: Optional LLM generating the intro, like llm in JSON mode. Defaults to llm.
+        response_cache: Optional cache of the answers of standalone questions.
+        contextualization: Optional policy deciding which inputs are rewritten into standalone
+            questions. Defaults to the CONTEXTUALIZE_ environment variables.
+        history: Optional manager bounding the chat history in the prompts. Defaults to the
+            HISTORY_ environment variables. Older messages are folded into the summary in the
+            background once an answer is returned, so answers do not wait for the summary.
+        context_packer: Optional packer of the retrieved documents into a token budget. Defaults
+            to the CONTEXT_ environment variables.
+        hybrid_retriever: Optional retriever of the documents of a hostname. Defaults to the
+            RETRIEVAL_ environment variables.
     """
+
     def __init__(
         self,
         llm: LanguageModelLike,
         vector_store: RedisVectorStore,
         intro_prompt: PromptTemplate,
         qa_prompt: ChatPromptTemplate,
+        call_model: Callable[[ChatState, RunnableConfig], Awaitable[dict[str, Any]]],
+        checkpointer: Optional[BaseCheckpointSaver] = None,
+        intro_llm: Optional[LanguageModelLike] = None,
+        response_cache: Optional[ResponseCache] = None,
+        contextualization: Optional[ContextualizationPolicy] = None,
+        history: Optional[HistoryManager] = None,
+        context_packer: Optional[ContextPacker] = None,
+        hybrid_retriever: Optional[HybridRetriever] = None,
     ) -> None:
         self.llm = llm
         self.vector_store = vector_store
         self.intro_prompt = intro_prompt
         self.qa_prompt = qa_prompt
+        self.checkpointer = checkpointer
+        self.response_cache = response_cache
+        if contextualization is None:
+            contextualization_config = get_contextualization_config()
+            contextualization = ContextualizationPolicy(
+                contextualization_config.policy, contextualization_config.min_words
+            )
+        self.contextualization = contextualization
+        if history is None:
+            history_config = get_history_config()
+            history = HistoryManager(llm, history_config.max_tokens, history_config.summarize)
+        self.history = history
+        if context_packer is None:
+            context_packing_config = get_context_packing_config()
+            context_packer = ContextPacker(
+                context_packing_config.max_tokens, context_packing_config.duplicate_threshold
+            )
+        self.context_packer = context_packer
+        self.hybrid_retriever = hybrid_retriever or create_hybrid_retriever(
+            vector_store, get_retrieval_config()
+        )
+        self.call_model = call_model
+        # The latest compaction of the chat history of each conversation
+        self._compactions: dict[str, asyncio.Task] = {}
+
+        # Retriever of the documents of the hostname in the config, packing the documents
+        def retrieve(query: str, config: RunnableConfig) -> list[Document]:
+            documents = self.hybrid_retriever.retrieve(query, get_hostname(config))
+            return self.context_packer.pack(query, documents)
+
+        async def aretrieve(query: str, config: RunnableConfig) -> list[Document]:
+            documents = await self.hybrid_retriever.aretrieve(query, get_hostname(config))
+            return self.context_packer.pack(query, documents)
+
+        retriever = RunnableLambda(retrieve, afunc=aretrieve, name="retriever")
+        self.retriever = retriever
+
+        # Intro RAG Chain
+        intro_llm = (intro_llm or self.llm).with_config(tags=[INTRO_ANSWER_TAG])
+        intro_chain = create_stuff_documents_chain(intro_llm, self.intro_prompt)
+        self.intro_rag_chain = create_retrieval_chain(itemgetter("input") | retriever, intro_chain)
+
+        # Rewrites the input into a standalone question using the chat history
+        self.contextualize_chain = (
+            contextualize_chat_prompt | self.llm | StrOutputParser()
+        ).with_config(run_name="contextualize_question")
+        answer_llm = self.llm.with_config(tags=[ANSWER_TAG])
+        self.question_answer_chain = create_stuff_documents_chain(answer_llm, self.qa_prompt)
+
+        # QA RAG Chain, returning the answer and context like create_retrieval_chain
+        self.rag_chain = RunnableLambda(self._arag, name="rag_chain")
+
+        workflow = StateGraph(state_schema=ChatState)
+        workflow.add_edge(START, "model")
+        workflow.add_node("model", call_model)
+        self.graph = workflow.compile(checkpointer=checkpointer)
+
+    async def _arag(self, state: ChatState, config: RunnableConfig) -> dict[str, Any]:
+        """Answer the input of the conversation from the context retrieved for it.
+
+        Only the summary and the newest messages of the chat history are put into the prompts.
+        Questions that are standalone as asked are looked up in the response cache first.
+        """
+        chat_history = self.history.prompt_messages(state["chat_history"], state.get("summary", ""))
+        state = {**state, "chat_history": chat_history}
+        question = state["input"]
+        speculative_context = None
+        if self.contextualization.should_rewrite(question, state["chat_history"]):
+            if self.contextualization.speculative:
+                # Retrieve with the input in case the rewrite does not change it
+                speculative_context = asyncio.ensure_future(
+                    self.retriever.ainvoke(question, config)
+                )
+            start = time.perf_counter()
+            question = await self.contextualize_chain.ainvoke(state, config)
+            self.contextualization.record_rewrite(
+                state["input"], question, time.perf_counter() - start
+            )
+
+        try:
+            return await self._aanswer(state, question, speculative_context, config)
+        finally:
+            if speculative_context is not None:
+                speculative_context.cancel()
+
+    async def _aanswer(
+        self,
+        state: ChatState,
+        question: str,
+        speculative_context: Optional[asyncio.Future],
+        config: RunnableConfig,
+    ) -> dict[str, Any]:
+        hostname = get_hostname(config)
+        is_standalone = is_same_question(question, state["input"])
+        # Questions rewritten using the conversation depend on it, so are not shared
+        cacheable = self.response_cache is not None and is_standalone
+        if self.response_cache is not None and not cacheable:
+            self.response_cache.skip()
+        if cacheable:
+            answer = await self.response_cache.aget(hostname, question)
+            if answer is not None:
+                try:
+                    await adispatch_custom_event(
+                        CACHED_ANSWER_EVENT, {"answer": answer}, config=config
+                    )
+                except RuntimeError:
+                    # Not called from within a run, so nobody is listening
+                    pass
+                return {"answer": answer, "context": []}
+
+        start = time.perf_counter()
+        if speculative_context is not None:
+            self.contextualization.record_speculation(is_standalone)
+        if speculative_context is not None and is_standalone:
+            context = await speculative_context
+        else:
+            context = await self.retriever.ainvoke(question, config)
+        answer = await self.question_answer_chain.ainvoke({**state, "context": context}, config)
+        if cacheable:
+            generation_seconds = time.perf_counter() - start
+            await self.response_cache.aset(hostname, question, answer, generation_seconds)
+        return {"answer": answer, "context": context}
+
+    @staticmethod
+    def _with_hostname(hostname: str, config: RunnableConfig) -> RunnableConfig:
+        return {
+            **config,
+            "configurable": {**config.get("configurable", {}), "hostname": hostname},
+        }
+
+    @asynccontextmanager
+    async def _checkpointed_graph(self) -> AsyncIterator[CompiledStateGraph]:
+        """The compiled graph, with a Postgres checkpointer if none was given."""
+        if self.checkpointer is not None:
+            yield self.graph
+            return
+
+        async with AsyncPostgresSaver.from_conn_string(get_psql_url()) as checkpointer:
+            # Copying the compiled graph with another checkpointer does not rebuild it
+            yield self.graph.copy(update={"checkpointer": checkpointer})
+
+    def _displayed_content(self, text: str, is_intro: bool) -> str:
+        """The part of the answer generated so far that is shown to the user."""
+        return text
 
     async def _ainvoke(
         self,
         hostname: str,
         config: RunnableConfig,
-        call_model: Callable[[ChatState], dict[str, Any]],
         input: str,
     ) -> Union[dict[str, Any], Any]:  # noqa: ANN401
-        """Asynchronously create and invoke the graph.
-        
+        """Asynchronously invoke the graph.
+
         Args:
             hostname: The hostname of the url. Used to filter the vector store.
             config: The configuration for the graph.
-            call_model: The function to call.
             input: The user's input.
         """
-        # Retriever
-        filter = Tag("hostname") == hostname
-        retriever = self.vector_store.as_retriever(search_kwargs={"filter": filter})
+        config = self._with_hostname(hostname, config)
+        await self._await_compaction(config)
+        async with self._checkpointed_graph() as graph:
+            result = await graph.ainvoke({"input": input}, config=config)
+        self._compact_in_background(config)
+        return result
 
-        # Intro RAG Chain
-        intro_chain = create_stuff_documents_chain(self.llm, self.intro_prompt)
-        intro_rag_chain = create_retrieval_chain(retriever, intro_chain)
+    async def _astart_with_intro(
+        self,
+        hostname: str,
+        config: RunnableConfig,
+        intro: AIMessage,
+        answer: Union[ChatMessage, str],
+    ) -> dict[str, Any]:
+        """Start a conversation with an intro that was already generated, like a cached one.
 
-        history_aware_retriever = create_history_aware_retriever(
-            self.llm, retriever, contextualize_chat_prompt
-        )
-        question_answer_chain = create_stuff_documents_chain(self.llm, self.qa_prompt)
+        Args:
+            hostname: The hostname of the url.
+            config: The configuration for the graph.
+            intro: The intro message stored in the chat history.
+            answer: The answer returned for the intro.
+        """
+        values = {"input": "", "chat_history": [intro], "context": [], "answer": answer}
+        async with self._checkpointed_graph() as graph:
+            # Stored as the output of the model node, like a generated intro
+            await graph.aupdate_state(
+                self._with_hostname(hostname, config), values, as_node="model"
+            )
+        return values
 
-        # QA RAG Chain
-        rag_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
+    async def _astream(
+        self,
+        hostname: str,
+        config: RunnableConfig,
+        input: str,
+    ) -> AsyncIterator[tuple[str, Any]]:
+        """Asynchronously invoke the graph and stream the answer as the LLM generates it.
 
-        workflow = StateGraph(state_schema=ChatState)
-        workflow.add_edge(START, "model")
-        workflow.add_node("model", lambda state: call_model(intro_rag_chain, rag_chain, state))
+        Args:
+            hostname: The hostname of the url. Used to filter the vector store.
+            config: The configuration for the graph.
+            input: The user's input.
 
-        async with AsyncPostgresSaver.from_conn_string(get_psql_url()) as checkpointer:
-            self.app = workflow.compile(checkpointer=checkpointer)
+        Yields:
+            tuple[str, Any]: ("token", text) for each new piece of the answer, ("reset", None)
+                when the answer being generated was not valid and the text so far should be
+                discarded, and
+                lastly ("result", state) with the same state ainvoke returns.
+        """
+        config = self._with_hostname(hostname, config)
+        result = None
+        # The answer text of every attempt generating it. Only the text of the earliest attempt
+        # that was not found invalid is displayed.
+        texts: dict[Any, str] = {}
+        displayed_attempt = None
+        displayed = ""
+        await self._await_compaction(config)
+        async with self._checkpointed_graph() as graph:
+            async for event in graph.astream_events({"input": input}, config, version="v2"):
+                tags = event.get("tags", [])
+                is_answer = ANSWER_TAG in tags or INTRO_ANSWER_TAG in tags
+                is_intro = INTRO_ANSWER_TAG in tags
+                attempt = event.get("metadata", {}).get(ATTEMPT_METADATA_KEY, event["run_id"])
+                if event["event"] == "on_chat_model_start" and is_answer:
+                    texts[attempt] = ""
+                    if displayed_attempt is None:
+                        displayed_attempt = attempt
+                elif event["event"] == "on_chat_model_stream" and is_answer:
+                    texts[attempt] = texts.get(attempt, "") + event["data"]["chunk"].content
+                    if attempt != displayed_attempt:
+                        continue
+                    content = self._displayed_content(texts[attempt], is_intro)
+                    if len(content) > len(displayed) and content.startswith(displayed):
+                        yield "token", content[len(displayed) :]
+                        displayed = content
+                elif event["event"] == "on_custom_event" and event["name"] == ATTEMPT_PARSED_EVENT:
+                    if event["data"]["valid"]:
+                        continue
+                    texts.pop(event["data"]["attempt"], None)
+                    if event["data"]["attempt"] != displayed_attempt:
+                        continue
+                    # Display the next attempt instead of the invalid one
+                    displayed_attempt = next(iter(texts), None)
+                    if displayed:
+                        displayed = ""
+                        yield "reset", None
+                    if displayed_attempt is not None:
+                        content = self._displayed_content(texts[displayed_attempt], True)
+                        if content:
+                            yield "token", content
+                            displayed = content
+                elif event["event"] == "on_custom_event" and event["name"] == CACHED_ANSWER_EVENT:
+                    content = self._displayed_content(event["data"]["answer"], False)
+                    if content:
+                        yield "token", content
+                        displayed = content
+                elif event["event"] == "on_chain_end" and not event.get("parent_ids"):
+                    result = event["data"]["output"]
+        self._compact_in_background(config)
+        yield "result", result
 
-            result = await self.app.ainvoke(
-                {"input": input},
-                config=config,
-            )
-            return result
+    def _compact_in_background(self, config: RunnableConfig) -> None:
+        """Fold older messages of the conversation into the summary in the background, if needed."""
+        if not self.history.summarize:
+            return
+        thread_id = config["configurable"]["thread_id"]
+        task = asyncio.create_task(self._acompact(config))
+        self._compactions[thread_id] = task
+
+        def discard(task: asyncio.Task) -> None:
+            if self._compactions.get(thread_id) is task:
+                del self._compactions[thread_id]
+
+        task.add_done_callback(discard)
+
+    async def _await_compaction(self, config: RunnableConfig) -> None:
+        """Wait for the compaction of the conversation before starting a turn.
+
+        A turn started before the compaction is done would store the chat history it read over the
+        compacted one.
+        """
+        task = self._compactions.get(config["configurable"]["thread_id"])
+        if task is not None:
+            # Not cancelled with the turn
+            await asyncio.wait([task])
+
+    async def _acompact(self, config: RunnableConfig) -> None:
+        try:
+            async with self._checkpointed_graph() as graph:
+                state = await graph.aget_state(config)
+                compacted = await self.history.acompact(
+                    state.values.get("chat_history", []), state.values.get("summary", ""), config
+                )
+                if compacted:
+                    await graph.aupdate_state(config, compacted, as_node="model")
+        except Exception as e:
+            # The history is only windowed until the next turn tries again
+            logger.warning(f"Failed to compact the chat history: {e}")
+
+    async def await_compactions(self) -> None:
+        """Wait for the chat histories being compacted."""
+        await asyncio.gather(*self._compactions.values(), return_exceptions=True)
+
+    async def aclose(self) -> None:
+        """Cancel the chat histories being compacted."""
+        tasks = list(self._compactions.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
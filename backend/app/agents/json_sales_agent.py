@@ -1,7 +1,10 @@
 import logging
-from typing import Any, Dict, Union
+import re
+from operator import itemgetter
+from typing import Any, AsyncIterator, Optional, Union
 
 import langchain
+from langchain_core.exceptions import OutputParserException
 from langchain_core.language_models import LanguageModelLike
 from langchain_core.messages import AIMessage, HumanMessage
 from langchain_core.output_parsers import PydanticOutputParser
@@ -11,11 +14,20 @@ from langchain_core.prompts import (
     MessagesPlaceholder,
     PromptTemplate,
 )
-from langchain_core.runnables import Runnable
 from langchain_core.runnables.config import RunnableConfig
+from langchain_core.utils.json import parse_json_markdown, parse_partial_json
 from langchain_redis import RedisVectorStore
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from pydantic import ValidationError
 
 from app.agents.base_sales_agent import BaseSalesAgent
+from app.config import StructuredOutputConfig, get_structured_output_config
+from app.context_packing import ContextPacker
+from app.contextualization import ContextualizationPolicy
+from app.history import HistoryManager
+from app.response_cache import ResponseCache
+from app.retrieval import HybridRetriever
+from app.structured_output import StructuredOutputEngine, with_json_mode
 
 from . import ChatMessage, ChatState
 
@@ -134,46 +146,130 @@ qa_prompt = ChatPromptTemplate.from_messages(
 # How many multiple choice options
 MC_OPTION_LENGTH = 4
 
+mc_option_pattern = re.compile(r"^\s*([A-Z])\)\s*(.+?)\s*$", re.MULTILINE)
+
+
+def validate_intro(intro: ChatMessage) -> ChatMessage:
+    """Ensure the intro has MC_OPTION_LENGTH options."""
+    if not intro.mc_options or len(intro.mc_options) != MC_OPTION_LENGTH:
+        raise OutputParserException(f"The intro does not have {MC_OPTION_LENGTH} options")
+    return intro
+
+
+def parse_intro(text: str) -> ChatMessage:
+    return validate_intro(output_parser.parse(text))
+
+
+def repair_intro(text: str) -> ChatMessage:
+    """Parse an intro leniently.
+
+    The JSON object is looked for in the surrounding text, trailing commas and a truncated end are
+    fixed, and options listed in the content instead of mc_options are moved to mc_options.
+    """
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1:
+        raise OutputParserException("The intro has no JSON object")
+    json_text = text[start : end + 1] if end > start else text[start:]
+    intro = parse_partial_json(re.sub(r",\s*([}\]])", r"\1", json_text))
+    if not isinstance(intro, dict) or not isinstance(intro.get("content"), str):
+        raise OutputParserException("The intro has no content")
+
+    if not intro.get("mc_options"):
+        options = mc_option_pattern.findall(intro["content"])
+        if len(options) == MC_OPTION_LENGTH:
+            intro["mc_options"] = [f"{letter}) {option}" for letter, option in options]
+            intro["content"] = mc_option_pattern.sub("", intro["content"]).strip()
+    try:
+        return validate_intro(ChatMessage.model_validate(intro))
+    except ValidationError as e:
+        raise OutputParserException(str(e)) from e
+
 
 class JsonSalesAgent(BaseSalesAgent):
     """A SalesAgent that generates JSON responses.
 
+    The intro is generated in the LLM's JSON mode, if it has one, by a StructuredOutputEngine.
+
     Init args:
         llm: The LLM to use.
-        vector_store: The RedisVectorStore to use
+        vector_store: The RedisVectorStore to use.
+        checkpointer: Optional checkpointer to compile the graph with.
+        structured_output_config: Optional attempts to generate the intro with. Defaults to the
+            STRUCTURED_OUTPUT_ environment variables.
+        response_cache: Optional cache of the answers of standalone questions.
+        contextualization: Optional policy deciding which inputs are rewritten into standalone
+            questions.
+        history: Optional manager bounding the chat history in the prompts.
+        context_packer: Optional packer of the retrieved documents into a token budget.
+        hybrid_retriever: Optional retriever of the documents of a hostname.
     """
 
-    def __init__(self, llm: LanguageModelLike, vector_store: RedisVectorStore) -> None:
-        super().__init__(llm, vector_store, intro_few_shot_prompt, qa_prompt)
-
-    def __call_model(
+    def __init__(
         self,
-        intro_rag_chain: Runnable[Dict[str, Any], Any],
-        rag_chain: Runnable[Dict[str, Any], Any],
-        state: ChatState,
+        llm: LanguageModelLike,
+        vector_store: RedisVectorStore,
+        checkpointer: Optional[BaseCheckpointSaver] = None,
+        structured_output_config: Optional[StructuredOutputConfig] = None,
+        response_cache: Optional[ResponseCache] = None,
+        contextualization: Optional[ContextualizationPolicy] = None,
+        history: Optional[HistoryManager] = None,
+        context_packer: Optional[ContextPacker] = None,
+        hybrid_retriever: Optional[HybridRetriever] = None,
+    ) -> None:
+        super().__init__(
+            llm,
+            vector_store,
+            intro_few_shot_prompt,
+            qa_prompt,
+            self.__call_model,
+            checkpointer,
+            intro_llm=with_json_mode(llm),
+            response_cache=response_cache,
+            contextualization=contextualization,
+            history=history,
+            context_packer=context_packer,
+            hybrid_retriever=hybrid_retriever,
+        )
+        structured_output_config = structured_output_config or get_structured_output_config()
+        self.intro_output = StructuredOutputEngine(
+            parse_intro,
+            repair=repair_intro,
+            max_attempts=structured_output_config.max_attempts,
+            parallel_attempts=structured_output_config.parallel_attempts,
+            hedge_delay=structured_output_config.hedge_delay,
+        )
+
+    async def _agenerate_intro(self, config: RunnableConfig) -> tuple[ChatMessage, dict[str, Any]]:
+        init_state = ChatState(input="placeholder")
+        return await self.intro_output.agenerate(
+            lambda config: self.intro_rag_chain.ainvoke(init_state, config),
+            itemgetter("answer"),
+            config,
+        )
+
+    async def agenerate_intro(self, hostname: str) -> ChatMessage:
+        """Generate an intro for the hostname without starting a conversation, eg. to cache it."""
+        intro, _ = await self._agenerate_intro({"configurable": {"hostname": hostname}})
+        return intro
+
+    async def astart_with_intro(
+        self, hostname: str, config: RunnableConfig, intro: ChatMessage
     ) -> dict[str, Any]:
+        """Start a conversation with an intro that was already generated, eg. a cached one."""
+        return await super(JsonSalesAgent, self)._astart_with_intro(
+            hostname, config, AIMessage(intro.toJson()), intro
+        )
+
+    async def __call_model(self, state: ChatState, config: RunnableConfig) -> dict[str, Any]:
         """Invoke the graph chain.
 
         Args:
-            intro_rag_chain: The chain used to generate the introductory message.
-            rag_chain: The chain used to generate subsequent responses to user inputs.
             state: The state of the conversation.
+            config: The config of the invocation, holding the hostname to retrieve for.
         """
-        json_result = None
         # Check if chat history is empty to send the first AI message
         if not state["chat_history"]:
-            init_state = ChatState(input="placeholder")
-            while json_result is None:
-                try:
-                    initial_response = intro_rag_chain.invoke(init_state)
-
-                    # try parsing json and ensure 4 options
-                    temp_result = output_parser.parse(initial_response["answer"])
-                    if temp_result.mc_options and len(temp_result.mc_options) == MC_OPTION_LENGTH:
-                        json_result = temp_result
-                except Exception as e:
-                    logger.warning(e)
-
+            json_result, initial_response = await self._agenerate_intro(config)
             return {
                 "chat_history": [
                     AIMessage(initial_response["answer"]),
@@ -183,7 +279,7 @@ class JsonSalesAgent(BaseSalesAgent):
             }
 
         # Normal flow if chat history is present
-        response = rag_chain.invoke(state)
+        response = await self.rag_chain.ainvoke(state, config)
 
         return {
             "chat_history": [
@@ -197,6 +293,21 @@ class JsonSalesAgent(BaseSalesAgent):
     async def ainvoke(
         self, hostname: str, config: RunnableConfig, input: str
     ) -> Union[dict[str, Any], Any]:  # noqa: ANN401
-        return await super(JsonSalesAgent, self)._ainvoke(
-            hostname, config, self.__call_model, input
-        )
+        return await super(JsonSalesAgent, self)._ainvoke(hostname, config, input)
+
+    async def astream(
+        self, hostname: str, config: RunnableConfig, input: str
+    ) -> AsyncIterator[tuple[str, Any]]:
+        async for event in super(JsonSalesAgent, self)._astream(hostname, config, input):
+            yield event
+
+    def _displayed_content(self, text: str, is_intro: bool) -> str:
+        """Only the content field of the JSON intro is shown while it is generated."""
+        if not is_intro:
+            return text
+        try:
+            intro = parse_json_markdown(text, parser=parse_partial_json)
+        except Exception:
+            return ""
+        content = intro.get("content") if isinstance(intro, dict) else None
+        return content if isinstance(content, str) else ""
@@ -1,4 +1,4 @@
-from typing import Any, Dict, Union
+from typing import Any, AsyncIterator, Optional, Union
 
 import langchain
 from langchain_core.language_models import LanguageModelLike
@@ -8,11 +8,16 @@ from langchain_core.prompts import (
     MessagesPlaceholder,
     PromptTemplate,
 )
-from langchain_core.runnables import Runnable
 from langchain_core.runnables.config import RunnableConfig
 from langchain_redis import RedisVectorStore
+from langgraph.checkpoint.base import BaseCheckpointSaver
 
 from app.agents.base_sales_agent import BaseSalesAgent
+from app.context_packing import ContextPacker
+from app.contextualization import ContextualizationPolicy
+from app.history import HistoryManager
+from app.response_cache import ResponseCache
+from app.retrieval import HybridRetriever
 
 from . import ChatState
 
@@ -111,28 +116,51 @@ class TextSalesAgent(BaseSalesAgent):
     Init args:
         llm: The LLM to use.
         vector_store: The RedisVectorStore to use.
+        checkpointer: Optional checkpointer to compile the graph with.
+        response_cache: Optional cache of the answers of standalone questions.
+        contextualization: Optional policy deciding which inputs are rewritten into standalone
+            questions.
+        history: Optional manager bounding the chat history in the prompts.
+        context_packer: Optional packer of the retrieved documents into a token budget.
+        hybrid_retriever: Optional retriever of the documents of a hostname.
     """
 
-    def __init__(self, llm: LanguageModelLike, vector_store: RedisVectorStore) -> None:
-        super().__init__(llm, vector_store, intro_prompt, qa_prompt)
-
-    def __call_model(
+    def __init__(
         self,
-        intro_rag_chain: Runnable[Dict[str, Any], Any],
-        rag_chain: Runnable[Dict[str, Any], Any],
-        state: ChatState,
-    ) -> dict[str, Any]:
+        llm: LanguageModelLike,
+        vector_store: RedisVectorStore,
+        checkpointer: Optional[BaseCheckpointSaver] = None,
+        response_cache: Optional[ResponseCache] = None,
+        contextualization: Optional[ContextualizationPolicy] = None,
+        history: Optional[HistoryManager] = None,
+        context_packer: Optional[ContextPacker] = None,
+        hybrid_retriever: Optional[HybridRetriever] = None,
+    ) -> None:
+        super().__init__(
+            llm,
+            vector_store,
+            intro_prompt,
+            qa_prompt,
+            self.__call_model,
+            checkpointer,
+            response_cache=response_cache,
+            contextualization=contextualization,
+            history=history,
+            context_packer=context_packer,
+            hybrid_retriever=hybrid_retriever,
+        )
+
+    async def __call_model(self, state: ChatState, config: RunnableConfig) -> dict[str, Any]:
         """Invoke the graph chain.
 
         Args:
-            intro_rag_chain: The chain used to generate the introductory message.
-            rag_chain: The chain used to generate subsequent responses to user inputs.
             state: The state of the conversation.
+            config: The config of the invocation, holding the hostname to retrieve for.
         """
         # # Check if chat history is empty to send the first AI message
         if not state["chat_history"]:
             init_state = ChatState(input="placeholder")
-            initial_response = intro_rag_chain.invoke(init_state)
+            initial_response = await self.intro_rag_chain.ainvoke(init_state, config)
             return {
                 "chat_history": [
                     AIMessage(initial_response["answer"]),
@@ -142,7 +170,7 @@ class TextSalesAgent(BaseSalesAgent):
             }
 
         # Normal flow if chat history is present
-        response = rag_chain.invoke(state)
+        response = await self.rag_chain.ainvoke(state, config)
         return {
             "chat_history": [
                 HumanMessage(state["input"]),
@@ -155,6 +183,10 @@ class TextSalesAgent(BaseSalesAgent):
     async def ainvoke(
         self, hostname: str, config: RunnableConfig, input: str
     ) -> Union[dict[str, Any], Any]:  # noqa: ANN401
-        return await super(TextSalesAgent, self)._ainvoke(
-            hostname, config, self.__call_model, input
-        )
+        return await super(TextSalesAgent, self)._ainvoke(hostname, config, input)
+
+    async def astream(
+        self, hostname: str, config: RunnableConfig, input: str
+    ) -> AsyncIterator[tuple[str, Any]]:
+        async for event in super(TextSalesAgent, self)._astream(hostname, config, input):
+            yield event
@@ -0,0 +1,57 @@
+from typing import Any
+
+from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+
+from app.config import CheckpointPoolConfig
+
+
+def create_checkpoint_pool(
+    psql_url: str, checkpoint_pool_config: CheckpointPoolConfig
+) -> AsyncConnectionPool:
+    """Create the connection pool of the chat checkpointer. It is opened with `await pool.open()`.
+
+    Args:
+        psql_url: The url of the Postgres database.
+        checkpoint_pool_config: The size and timeouts of the pool.
+    """
+    return AsyncConnectionPool(
+        psql_url,
+        min_size=checkpoint_pool_config.min_size,
+        max_size=checkpoint_pool_config.max_size,
+        timeout=checkpoint_pool_config.timeout,
+        max_idle=checkpoint_pool_config.max_idle,
+        # The connection settings AsyncPostgresSaver.from_conn_string uses
+        kwargs={"autocommit": True, "prepare_threshold": 0, "row_factory": dict_row},
+        # Connections closed by the server while idle are replaced instead of failing a request
+        check=AsyncConnectionPool.check_connection,
+        open=False,
+        name="checkpoint",
+    )
+
+
+def create_checkpointer(pool: AsyncConnectionPool) -> AsyncPostgresSaver:
+    """Create a checkpointer that borrows a pooled connection for every read and write."""
+    return AsyncPostgresSaver(pool)
+
+
+def get_pool_stats(pool: AsyncConnectionPool) -> dict[str, Any]:
+    """The size of the pool and how long requests waited for and used its connections."""
+    stats = pool.get_stats()
+    requests_num = stats.get("requests_num", 0)
+    return {
+        "pool_min": stats.get("pool_min"),
+        "pool_max": stats.get("pool_max"),
+        "pool_size": stats.get("pool_size"),
+        "pool_available": stats.get("pool_available"),
+        "requests_waiting": stats.get("requests_waiting"),
+        "requests_num": stats.get("requests_num", 0),
+        "requests_queued": stats.get("requests_queued", 0),
+        "requests_wait_ms": stats.get("requests_wait_ms", 0),
+        "avg_wait_ms": stats.get("requests_wait_ms", 0) / requests_num if requests_num else 0.0,
+        "requests_errors": stats.get("requests_errors", 0),
+        "usage_ms": stats.get("usage_ms", 0),
+        "connections_num": stats.get("connections_num", 0),
+        "connections_errors": stats.get("connections_errors", 0),
+    }
@@ -0,0 +1,60 @@
+from typing import Iterable, Iterator
+from uuid import NAMESPACE_URL, uuid5
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from app.tokens import count_tokens
+
+# Split on the headings kept by the extractor first, then on lines, sentences and words
+HEADING_SEPARATORS = [r"\n# ", r"\n## ", r"\n### ", r"\n#### ", r"\n##### ", r"\n###### "]
+TEXT_SEPARATORS = [r"\n", r"(?<=[.!?]) ", r" ", r""]
+
+
+def create_text_splitter(
+    chunk_size: int, chunk_overlap: int, strategy: str
+) -> RecursiveCharacterTextSplitter:
+    """Create the splitter used to chunk pages before embedding.
+
+    Args:
+        chunk_size: The max size of a chunk in tokens.
+        chunk_overlap: The number of tokens shared by consecutive chunks.
+        strategy: "headings" to prefer splitting at html headings, or "tokens" to only
+            split on lines, sentences and words.
+    """
+    if strategy == "headings":
+        separators = HEADING_SEPARATORS + TEXT_SEPARATORS
+    elif strategy == "tokens":
+        separators = TEXT_SEPARATORS
+    else:
+        raise ValueError("Unsupported chunking strategy")
+
+    return RecursiveCharacterTextSplitter(
+        separators=separators,
+        keep_separator="start",
+        is_separator_regex=True,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=count_tokens,
+        add_start_index=True,
+    )
+
+
+def chunk_id(source: str, start_index: int) -> str:
+    """A stable id for the chunk of a page starting at the given character offset."""
+    return str(uuid5(NAMESPACE_URL, f"{source}#{start_index}"))
+
+
+def chunk_documents(
+    docs: Iterable[Document], text_splitter: RecursiveCharacterTextSplitter
+) -> Iterator[Document]:
+    """Split pages into chunks that keep the metadata of their page.
+
+    Each chunk gets a `start_index` and a `chunk_id` derived from its source and offset, so
+    re-crawling an unchanged page produces the same chunks.
+    """
+    for doc in docs:
+        for chunk in text_splitter.split_documents([doc]):
+            chunk.id = chunk_id(chunk.metadata["source"], chunk.metadata["start_index"])
+            chunk.metadata["chunk_id"] = chunk.id
+            yield chunk
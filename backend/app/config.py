@@ -38,8 +38,8 @@ if not redis_url or redis_url == "":
     raise ValueError("REDIS_URL environment variable is missing")
 
 llm = os.getenv("LLM")
-if llm not in ["llama", "openai"]:
-    raise ValueError("Valid options for the LLM environment variable are llama or openai")
+if llm not in ["llama", "openai", "fake"]:
+    raise ValueError("Valid options for the LLM environment variable are llama, openai or fake")
 llm_api_key = os.getenv("LLM_API_KEY")
 if llm == "openai" and (not llm_api_key or llm_api_key == ""):
     raise ValueError("LLM is set to 'openai' but LLM_API_KEY environment variable is missing")
@@ -58,22 +58,198 @@ config = {
     "LLM": llm,
     "LLM_URL": os.getenv("LLM_URL"),
     "LLM_API_KEY": llm_api_key,
+    "LLM_FAKE_LATENCY": float(os.getenv("LLM_FAKE_LATENCY", 1.0)),
     "HOST": os.getenv("HOST", "0.0.0.0"),
     "PORT": os.getenv("PORT", 5555),
+    "SERVER_MODE": os.getenv("SERVER_MODE", "development"),
+    "SERVER_WORKERS": int(os.getenv("SERVER_WORKERS", 2)),
+    "SERVER_GRACEFUL_TIMEOUT": float(os.getenv("SERVER_GRACEFUL_TIMEOUT", 30)),
     "URL_RECURSIVE_MAX_DEPTH": int(os.getenv("URL_RECURSIVE_MAX_DEPTH", 1)),
+    "CRAWL_TTL": int(os.getenv("CRAWL_TTL", 86400)),
+    "CRAWL_CONCURRENCY_PER_HOST": int(os.getenv("CRAWL_CONCURRENCY_PER_HOST", 4)),
+    "CRAWL_MAX_PAGES": int(os.getenv("CRAWL_MAX_PAGES", 500)),
+    "CRAWL_MAX_BYTES": int(os.getenv("CRAWL_MAX_BYTES", 50_000_000)),
+    "CRAWL_MAX_FRONTIER": int(os.getenv("CRAWL_MAX_FRONTIER", 10_000)),
+    "CRAWL_REQUEST_TIMEOUT": float(os.getenv("CRAWL_REQUEST_TIMEOUT", 10)),
+    "CRAWL_CONDITIONAL_REQUESTS": os.getenv("CRAWL_CONDITIONAL_REQUESTS", "true")
+    in ["1", "True", "true"],
+    "CRAWL_USER_AGENT": os.getenv("CRAWL_USER_AGENT", "RagAiChatbot"),
+    "CRAWL_RESPECT_ROBOTS": os.getenv("CRAWL_RESPECT_ROBOTS", "true") in ["1", "True", "true"],
+    "CRAWL_DELAY": float(os.getenv("CRAWL_DELAY", 0)),
+    "CRAWL_MAX_DELAY": float(os.getenv("CRAWL_MAX_DELAY", 10)),
+    "CRAWL_SITEMAPS": os.getenv("CRAWL_SITEMAPS", "true") in ["1", "True", "true"],
+    "CRAWL_PLATFORM": os.getenv("CRAWL_PLATFORM", "auto"),
+    "CRAWL_INCLUDE_PATTERNS": [
+        pattern for pattern in os.getenv("CRAWL_INCLUDE_PATTERNS", "").split(",") if pattern
+    ],
+    "CRAWL_EXCLUDE_PATTERNS": [
+        pattern for pattern in os.getenv("CRAWL_EXCLUDE_PATTERNS", "").split(",") if pattern
+    ],
+    "CRAWL_NEAR_DUPLICATES": os.getenv("CRAWL_NEAR_DUPLICATES", "true") in ["1", "True", "true"],
+    "CRAWL_NEAR_DUPLICATE_DISTANCE": int(os.getenv("CRAWL_NEAR_DUPLICATE_DISTANCE", 3)),
+    "CRAWL_ALLOW_HTTP": os.getenv("CRAWL_ALLOW_HTTP", "false") in ["1", "True", "true"],
+    "EXTRACTION_WORKERS": int(os.getenv("EXTRACTION_WORKERS", 2)),
+    "CHUNK_SIZE": int(os.getenv("CHUNK_SIZE", 512)),
+    "CHUNK_OVERLAP": int(os.getenv("CHUNK_OVERLAP", 64)),
+    "CHUNK_STRATEGY": os.getenv("CHUNK_STRATEGY", "headings"),
+    "EMBEDDING_CACHE": os.getenv("EMBEDDING_CACHE", "redis"),
+    "EMBEDDING_CACHE_MAX_ENTRIES": int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 10_000)),
+    "EMBEDDING_MAX_BATCH_SIZE": int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", 128)),
+    "EMBEDDING_MAX_CONCURRENCY": int(os.getenv("EMBEDDING_MAX_CONCURRENCY", 4)),
+    "EMBEDDING_REQUESTS_PER_SECOND": float(os.getenv("EMBEDDING_REQUESTS_PER_SECOND", 10)),
+    "EMBEDDING_TOKENS_PER_MINUTE": int(os.getenv("EMBEDDING_TOKENS_PER_MINUTE", 0)),
+    "EMBEDDING_MAX_RETRIES": int(os.getenv("EMBEDDING_MAX_RETRIES", 6)),
+    "CRAWL_WORKER_MODE": os.getenv("CRAWL_WORKER_MODE", "inprocess"),
+    "CRAWL_WORKER_CONCURRENCY": int(os.getenv("CRAWL_WORKER_CONCURRENCY", 2)),
+    "CRAWL_JOB_POLL_INTERVAL": float(os.getenv("CRAWL_JOB_POLL_INTERVAL", 1.0)),
+    "CRAWL_JOB_HEARTBEAT_INTERVAL": float(os.getenv("CRAWL_JOB_HEARTBEAT_INTERVAL", 30)),
+    "CRAWL_JOB_TIMEOUT": int(os.getenv("CRAWL_JOB_TIMEOUT", 300)),
+    "CHECKPOINT_POOL_MIN_SIZE": int(os.getenv("CHECKPOINT_POOL_MIN_SIZE", 1)),
+    "CHECKPOINT_POOL_MAX_SIZE": int(os.getenv("CHECKPOINT_POOL_MAX_SIZE", 10)),
+    "CHECKPOINT_POOL_TIMEOUT": float(os.getenv("CHECKPOINT_POOL_TIMEOUT", 30)),
+    "CHECKPOINT_POOL_MAX_IDLE": float(os.getenv("CHECKPOINT_POOL_MAX_IDLE", 600)),
+    "STRUCTURED_OUTPUT_MAX_ATTEMPTS": int(os.getenv("STRUCTURED_OUTPUT_MAX_ATTEMPTS", 4)),
+    "STRUCTURED_OUTPUT_PARALLEL_ATTEMPTS": int(os.getenv("STRUCTURED_OUTPUT_PARALLEL_ATTEMPTS", 2)),
+    "STRUCTURED_OUTPUT_HEDGE_DELAY": float(os.getenv("STRUCTURED_OUTPUT_HEDGE_DELAY", 5.0)),
+    "INTRO_CACHE": os.getenv("INTRO_CACHE", "redis"),
+    "INTRO_CACHE_VARIANTS": int(os.getenv("INTRO_CACHE_VARIANTS", 3)),
+    "INTRO_CACHE_TTL": int(os.getenv("INTRO_CACHE_TTL", 604800)),
+    "RESPONSE_CACHE": os.getenv("RESPONSE_CACHE", False) in ["1", "True", "true"],
+    "RESPONSE_CACHE_DISTANCE_THRESHOLD": float(os.getenv("RESPONSE_CACHE_DISTANCE_THRESHOLD", 0.1)),
+    "RESPONSE_CACHE_TTL": int(os.getenv("RESPONSE_CACHE_TTL", 86400)),
+    "CONTEXTUALIZE_POLICY": os.getenv("CONTEXTUALIZE_POLICY", "heuristic"),
+    "CONTEXTUALIZE_MIN_WORDS": int(os.getenv("CONTEXTUALIZE_MIN_WORDS", 4)),
+    "HISTORY_MAX_TOKENS": int(os.getenv("HISTORY_MAX_TOKENS", 2000)),
+    "HISTORY_SUMMARY": os.getenv("HISTORY_SUMMARY", "true") in ["1", "True", "true"],
+    "CONTEXT_MAX_TOKENS": int(os.getenv("CONTEXT_MAX_TOKENS", 1500)),
+    "CONTEXT_DUPLICATE_THRESHOLD": float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", 0.8)),
+    "RETRIEVAL_MODE": os.getenv("RETRIEVAL_MODE", "hybrid"),
+    "RETRIEVAL_K": int(os.getenv("RETRIEVAL_K", 4)),
+    "RETRIEVAL_CANDIDATES": int(os.getenv("RETRIEVAL_CANDIDATES", 20)),
+    "RETRIEVAL_RERANKER": os.getenv("RETRIEVAL_RERANKER", "none"),
+    "RETRIEVAL_RERANK_MODEL": os.getenv(
+        "RETRIEVAL_RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2"
+    ),
+    "RETRIEVAL_RERANK_BUDGET": float(os.getenv("RETRIEVAL_RERANK_BUDGET", 0.1)),
+    "VECTOR_INDEX_ALGORITHM": os.getenv("VECTOR_INDEX_ALGORITHM", "FLAT"),
+    "VECTOR_DISTANCE_METRIC": os.getenv("VECTOR_DISTANCE_METRIC", "COSINE"),
+    "VECTOR_HNSW_M": int(os.getenv("VECTOR_HNSW_M", 16)),
+    "VECTOR_HNSW_EF_CONSTRUCTION": int(os.getenv("VECTOR_HNSW_EF_CONSTRUCTION", 200)),
+    "VECTOR_HNSW_EF_RUNTIME": int(os.getenv("VECTOR_HNSW_EF_RUNTIME", 10)),
+    "VECTOR_DATATYPE": os.getenv("VECTOR_DATATYPE", "FLOAT32"),
+    "EMBEDDING_DIMENSIONS": int(os.getenv("EMBEDDING_DIMENSIONS", 0)),
     "PASSPHRASES": os.getenv("PASSPHRASES", "").split(","),
     "LOG_FOLDER": os.getenv("LOG_FOLDER", "_logs"),
     "IS_DEBUG": os.getenv("IS_DEBUG", False) in ["1", "True", "true"],
 }
 
 DEFAULTS = {
+    "LLM_FAKE_LATENCY": 1.0,
     "HOST": "localhsot",
     "PORT": 5555,
+    "SERVER_MODE": "development",
+    "SERVER_WORKERS": 2,
+    "SERVER_GRACEFUL_TIMEOUT": 30,
     "URL_RECURSIVE_MAX_DEPTH": 1,
+    "CRAWL_TTL": 86400,
+    "CRAWL_CONCURRENCY_PER_HOST": 4,
+    "CRAWL_MAX_PAGES": 500,
+    "CRAWL_MAX_BYTES": 50_000_000,
+    "CRAWL_MAX_FRONTIER": 10_000,
+    "CRAWL_REQUEST_TIMEOUT": 10,
+    "CRAWL_CONDITIONAL_REQUESTS": True,
+    "CRAWL_USER_AGENT": "RagAiChatbot",
+    "CRAWL_RESPECT_ROBOTS": True,
+    "CRAWL_DELAY": 0,
+    "CRAWL_MAX_DELAY": 10,
+    "CRAWL_SITEMAPS": True,
+    "CRAWL_PLATFORM": "auto",
+    "CRAWL_INCLUDE_PATTERNS": [],
+    "CRAWL_EXCLUDE_PATTERNS": [],
+    "CRAWL_NEAR_DUPLICATES": True,
+    "CRAWL_NEAR_DUPLICATE_DISTANCE": 3,
+    "CRAWL_ALLOW_HTTP": False,
+    "EXTRACTION_WORKERS": 2,
+    "CHUNK_SIZE": 512,
+    "CHUNK_OVERLAP": 64,
+    "CHUNK_STRATEGY": "headings",
+    "EMBEDDING_CACHE": "redis",
+    "EMBEDDING_CACHE_MAX_ENTRIES": 10_000,
+    "EMBEDDING_MAX_BATCH_SIZE": 128,
+    "EMBEDDING_MAX_CONCURRENCY": 4,
+    "EMBEDDING_REQUESTS_PER_SECOND": 10,
+    "EMBEDDING_TOKENS_PER_MINUTE": 0,
+    "EMBEDDING_MAX_RETRIES": 6,
+    "CRAWL_WORKER_MODE": "inprocess",
+    "CRAWL_WORKER_CONCURRENCY": 2,
+    "CRAWL_JOB_POLL_INTERVAL": 1.0,
+    "CRAWL_JOB_HEARTBEAT_INTERVAL": 30,
+    "CRAWL_JOB_TIMEOUT": 300,
+    "CHECKPOINT_POOL_MIN_SIZE": 1,
+    "CHECKPOINT_POOL_MAX_SIZE": 10,
+    "CHECKPOINT_POOL_TIMEOUT": 30,
+    "CHECKPOINT_POOL_MAX_IDLE": 600,
+    "STRUCTURED_OUTPUT_MAX_ATTEMPTS": 4,
+    "STRUCTURED_OUTPUT_PARALLEL_ATTEMPTS": 2,
+    "STRUCTURED_OUTPUT_HEDGE_DELAY": 5.0,
+    "INTRO_CACHE": "redis",
+    "INTRO_CACHE_VARIANTS": 3,
+    "INTRO_CACHE_TTL": 604800,
+    "RESPONSE_CACHE": False,
+    "RESPONSE_CACHE_DISTANCE_THRESHOLD": 0.1,
+    "RESPONSE_CACHE_TTL": 86400,
+    "CONTEXTUALIZE_POLICY": "heuristic",
+    "CONTEXTUALIZE_MIN_WORDS": 4,
+    "HISTORY_MAX_TOKENS": 2000,
+    "HISTORY_SUMMARY": True,
+    "CONTEXT_MAX_TOKENS": 1500,
+    "CONTEXT_DUPLICATE_THRESHOLD": 0.8,
+    "RETRIEVAL_MODE": "hybrid",
+    "RETRIEVAL_K": 4,
+    "RETRIEVAL_CANDIDATES": 20,
+    "RETRIEVAL_RERANKER": "none",
+    "RETRIEVAL_RERANK_MODEL": "cross-encoder/ms-marco-MiniLM-L-6-v2",
+    "RETRIEVAL_RERANK_BUDGET": 0.1,
+    "VECTOR_INDEX_ALGORITHM": "FLAT",
+    "VECTOR_DISTANCE_METRIC": "COSINE",
+    "VECTOR_HNSW_M": 16,
+    "VECTOR_HNSW_EF_CONSTRUCTION": 200,
+    "VECTOR_HNSW_EF_RUNTIME": 10,
+    "VECTOR_DATATYPE": "FLOAT32",
+    "EMBEDDING_DIMENSIONS": 0,
     "LOG_FOLDER": "_logs",
     "IS_DEBUG": False,
 }
 
+if config["SERVER_MODE"] not in ["development", "production"]:
+    raise ValueError("Valid options for SERVER_MODE are development or production")
+if config["CHUNK_STRATEGY"] not in ["headings", "tokens"]:
+    raise ValueError("Valid options for CHUNK_STRATEGY are headings or tokens")
+if config["EMBEDDING_CACHE"] not in ["redis", "memory", "none"]:
+    raise ValueError("Valid options for EMBEDDING_CACHE are redis, memory or none")
+if config["INTRO_CACHE"] not in ["redis", "memory", "none"]:
+    raise ValueError("Valid options for INTRO_CACHE are redis, memory or none")
+if config["CONTEXTUALIZE_POLICY"] not in ["always", "heuristic", "speculative"]:
+    raise ValueError("Valid options for CONTEXTUALIZE_POLICY are always, heuristic or speculative")
+if config["RETRIEVAL_MODE"] not in ["hybrid", "vector"]:
+    raise ValueError("Valid options for RETRIEVAL_MODE are hybrid or vector")
+if config["RETRIEVAL_RERANKER"] not in ["none", "lexical", "cross-encoder"]:
+    raise ValueError("Valid options for RETRIEVAL_RERANKER are none, lexical or cross-encoder")
+if config["VECTOR_INDEX_ALGORITHM"] not in ["FLAT", "HNSW"]:
+    raise ValueError("Valid options for VECTOR_INDEX_ALGORITHM are FLAT or HNSW")
+if config["VECTOR_DISTANCE_METRIC"] not in ["COSINE", "IP", "L2"]:
+    raise ValueError("Valid options for VECTOR_DISTANCE_METRIC are COSINE, IP or L2")
+if config["VECTOR_DATATYPE"] not in ["FLOAT32", "FLOAT16"]:
+    raise ValueError("Valid options for VECTOR_DATATYPE are FLOAT32 or FLOAT16")
+if config["CRAWL_WORKER_MODE"] not in ["inprocess", "external"]:
+    raise ValueError("Valid options for CRAWL_WORKER_MODE are inprocess or external")
+if not 0 < config["CRAWL_JOB_HEARTBEAT_INTERVAL"] < config["CRAWL_JOB_TIMEOUT"]:
+    raise ValueError("CRAWL_JOB_HEARTBEAT_INTERVAL must be between 0 and CRAWL_JOB_TIMEOUT")
+if config["CRAWL_PLATFORM"] not in ["auto", "generic", "shopify", "woocommerce"]:
+    raise ValueError("Valid options for CRAWL_PLATFORM are auto, generic, shopify or woocommerce")
+if not 0 <= config["CRAWL_NEAR_DUPLICATE_DISTANCE"] <= 15:
+    raise ValueError("Valid options for CRAWL_NEAR_DUPLICATE_DISTANCE are 0 to 15")
+
 # apply defaults for missing config params
 for key in DEFAULTS:
     if key not in config or config[key] is None:
@@ -107,11 +283,191 @@ class FlaskConfig:
         self.port = port
 
 
+class ServerConfig:
+    def __init__(self, mode: str, workers: int, graceful_timeout: float) -> None:
+        self.mode = mode
+        self.workers = workers
+        self.graceful_timeout = graceful_timeout
+
+
+class CrawlerConfig:
+    def __init__(
+        self,
+        concurrency_per_host: int,
+        max_pages: int,
+        max_bytes: int,
+        max_frontier: int,
+        request_timeout: float,
+        conditional_requests: bool,
+        user_agent: str,
+        respect_robots: bool,
+        crawl_delay: float,
+        max_crawl_delay: float,
+        use_sitemaps: bool,
+        platform: str,
+        include_patterns: list[str],
+        exclude_patterns: list[str],
+        near_duplicates: bool,
+        near_duplicate_distance: int,
+        allow_http: bool,
+    ) -> None:
+        self.concurrency_per_host = concurrency_per_host
+        self.max_pages = max_pages
+        self.max_bytes = max_bytes
+        self.max_frontier = max_frontier
+        self.request_timeout = request_timeout
+        self.conditional_requests = conditional_requests
+        self.user_agent = user_agent
+        self.respect_robots = respect_robots
+        self.crawl_delay = crawl_delay
+        self.max_crawl_delay = max_crawl_delay
+        self.use_sitemaps = use_sitemaps
+        self.platform = platform
+        self.include_patterns = include_patterns
+        self.exclude_patterns = exclude_patterns
+        self.near_duplicates = near_duplicates
+        self.near_duplicate_distance = near_duplicate_distance
+        self.allow_http = allow_http
+
+
+class ChunkingConfig:
+    def __init__(self, chunk_size: int, chunk_overlap: int, strategy: str) -> None:
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.strategy = strategy
+
+
+class EmbeddingCacheConfig:
+    def __init__(self, backend: str, max_entries: int) -> None:
+        self.backend = backend
+        self.max_entries = max_entries
+
+
+class EmbeddingExecutorConfig:
+    def __init__(
+        self,
+        max_batch_size: int,
+        max_concurrency: int,
+        requests_per_second: float,
+        tokens_per_minute: int,
+        max_retries: int,
+    ) -> None:
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+        self.requests_per_second = requests_per_second
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+
+
+class CrawlWorkerConfig:
+    def __init__(
+        self,
+        mode: str,
+        concurrency: int,
+        poll_interval: float,
+        heartbeat_interval: float,
+        job_timeout: int,
+    ) -> None:
+        self.mode = mode
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.job_timeout = job_timeout
+
+
+class CheckpointPoolConfig:
+    def __init__(self, min_size: int, max_size: int, timeout: float, max_idle: float) -> None:
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+
+
+class StructuredOutputConfig:
+    def __init__(self, max_attempts: int, parallel_attempts: int, hedge_delay: float) -> None:
+        self.max_attempts = max_attempts
+        self.parallel_attempts = parallel_attempts
+        self.hedge_delay = hedge_delay
+
+
+class IntroCacheConfig:
+    def __init__(self, backend: str, variants: int, ttl: int) -> None:
+        self.backend = backend
+        self.variants = variants
+        self.ttl = ttl
+
+
+class ResponseCacheConfig:
+    def __init__(self, enabled: bool, distance_threshold: float, ttl: int) -> None:
+        self.enabled = enabled
+        self.distance_threshold = distance_threshold
+        self.ttl = ttl
+
+
+class ContextualizationConfig:
+    def __init__(self, policy: str, min_words: int) -> None:
+        self.policy = policy
+        self.min_words = min_words
+
+
+class HistoryConfig:
+    def __init__(self, max_tokens: int, summarize: bool) -> None:
+        self.max_tokens = max_tokens
+        self.summarize = summarize
+
+
+class ContextPackingConfig:
+    def __init__(self, max_tokens: int, duplicate_threshold: float) -> None:
+        self.max_tokens = max_tokens
+        self.duplicate_threshold = duplicate_threshold
+
+
+class RetrievalConfig:
+    def __init__(
+        self,
+        mode: str,
+        k: int,
+        candidates: int,
+        reranker: str,
+        rerank_model: str,
+        rerank_budget: float,
+    ) -> None:
+        self.mode = mode
+        self.k = k
+        self.candidates = candidates
+        self.reranker = reranker
+        self.rerank_model = rerank_model
+        self.rerank_budget = rerank_budget
+
+
+class VectorIndexConfig:
+    def __init__(
+        self,
+        algorithm: str,
+        distance_metric: str,
+        m: int,
+        ef_construction: int,
+        ef_runtime: int,
+        datatype: str,
+        dimensions: int,
+    ) -> None:
+        self.algorithm = algorithm
+        self.distance_metric = distance_metric
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_runtime = ef_runtime
+        self.datatype = datatype
+        self.dimensions = dimensions
+
+
 class LlmConfig:
-    def __init__(self, llm: str, url: str | None, api_secret_key: str | None) -> None:
+    def __init__(
+        self, llm: str, url: str | None, api_secret_key: str | None, fake_latency: float = 0
+    ) -> None:
         self.llm = llm
         self.url = url
         self.api_secret_key = api_secret_key
+        self.fake_latency = fake_latency
 
 
 # Getters
@@ -144,6 +500,8 @@ def get_redis_config() -> RedisConfig:
         index_name="website",
         redis_url=config["REDIS_URL"],
         # from_existing=True,
+        # The page text, indexed as a full-text field for the BM25 search of hybrid retrieval
+        content_field="text",
         metadata_schema=[
             {
                 "name": "source",
@@ -158,11 +516,168 @@ def get_redis_config() -> RedisConfig:
     return redis_config
 
 
+def get_crawl_ttl() -> int:
+    return config["CRAWL_TTL"]
+
+
+def get_crawler_config() -> CrawlerConfig:
+    crawler_config = CrawlerConfig(
+        concurrency_per_host=config["CRAWL_CONCURRENCY_PER_HOST"],
+        max_pages=config["CRAWL_MAX_PAGES"],
+        max_bytes=config["CRAWL_MAX_BYTES"],
+        max_frontier=config["CRAWL_MAX_FRONTIER"],
+        request_timeout=config["CRAWL_REQUEST_TIMEOUT"],
+        conditional_requests=config["CRAWL_CONDITIONAL_REQUESTS"],
+        user_agent=config["CRAWL_USER_AGENT"],
+        respect_robots=config["CRAWL_RESPECT_ROBOTS"],
+        crawl_delay=config["CRAWL_DELAY"],
+        max_crawl_delay=config["CRAWL_MAX_DELAY"],
+        use_sitemaps=config["CRAWL_SITEMAPS"],
+        platform=config["CRAWL_PLATFORM"],
+        include_patterns=config["CRAWL_INCLUDE_PATTERNS"],
+        exclude_patterns=config["CRAWL_EXCLUDE_PATTERNS"],
+        near_duplicates=config["CRAWL_NEAR_DUPLICATES"],
+        near_duplicate_distance=config["CRAWL_NEAR_DUPLICATE_DISTANCE"],
+        allow_http=config["CRAWL_ALLOW_HTTP"],
+    )
+    return crawler_config
+
+
+def get_extraction_workers() -> int:
+    return config["EXTRACTION_WORKERS"]
+
+
+def get_chunking_config() -> ChunkingConfig:
+    chunking_config = ChunkingConfig(
+        chunk_size=config["CHUNK_SIZE"],
+        chunk_overlap=config["CHUNK_OVERLAP"],
+        strategy=config["CHUNK_STRATEGY"],
+    )
+    return chunking_config
+
+
+def get_embedding_cache_config() -> EmbeddingCacheConfig:
+    embedding_cache_config = EmbeddingCacheConfig(
+        backend=config["EMBEDDING_CACHE"],
+        max_entries=config["EMBEDDING_CACHE_MAX_ENTRIES"],
+    )
+    return embedding_cache_config
+
+
+def get_embedding_executor_config() -> EmbeddingExecutorConfig:
+    embedding_executor_config = EmbeddingExecutorConfig(
+        max_batch_size=config["EMBEDDING_MAX_BATCH_SIZE"],
+        max_concurrency=config["EMBEDDING_MAX_CONCURRENCY"],
+        requests_per_second=config["EMBEDDING_REQUESTS_PER_SECOND"],
+        tokens_per_minute=config["EMBEDDING_TOKENS_PER_MINUTE"],
+        max_retries=config["EMBEDDING_MAX_RETRIES"],
+    )
+    return embedding_executor_config
+
+
+def get_crawl_worker_config() -> CrawlWorkerConfig:
+    crawl_worker_config = CrawlWorkerConfig(
+        mode=config["CRAWL_WORKER_MODE"],
+        concurrency=config["CRAWL_WORKER_CONCURRENCY"],
+        poll_interval=config["CRAWL_JOB_POLL_INTERVAL"],
+        heartbeat_interval=config["CRAWL_JOB_HEARTBEAT_INTERVAL"],
+        job_timeout=config["CRAWL_JOB_TIMEOUT"],
+    )
+    return crawl_worker_config
+
+
+def get_checkpoint_pool_config() -> CheckpointPoolConfig:
+    checkpoint_pool_config = CheckpointPoolConfig(
+        min_size=config["CHECKPOINT_POOL_MIN_SIZE"],
+        max_size=config["CHECKPOINT_POOL_MAX_SIZE"],
+        timeout=config["CHECKPOINT_POOL_TIMEOUT"],
+        max_idle=config["CHECKPOINT_POOL_MAX_IDLE"],
+    )
+    return checkpoint_pool_config
+
+
+def get_structured_output_config() -> StructuredOutputConfig:
+    structured_output_config = StructuredOutputConfig(
+        max_attempts=config["STRUCTURED_OUTPUT_MAX_ATTEMPTS"],
+        parallel_attempts=config["STRUCTURED_OUTPUT_PARALLEL_ATTEMPTS"],
+        hedge_delay=config["STRUCTURED_OUTPUT_HEDGE_DELAY"],
+    )
+    return structured_output_config
+
+
+def get_intro_cache_config() -> IntroCacheConfig:
+    intro_cache_config = IntroCacheConfig(
+        backend=config["INTRO_CACHE"],
+        variants=config["INTRO_CACHE_VARIANTS"],
+        ttl=config["INTRO_CACHE_TTL"],
+    )
+    return intro_cache_config
+
+
+def get_response_cache_config() -> ResponseCacheConfig:
+    response_cache_config = ResponseCacheConfig(
+        enabled=config["RESPONSE_CACHE"],
+        distance_threshold=config["RESPONSE_CACHE_DISTANCE_THRESHOLD"],
+        ttl=config["RESPONSE_CACHE_TTL"],
+    )
+    return response_cache_config
+
+
+def get_contextualization_config() -> ContextualizationConfig:
+    contextualization_config = ContextualizationConfig(
+        policy=config["CONTEXTUALIZE_POLICY"],
+        min_words=config["CONTEXTUALIZE_MIN_WORDS"],
+    )
+    return contextualization_config
+
+
+def get_history_config() -> HistoryConfig:
+    history_config = HistoryConfig(
+        max_tokens=config["HISTORY_MAX_TOKENS"],
+        summarize=config["HISTORY_SUMMARY"],
+    )
+    return history_config
+
+
+def get_context_packing_config() -> ContextPackingConfig:
+    context_packing_config = ContextPackingConfig(
+        max_tokens=config["CONTEXT_MAX_TOKENS"],
+        duplicate_threshold=config["CONTEXT_DUPLICATE_THRESHOLD"],
+    )
+    return context_packing_config
+
+
+def get_retrieval_config() -> RetrievalConfig:
+    retrieval_config = RetrievalConfig(
+        mode=config["RETRIEVAL_MODE"],
+        k=config["RETRIEVAL_K"],
+        candidates=config["RETRIEVAL_CANDIDATES"],
+        reranker=config["RETRIEVAL_RERANKER"],
+        rerank_model=config["RETRIEVAL_RERANK_MODEL"],
+        rerank_budget=config["RETRIEVAL_RERANK_BUDGET"],
+    )
+    return retrieval_config
+
+
+def get_vector_index_config() -> VectorIndexConfig:
+    vector_index_config = VectorIndexConfig(
+        algorithm=config["VECTOR_INDEX_ALGORITHM"],
+        distance_metric=config["VECTOR_DISTANCE_METRIC"],
+        m=config["VECTOR_HNSW_M"],
+        ef_construction=config["VECTOR_HNSW_EF_CONSTRUCTION"],
+        ef_runtime=config["VECTOR_HNSW_EF_RUNTIME"],
+        datatype=config["VECTOR_DATATYPE"],
+        dimensions=config["EMBEDDING_DIMENSIONS"],
+    )
+    return vector_index_config
+
+
 def get_llm_config() -> LlmConfig:
     llm_config = LlmConfig(
         llm=config["LLM"],
         url=config["LLM_URL"],
         api_secret_key=config["LLM_API_KEY"],
+        fake_latency=config["LLM_FAKE_LATENCY"],
     )
     return llm_config
 
@@ -172,6 +687,15 @@ def get_flask_config() -> FlaskConfig:
     return flask_config
 
 
+def get_server_config() -> ServerConfig:
+    server_config = ServerConfig(
+        mode=config["SERVER_MODE"],
+        workers=config["SERVER_WORKERS"],
+        graceful_timeout=config["SERVER_GRACEFUL_TIMEOUT"],
+    )
+    return server_config
+
+
 def get_passphrases() -> bool:
     return config["PASSPHRASES"]
 
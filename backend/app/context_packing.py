@@ -0,0 +1,176 @@
+import logging
+import re
+import threading
+from typing import Any
+
+from langchain_core.documents import Document
+
+from app.tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Common words that say nothing about whether a sentence is relevant to the query
+STOP_WORDS = {
+    "a",
+    "about",
+    "an",
+    "and",
+    "are",
+    "as",
+    "at",
+    "be",
+    "by",
+    "can",
+    "do",
+    "does",
+    "for",
+    "from",
+    "have",
+    "how",
+    "i",
+    "in",
+    "is",
+    "it",
+    "me",
+    "my",
+    "of",
+    "on",
+    "or",
+    "our",
+    "the",
+    "to",
+    "we",
+    "what",
+    "which",
+    "with",
+    "you",
+    "your",
+}
+sentence_pattern = re.compile(r"(?<=[.!?])\s+|\n+")
+word_pattern = re.compile(r"\w+")
+
+
+def split_sentences(text: str) -> list[str]:
+    return [sentence.strip() for sentence in sentence_pattern.split(text) if sentence.strip()]
+
+
+def terms(text: str) -> set[str]:
+    return {word for word in word_pattern.findall(text.lower()) if word not in STOP_WORDS}
+
+
+def shingles(text: str, size: int = 3) -> set[tuple[str, ...]]:
+    words = word_pattern.findall(text.lower())
+    if len(words) <= size:
+        return {tuple(words)}
+    return {tuple(words[i : i + size]) for i in range(len(words) - size + 1)}
+
+
+def similarity(a: set, b: set) -> float:
+    """The Jaccard similarity of two sets."""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class ContextPacker:
+    """Packs the documents retrieved for a query into a token budget for the prompts.
+
+    Near-identical documents, like the same section on several pages, are dropped. Documents are
+    then given an equal share of the budget in the order they were retrieved, with the share left
+    unused by a document going to the next ones. A document over its share is trimmed to its
+    sentences sharing the most words with the query, kept in their original order.
+
+    Init args:
+        max_tokens: The token budget of the packed documents.
+        duplicate_threshold: The similarity of the word shingles of two documents from which the
+            later one is dropped.
+    """
+
+    def __init__(self, max_tokens: int = 1500, duplicate_threshold: float = 0.8) -> None:
+        self.max_tokens = max_tokens
+        self.duplicate_threshold = duplicate_threshold
+        self.requests = 0
+        self.duplicates = 0
+        self.tokens_retrieved = 0
+        self.tokens_packed = 0
+        self._lock = threading.Lock()
+
+    def _deduplicate(self, documents: list[Document]) -> list[Document]:
+        unique: list[tuple[Document, set]] = []
+        for document in documents:
+            document_shingles = shingles(document.page_content)
+            if any(
+                similarity(document_shingles, other) >= self.duplicate_threshold
+                for _, other in unique
+            ):
+                continue
+            unique.append((document, document_shingles))
+        return [document for document, _ in unique]
+
+    def _trim(self, query_terms: set[str], text: str, max_tokens: int) -> str:
+        sentences = split_sentences(text)
+        scores = [len(query_terms & terms(sentence)) for sentence in sentences]
+        # Most relevant first, earlier sentences first among equally relevant ones. Sentences
+        # unrelated to the query are only kept when none is related, eg. for the intro.
+        ranked = sorted(range(len(sentences)), key=lambda i: (-scores[i], i))
+        if any(scores):
+            ranked = [i for i in ranked if scores[i]]
+        kept = []
+        tokens = 0
+        for i in ranked:
+            sentence_tokens = count_tokens(sentences[i])
+            if tokens + sentence_tokens > max_tokens:
+                continue
+            kept.append(i)
+            tokens += sentence_tokens
+        return " ".join(sentences[i] for i in sorted(kept))
+
+    def pack(self, query: str, documents: list[Document]) -> list[Document]:
+        """Pack the documents retrieved for the query into the token budget.
+
+        Returns:
+            list[Document]: The packed documents, with the metadata of the retrieved ones.
+        """
+        tokens_retrieved = sum(count_tokens(document.page_content) for document in documents)
+        unique = self._deduplicate(documents)
+        query_terms = terms(query)
+
+        packed = []
+        remaining = self.max_tokens
+        for i, document in enumerate(unique):
+            share = remaining // (len(unique) - i)
+            text = document.page_content
+            tokens = count_tokens(text)
+            if tokens > share:
+                text = self._trim(query_terms, text, share)
+                tokens = count_tokens(text)
+            if not text:
+                continue
+            remaining -= tokens
+            packed.append(Document(text, id=document.id, metadata=document.metadata))
+
+        tokens_packed = self.max_tokens - remaining
+        if tokens_retrieved > tokens_packed:
+            logger.info(
+                f"Packed {len(documents)} documents from {tokens_retrieved} to {tokens_packed} "
+                f"tokens, saving {tokens_retrieved - tokens_packed} tokens"
+            )
+        with self._lock:
+            self.requests += 1
+            self.duplicates += len(documents) - len(unique)
+            self.tokens_retrieved += tokens_retrieved
+            self.tokens_packed += tokens_packed
+        return packed
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            saved = self.tokens_retrieved - self.tokens_packed
+            return {
+                "max_tokens": self.max_tokens,
+                "requests": self.requests,
+                "duplicates": self.duplicates,
+                "tokens_retrieved": self.tokens_retrieved,
+                "tokens_packed": self.tokens_packed,
+                "tokens_saved": saved,
+                "saved_ratio": saved / self.tokens_retrieved if self.tokens_retrieved else 0.0,
+            }
@@ -0,0 +1,151 @@
+import re
+import threading
+from typing import Any, Sequence
+
+from langchain_core.messages import BaseMessage
+
+from app.metrics import LatencyRecorder
+
+POLICIES = ["always", "heuristic", "speculative"]
+
+# Words that refer back to something said earlier in the conversation
+REFERENCE_WORDS = {
+    "it",
+    "its",
+    "itself",
+    "they",
+    "them",
+    "their",
+    "theirs",
+    "this",
+    "that",
+    "these",
+    "those",
+    "he",
+    "him",
+    "his",
+    "she",
+    "her",
+    "hers",
+    "there",
+    "one",
+    "ones",
+    "same",
+    "former",
+    "latter",
+    "above",
+    "previous",
+    "earlier",
+    "option",
+    "options",
+    "other",
+    "another",
+    "else",
+    "more",
+    "also",
+    "too",
+    "instead",
+    "which",
+}
+# Openings of follow ups, like "and the price?" or "what about shipping?"
+FOLLOW_UP_PATTERN = re.compile(r"^(and|but|so|or|then|what about|how about)\b", re.IGNORECASE)
+# Picking a multiple choice option, like "B", "c)" or "Lets go with D". A lone "A" followed by a
+# word is taken for the article.
+OPTION_PATTERN = re.compile(r"(?<![\w'])(?:[B-Db-d]|A(?!\s+[a-z]))(?:\)|\.|,|!|\?|\s|$)")
+
+
+def is_same_question(question: str, input: str) -> bool:
+    """Whether the contextualized question is the input, ignoring case and punctuation."""
+
+    def normalize(text: str) -> str:
+        return re.sub(r"\W+", " ", text).strip().lower()
+
+    return normalize(question) == normalize(input)
+
+
+def references_conversation(input: str, min_words: int = 4) -> bool:
+    """Whether the input may refer to the conversation, so it needs to be rewritten.
+
+    Errs on the side of rewriting: inputs shorter than min_words, picking an option, opening like
+    a follow up or containing a reference word are all rewritten.
+    """
+    words = re.findall(r"[\w']+", input.lower())
+    if len(words) < min_words:
+        return True
+    if FOLLOW_UP_PATTERN.match(input.strip()) or OPTION_PATTERN.search(input):
+        return True
+    return any(word in REFERENCE_WORDS for word in words)
+
+
+class ContextualizationPolicy:
+    """Decides whether the input of a conversation is rewritten into a standalone question.
+
+    Rewriting is an LLM call before the retrieval of every answer, so the "heuristic" and
+    "speculative" policies skip it for inputs that do not appear to refer to the conversation.
+    The "speculative" policy also retrieves with the input while it is rewritten, and uses that
+    context if the rewrite returns the input unchanged. The "always" policy rewrites every input
+    of a conversation that has a history.
+
+    Init args:
+        policy: One of always, heuristic or speculative.
+        min_words: Inputs with fewer words are always rewritten.
+    """
+
+    def __init__(self, policy: str = "heuristic", min_words: int = 4) -> None:
+        if policy not in POLICIES:
+            raise ValueError(f"Valid contextualization policies are {', '.join(POLICIES)}")
+        self.policy = policy
+        self.min_words = min_words
+        self.skipped = 0
+        self.rewritten = 0
+        self.unchanged = 0
+        self.speculative_hits = 0
+        self.speculative_misses = 0
+        self.rewrite_latency = LatencyRecorder()
+        self._lock = threading.Lock()
+
+    @property
+    def speculative(self) -> bool:
+        """Whether to retrieve with the input while it is rewritten."""
+        return self.policy == "speculative"
+
+    def should_rewrite(self, input: str, chat_history: Sequence[BaseMessage]) -> bool:
+        """Whether to rewrite the input with the chat history before retrieving."""
+        if not chat_history:
+            return False
+        if self.policy == "always" or references_conversation(input, self.min_words):
+            return True
+        with self._lock:
+            self.skipped += 1
+        return False
+
+    def record_rewrite(self, input: str, question: str, seconds: float) -> None:
+        """Record a rewrite of the input into the question, which took seconds."""
+        self.rewrite_latency.record(seconds)
+        with self._lock:
+            self.rewritten += 1
+            if is_same_question(question, input):
+                self.unchanged += 1
+
+    def record_speculation(self, hit: bool) -> None:
+        """Record whether the context retrieved with the input was used."""
+        with self._lock:
+            if hit:
+                self.speculative_hits += 1
+            else:
+                self.speculative_misses += 1
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            decisions = self.skipped + self.rewritten
+            return {
+                "policy": self.policy,
+                "skipped": self.skipped,
+                "rewritten": self.rewritten,
+                # Rewrites that returned the input, so could have been skipped
+                "unchanged": self.unchanged,
+                "skip_ratio": self.skipped / decisions if decisions else 0.0,
+                "speculative_hits": self.speculative_hits,
+                "speculative_misses": self.speculative_misses,
+                "rewrite": self.rewrite_latency.stats(),
+            }
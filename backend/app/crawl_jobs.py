@@ -0,0 +1,129 @@
+import datetime
+import logging
+from typing import Optional
+
+from peewee import IntegrityError, fn
+
+from app.db.schema import CrawlJob, CrawlJobStatus, db_proxy
+
+logger = logging.getLogger(__name__)
+
+active_statuses = [CrawlJobStatus.PENDING, CrawlJobStatus.RUNNING]
+
+
+def get_crawl_job(job_id: int) -> Optional[CrawlJob]:
+    return CrawlJob.get_or_none(CrawlJob.id == job_id)
+
+
+def get_active_crawl_job(hostname: str) -> Optional[CrawlJob]:
+    """Get the pending or running crawl job of a hostname."""
+    return CrawlJob.get_or_none(
+        (CrawlJob.hostname == hostname) & (CrawlJob.status.in_(active_statuses))
+    )
+
+
+def enqueue_crawl_job(hostname: str, url: str, max_depth: Optional[int]) -> CrawlJob:
+    """Enqueue a crawl job unless the hostname already has a pending or running one.
+
+    Args:
+        hostname: The hostname of the website.
+        url: The normalized url to start crawling from.
+        max_depth: Optional number for the max depth for recursively loading webpages.
+
+    Returns:
+        CrawlJob: The new job or the already active job of the hostname.
+    """
+    active_job = get_active_crawl_job(hostname)
+    if active_job is not None:
+        return active_job
+
+    try:
+        with db_proxy.atomic():
+            return CrawlJob.create(hostname=hostname, url=url, max_depth=max_depth)
+    except IntegrityError:
+        # A concurrent request enqueued the same hostname first
+        return get_active_crawl_job(hostname)
+
+
+def claim_next_crawl_job(job_timeout: int) -> Optional[CrawlJob]:
+    """Claim the oldest pending job, or a running job whose worker stopped sending heartbeats.
+
+    Rows are locked with SKIP LOCKED so concurrent workers never claim the same job.
+
+    Args:
+        job_timeout: Seconds without a heartbeat after which a running job is considered abandoned.
+    """
+    now = datetime.datetime.now()
+    abandoned_before = now - datetime.timedelta(seconds=job_timeout)
+    with db_proxy.atomic():
+        job = (
+            CrawlJob.select()
+            .where(
+                (CrawlJob.status == CrawlJobStatus.PENDING)
+                | (
+                    (CrawlJob.status == CrawlJobStatus.RUNNING)
+                    & (fn.COALESCE(CrawlJob.heartbeat_at, CrawlJob.started_at) < abandoned_before)
+                )
+            )
+            .order_by(CrawlJob.created_at)
+            .limit(1)
+            .for_update("FOR UPDATE SKIP LOCKED")
+            .first()
+        )
+        if job is None:
+            return None
+
+        if job.status == CrawlJobStatus.RUNNING:
+            logger.warning(f"Reclaiming abandoned crawl job {job.id} for {job.hostname}")
+        job.status = CrawlJobStatus.RUNNING
+        job.started_at = now
+        job.heartbeat_at = now
+        job.save()
+        return job
+
+
+def heartbeat_crawl_job(job: CrawlJob) -> bool:
+    """Record that the worker running a job is alive.
+
+    Returns:
+        bool: False if the job is no longer running, ie. it was finished or reclaimed.
+    """
+    now = datetime.datetime.now()
+    updated = (
+        CrawlJob.update(heartbeat_at=now)
+        .where(
+            (CrawlJob.id == job.id)
+            & (CrawlJob.status == CrawlJobStatus.RUNNING)
+            & (CrawlJob.started_at == job.started_at)
+        )
+        .execute()
+    )
+    return updated > 0
+
+
+def finish_crawl_job(job: CrawlJob, error: Optional[str] = None) -> bool:
+    """Mark a job as done, or as failed when an error is given.
+
+    Jobs reclaimed by another worker are left to it.
+
+    Returns:
+        bool: False if the job is no longer running under this claim, ie. it was reclaimed.
+    """
+    status = CrawlJobStatus.FAILED if error else CrawlJobStatus.DONE
+    finished_at = datetime.datetime.now()
+    updated = (
+        CrawlJob.update(status=status, error=error, finished_at=finished_at)
+        .where(
+            (CrawlJob.id == job.id)
+            & (CrawlJob.status == CrawlJobStatus.RUNNING)
+            & (CrawlJob.started_at == job.started_at)
+        )
+        .execute()
+    )
+    if not updated:
+        logger.warning(f"Crawl job {job.id} was reclaimed by another worker, not finishing it")
+        return False
+    job.status = status
+    job.error = error
+    job.finished_at = finished_at
+    return True
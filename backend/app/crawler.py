@@ -0,0 +1,415 @@
+import asyncio
+import datetime
+import html as html_lib
+import itertools
+import logging
+import math
+import time
+from typing import AsyncIterator, Mapping, Optional, Sequence
+from urllib.parse import urljoin
+from urllib.robotparser import RobotFileParser
+
+import aiohttp
+from langchain_core.utils.html import extract_sub_links
+
+from app.dedup import canonicalize_url
+from app.discovery import SitemapReader, SitemapUrl, discover_urls, fetch_robots
+from app.frontier import Frontier, UrlScorer, extract_anchor_texts
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = "RagAiChatbot"
+# Bytes read from a response at a time
+CHUNK_SIZE = 64 * 1024
+
+
+class PageValidators:
+    """What a previous crawl learned about a page, to only download it again if it changed.
+
+    Init args:
+        etag: The ETag header of the page, sent as If-None-Match.
+        last_modified: The Last-Modified header of the page, sent as If-Modified-Since.
+        links: The links of the page, followed when it was not modified.
+    """
+
+    def __init__(
+        self, etag: Optional[str], last_modified: Optional[str], links: Sequence[str] = ()
+    ) -> None:
+        self.etag = etag
+        self.last_modified = last_modified
+        self.links = links
+
+
+class CrawledPage:
+    """A fetched HTML page.
+
+    Init args:
+        url: The url of the page.
+        html: The raw html of the page, empty when it was not modified.
+        content_type: The Content-Type header of the response.
+        depth: The number of links followed from the start url to reach the page.
+        etag: The ETag header of the response.
+        last_modified: The Last-Modified header of the response.
+        not_modified: Whether the server answered 304 Not Modified to a conditional request.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        html: str,
+        content_type: str,
+        depth: int,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+        not_modified: bool = False,
+    ) -> None:
+        self.url = url
+        self.html = html
+        self.content_type = content_type
+        self.depth = depth
+        self.etag = etag
+        self.last_modified = last_modified
+        self.not_modified = not_modified
+        # The links of the page within the website
+        self.links: Sequence[str] = ()
+
+
+class AsyncCrawler:
+    """Concurrent crawler for a single website.
+
+    Pages are fetched by a fixed number of tasks sharing one keep-alive aiohttp session and
+    are yielded as soon as they arrive, so indexing can start before the crawl finishes.
+
+    Init args:
+        base_url: Only links starting with the base url are followed.
+        max_depth: The max depth for recursively loading webpages. 1 only loads the start url.
+        exclude_dirs: Url prefixes that are never fetched.
+        concurrency_per_host: The number of requests in flight at the same time.
+        max_pages: The max number of pages to fetch.
+        max_bytes: The max number of response bytes to download.
+        max_frontier: The max number of urls waiting to be fetched. When full, the urls of the
+            lowest score are dropped.
+        timeout: The timeout of each request in seconds.
+        session: Optional session to reuse connections across crawls.
+        validators: Optional validators of the pages of a previous crawl by url. Their pages are
+            requested conditionally and yielded without html when they were not modified.
+        user_agent: The User-Agent of the requests and of the robots.txt rules applied.
+        respect_robots: Whether to skip the urls robots.txt disallows and wait its Crawl-delay
+            between requests.
+        crawl_delay: The min seconds between requests. A longer robots.txt Crawl-delay is used up
+            to max_crawl_delay.
+        max_crawl_delay: The max seconds between requests, whatever robots.txt asks.
+        use_sitemaps: Whether to also fetch the urls of the sitemaps of robots.txt, or of
+            /sitemap.xml, most recently modified first, as if the start url linked to them.
+        modified_since: Optional time of the previous crawl, sitemap urls last modified before
+            it are not fetched.
+        scorer: Optional scorer of the urls, fetched best first unless excluded by its rules.
+            Without it, urls are fetched breadth first.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        max_depth: Optional[int] = 2,
+        exclude_dirs: Sequence[str] = (),
+        concurrency_per_host: int = 4,
+        max_pages: int = 500,
+        max_bytes: int = 50_000_000,
+        max_frontier: int = 10_000,
+        timeout: float = 10,
+        session: Optional[aiohttp.ClientSession] = None,
+        validators: Optional[Mapping[str, PageValidators]] = None,
+        user_agent: str = USER_AGENT,
+        respect_robots: bool = False,
+        crawl_delay: float = 0,
+        max_crawl_delay: float = 10,
+        use_sitemaps: bool = False,
+        modified_since: Optional[datetime.datetime] = None,
+        scorer: Optional[UrlScorer] = None,
+    ) -> None:
+        self.base_url = base_url
+        self.max_depth = max_depth if max_depth is not None else 2
+        self.exclude_dirs = exclude_dirs
+        self.concurrency_per_host = concurrency_per_host
+        self.max_pages = max_pages
+        self.max_bytes = max_bytes
+        self.max_frontier = max_frontier
+        self.timeout = timeout
+        self.session = session
+        self.validators = validators or {}
+        self.user_agent = user_agent
+        self.respect_robots = respect_robots
+        self.crawl_delay = crawl_delay
+        self.max_crawl_delay = max_crawl_delay
+        self.use_sitemaps = use_sitemaps
+        self.modified_since = modified_since
+        self.scorer = scorer
+        self.robots: Optional[RobotFileParser] = None
+
+        self.pages_fetched = 0
+        self.pages_not_modified = 0
+        self.bytes_fetched = 0
+        self.urls_dropped = 0
+        self.urls_disallowed = 0
+        self.sitemap_urls = 0
+        self.urls_excluded = 0
+        self._sequence = itertools.count()
+        self._next_request_at = 0.0
+        self._throttle_lock: Optional[asyncio.Lock] = None
+
+    def create_session(self) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=self.concurrency_per_host,
+            limit_per_host=self.concurrency_per_host,
+            keepalive_timeout=30,
+        )
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            headers={"User-Agent": self.user_agent},
+        )
+
+    def _is_budget_exhausted(self) -> bool:
+        return self.pages_fetched >= self.max_pages or self.bytes_fetched >= self.max_bytes
+
+    async def _throttle(self) -> None:
+        """Wait until crawl_delay seconds have passed since the previous request."""
+        if not self.crawl_delay:
+            return
+        async with self._throttle_lock:
+            wait = self._next_request_at - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._next_request_at = time.monotonic() + self.crawl_delay
+
+    async def _fetch(
+        self, session: aiohttp.ClientSession, url: str, depth: int
+    ) -> Optional[CrawledPage]:
+        validators = self.validators.get(url)
+        headers = {}
+        if validators is not None:
+            if validators.etag:
+                headers["If-None-Match"] = validators.etag
+            if validators.last_modified:
+                headers["If-Modified-Since"] = validators.last_modified
+        await self._throttle()
+        try:
+            async with session.get(url, headers=headers) as response:
+                body = await self._read(response)
+                if body is None:
+                    logger.warning(f"Skipping {url}, the byte budget of the crawl is spent")
+                    return None
+                etag = response.headers.get("ETag")
+                last_modified = response.headers.get("Last-Modified")
+                if response.status == 304 and validators is not None:
+                    self.pages_not_modified += 1
+                    page = CrawledPage(
+                        url,
+                        "",
+                        "",
+                        depth,
+                        etag=etag or validators.etag,
+                        last_modified=last_modified or validators.last_modified,
+                        not_modified=True,
+                    )
+                    page.links = validators.links
+                    return page
+                if response.status >= 400:
+                    logger.debug(f"Skipping {url}, status {response.status}")
+                    return None
+                content_type = response.headers.get("Content-Type", "")
+                if "html" not in content_type:
+                    return None
+                html = body.decode(response.charset or "utf-8", errors="replace")
+                return CrawledPage(url, html, content_type, depth, etag, last_modified)
+        except (aiohttp.ClientError, asyncio.TimeoutError, LookupError) as e:
+            logger.warning(f"Unable to load {url}: {e!r}")
+            return None
+
+    async def _read(self, response: aiohttp.ClientResponse) -> Optional[bytes]:
+        """Read the body of a response, or None if the byte budget ran out before its end."""
+        body = bytearray()
+        while True:
+            remaining = self.max_bytes - self.bytes_fetched
+            if remaining <= 0:
+                # A single large response stops at the budget rather than going past it
+                return bytes(body) if response.content.at_eof() else None
+            chunk = await response.content.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                return bytes(body)
+            self.bytes_fetched += len(chunk)
+            body.extend(chunk)
+
+    def _is_excluded(self, url: str, depth: int) -> bool:
+        # The start url is always fetched
+        return self.scorer is not None and depth > 0 and not self.scorer.allows(url)
+
+    def _enqueue(
+        self,
+        frontier: Frontier,
+        seen: set[str],
+        url: str,
+        depth: int,
+        anchor_text: str = "",
+        sitemap_priority: Optional[float] = None,
+    ) -> None:
+        # Variants of a url differing by tracking parameters or query order are fetched once.
+        # Links are extracted from the html as is, with their &amp; entities.
+        url = canonicalize_url(html_lib.unescape(url))
+        if url in seen:
+            return
+        seen.add(url)
+        if self.robots is not None and not self.robots.can_fetch(self.user_agent, url):
+            self.urls_disallowed += 1
+            return
+        if self._is_excluded(url, depth):
+            self.urls_excluded += 1
+            return
+        # Urls of the same score are fetched in the order they were found, so without a scorer
+        # the crawl is breadth first
+        score = 0.0
+        if depth == 0:
+            score = math.inf
+        elif self.scorer is not None:
+            score = self.scorer.score(url, depth, anchor_text, sitemap_priority)
+        dropped = frontier.put_or_replace((-score, next(self._sequence), url, depth))
+        if dropped is not None:
+            self.urls_dropped += 1
+            # Queued again if linked once the frontier has room
+            seen.discard(dropped[2])
+
+    async def _work(
+        self,
+        session: aiohttp.ClientSession,
+        frontier: Frontier,
+        pages: asyncio.Queue,
+        seen: set[str],
+    ) -> None:
+        while True:
+            _, _, url, depth = await frontier.get()
+            try:
+                if self._is_budget_exhausted():
+                    continue
+                # The rules may have changed with the platform detected on the start page
+                if self._is_excluded(url, depth):
+                    self.urls_excluded += 1
+                    continue
+                self.pages_fetched += 1
+                page = await self._fetch(session, url, depth)
+                if page is None:
+                    continue
+
+                anchor_texts = {}
+                if not page.not_modified and self.scorer is not None:
+                    if depth == 0:
+                        self.scorer.detect_platform(page.html)
+                    anchor_texts = extract_anchor_texts(page.html, url)
+                if not page.not_modified:
+                    # Kept with the page so a later crawl can follow them if it is not modified
+                    page.links = extract_sub_links(
+                        page.html,
+                        url,
+                        base_url=self.base_url,
+                        prevent_outside=True,
+                        exclude_prefixes=self.exclude_dirs,
+                        continue_on_failure=True,
+                    )
+                if depth + 1 < self.max_depth:
+                    for link in page.links:
+                        self._enqueue(frontier, seen, link, depth + 1, anchor_texts.get(link, ""))
+
+                await pages.put(page)
+            except Exception as e:
+                # A worker that died would leave the frontier unfinished and the crawl waiting
+                logger.warning(f"Unable to crawl {url}: {e!r}")
+            finally:
+                frontier.task_done()
+
+    async def _discover(self, session: aiohttp.ClientSession) -> list[SitemapUrl]:
+        """Load the robots.txt rules and the urls of the sitemaps, as configured.
+
+        Returns:
+            list[SitemapUrl]: The sitemap urls to crawl, most recently modified first.
+        """
+        if self.respect_robots:
+            self.robots, robots_bytes = await fetch_robots(session, self.base_url)
+            self.bytes_fetched += robots_bytes
+            robots_delay = self.robots.crawl_delay(self.user_agent)
+            if robots_delay:
+                if float(robots_delay) > self.max_crawl_delay:
+                    logger.warning(
+                        f"{self.base_url} asks for a Crawl-delay of {robots_delay}s, "
+                        f"waiting {self.max_crawl_delay}s instead"
+                    )
+                self.crawl_delay = max(
+                    self.crawl_delay, min(float(robots_delay), self.max_crawl_delay)
+                )
+        # A max depth of 1 only loads the start url
+        if not self.use_sitemaps or self.max_depth < 2:
+            return []
+
+        sitemaps = self.robots.site_maps() if self.robots is not None else None
+        sitemap_urls = [urljoin(self.base_url + "/", sitemap) for sitemap in sitemaps or []]
+        reader = SitemapReader(session, self.base_url)
+        seeds = await discover_urls(
+            reader,
+            sitemap_urls or [f"{self.base_url}/sitemap.xml"],
+            self.robots,
+            self.user_agent,
+            self.max_pages,
+            self.modified_since,
+        )
+        self.bytes_fetched += reader.bytes_fetched
+        self.sitemap_urls = len(seeds)
+        logger.debug(
+            f"Discovered {len(seeds)} urls in {reader.sitemaps_fetched} sitemaps of {self.base_url}"
+        )
+        return seeds
+
+    async def crawl(self, url: str) -> AsyncIterator[CrawledPage]:
+        """Crawl a website, yielding pages as they are fetched.
+
+        Args:
+            url: The url to start crawling from.
+        """
+        frontier = Frontier(maxsize=self.max_frontier)
+        pages: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency_per_host * 2)
+        seen: set[str] = set()
+        self._throttle_lock = asyncio.Lock()
+
+        session = self.session or self.create_session()
+        try:
+            seeds = await self._discover(session)
+        except BaseException:
+            if self.session is None:
+                await session.close()
+            raise
+        self._enqueue(frontier, seen, url, 0)
+        # Sitemap urls are crawled as if the start url linked to them
+        for seed in seeds:
+            if not seed.url.startswith(tuple(self.exclude_dirs)):
+                self._enqueue(frontier, seen, seed.url, 1, sitemap_priority=seed.priority)
+
+        workers = [
+            asyncio.create_task(self._work(session, frontier, pages, seen))
+            for _ in range(self.concurrency_per_host)
+        ]
+
+        async def finish() -> None:
+            await frontier.join()
+            await pages.put(None)
+
+        finisher = asyncio.create_task(finish())
+        try:
+            while (page := await pages.get()) is not None:
+                yield page
+        finally:
+            finisher.cancel()
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(finisher, *workers, return_exceptions=True)
+            if self.session is None:
+                await session.close()
+
+        if self.urls_dropped:
+            logger.warning(f"Crawl frontier was full, dropped {self.urls_dropped} urls")
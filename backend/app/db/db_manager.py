@@ -6,6 +6,7 @@ import redis
 from langchain.indexes import SQLRecordManager
 from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
 from peewee import PostgresqlDatabase
+from playhouse.migrate import PostgresqlMigrator, migrate
 from psycopg2 import sql
 
 from app.config import (
@@ -14,10 +15,12 @@ from app.config import (
     get_psql_url,
     get_redis_url,
 )
-from app.db.schema import WebSite, db_proxy
+from app.db.schema import CrawlJob, IngestItem, PageFetchState, WebSite, db_proxy
 
 logger = logging.getLogger(__name__)
 
+peewee_models = [WebSite, CrawlJob, PageFetchState, IngestItem]
+
 
 def _executeAdminCmd(sql: str, vars: Sequence[Any] | Mapping[str, Any] | None = None) -> None:
     psql_admin_config = get_psql_admin_config()
@@ -79,7 +82,8 @@ class DbManager:
         if not db.is_connection_usable:
             db.connect()
         # peewee
-        db.create_tables([WebSite])
+        db.create_tables(peewee_models)
+        self.migrate_peewee_tables()
         # documentloader/index
         record_manager = SQLRecordManager("namespace", db_url=self.psql_db_url)
         record_manager.create_schema()
@@ -87,12 +91,28 @@ class DbManager:
         async with AsyncPostgresSaver.from_conn_string(self.psql_db_url) as checkpointer:
             await checkpointer.setup()
 
+    def migrate_peewee_tables(self) -> None:
+        """Add columns that were added to the peewee models after their tables were created"""
+        db = self.db
+        migrator = PostgresqlMigrator(db)
+        for model in peewee_models:
+            table_name = model._meta.table_name
+            existing_columns = {column.name for column in db.get_columns(table_name)}
+            operations = [
+                migrator.add_column(table_name, field.column_name, field)
+                for field in model._meta.sorted_fields
+                if field.column_name not in existing_columns
+            ]
+            if operations:
+                migrate(*operations)
+                logger.info(f"Migrated {table_name} table")
+
     def recreate_peewee_tables(self) -> None:
         db = self.db
         if not db.is_connection_usable:
             db.connect()
-        db.drop_tables([WebSite])
-        db.create_tables([WebSite])
+        db.drop_tables(peewee_models)
+        db.create_tables(peewee_models)
         db.close()
 
     async def reset_dbs(self) -> None:
@@ -104,6 +124,9 @@ class DbManager:
             db.connect()
 
         WebSite.delete().execute()
+        CrawlJob.delete().execute()
+        PageFetchState.delete().execute()
+        IngestItem.delete().execute()
 
         if db.is_connection_usable:
             db.close()
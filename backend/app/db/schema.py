@@ -1,4 +1,16 @@
-from peewee import CharField, Model, Proxy
+import datetime
+
+from peewee import (
+    SQL,
+    BigIntegerField,
+    CharField,
+    DateTimeField,
+    FloatField,
+    IntegerField,
+    Model,
+    Proxy,
+    TextField,
+)
 
 db_proxy = Proxy()
 
@@ -12,3 +24,100 @@ class BaseModel(Model):
 class WebSite(BaseModel):
     hostname = CharField(unique=True)
     base_url = CharField(unique=True)
+    last_crawled_at = DateTimeField(null=True)
+    # Hash of the indexed pages, changes whenever the site content changes
+    content_fingerprint = CharField(null=True)
+    # Per-hostname override of CRAWL_TTL in seconds
+    ttl = IntegerField(null=True)
+    # The platform detected by the first crawl, which picks the crawl rules of the next ones
+    platform = CharField(null=True)
+
+
+# What the last crawl of a page fetched, to only download and index it again if it changed
+class PageFetchState(BaseModel):
+    hostname = CharField(index=True)
+    url = TextField(unique=True)
+    etag = CharField(null=True)
+    last_modified = CharField(null=True)
+    # Hash of the extracted text of the page, or of the canonical page it is indexed under
+    content_hash = CharField(null=True)
+    # Newline separated links of the page, followed when it was not modified
+    links = TextField(null=True)
+    # Hex SimHash of the extracted text, to find the near duplicates of the page
+    simhash = CharField(null=True)
+    # The canonical page or near duplicate this page is a variant of, its text is not indexed
+    # under its own url
+    duplicate_of = TextField(null=True)
+    fetched_at = DateTimeField(default=datetime.datetime.now)
+
+    class Meta:
+        table_name = "page_fetch_states"
+
+
+class CrawlJobStatus:
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class CrawlJob(BaseModel):
+    hostname = CharField(index=True)
+    url = CharField()
+    max_depth = IntegerField(null=True)
+    status = CharField(default=CrawlJobStatus.PENDING)
+    error = TextField(null=True)
+    created_at = DateTimeField(default=datetime.datetime.now)
+    started_at = DateTimeField(null=True)
+    heartbeat_at = DateTimeField(null=True)
+    finished_at = DateTimeField(null=True)
+
+    class Meta:
+        table_name = "crawl_jobs"
+
+    def toDict(self) -> dict[str, object]:
+        return {
+            "id": self.id,
+            "hostname": self.hostname,
+            "status": self.status,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "heartbeat_at": self.heartbeat_at,
+            "finished_at": self.finished_at,
+        }
+
+
+# Only one pending or running job per hostname
+CrawlJob.add_index(
+    SQL(
+        "CREATE UNIQUE INDEX IF NOT EXISTS crawl_jobs_active_hostname ON crawl_jobs (hostname) "
+        f"WHERE status IN ('{CrawlJobStatus.PENDING}', '{CrawlJobStatus.RUNNING}')"
+    )
+)
+
+
+class IngestStatus:
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    # Crawled within its TTL, so not crawled again
+    FRESH = "fresh"
+    FAILED = "failed"
+
+
+# A url of a `python -m app.ingest` run, checkpointed so a killed run resumes where it stopped
+class IngestItem(BaseModel):
+    run = CharField()
+    url = TextField()
+    hostname = CharField(null=True)
+    status = CharField(default=IngestStatus.PENDING)
+    error = TextField(null=True)
+    pages = IntegerField(default=0)
+    bytes_fetched = BigIntegerField(default=0)
+    seconds = FloatField(null=True)
+    finished_at = DateTimeField(null=True)
+
+    class Meta:
+        table_name = "ingest_items"
+        indexes = ((("run", "url"), True),)
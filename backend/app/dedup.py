@@ -0,0 +1,167 @@
+import hashlib
+import re
+import threading
+from typing import Any, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import numpy as np
+
+# Query parameters of ad, email and analytics campaigns, which never change the page
+TRACKING_PARAMS = {
+    "gclid", "gbraid", "wbraid", "dclid", "fbclid", "msclkid", "yclid", "igshid", "twclid",
+    "mc_cid", "mc_eid", "_ga", "_gl", "_hsenc", "_hsmi", "mkt_tok", "srsltid", "_pos", "_sid",
+    "_ss", "_psq", "_fid",
+}  # fmt: skip
+TRACKING_PREFIXES = ("utm_", "pk_", "hsa_")
+DEFAULT_PORTS = {"http": ":80", "https": ":443"}
+
+FINGERPRINT_BITS = 64
+SHINGLE_SIZE = 3
+# Pages of fewer shingles are too short to tell near duplicates from distinct pages
+MIN_SHINGLES = 8
+
+_word_re = re.compile(r"\w+")
+
+
+def canonicalize_url(url: str) -> str:
+    """The canonical form of a url, so the variants of a page are crawled once.
+
+    The scheme and host are lowercased, default ports, fragments and tracking parameters are
+    dropped, and the query parameters are sorted.
+    """
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if scheme in DEFAULT_PORTS and netloc.endswith(DEFAULT_PORTS[scheme]):
+        netloc = netloc[: -len(DEFAULT_PORTS[scheme])]
+    query = sorted(
+        (name, value)
+        for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if name.lower() not in TRACKING_PARAMS and not name.lower().startswith(TRACKING_PREFIXES)
+    )
+    return urlunsplit((scheme, netloc, parts.path, urlencode(query), ""))
+
+
+def resolve_canonical(url: str, canonical: Optional[str], base_url: str) -> str:
+    """The url a page is indexed under, its rel=canonical url when it can be trusted.
+
+    Canonical urls of other websites are ignored, and so are pages declaring the home page as
+    their canonical url, a common misconfiguration of themes.
+    """
+    if not canonical:
+        return url
+    canonical = canonicalize_url(canonical)
+    if canonical != base_url and not canonical.startswith(f"{base_url}/"):
+        return url
+    if urlsplit(canonical).path in ["", "/"] and urlsplit(url).path not in ["", "/"]:
+        return url
+    return canonical
+
+
+def simhash(text: str) -> Optional[int]:
+    """The 64 bit SimHash of the word shingles of a text, None for texts too short to compare.
+
+    Texts differing by a few words have fingerprints differing by a few bits.
+    """
+    words = _word_re.findall(text.lower())
+    shingles = {" ".join(words[i : i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+    if len(shingles) < MIN_SHINGLES:
+        return None
+    hashes = np.array(
+        [
+            int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "little")
+            for shingle in shingles
+        ],
+        dtype="<u8",
+    )
+    # The bits of every hash, least significant first
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+    majority = bits.sum(axis=0) * 2 > len(shingles)
+    return int.from_bytes(np.packbits(majority, bitorder="little").tobytes(), "little")
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class NearDuplicateIndex:
+    """Finds the pages whose SimHash fingerprints differ from a fingerprint by a few bits.
+
+    Fingerprints are split into max_distance + 1 bands, two fingerprints within max_distance
+    bits have at least one band in common, so only the pages sharing a band are compared.
+
+    Init args:
+        max_distance: The max number of bits near duplicate fingerprints differ by.
+    """
+
+    def __init__(self, max_distance: int = 3) -> None:
+        self.max_distance = max_distance
+        num_bands = max_distance + 1
+        bounds = [FINGERPRINT_BITS * i // num_bands for i in range(num_bands + 1)]
+        self._bands = [(start, (1 << (end - start)) - 1) for start, end in zip(bounds, bounds[1:])]
+        self.fingerprints: dict[str, int] = {}
+        self._buckets: list[dict[int, set[str]]] = [{} for _ in self._bands]
+
+    def _keys(self, fingerprint: int) -> list[int]:
+        return [(fingerprint >> start) & mask for start, mask in self._bands]
+
+    def add(self, source: str, fingerprint: int) -> None:
+        """Add the fingerprint of a page, replacing its previous one."""
+        self.fingerprints[source] = fingerprint
+        for buckets, key in zip(self._buckets, self._keys(fingerprint)):
+            buckets.setdefault(key, set()).add(source)
+
+    def find(self, fingerprint: int, exclude: Optional[str] = None) -> Optional[str]:
+        """The page whose fingerprint is the closest to the fingerprint, if any is near enough.
+
+        Args:
+            fingerprint: The fingerprint to look up.
+            exclude: The page to leave out, usually the page of the fingerprint.
+        """
+        best: Optional[tuple[int, str]] = None
+        for buckets, key in zip(self._buckets, self._keys(fingerprint)):
+            for source in buckets.get(key, ()):
+                if source == exclude:
+                    continue
+                # Buckets keep the pages whose fingerprint was replaced since
+                distance = hamming_distance(self.fingerprints[source], fingerprint)
+                if distance <= self.max_distance and (best is None or (distance, source) < best):
+                    best = (distance, source)
+        return best[1] if best else None
+
+
+class DeduplicationStats:
+    """Counts the duplicate pages found by crawls and the embeddings they did not need."""
+
+    def __init__(self) -> None:
+        self.crawls = 0
+        self.pages = 0
+        self.near_duplicates = 0
+        self.canonical_duplicates = 0
+        self.embeddings_saved = 0
+        self._lock = threading.Lock()
+
+    def record(
+        self, pages: int, near_duplicates: int, canonical_duplicates: int, embeddings_saved: int
+    ) -> None:
+        with self._lock:
+            self.crawls += 1
+            self.pages += pages
+            self.near_duplicates += near_duplicates
+            self.canonical_duplicates += canonical_duplicates
+            self.embeddings_saved += embeddings_saved
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            duplicates = self.near_duplicates + self.canonical_duplicates
+            return {
+                "crawls": self.crawls,
+                "pages": self.pages,
+                "near_duplicates": self.near_duplicates,
+                "canonical_duplicates": self.canonical_duplicates,
+                "duplicate_rate": duplicates / self.pages if self.pages else 0.0,
+                "embeddings_saved": self.embeddings_saved,
+            }
+
+
+deduplication_stats = DeduplicationStats()
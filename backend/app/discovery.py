@@ -0,0 +1,216 @@
+import asyncio
+import datetime
+import heapq
+import logging
+import math
+import zlib
+from typing import AsyncIterator, Optional, Sequence
+from urllib.parse import urljoin
+from urllib.robotparser import RobotFileParser
+
+import aiohttp
+from lxml import etree
+
+logger = logging.getLogger(__name__)
+
+# Bytes read from a sitemap at a time, sitemaps can be up to 50MB uncompressed
+CHUNK_SIZE = 64 * 1024
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+class SitemapUrl:
+    """A url listed in a sitemap.
+
+    Init args:
+        url: The absolute url of the page.
+        lastmod: When the page was last modified, if the sitemap says.
+        priority: The priority of the page relative to the other pages of the site, 0.5 if the
+            sitemap doesn't say.
+    """
+
+    def __init__(
+        self, url: str, lastmod: Optional[datetime.datetime] = None, priority: float = 0.5
+    ) -> None:
+        self.url = url
+        self.lastmod = lastmod
+        self.priority = priority
+
+    def rank(self) -> tuple[float, float]:
+        """Recently modified first, then by priority."""
+        return (self.lastmod.timestamp() if self.lastmod else 0.0, self.priority)
+
+
+def parse_lastmod(value: Optional[str]) -> Optional[datetime.datetime]:
+    """Parse a W3C datetime like 2024-05-01 or 2024-05-01T10:00:00+00:00, in UTC."""
+    if not value:
+        return None
+    try:
+        lastmod = datetime.datetime.fromisoformat(value.strip())
+    except ValueError:
+        return None
+    if lastmod.tzinfo is None:
+        return lastmod.replace(tzinfo=datetime.timezone.utc)
+    return lastmod.astimezone(datetime.timezone.utc)
+
+
+def round_crawl_delays(lines: list[str]) -> list[str]:
+    """Round decimal Crawl-delays up to whole seconds, RobotFileParser ignores them otherwise."""
+    rounded = []
+    for line in lines:
+        name, _, value = line.partition(":")
+        if name.strip().lower() == "crawl-delay":
+            try:
+                line = f"{name}: {math.ceil(float(value.split('#')[0]))}"
+            except ValueError:
+                pass
+        rounded.append(line)
+    return rounded
+
+
+async def fetch_robots(
+    session: aiohttp.ClientSession, base_url: str
+) -> tuple[RobotFileParser, int]:
+    """Fetch and parse the robots.txt of a website.
+
+    A missing robots.txt allows everything. Unreachable ones or server errors disallow
+    everything, as the robots.txt standard asks.
+
+    Returns:
+        tuple[RobotFileParser, int]: The rules and the number of bytes downloaded.
+    """
+    robots = RobotFileParser(f"{base_url}/robots.txt")
+    try:
+        async with session.get(robots.url) as response:
+            body = await response.read()
+            if response.status >= 500:
+                logger.warning(f"{robots.url} failed with status {response.status}")
+                robots.disallow_all = True
+            elif response.status >= 400:
+                robots.allow_all = True
+            else:
+                robots.parse(round_crawl_delays(body.decode(errors="replace").splitlines()))
+            return robots, len(body)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.warning(f"Unable to load {robots.url}: {e!r}")
+        robots.disallow_all = True
+        return robots, 0
+
+
+class SitemapReader:
+    """Streams the urls of sitemaps and sitemap indexes, without loading them whole.
+
+    Sitemaps are parsed incrementally as they download, gzipped ones included. Sitemap indexes
+    are followed, most recently modified sitemaps first.
+
+    Init args:
+        session: The session to fetch the sitemaps with.
+        base_url: Only urls starting with the base url are yielded.
+        max_sitemaps: The max number of sitemaps fetched, sitemap indexes included.
+    """
+
+    def __init__(
+        self, session: aiohttp.ClientSession, base_url: str, max_sitemaps: int = 50
+    ) -> None:
+        self.session = session
+        self.base_url = base_url
+        self.max_sitemaps = max_sitemaps
+        self.sitemaps_fetched = 0
+        self.bytes_fetched = 0
+
+    async def _read(self, sitemap_url: str) -> AsyncIterator[etree._Element]:
+        """Yield the <url> and <sitemap> elements of a sitemap as they are parsed."""
+        parser = etree.XMLPullParser(events=("end",), resolve_entities=False, no_network=True)
+        decompressor = None
+        async with self.session.get(sitemap_url) as response:
+            if response.status >= 400:
+                logger.debug(f"Skipping sitemap {sitemap_url}, status {response.status}")
+                return
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                self.bytes_fetched += len(chunk)
+                if decompressor is None and chunk.startswith(GZIP_MAGIC):
+                    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                parser.feed(decompressor.decompress(chunk) if decompressor else chunk)
+                for _, element in parser.read_events():
+                    if etree.QName(element).localname in ["url", "sitemap"]:
+                        yield element
+                        # Free the parsed elements so large sitemaps use constant memory
+                        element.clear()
+                        while element.getprevious() is not None:
+                            del element.getparent()[0]
+
+    @staticmethod
+    def _child_text(element: etree._Element, name: str) -> Optional[str]:
+        for child in element:
+            if etree.QName(child).localname == name and child.text:
+                return child.text.strip()
+        return None
+
+    async def urls(self, sitemap_urls: Sequence[str]) -> AsyncIterator[SitemapUrl]:
+        """Yield the urls of the sitemaps, following sitemap indexes."""
+        # Most recently modified sitemaps first
+        pending = [(0.0, i, url) for i, url in enumerate(sitemap_urls)]
+        heapq.heapify(pending)
+        seen = set(sitemap_urls)
+        while pending and self.sitemaps_fetched < self.max_sitemaps:
+            _, _, sitemap_url = heapq.heappop(pending)
+            self.sitemaps_fetched += 1
+            try:
+                async for element in self._read(sitemap_url):
+                    loc = self._child_text(element, "loc")
+                    if loc is None:
+                        continue
+                    url = urljoin(sitemap_url, loc)
+                    lastmod = parse_lastmod(self._child_text(element, "lastmod"))
+                    if etree.QName(element).localname == "sitemap":
+                        if url not in seen:
+                            seen.add(url)
+                            priority = -lastmod.timestamp() if lastmod else 0.0
+                            heapq.heappush(pending, (priority, len(seen), url))
+                        continue
+                    if not url.startswith(self.base_url):
+                        continue
+                    try:
+                        priority = float(self._child_text(element, "priority") or 0.5)
+                    except ValueError:
+                        priority = 0.5
+                    yield SitemapUrl(url, lastmod, priority)
+            except (
+                aiohttp.ClientError,
+                asyncio.TimeoutError,
+                etree.XMLSyntaxError,
+                zlib.error,
+            ) as e:
+                logger.warning(f"Unable to read sitemap {sitemap_url}: {e!r}")
+
+
+async def discover_urls(
+    reader: SitemapReader,
+    sitemap_urls: Sequence[str],
+    robots: Optional[RobotFileParser],
+    user_agent: str,
+    max_urls: int,
+    modified_since: Optional[datetime.datetime] = None,
+) -> list[SitemapUrl]:
+    """The max_urls most recently modified, then highest priority, urls of the sitemaps.
+
+    Urls disallowed by robots.txt are dropped, and so are urls last modified before
+    modified_since, which a previous crawl already indexed.
+    """
+    since = modified_since.astimezone(datetime.timezone.utc) if modified_since else None
+    best: list[tuple[tuple[float, float], int, SitemapUrl]] = []
+    seen = set()
+    async for sitemap_url in reader.urls(sitemap_urls):
+        if sitemap_url.url in seen:
+            continue
+        seen.add(sitemap_url.url)
+        if robots is not None and not robots.can_fetch(user_agent, sitemap_url.url):
+            continue
+        if since and sitemap_url.lastmod and sitemap_url.lastmod < since:
+            continue
+        # A bounded heap keeps the best urls of sitemaps too large to hold in memory
+        item = (sitemap_url.rank(), -len(seen), sitemap_url)
+        if len(best) < max_urls:
+            heapq.heappush(best, item)
+        elif max_urls:
+            heapq.heappushpop(best, item)
+    return [sitemap_url for _, _, sitemap_url in sorted(best, reverse=True)]
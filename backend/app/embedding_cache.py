@@ -0,0 +1,201 @@
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Any, Optional, Sequence
+
+import redis
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryEmbeddingStore:
+    """An in process LRU store of encoded embeddings.
+
+    Init args:
+        max_entries: The number of embeddings kept before the least recently used are evicted.
+    """
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def mget(self, keys: Sequence[str]) -> list[Optional[bytes]]:
+        with self._lock:
+            values = []
+            for key in keys:
+                value = self._entries.get(key)
+                if value is not None:
+                    self._entries.move_to_end(key)
+                values.append(value)
+            return values
+
+    def mset(self, items: Sequence[tuple[str, bytes]]) -> None:
+        with self._lock:
+            for key, value in items:
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class RedisEmbeddingStore:
+    """A Redis store of encoded embeddings shared by every server and worker process.
+
+    A sorted set tracks when each embedding was last used so the least recently used are
+    evicted once there are more than max_entries.
+
+    Init args:
+        redis_client: The Redis client to use.
+        max_entries: The number of embeddings kept before the least recently used are evicted.
+        namespace: The prefix of the Redis keys.
+    """
+
+    def __init__(
+        self, redis_client: redis.Redis, max_entries: int, namespace: str = "embedding_cache"
+    ) -> None:
+        self.redis_client = redis_client
+        self.max_entries = max_entries
+        self.namespace = namespace
+        self.lru_key = f"{namespace}:lru"
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def mget(self, keys: Sequence[str]) -> list[Optional[bytes]]:
+        if not keys:
+            return []
+        values = self.redis_client.mget([self._key(key) for key in keys])
+        hits = {self._key(key): time.time() for key, value in zip(keys, values) if value}
+        if hits:
+            self.redis_client.zadd(self.lru_key, hits)
+        return values
+
+    def mset(self, items: Sequence[tuple[str, bytes]]) -> None:
+        if not items:
+            return
+        now = time.time()
+        pipeline = self.redis_client.pipeline(transaction=False)
+        pipeline.mset({self._key(key): value for key, value in items})
+        pipeline.zadd(self.lru_key, {self._key(key): now for key, _ in items})
+        pipeline.zcard(self.lru_key)
+        size = pipeline.execute()[-1]
+
+        excess = size - self.max_entries
+        if excess > 0:
+            evicted = [key for key, _ in self.redis_client.zpopmin(self.lru_key, excess)]
+            self.redis_client.delete(*evicted)
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings that are cached by a hash of the model and the text.
+
+    Vectors are stored as float32 bytes. Identical texts in a call are only embedded once.
+
+    Init args:
+        embeddings: The embeddings model to cache.
+        store: The MemoryEmbeddingStore or RedisEmbeddingStore to cache in.
+        model_name: Part of the cache key, defaults to the model of the embeddings.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        store: MemoryEmbeddingStore | RedisEmbeddingStore,
+        model_name: Optional[str] = None,
+    ) -> None:
+        self.embeddings = embeddings
+        self.store = store
+        self.model_name = model_name or getattr(embeddings, "model", type(embeddings).__name__)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _key(self, kind: str, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{kind}\0{text}".encode()).hexdigest()
+
+    @staticmethod
+    def _encode(vector: list[float]) -> bytes:
+        return array("f", vector).tobytes()
+
+    @staticmethod
+    def _decode(value: bytes) -> list[float]:
+        vector = array("f")
+        vector.frombytes(value)
+        return vector.tolist()
+
+    def _count(self, hits: int, misses: int) -> None:
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def _lookup(self, kind: str, texts: list[str]) -> tuple[list[str], list[Optional[bytes]]]:
+        keys = [self._key(kind, text) for text in texts]
+        return keys, self.store.mget(keys)
+
+    def _merge(
+        self,
+        texts: list[str],
+        keys: list[str],
+        values: list[Optional[bytes]],
+        missing_texts: list[str],
+        missing_vectors: list[list[float]],
+    ) -> list[list[float]]:
+        """Store the new vectors and combine them with the cached ones in input order."""
+        key_by_text = dict(zip(texts, keys))
+        new_values = {
+            key_by_text[text]: self._encode(vector)
+            for text, vector in zip(missing_texts, missing_vectors)
+        }
+        self.store.mset(list(new_values.items()))
+        self._count(hits=len(texts) - len(missing_texts), misses=len(missing_texts))
+        return [self._decode(value or new_values[key]) for key, value in zip(keys, values)]
+
+    @staticmethod
+    def _missing(texts: list[str], values: list[Optional[bytes]]) -> list[str]:
+        return list(dict.fromkeys(text for text, value in zip(texts, values) if value is None))
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        keys, values = self._lookup("document", texts)
+        missing_texts = self._missing(texts, values)
+        missing_vectors = self.embeddings.embed_documents(missing_texts) if missing_texts else []
+        return self._merge(texts, keys, values, missing_texts, missing_vectors)
+
+    def embed_query(self, text: str) -> list[float]:
+        keys, values = self._lookup("query", [text])
+        missing_vectors = [] if values[0] else [self.embeddings.embed_query(text)]
+        return self._merge(
+            [text], keys, values, [text] if missing_vectors else [], missing_vectors
+        )[0]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        keys, values = await asyncio.to_thread(self._lookup, "document", texts)
+        missing_texts = self._missing(texts, values)
+        missing_vectors = (
+            await self.embeddings.aembed_documents(missing_texts) if missing_texts else []
+        )
+        return await asyncio.to_thread(
+            self._merge, texts, keys, values, missing_texts, missing_vectors
+        )
+
+    async def aembed_query(self, text: str) -> list[float]:
+        keys, values = await asyncio.to_thread(self._lookup, "query", [text])
+        missing_vectors = [] if values[0] else [await self.embeddings.aembed_query(text)]
+        vectors = await asyncio.to_thread(
+            self._merge, [text], keys, values, [text] if missing_vectors else [], missing_vectors
+        )
+        return vectors[0]
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "model": self.model_name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,228 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import Any, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from app.tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """A token bucket rate limiter that can be shared by threads running their own event loops.
+
+    Init args:
+        rate: The number of tokens added per second.
+        capacity: The max number of tokens, which is the largest allowed burst.
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, amount: float) -> float:
+        """Take tokens, going into debt if needed, and return how long to wait for them."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            self._tokens -= amount
+            return max(0.0, -self._tokens / self.rate)
+
+    async def acquire(self, amount: float = 1) -> None:
+        # Requests larger than the bucket are allowed through once the bucket is full
+        wait = self._reserve(min(amount, self.capacity))
+        if wait:
+            await asyncio.sleep(wait)
+
+
+def is_rate_limit_error(e: Exception) -> bool:
+    status_code = getattr(e, "status_code", None) or getattr(
+        getattr(e, "response", None), "status_code", None
+    )
+    return status_code == 429 or type(e).__name__ == "RateLimitError"
+
+
+def is_quota_error(e: Exception) -> bool:
+    """Out of quota errors are not retried, routes report them to the user."""
+    return "insufficient_quota" in [getattr(e, "type", None), getattr(e, "code", None)]
+
+
+def is_transient_error(e: Exception) -> bool:
+    status_code = getattr(e, "status_code", None) or getattr(
+        getattr(e, "response", None), "status_code", None
+    )
+    return isinstance(e, (ConnectionError, asyncio.TimeoutError)) or (
+        isinstance(status_code, int) and status_code >= 500
+    )
+
+
+class EmbeddingExecutor:
+    """Embeds texts in concurrent batches within the rate limits of the embeddings provider.
+
+    The batch size grows while requests succeed and is halved when the provider rate limits,
+    failed batches are retried with exponential backoff and full jitter.
+
+    Batches run on an event loop owned by the executor, in a thread of its own, whatever loop or
+    thread they are requested from. The async client of the provider is only ever used from that
+    loop, and max_concurrency bounds the batches in flight across the whole process.
+
+    Init args:
+        embeddings: The embeddings model to call.
+        max_batch_size: The largest number of texts sent in one request.
+        min_batch_size: The smallest batch size, also the step the batch size grows by.
+        max_concurrency: The number of batches in flight at the same time.
+        requests_per_second: The max request rate.
+        tokens_per_minute: Optional max rate of embedded tokens.
+        max_retries: The number of times a batch is retried before giving up.
+        base_delay: The first backoff delay in seconds.
+        max_delay: The largest backoff delay in seconds.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        max_batch_size: int = 128,
+        min_batch_size: int = 8,
+        max_concurrency: int = 4,
+        requests_per_second: float = 10,
+        tokens_per_minute: Optional[int] = None,
+        max_retries: int = 6,
+        base_delay: float = 0.5,
+        max_delay: float = 30,
+    ) -> None:
+        self.embeddings = embeddings
+        self.max_batch_size = max_batch_size
+        self.min_batch_size = min(min_batch_size, max_batch_size)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # Requests are spaced evenly, a burst could exceed per second limits of the provider
+        self.request_bucket = TokenBucket(requests_per_second, 1)
+        self.token_bucket = (
+            TokenBucket(tokens_per_minute / 60, tokens_per_minute) if tokens_per_minute else None
+        )
+
+        self.batch_size = max_batch_size
+        self.batches = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._semaphore = asyncio.Semaphore(self.max_concurrency)
+                threading.Thread(
+                    target=self._loop.run_forever, name="embedding-executor", daemon=True
+                ).start()
+            return self._loop
+
+    def _on_success(self) -> None:
+        with self._lock:
+            self.batches += 1
+            self.batch_size = min(self.max_batch_size, self.batch_size + self.min_batch_size)
+
+    def _on_retry(self, rate_limited: bool) -> None:
+        with self._lock:
+            self.retries += 1
+            if rate_limited:
+                self.rate_limited += 1
+                self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+
+    async def _embed_batch(self, texts: list[str]) -> list[list[float]]:
+        attempt = 0
+        while True:
+            await self.request_bucket.acquire()
+            if self.token_bucket is not None:
+                await self.token_bucket.acquire(sum(count_tokens(text) for text in texts))
+            try:
+                vectors = await self.embeddings.aembed_documents(texts)
+                self._on_success()
+                return vectors
+            except Exception as e:
+                rate_limited = is_rate_limit_error(e) and not is_quota_error(e)
+                if attempt >= self.max_retries or not (rate_limited or is_transient_error(e)):
+                    raise
+                self._on_retry(rate_limited)
+                logger.debug(f"Retrying embedding batch of {len(texts)} texts: {e!r}")
+
+            delay = min(self.max_delay, self.base_delay * 2**attempt)
+            await asyncio.sleep(random.uniform(0, delay))
+            attempt += 1
+
+            # A batch larger than the reduced batch size is retried in smaller batches
+            if len(texts) > self.batch_size:
+                batch_size = self.batch_size
+                vectors = []
+                for i in range(0, len(texts), batch_size):
+                    vectors.extend(await self._embed_batch(texts[i : i + batch_size]))
+                return vectors
+
+    async def _embed_batches(self, texts: list[str]) -> list[list[float]]:
+        batch_size = self.batch_size
+        batches = [texts[i : i + batch_size] for i in range(0, len(texts), batch_size)]
+
+        async def run(batch: list[str]) -> list[list[float]]:
+            async with self._semaphore:
+                return await self._embed_batch(batch)
+
+        results = await asyncio.gather(*(run(batch) for batch in batches))
+        return [vector for vectors in results for vector in vectors]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Embed texts from a thread without a running event loop, waiting for the vectors."""
+        if not texts:
+            return []
+        future = asyncio.run_coroutine_threadsafe(self._embed_batches(texts), self._get_loop())
+        return future.result()
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        if not texts:
+            return []
+        future = asyncio.run_coroutine_threadsafe(self._embed_batches(texts), self._get_loop())
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "batch_size": self.batch_size,
+            "batches": self.batches,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+        }
+
+
+class ExecutorEmbeddings(Embeddings):
+    """Embeddings whose documents are embedded through an EmbeddingExecutor.
+
+    Init args:
+        executor: The EmbeddingExecutor to embed documents with.
+    """
+
+    def __init__(self, executor: EmbeddingExecutor) -> None:
+        self.executor = executor
+        self.model = getattr(executor.embeddings, "model", type(executor.embeddings).__name__)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        # Indexing runs in worker threads that have no running event loop
+        return self.executor.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.executor.embeddings.embed_query(text)
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        return await self.executor.aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return await self.executor.embeddings.aembed_query(text)
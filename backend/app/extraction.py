@@ -0,0 +1,120 @@
+import asyncio
+import multiprocessing
+import re
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Optional
+from urllib.parse import urljoin, urlparse
+
+import lxml.html
+from lxml.etree import ParserError
+
+# Elements that never contain page content
+BOILERPLATE_XPATH = (
+    "//script | //style | //noscript | //template | //svg | //iframe | //nav | //footer"
+    " | //aside | //*[@role='navigation' or @role='contentinfo' or @aria-hidden='true']"
+    " | //header[not(ancestor::main) and not(ancestor::article)]"
+)
+
+# Elements whose text is separated from the surrounding text by a line break
+BLOCK_TAGS = {
+    "address", "article", "blockquote", "br", "dd", "div", "dl", "dt", "figcaption", "figure",
+    "hr", "li", "main", "ol", "p", "pre", "section", "table", "td", "th", "tr", "ul",
+}  # fmt: skip
+
+HEADING_TAGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+
+_whitespace_re = re.compile(r"\s+")
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def extract_page(html: str, url: str, content_type: str) -> tuple[str, dict]:
+    """Parse html once and extract its text content and metadata.
+
+    Args:
+        html: The raw html of the page.
+        url: The url of the page.
+        content_type: The Content-Type header of the response.
+
+    Returns:
+        tuple[str, dict]: The text without boilerplate and the metadata of the page.
+    """
+    metadata = {"hostname": urlparse(url).hostname, "source": url, "content_type": content_type}
+    try:
+        root = lxml.html.document_fromstring(html)
+    except ValueError:
+        # lxml refuses str input that has an xml encoding declaration
+        root = lxml.html.document_fromstring(html.encode())
+    except ParserError:
+        return "", metadata
+
+    if (title := root.findtext(".//title")) is not None:
+        metadata["title"] = title
+    if description := root.xpath("//meta[@name='description']/@content"):
+        metadata["description"] = description[0]
+    if canonical := root.xpath("//link[@rel='canonical']/@href"):
+        # The url the page says it is a variant of
+        metadata["canonical"] = urljoin(url, canonical[0].strip())
+    metadata["language"] = root.get("lang", "en-US")
+
+    for element in root.xpath(BOILERPLATE_XPATH):
+        element.drop_tree()
+
+    body = root.body if root.find("body") is not None else root
+    for element in body.iter():
+        # Source formatting is ignored, only block elements start new lines
+        text = _whitespace_re.sub(" ", element.text) if element.text else ""
+        tail = _whitespace_re.sub(" ", element.tail) if element.tail else ""
+        if element.tag in HEADING_TAGS:
+            # Headings are kept as markdown so chunking can split pages into sections
+            text = "\n" + "#" * HEADING_TAGS[element.tag] + " " + text.lstrip()
+            tail = "\n" + tail
+        elif element.tag in BLOCK_TAGS:
+            text, tail = "\n" + text, "\n" + tail
+        element.text, element.tail = text, tail
+
+    lines = (line.strip() for line in body.text_content().splitlines())
+    text = "\n".join(line for line in lines if line)
+    return text, metadata
+
+
+def get_extraction_pool(workers: int) -> Optional[ProcessPoolExecutor]:
+    """Get the process pool used for parsing, or None to parse in the calling process.
+
+    Args:
+        workers: The number of parsing processes. 0 disables the pool.
+    """
+    global _pool
+    if workers <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # Spawn instead of fork, the server process runs threads
+            context = multiprocessing.get_context("spawn")
+            _pool = ProcessPoolExecutor(workers, mp_context=context)
+        return _pool
+
+
+def shutdown_extraction_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
+
+
+async def aextract_page(
+    html: str, url: str, content_type: str, executor: Optional[Executor] = None
+) -> tuple[str, dict]:
+    """Extract a page in an executor so parsing does not block the event loop.
+
+    Args:
+        html: The raw html of the page.
+        url: The url of the page.
+        content_type: The Content-Type header of the response.
+        executor: The executor to parse in. Defaults to the event loop's thread pool.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, extract_page, html, url, content_type)
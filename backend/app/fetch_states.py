@@ -0,0 +1,72 @@
+import datetime
+from typing import Optional, Sequence
+
+from app.crawler import PageValidators
+from app.db.schema import PageFetchState, db_proxy
+
+# Rows upserted per statement
+SAVE_BATCH_SIZE = 500
+
+
+def load_fetch_states(hostname: str) -> dict[str, PageFetchState]:
+    """Get the fetch state of every page of a hostname by url."""
+    query = PageFetchState.select().where(PageFetchState.hostname == hostname)
+    return {state.url: state for state in query}
+
+
+def to_validators(state: PageFetchState) -> PageValidators:
+    links = state.links.split("\n") if state.links else []
+    return PageValidators(state.etag, state.last_modified, links)
+
+
+def save_fetch_states(
+    hostname: str,
+    pages: Sequence[
+        tuple[
+            str,
+            Optional[str],
+            Optional[str],
+            Optional[str],
+            Sequence[str],
+            Optional[str],
+            Optional[str],
+        ]
+    ],
+) -> None:
+    """Save what a crawl fetched, replacing the previous state of the pages.
+
+    Args:
+        hostname: The hostname of the website.
+        pages: The url, ETag, Last-Modified, content hash, links, SimHash and the page it is a
+            near duplicate of, of each fetched page.
+    """
+    now = datetime.datetime.now()
+    rows = [
+        {
+            "hostname": hostname,
+            "url": url,
+            "etag": etag,
+            "last_modified": last_modified,
+            "content_hash": content_hash,
+            "links": "\n".join(links),
+            "simhash": simhash,
+            "duplicate_of": duplicate_of,
+            "fetched_at": now,
+        }
+        for url, etag, last_modified, content_hash, links, simhash, duplicate_of in pages
+    ]
+    with db_proxy.atomic():
+        for i in range(0, len(rows), SAVE_BATCH_SIZE):
+            PageFetchState.insert_many(rows[i : i + SAVE_BATCH_SIZE]).on_conflict(
+                conflict_target=[PageFetchState.url],
+                preserve=[
+                    PageFetchState.hostname,
+                    PageFetchState.etag,
+                    PageFetchState.last_modified,
+                    PageFetchState.content_hash,
+                    PageFetchState.links,
+                    PageFetchState.simhash,
+                    PageFetchState.duplicate_of,
+                    PageFetchState.fetched_at,
+                ],
+            ).execute()
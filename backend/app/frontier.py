@@ -0,0 +1,300 @@
+import asyncio
+import heapq
+import html as html_lib
+import re
+from collections import Counter
+from typing import Any, Optional, Sequence
+from urllib.parse import urljoin, urlsplit
+
+# Links with their anchor text, the text is stripped of its tags
+ANCHOR_PATTERN = re.compile(
+    r"<a\s[^>]*?href\s*=\s*[\"']([^\"'#]+)[\"'][^>]*>(.*?)</a>", re.I | re.S
+)
+TAG_PATTERN = re.compile(r"<[^>]+>")
+WORD_PATTERN = re.compile(r"[a-z0-9]{3,}")
+
+# Anchor texts of the pages a sales agent needs, and of the pages it doesn't
+HIGH_VALUE_WORDS = {
+    "buy",
+    "shop",
+    "store",
+    "product",
+    "products",
+    "collection",
+    "collections",
+    "catalog",
+    "category",
+    "price",
+    "prices",
+    "pricing",
+    "plans",
+    "features",
+    "order",
+    "shipping",
+    "delivery",
+    "returns",
+    "faq",
+}
+LOW_VALUE_WORDS = {
+    "privacy",
+    "terms",
+    "cookie",
+    "cookies",
+    "legal",
+    "login",
+    "careers",
+    "jobs",
+    "press",
+    "blog",
+    "author",
+    "tag",
+}
+
+ANCHOR_WEIGHT = 1.0
+SITEMAP_PRIORITY_WEIGHT = 2.0
+SIMILARITY_WEIGHT = 2.0
+DEPTH_WEIGHT = 0.5
+
+
+class CrawlRules:
+    """Rules ranking and filtering the urls of a website by their path and query.
+
+    Init args:
+        include: Regexes of the urls to crawl. When empty, every url not excluded is crawled.
+        exclude: Regexes of the urls never crawled.
+        scores: Regexes with the score added to the urls they match, negative for pages that
+            are worth less per fetch than the others.
+    """
+
+    def __init__(
+        self,
+        include: Sequence[str] = (),
+        exclude: Sequence[str] = (),
+        scores: Sequence[tuple[str, float]] = (),
+    ) -> None:
+        self.include = [re.compile(pattern, re.I) for pattern in include]
+        self.exclude = [re.compile(pattern, re.I) for pattern in exclude]
+        self.scores = [(re.compile(pattern, re.I), score) for pattern, score in scores]
+
+    def extend(self, rules: "CrawlRules") -> "CrawlRules":
+        """These rules with the rules of another rule set added."""
+        extended = CrawlRules()
+        extended.include = self.include + rules.include
+        extended.exclude = self.exclude + rules.exclude
+        extended.scores = self.scores + rules.scores
+        return extended
+
+    def allows(self, path: str) -> bool:
+        if any(pattern.search(path) for pattern in self.exclude):
+            return False
+        return not self.include or any(pattern.search(path) for pattern in self.include)
+
+    def score(self, path: str) -> float:
+        return sum(score for pattern, score in self.scores if pattern.search(path))
+
+
+GENERIC_RULES = CrawlRules(
+    exclude=[
+        r"^/cart(/|$)",
+        r"^/(wp-includes|wp-content|wp-json)(/|$)",
+        r"^/xmlrpc\.php",
+        r"^/(login|logout|signin|signup|account)(/|$)",
+        r"\.(jpe?g|png|gif|svg|webp|pdf|zip|css|js)$",
+    ],
+    scores=[
+        (r"/(products?|shop|store|catalog)(/|$)", 3),
+        (r"/(pricing|prices|plans)(/|\.|$)", 3),
+        (r"/(collections?|categor(y|ies))(/|$)", 2),
+        (r"/(shipping|delivery|returns|faq)(/|\.|$)", 1),
+        (r"/(blog|news|articles?|press|tags?|author)(/|$)", -2),
+        (r"/(privacy|terms|legal|cookies?|careers|jobs)(/|\.|-|$)", -3),
+        (r"[?&](page|p|sort|order|orderby)=", -1),
+    ],
+)
+
+PLATFORM_RULES = {
+    "generic": GENERIC_RULES,
+    "shopify": GENERIC_RULES.extend(
+        CrawlRules(
+            exclude=[
+                r"^/(account|checkouts?|orders|search|cdn)(/|$)",
+                # The same products as /products/, under the url of each of their collections
+                r"^/collections/[^/]+/products/",
+                r"[?&](variant|sort_by|filter\.[^=]+)=",
+                r"\.(atom|oembed|json|xml)$",
+            ],
+            scores=[(r"^/pages/", 1), (r"^/policies/", 0.5)],
+        )
+    ),
+    "woocommerce": GENERIC_RULES.extend(
+        CrawlRules(
+            exclude=[
+                r"^/(checkout|my-account|wp-admin|wp-login\.php)(/|$)",
+                r"[?&](add-to-cart|add_to_wishlist|orderby|min_price|max_price|filter_[^=]+)=",
+                r"/feed/?$",
+            ],
+            scores=[(r"^/product-category/", 2), (r"^/product-tag/", -1)],
+        )
+    ),
+}
+
+# Markers of the html of each platform
+PLATFORM_MARKERS = {
+    "shopify": ["cdn.shopify.com", "Shopify.theme", "shopify-section"],
+    "woocommerce": ["woocommerce", "wc-block", "wp-content/plugins/woocommerce"],
+}
+
+
+def detect_platform(html: str) -> str:
+    """The e-commerce platform a page was built with, or generic."""
+    for platform, markers in PLATFORM_MARKERS.items():
+        if any(marker in html for marker in markers):
+            return platform
+    return "generic"
+
+
+def extract_anchor_texts(html: str, url: str) -> dict[str, str]:
+    """The text of the first link to each url of a page, by absolute url."""
+    anchor_texts: dict[str, str] = {}
+    for href, text in ANCHOR_PATTERN.findall(html):
+        link = urljoin(url, html_lib.unescape(href.strip()))
+        if link not in anchor_texts:
+            anchor_texts[link] = html_lib.unescape(TAG_PATTERN.sub(" ", text)).strip()
+    return anchor_texts
+
+
+def words(text: str) -> set[str]:
+    return set(WORD_PATTERN.findall(text.lower()))
+
+
+class UrlScorer:
+    """Ranks the urls of a crawl frontier by how much a fetch is worth to a sales agent.
+
+    A url is scored by the rules of the platform of the website matching its path, the words of
+    the anchor text of its link, its sitemap priority, and how similar its words are to the
+    high-value pages indexed so far. Urls deeper in the site score a bit lower.
+
+    Init args:
+        platform: The rule set to use, one of PLATFORM_RULES or "auto" to detect it from the
+            start page and use the generic rules until then.
+        include: Regexes of the urls to crawl, added to the rules of the platform.
+        exclude: Regexes of the urls never crawled, added to the rules of the platform.
+    """
+
+    def __init__(
+        self, platform: str = "generic", include: Sequence[str] = (), exclude: Sequence[str] = ()
+    ) -> None:
+        if platform != "auto" and platform not in PLATFORM_RULES:
+            raise ValueError(f"Unsupported crawl platform {platform}")
+        self.auto = platform == "auto"
+        self.custom_rules = CrawlRules(include, exclude)
+        self.use_platform("generic" if self.auto else platform)
+        # The number of high-value pages learned from containing each word
+        self.profile: Counter[str] = Counter()
+        self.pages_learned = 0
+
+    def use_platform(self, platform: str) -> None:
+        self.platform = platform
+        self.rules = PLATFORM_RULES[platform].extend(self.custom_rules)
+
+    def detect_platform(self, html: str) -> None:
+        """Use the rules of the platform of the start page, when detecting it."""
+        if self.auto:
+            self.use_platform(detect_platform(html))
+            self.auto = False
+
+    @staticmethod
+    def _path(url: str) -> str:
+        parts = urlsplit(url)
+        return f"{parts.path or '/'}?{parts.query}" if parts.query else parts.path or "/"
+
+    def allows(self, url: str) -> bool:
+        return self.rules.allows(self._path(url))
+
+    def learn(self, url: str, text: str) -> None:
+        """Learn the words of an indexed page, when the rules rank it as a high-value page."""
+        if self.rules.score(self._path(url)) > 0:
+            self.profile.update(words(text))
+            self.pages_learned += 1
+
+    def similarity(self, url: str, anchor_text: str = "") -> float:
+        """The share of the pages learned containing the words of the link, on average."""
+        link_words = words(f"{urlsplit(url).path} {anchor_text}")
+        if not self.pages_learned or not link_words:
+            return 0.0
+        return sum(self.profile[word] for word in link_words) / (
+            len(link_words) * self.pages_learned
+        )
+
+    def score(
+        self,
+        url: str,
+        depth: int,
+        anchor_text: str = "",
+        sitemap_priority: Optional[float] = None,
+    ) -> float:
+        score = self.rules.score(self._path(url)) - DEPTH_WEIGHT * depth
+        if anchor_text:
+            anchor_words = words(anchor_text)
+            score += ANCHOR_WEIGHT * (
+                min(len(anchor_words & HIGH_VALUE_WORDS), 2)
+                - min(len(anchor_words & LOW_VALUE_WORDS), 2)
+            )
+        if sitemap_priority is not None:
+            score += SITEMAP_PRIORITY_WEIGHT * sitemap_priority
+        return score + SIMILARITY_WEIGHT * self.similarity(url, anchor_text)
+
+
+class Frontier(asyncio.PriorityQueue):
+    """The urls waiting to be fetched, keeping the best urls when it is full.
+
+    Items are tuples starting with their priority, lowest first, and a unique sequence number.
+    When full, an item replaces the queued item of the highest priority if its own is lower.
+    Replaced items are skipped when they reach the front of the queue.
+    """
+
+    def _init(self, maxsize: int) -> None:
+        super()._init(maxsize)
+        # The items by highest priority, including items gotten or replaced since
+        self._worst: list[tuple[Any, int, tuple]] = []
+        # The sequence numbers of the items queued and not replaced
+        self._queued: set[int] = set()
+
+    def _put(self, item: tuple) -> None:
+        super()._put(item)
+        heapq.heappush(self._worst, (-item[0], -item[1], item))
+        self._queued.add(item[1])
+
+    def _get(self) -> tuple:
+        while True:
+            item = super()._get()
+            if item[1] in self._queued:
+                self._queued.remove(item[1])
+                return item
+
+    def qsize(self) -> int:
+        return len(self._queued)
+
+    def empty(self) -> bool:
+        return not self._queued
+
+    def put_or_replace(self, item: tuple) -> Optional[tuple]:
+        """Put an item without waiting, replacing the item of the highest priority when full.
+
+        Returns:
+            Optional[tuple]: The item dropped, the new item when its priority is not lower than
+                the priority of every queued item, or None when there was room.
+        """
+        if not self.full():
+            self.put_nowait(item)
+            return None
+        while self._worst[0][2][1] not in self._queued:
+            heapq.heappop(self._worst)
+        worst = self._worst[0][2]
+        if item[0] >= worst[0]:
+            return item
+        heapq.heappop(self._worst)
+        self._queued.remove(worst[1])
+        # The number of queued items and of unfinished tasks stays the same
+        self._put(item)
+        return worst
@@ -0,0 +1,146 @@
+import logging
+import threading
+from typing import Any, Sequence
+
+from langchain_core.language_models import LanguageModelLike
+from langchain_core.messages import BaseMessage, RemoveMessage, SystemMessage
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.runnables.config import RunnableConfig
+
+from app.tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Tokens added by the chat format to every message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+summarize_system_prompt = """
+        You keep a summary of a conversation between a sales agent and a customer.
+        Extend the summary so far with the messages below. Keep what the customer
+        is looking for, the options they chose, their preferences and the products
+        or services discussed. Answer with the summary only.
+
+        Summary so far: {summary}
+    """
+summarize_prompt = ChatPromptTemplate.from_messages(
+    [
+        ("system", summarize_system_prompt),
+        MessagesPlaceholder("messages"),
+        ("human", "Write the extended summary."),
+    ]
+)
+
+
+def message_tokens(message: BaseMessage) -> int:
+    content = message.content if isinstance(message.content, str) else str(message.content)
+    return count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+
+
+class HistoryManager:
+    """Bounds the chat history put into the prompts with a token budget and a rolling summary.
+
+    Only the newest messages within max_tokens are put into the prompts. When summarize is set,
+    older messages are folded into a summary kept in the checkpointed state and removed from the
+    chat history, once the history is over max_tokens. Messages are folded until the history is
+    within half of max_tokens, so the summary is extended every few turns rather than every turn.
+
+    Init args:
+        llm: The LLM summarizing the folded messages.
+        max_tokens: The token budget of the chat history in the prompts.
+        summarize: Whether to fold older messages into a summary instead of only dropping them
+            from the prompts.
+    """
+
+    def __init__(
+        self, llm: LanguageModelLike, max_tokens: int = 2000, summarize: bool = True
+    ) -> None:
+        self.llm = llm
+        self.max_tokens = max_tokens
+        self.summarize = summarize
+        self.summarize_chain = (summarize_prompt | llm | StrOutputParser()).with_config(
+            run_name="summarize_history"
+        )
+        self.summaries = 0
+        self.folded_messages = 0
+        self._lock = threading.Lock()
+
+    def window(self, chat_history: Sequence[BaseMessage]) -> list[BaseMessage]:
+        """The newest messages of the chat history within max_tokens, at least the last one."""
+        window: list[BaseMessage] = []
+        tokens = 0
+        for message in reversed(chat_history):
+            tokens += message_tokens(message)
+            if window and tokens > self.max_tokens:
+                break
+            window.append(message)
+        window.reverse()
+        return window
+
+    def prompt_messages(
+        self, chat_history: Sequence[BaseMessage], summary: str
+    ) -> list[BaseMessage]:
+        """The chat history to put into the prompts: the summary followed by the window."""
+        window = self.window(chat_history)
+        if not summary:
+            return window
+        return [SystemMessage(f"Summary of the earlier conversation: {summary}"), *window]
+
+    async def acompact(
+        self,
+        chat_history: Sequence[BaseMessage],
+        summary: str,
+        config: RunnableConfig,
+    ) -> dict[str, Any]:
+        """Fold the oldest messages into the summary if the chat history is over max_tokens.
+
+        Args:
+            chat_history: The chat history stored in the state, including the messages of the
+                turn. Only messages with an id, ie. already stored, are folded.
+            summary: The summary stored in the state.
+            config: The config of the invocation.
+
+        Returns:
+            dict[str, Any]: The state update removing the folded messages and setting the
+                extended summary, or an empty dict when nothing is folded.
+        """
+        if not self.summarize:
+            return {}
+        tokens = sum(message_tokens(message) for message in chat_history)
+        if tokens <= self.max_tokens:
+            return {}
+
+        folded: list[BaseMessage] = []
+        for message in chat_history:
+            if tokens <= self.max_tokens // 2 or message.id is None:
+                break
+            folded.append(message)
+            tokens -= message_tokens(message)
+        if not folded:
+            return {}
+
+        try:
+            summary = await self.summarize_chain.ainvoke(
+                {"summary": summary or "none yet", "messages": folded}, config
+            )
+        except Exception as e:
+            # The history is only windowed until the next turn tries again
+            logger.warning(f"Failed to summarize the chat history: {e}")
+            return {}
+
+        with self._lock:
+            self.summaries += 1
+            self.folded_messages += len(folded)
+        return {
+            "chat_history": [RemoveMessage(id=message.id) for message in folded],
+            "summary": summary,
+        }
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "max_tokens": self.max_tokens,
+                "summarize": self.summarize,
+                "summaries": self.summaries,
+                "folded_messages": self.folded_messages,
+            }
@@ -0,0 +1,252 @@
+"""Crawl and index the websites of a file of urls, like /api/start_chat does for one url.
+
+The file has a url per line, blank lines and lines starting with # are ignored. Websites are
+crawled concurrently, the urls of a hostname one after another, and indexed into the same
+`redis/{hostname}` namespaces as on demand indexing. Websites crawled within their TTL are skipped
+unless --force is given. --ttl sets the TTL of the websites of the file, instead of CRAWL_TTL.
+
+The progress of each url is checkpointed in the ingest_items table under the name of the run, the
+file name by default. Running the same file again resumes the run: done and fresh urls are
+skipped, as are failed ones unless --retry-failed is given.
+    python -m app.ingest urls.txt --concurrency 8 --per-host 4
+"""
+
+import argparse
+import asyncio
+import datetime
+import logging
+import os
+import time
+from collections import Counter
+from typing import Optional, Sequence
+
+from app.config import (
+    get_config,
+    get_embedding_cache_config,
+    get_embedding_executor_config,
+    get_llm_config,
+    get_redis_config,
+    get_vector_index_config,
+)
+from app.db.db_manager import DbManager
+from app.db.schema import IngestItem, IngestStatus
+from app.extraction import shutdown_extraction_pool
+from app.llm import create_cached_embeddings
+from app.url_processor import UrlProcessor
+from app.vector_index import TunedRedisVectorStore
+
+logger = logging.getLogger(__name__)
+
+# Most frequent errors printed in the summary
+SUMMARY_ERRORS = 5
+
+
+def read_urls(path: str) -> list[str]:
+    """The urls of a file, in order and without duplicates."""
+    with open(path) as file:
+        lines = [line.strip() for line in file]
+    return list(dict.fromkeys(line for line in lines if line and not line.startswith("#")))
+
+
+def checkpoint_urls(run: str, urls: Sequence[str], retry_failed: bool) -> list[IngestItem]:
+    """Add the urls to the run and get the items still to ingest.
+
+    Items left running by a killed run are ingested again.
+    """
+    IngestItem.insert_many(
+        [{"run": run, "url": url} for url in urls]
+    ).on_conflict_ignore().execute()
+    statuses = [IngestStatus.PENDING, IngestStatus.RUNNING]
+    if retry_failed:
+        statuses.append(IngestStatus.FAILED)
+    items = IngestItem.select().where((IngestItem.run == run) & (IngestItem.status.in_(statuses)))
+    order = {url: i for i, url in enumerate(urls)}
+    return sorted(items, key=lambda item: order.get(item.url, len(order)))
+
+
+class BulkIngestor:
+    """Ingests the items of a run, checkpointing the outcome of each.
+
+    Init args:
+        url_processor: The url processor crawling and indexing the websites.
+        concurrency: The number of websites crawled at the same time.
+        concurrency_per_host: Optional number of requests in flight at the same time per
+            website, CRAWL_CONCURRENCY_PER_HOST by default.
+        max_depth: Optional number for the max depth for recursively loading webpages.
+        force: Whether to crawl websites crawled within their TTL again.
+        ttl: Optional seconds the websites stay fresh, overriding CRAWL_TTL for them.
+    """
+
+    def __init__(
+        self,
+        url_processor: UrlProcessor,
+        concurrency: int,
+        concurrency_per_host: Optional[int],
+        max_depth: Optional[int],
+        force: bool = False,
+        ttl: Optional[int] = None,
+    ) -> None:
+        self.url_processor = url_processor
+        self.concurrency = concurrency
+        self.concurrency_per_host = concurrency_per_host
+        self.max_depth = max_depth
+        self.force = force
+        self.ttl = ttl
+        # The items ingested so far, in the order they finished
+        self.ingested: list[IngestItem] = []
+
+    async def _ingest_host(
+        self, semaphore: asyncio.Semaphore, items: list[IngestItem], total: int
+    ) -> None:
+        # The urls of a hostname share its fetch states and record manager namespace
+        for item in items:
+            async with semaphore:
+                await self._ingest(item)
+            self.ingested.append(item)
+            logger.info(
+                f"[{len(self.ingested)}/{total}] {item.status} {item.url}, {item.pages} pages "
+                f"in {item.seconds or 0:.1f}s" + (f": {item.error}" if item.error else "")
+            )
+
+    async def _ingest(self, item: IngestItem) -> None:
+        start = time.perf_counter()
+        item.status = IngestStatus.RUNNING
+        item.save()
+        try:
+            item.hostname = self.url_processor.resolveUrl(item.url)[0]
+            crawler = await self.url_processor.crawlUrl(
+                item.url, self.max_depth, self.force, self.concurrency_per_host, self.ttl
+            )
+            if crawler is None:
+                item.status = IngestStatus.FRESH
+            else:
+                item.pages = crawler.pages_fetched
+                item.bytes_fetched = crawler.bytes_fetched
+                item.status = IngestStatus.DONE
+            item.error = None
+        except Exception as e:
+            logger.error(f"Unable to ingest {item.url}: {e!r}")
+            item.status = IngestStatus.FAILED
+            item.error = str(e) or repr(e)
+        item.seconds = time.perf_counter() - start
+        item.finished_at = datetime.datetime.now()
+        item.save()
+
+    async def ingest(self, items: Sequence[IngestItem]) -> None:
+        """Ingest the items, grouped by hostname."""
+        by_host: dict[str, list[IngestItem]] = {}
+        for item in items:
+            try:
+                hostname = self.url_processor.resolveUrl(item.url)[0]
+            except Exception:
+                # Failed by _ingest, on its own
+                hostname = item.url
+            by_host.setdefault(hostname, []).append(item)
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        await asyncio.gather(
+            *(
+                self._ingest_host(semaphore, host_items, len(items))
+                for host_items in by_host.values()
+            )
+        )
+
+
+def summarize(run: str, items: Sequence[IngestItem], elapsed: float) -> str:
+    """The throughput of the items ingested by this process and the errors of the run."""
+    elapsed = max(elapsed, 1e-9)
+    pages = sum(item.pages for item in items)
+    megabytes = sum(item.bytes_fetched for item in items) / 2**20
+    crawled = sum(item.status == IngestStatus.DONE for item in items)
+    run_items = list(IngestItem.select().where(IngestItem.run == run))
+    statuses = Counter(item.status for item in run_items)
+    errors = Counter(
+        item.error.splitlines()[0][:120]
+        for item in run_items
+        if item.status == IngestStatus.FAILED and item.error
+    )
+
+    lines = [
+        f"Ingested {len(items)} urls in {elapsed:.1f}s: {crawled} websites crawled, "
+        f"{pages} pages, {megabytes:.1f} MB",
+        f"Throughput: {pages / elapsed:.1f} pages/s, {crawled * 60 / elapsed:.1f} websites/min, "
+        f"{megabytes / elapsed:.2f} MB/s",
+        f"Run {run}: {len(run_items)} urls, "
+        + ", ".join(f"{statuses[status]} {status}" for status in sorted(statuses)),
+    ]
+    if errors:
+        lines.append(f"Errors ({sum(errors.values())}):")
+        lines.extend(f"  {count} x {error}" for error, count in errors.most_common(SUMMARY_ERRORS))
+    return "\n".join(lines)
+
+
+async def ingest(
+    path: str,
+    run: Optional[str],
+    concurrency: int,
+    concurrency_per_host: Optional[int],
+    max_depth: Optional[int],
+    force: bool,
+    retry_failed: bool,
+    ttl: Optional[int],
+) -> None:
+    embeddings = create_cached_embeddings(
+        get_llm_config(), get_embedding_cache_config(), get_embedding_executor_config()
+    )
+    vector_store = TunedRedisVectorStore(embeddings, get_redis_config(), get_vector_index_config())
+    run = run or os.path.basename(path)
+    items = checkpoint_urls(run, read_urls(path), retry_failed)
+    logger.info(f"Ingesting {len(items)} urls of run {run}")
+
+    ingestor = BulkIngestor(
+        UrlProcessor(vector_store), concurrency, concurrency_per_host, max_depth, force, ttl
+    )
+    start = time.perf_counter()
+    try:
+        await ingestor.ingest(items)
+    finally:
+        print(summarize(run, ingestor.ingested, time.perf_counter() - start))
+
+
+def main() -> None:
+    config = get_config()
+    logging.basicConfig(
+        level=(logging.DEBUG if config["IS_DEBUG"] else logging.INFO),
+        format="%(asctime)s [%(levelname)s] %(message)s",
+    )
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("file", help="File of urls, one per line")
+    parser.add_argument("--run", help="Name of the run to resume, the file name by default")
+    parser.add_argument("--concurrency", type=int, default=4, help="Websites crawled at once")
+    parser.add_argument(
+        "--per-host", type=int, help="Requests in flight per website, CRAWL_CONCURRENCY_PER_HOST"
+    )
+    parser.add_argument("--max-depth", type=int, default=config["URL_RECURSIVE_MAX_DEPTH"])
+    parser.add_argument("--force", action="store_true", help="Crawl fresh websites again")
+    parser.add_argument("--retry-failed", action="store_true", help="Retry the failed urls")
+    parser.add_argument("--ttl", type=int, help="Seconds the websites stay fresh, CRAWL_TTL")
+    args = parser.parse_args()
+
+    with DbManager() as db_manager:
+        asyncio.run(db_manager.setup_db())
+        try:
+            asyncio.run(
+                ingest(
+                    args.file,
+                    args.run,
+                    args.concurrency,
+                    args.per_host,
+                    args.max_depth,
+                    args.force,
+                    args.retry_failed,
+                    args.ttl,
+                )
+            )
+        except KeyboardInterrupt:
+            logger.info("Stopped, run the same command again to resume")
+        finally:
+            shutdown_extraction_pool()
+
+
+if __name__ == "__main__":
+    main()
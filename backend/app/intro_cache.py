@@ -0,0 +1,335 @@
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Optional
+
+import redis
+from langchain_core.prompts import BasePromptTemplate
+
+from app.agents import ChatMessage
+from app.config import IntroCacheConfig, get_redis_url
+from app.db.db_manager import WebSite
+from app.metrics import register_metrics
+
+logger = logging.getLogger(__name__)
+
+# Seconds a process holds the right to generate the intros of a version before others may retry
+FILL_LOCK_TTL = 300
+
+
+def prompt_version(prompt: BasePromptTemplate) -> str:
+    """A hash of the prompt with empty inputs, which changes whenever the prompt is edited."""
+    text = prompt.format(**{variable: "" for variable in prompt.input_variables})
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+def get_index_version(hostname: str) -> Optional[str]:
+    """The content fingerprint of the indexed website, which changes when it is re-indexed."""
+    website = WebSite.get_or_none(WebSite.hostname == hostname)
+    return website.content_fingerprint if website is not None else None
+
+
+class MemoryIntroStore:
+    """An in process store of intro variants."""
+
+    def __init__(self) -> None:
+        self._variants: dict[str, deque[str]] = {}
+        self._values: dict[str, str] = {}
+        self._locks: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def next_variant(self, key: str) -> Optional[str]:
+        with self._lock:
+            variants = self._variants.get(key)
+            if not variants:
+                return None
+            variants.rotate(-1)
+            return variants[-1]
+
+    def add_variant(self, key: str, value: str, max_variants: int, ttl: int) -> int:
+        with self._lock:
+            variants = self._variants.setdefault(key, deque(maxlen=max_variants))
+            variants.append(value)
+            return len(variants)
+
+    def count(self, key: str) -> int:
+        with self._lock:
+            return len(self._variants.get(key, ()))
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            return self._values.get(key)
+
+    def set(self, key: str, value: str, ttl: int) -> None:
+        with self._lock:
+            self._values[key] = value
+
+    def try_lock(self, key: str, ttl: int) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            if self._locks.get(key, 0) > now:
+                return False
+            self._locks[key] = now + ttl
+            return True
+
+    def unlock(self, key: str) -> None:
+        with self._lock:
+            self._locks.pop(key, None)
+
+
+class RedisIntroStore:
+    """A Redis store of intro variants shared by every server process.
+
+    Variants are kept in lists that are rotated on every read, so visitors get them in turn.
+
+    Init args:
+        redis_client: The Redis client to use.
+        namespace: The prefix of the Redis keys.
+    """
+
+    def __init__(self, redis_client: redis.Redis, namespace: str = "intro_cache") -> None:
+        self.redis_client = redis_client
+        self.namespace = namespace
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def next_variant(self, key: str) -> Optional[str]:
+        # Moves the last variant to the front and returns it
+        value = self.redis_client.rpoplpush(self._key(key), self._key(key))
+        return value.decode() if value is not None else None
+
+    def add_variant(self, key: str, value: str, max_variants: int, ttl: int) -> int:
+        pipeline = self.redis_client.pipeline()
+        pipeline.lpush(self._key(key), value)
+        pipeline.ltrim(self._key(key), 0, max_variants - 1)
+        pipeline.expire(self._key(key), ttl)
+        pipeline.llen(self._key(key))
+        return pipeline.execute()[-1]
+
+    def count(self, key: str) -> int:
+        return self.redis_client.llen(self._key(key))
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.redis_client.get(self._key(key))
+        return value.decode() if value is not None else None
+
+    def set(self, key: str, value: str, ttl: int) -> None:
+        self.redis_client.set(self._key(key), value, ex=ttl)
+
+    def try_lock(self, key: str, ttl: int) -> bool:
+        return bool(self.redis_client.set(self._key(f"{key}:lock"), 1, nx=True, ex=ttl))
+
+    def unlock(self, key: str) -> None:
+        self.redis_client.delete(self._key(f"{key}:lock"))
+
+
+class IntroCache:
+    """Pools of pre-generated intro messages per hostname, rotated between visitors.
+
+    Pools are keyed by the hostname, the version of its index and the version of the intro
+    prompt. When a website is re-indexed, the pool of its previous index version is served while
+    the pool of the new version is generated in the background.
+
+    Init args:
+        store: The MemoryIntroStore or RedisIntroStore to cache in.
+        prompt_version: The version of the intro prompt, see prompt_version().
+        variants: The number of intros generated per pool.
+        ttl: Seconds a pool is kept after it was last added to.
+    """
+
+    def __init__(
+        self,
+        store: MemoryIntroStore | RedisIntroStore,
+        prompt_version: str,
+        variants: int = 3,
+        ttl: int = 604800,
+    ) -> None:
+        self.store = store
+        self.prompt_version = prompt_version
+        self.variants = max(1, variants)
+        self.ttl = ttl
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.generated = 0
+        self._filling: set[str] = set()
+        self._tasks: set[asyncio.Task] = set()
+        self._lock = threading.Lock()
+
+    def _key(self, hostname: str, index_version: str) -> str:
+        return f"{hostname}:{index_version}:{self.prompt_version}"
+
+    def _latest_key(self, hostname: str) -> str:
+        return f"{hostname}:latest:{self.prompt_version}"
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    async def get(self, hostname: str, index_version: str) -> Optional[ChatMessage]:
+        """Get the next intro of the hostname's pool.
+
+        Falls back to the pool of the last index version that has intros, if the current one
+        has none yet.
+        """
+        value = await asyncio.to_thread(self.store.next_variant, self._key(hostname, index_version))
+        if value is not None:
+            self._count("hits")
+            return ChatMessage.model_validate_json(value)
+
+        latest_version = await asyncio.to_thread(self.store.get, self._latest_key(hostname))
+        if latest_version is not None and latest_version != index_version:
+            value = await asyncio.to_thread(
+                self.store.next_variant, self._key(hostname, latest_version)
+            )
+            if value is not None:
+                self._count("stale_hits")
+                return ChatMessage.model_validate_json(value)
+
+        self._count("misses")
+        return None
+
+    async def add(self, hostname: str, index_version: str, intro: ChatMessage) -> int:
+        """Add an intro to the hostname's pool.
+
+        Returns:
+            int: The number of intros in the pool.
+        """
+
+        def add() -> int:
+            count = self.store.add_variant(
+                self._key(hostname, index_version), intro.toJson(), self.variants, self.ttl
+            )
+            self.store.set(self._latest_key(hostname), index_version, self.ttl)
+            return count
+
+        return await asyncio.to_thread(add)
+
+    def fill(
+        self,
+        hostname: str,
+        index_version: str,
+        generate: Callable[[], Awaitable[ChatMessage]],
+    ) -> None:
+        """Generate the missing intros of the hostname's pool in the background.
+
+        Args:
+            hostname: The hostname of the pool.
+            index_version: The index version of the pool.
+            generate: Generates an intro for the hostname.
+        """
+        key = self._key(hostname, index_version)
+        if key in self._filling:
+            return
+        self._filling.add(key)
+        task = asyncio.create_task(self._fill(key, hostname, index_version, generate))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def refresh(self, hostname: str, generate: Callable[[], Awaitable[ChatMessage]]) -> None:
+        """Generate the intros of the hostname's current index version, eg. once it was re-indexed.
+
+        Args:
+            hostname: The hostname of the pool.
+            generate: Generates an intro for the hostname.
+        """
+        try:
+            index_version = await asyncio.to_thread(get_index_version, hostname)
+        except Exception as e:
+            logger.warning(f"Failed to get the index version of {hostname}: {e}")
+            return
+        if index_version is not None:
+            self.fill(hostname, index_version, generate)
+
+    async def _fill(
+        self,
+        key: str,
+        hostname: str,
+        index_version: str,
+        generate: Callable[[], Awaitable[ChatMessage]],
+    ) -> None:
+        try:
+            count = await asyncio.to_thread(self.store.count, key)
+            if count >= self.variants:
+                return
+            # Only one process generates the intros of a pool
+            if not await asyncio.to_thread(self.store.try_lock, key, FILL_LOCK_TTL):
+                return
+            try:
+                while count < self.variants:
+                    intro = await generate()
+                    count = await self.add(hostname, index_version, intro)
+                    self._count("generated")
+                logger.info(f"Generated {count} intros of {hostname}")
+            finally:
+                await asyncio.to_thread(self.store.unlock, key)
+        except Exception as e:
+            logger.warning(f"Failed to generate the intros of {hostname}: {e}")
+        finally:
+            self._filling.discard(key)
+
+    async def aclose(self) -> None:
+        """Cancel the intros being generated."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "prompt_version": self.prompt_version,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+            "generated": self.generated,
+            "filling": len(self._filling),
+        }
+
+
+def create_intro_refresher(
+    intro_cache: IntroCache,
+    generate_intro: Callable[[str], Awaitable[ChatMessage]],
+    loop: asyncio.AbstractEventLoop,
+) -> Callable[[str], None]:
+    """Create a callback refreshing the intros of a re-indexed hostname, from any thread.
+
+    The intros are generated in the background on the loop, eg. the one of the server process.
+
+    Args:
+        intro_cache: The intro cache to fill.
+        generate_intro: Generates an intro for a hostname.
+        loop: The running event loop to generate the intros on.
+    """
+
+    def refresh(hostname: str) -> None:
+        asyncio.run_coroutine_threadsafe(
+            intro_cache.refresh(hostname, lambda: generate_intro(hostname)), loop
+        )
+
+    return refresh
+
+
+def create_intro_cache(
+    intro_cache_config: IntroCacheConfig, prompt: BasePromptTemplate
+) -> Optional[IntroCache]:
+    """Create the configured intro cache of the intro prompt, or None if it is disabled."""
+    if intro_cache_config.backend == "redis":
+        store = RedisIntroStore(redis.Redis.from_url(get_redis_url()))
+    elif intro_cache_config.backend == "memory":
+        store = MemoryIntroStore()
+    else:
+        return None
+
+    intro_cache = IntroCache(
+        store,
+        prompt_version(prompt),
+        variants=intro_cache_config.variants,
+        ttl=intro_cache_config.ttl,
+    )
+    register_metrics("intro_cache", intro_cache.stats)
+    return intro_cache
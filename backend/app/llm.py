@@ -0,0 +1,148 @@
+import asyncio
+import json
+import time
+from typing import Any, AsyncIterator, Iterator, Optional
+
+import redis
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+from app.config import EmbeddingCacheConfig, EmbeddingExecutorConfig, LlmConfig, get_redis_url
+from app.embedding_cache import CachedEmbeddings, MemoryEmbeddingStore, RedisEmbeddingStore
+from app.embedding_executor import EmbeddingExecutor, ExecutorEmbeddings
+from app.metrics import register_metrics
+
+# The answer of the fake LLM, valid as an intro message of every agent
+FAKE_ANSWER = json.dumps(
+    {
+        "content": "Hi there! My name is Sam, welcome to Acme Widgets!",
+        "mc_options": ["A) Widgets", "B) Gadgets", "C) Shipping", "D) Returns"],
+    }
+)
+FAKE_EMBEDDING_SIZE = 256
+
+
+class SlowFakeChatModel(FakeListChatModel):
+    """A FakeListChatModel that waits latency seconds before answering, like a remote LLM.
+
+    Unlike FakeListChatModel's sleep, which is slept for every streamed chunk and blocks a thread
+    when invoked asynchronously, the latency is waited once and asynchronously by async calls.
+    """
+
+    latency: float = 0
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,  # noqa: ANN401
+    ) -> ChatResult:
+        time.sleep(self.latency)
+        return super()._generate(messages, stop, run_manager, **kwargs)
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,  # noqa: ANN401
+    ) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return super()._generate(messages, stop, **kwargs)
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,  # noqa: ANN401
+    ) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.latency)
+        yield from super()._stream(messages, stop, run_manager, **kwargs)
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,  # noqa: ANN401
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency)
+        async for chunk in super()._astream(messages, stop, run_manager, **kwargs):
+            yield chunk
+
+
+def create_fake_llm(latency: float = 0) -> SlowFakeChatModel:
+    """A chat model for load tests and benchmarks that answers FAKE_ANSWER after latency seconds."""
+    return SlowFakeChatModel(responses=[FAKE_ANSWER], latency=latency)
+
+
+def create_llm(llm_config: LlmConfig) -> BaseChatModel:
+    """Create the chat model configured by the LLM environment variable."""
+    if llm_config.llm == "llama":
+        from langchain_ollama import ChatOllama
+
+        return ChatOllama(model="llama3.2", base_url=llm_config.url)
+    elif llm_config.llm == "openai":
+        from langchain_openai import ChatOpenAI
+
+        return ChatOpenAI(model="gpt-4o-mini", api_key=llm_config.api_secret_key)
+    elif llm_config.llm == "fake":
+        return create_fake_llm(llm_config.fake_latency)
+    else:
+        raise ValueError("Unsupported llm type")
+
+
+def create_embeddings(llm_config: LlmConfig) -> Embeddings:
+    """Create the embeddings model configured by the LLM environment variable."""
+    if llm_config.llm == "llama":
+        from langchain_ollama import OllamaEmbeddings
+
+        return OllamaEmbeddings(model="llama3.2", base_url=llm_config.url)
+    elif llm_config.llm == "openai":
+        from langchain_openai import OpenAIEmbeddings
+
+        return OpenAIEmbeddings(model="text-embedding-3-large", api_key=llm_config.api_secret_key)
+    elif llm_config.llm == "fake":
+        return DeterministicFakeEmbedding(size=FAKE_EMBEDDING_SIZE)
+    else:
+        raise ValueError("Unsupported llm type")
+
+
+def create_cached_embeddings(
+    llm_config: LlmConfig,
+    embedding_cache_config: EmbeddingCacheConfig,
+    embedding_executor_config: EmbeddingExecutorConfig,
+) -> Embeddings:
+    """Create the embeddings model wrapped in the configured embedding cache.
+
+    Cache misses are embedded through a rate limited EmbeddingExecutor.
+    """
+    executor = EmbeddingExecutor(
+        create_embeddings(llm_config),
+        max_batch_size=embedding_executor_config.max_batch_size,
+        max_concurrency=embedding_executor_config.max_concurrency,
+        requests_per_second=embedding_executor_config.requests_per_second,
+        tokens_per_minute=embedding_executor_config.tokens_per_minute or None,
+        max_retries=embedding_executor_config.max_retries,
+    )
+    register_metrics("embedding_executor", executor.stats)
+
+    embeddings = ExecutorEmbeddings(executor)
+    if embedding_cache_config.backend == "redis":
+        store = RedisEmbeddingStore(
+            redis.Redis.from_url(get_redis_url()), embedding_cache_config.max_entries
+        )
+    elif embedding_cache_config.backend == "memory":
+        store = MemoryEmbeddingStore(embedding_cache_config.max_entries)
+    else:
+        return embeddings
+
+    cached_embeddings = CachedEmbeddings(embeddings, store)
+    register_metrics("embedding_cache", cached_embeddings.stats)
+    return cached_embeddings
@@ -1,22 +1,50 @@
 import asyncio
+import contextlib
 import logging
 import os
 import platform
 
-from flask import Flask
-from flask_cors import CORS
-from langchain_redis import RedisVectorStore
+from hypercorn.config import Config as HypercornConfig
+from hypercorn.run import run as run_hypercorn
 from psycopg2.errors import DuplicateDatabase
+from quart import Quart
+from quart_cors import cors
 
 import app.routes as routes
-from app.config import get_config, get_flask_config, get_llm_config, get_redis_config
+from app.agents.json_sales_agent import intro_few_shot_prompt
+from app.checkpointer import create_checkpoint_pool, create_checkpointer, get_pool_stats
+from app.config import (
+    get_checkpoint_pool_config,
+    get_config,
+    get_crawl_worker_config,
+    get_embedding_cache_config,
+    get_embedding_executor_config,
+    get_flask_config,
+    get_intro_cache_config,
+    get_llm_config,
+    get_psql_url,
+    get_redis_config,
+    get_response_cache_config,
+    get_server_config,
+    get_vector_index_config,
+)
 from app.db.db_manager import DbManager
+from app.dedup import deduplication_stats
+from app.extraction import shutdown_extraction_pool
+from app.intro_cache import create_intro_cache, create_intro_refresher
+from app.llm import create_cached_embeddings, create_llm
+from app.metrics import register_metrics
+from app.response_cache import create_response_cache
+from app.vector_index import TunedRedisVectorStore
+from app.worker import CrawlWorkerPool
 
 # Config
 config = get_config()
 is_debug = config["IS_DEBUG"]
 llm_config = get_llm_config()
 flask_config = get_flask_config()
+server_config = get_server_config()
+crawl_worker_config = get_crawl_worker_config()
 
 # Logging
 log_path = os.path.join(config["LOG_FOLDER"], "log.log")
@@ -28,29 +56,87 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-async def async_main() -> None:
-    app = Flask(__name__)
-    CORS(app)
+def create_app() -> Quart:
+    """Create the ASGI app.
+
+    The pools, vector store and crawl workers are created when the server starts, on the event
+    loop serving the requests, and closed when it shuts down. Each server process creates its own.
+    """
+    app = cors(Quart(__name__))
+    resources = contextlib.AsyncExitStack()
 
-    # LLM
-    llm = None
-    embeddings = None
-    if llm_config.llm == "llama":
-        from langchain_ollama import ChatOllama, OllamaEmbeddings
+    @app.before_serving
+    async def startup() -> None:
+        resources.enter_context(DbManager())
 
-        llm = ChatOllama(model="llama3.2", base_url=llm_config.url)
-        embeddings = OllamaEmbeddings(model="llama3.2", base_url=llm_config.url)
-    elif llm_config.llm == "openai":
-        from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+        # LLM
+        llm = create_llm(llm_config)
+        embeddings = create_cached_embeddings(
+            llm_config, get_embedding_cache_config(), get_embedding_executor_config()
+        )
 
-        llm = ChatOpenAI(model="gpt-4o-mini", api_key=llm_config.api_secret_key)
-        embeddings = OpenAIEmbeddings(
-            model="text-embedding-3-large", api_key=llm_config.api_secret_key
+        # Redis setup
+        redis_config = get_redis_config()
+        vector_store = TunedRedisVectorStore(embeddings, redis_config, get_vector_index_config())
+        resources.callback(vector_store.index.disconnect)
+
+        # Checkpointer connections are pooled for the lifetime of the server
+        checkpoint_pool = create_checkpoint_pool(get_psql_url(), get_checkpoint_pool_config())
+        await checkpoint_pool.open(wait=True)
+        resources.push_async_callback(checkpoint_pool.close)
+        register_metrics("checkpoint_pool", lambda: get_pool_stats(checkpoint_pool))
+        checkpointer = create_checkpointer(checkpoint_pool)
+
+        # Intros are cached per version of the prompt they are generated with
+        intro_cache = create_intro_cache(get_intro_cache_config(), intro_few_shot_prompt)
+        if intro_cache is not None:
+            resources.push_async_callback(intro_cache.aclose)
+
+        # Creating the cache embeds a text to get the dimensions of the vectors
+        response_cache = await asyncio.to_thread(
+            create_response_cache, get_response_cache_config(), embeddings
         )
-    else:
-        raise ValueError("Unsupported llm type")
 
-    # PSQL Setup
+        sales_agent = routes.register_endpoints(
+            app, llm, vector_store, checkpointer, intro_cache, response_cache
+        )
+        # Chat histories still being compacted are compacted by the next turn instead
+        resources.push_async_callback(sales_agent.aclose)
+
+        # Crawl workers
+        resources.callback(shutdown_extraction_pool)
+        register_metrics("deduplication", deduplication_stats.stats)
+        if crawl_worker_config.mode == "inprocess":
+            # The intros of re-indexed websites are generated on the loop serving the requests
+            on_indexed = None
+            if intro_cache is not None:
+                on_indexed = create_intro_refresher(
+                    intro_cache, sales_agent.agenerate_intro, asyncio.get_running_loop()
+                )
+            crawl_worker_pool = CrawlWorkerPool(
+                vector_store,
+                concurrency=crawl_worker_config.concurrency,
+                poll_interval=crawl_worker_config.poll_interval,
+                heartbeat_interval=crawl_worker_config.heartbeat_interval,
+                job_timeout=crawl_worker_config.job_timeout,
+                on_indexed=on_indexed,
+            )
+            crawl_worker_pool.start()
+            # Stopping waits for running crawl jobs
+            resources.push_async_callback(asyncio.to_thread, crawl_worker_pool.stop)
+
+        logger.info(f"Server process {os.getpid()} started")
+
+    @app.after_serving
+    async def shutdown() -> None:
+        await resources.aclose()
+        logger.info(f"Server process {os.getpid()} stopped")
+
+    return app
+
+
+def setup_dbs() -> None:
+    """Create the database and tables once, before any server process starts."""
     with DbManager() as db_manager:
         try:
             db_manager.create_db()
@@ -60,20 +146,20 @@ async def async_main() -> None:
             logger.error(e)
 
         try:
-            await db_manager.setup_db()
+            asyncio.run(db_manager.setup_db())
         except Exception as e:
             logger.error(e)
 
-        # Redis setup
-        redis_config = get_redis_config()
-        vector_store = RedisVectorStore(embeddings, config=redis_config)
 
-        # Start flask
-        try:
-            routes.register_endpoints(app, llm, vector_store)
-            app.run(host=flask_config.host, port=flask_config.port, debug=is_debug)
-        except Exception as e:
-            logger.error(e)
+def serve_production() -> None:
+    """Serve the ASGI app with hypercorn, in SERVER_WORKERS processes with an event loop each."""
+    hypercorn_config = HypercornConfig()
+    hypercorn_config.application_path = "app.main:create_app()"
+    hypercorn_config.bind = [f"{flask_config.host}:{flask_config.port}"]
+    hypercorn_config.workers = server_config.workers
+    hypercorn_config.graceful_timeout = server_config.graceful_timeout
+    hypercorn_config.errorlog = logger
+    run_hypercorn(hypercorn_config)
 
 
 def main() -> None:
@@ -81,7 +167,18 @@ def main() -> None:
         asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
     try:
-        asyncio.run(async_main())
+        setup_dbs()
+        if server_config.mode == "production":
+            serve_production()
+        else:
+            app = create_app()
+            # The reloader would start a second process with its own pools
+            app.run(
+                host=flask_config.host,
+                port=flask_config.port,
+                debug=is_debug,
+                use_reloader=False,
+            )
     except KeyboardInterrupt:
         pass
     except Exception as e:
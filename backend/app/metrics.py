@@ -0,0 +1,45 @@
+import threading
+from collections import deque
+from typing import Any, Callable
+
+_providers: dict[str, Callable[[], dict[str, Any]]] = {}
+
+
+def register_metrics(name: str, provider: Callable[[], dict[str, Any]]) -> None:
+    """Register a function reporting the metrics of a component under a name.
+
+    Registering the same name again replaces the previous provider.
+    """
+    _providers[name] = provider
+
+
+def get_metrics() -> dict[str, dict[str, Any]]:
+    """Collect the metrics of every registered component."""
+    return {name: provider() for name, provider in _providers.items()}
+
+
+class LatencyRecorder:
+    """Keeps the most recent latencies of an operation and reports their percentiles.
+
+    Init args:
+        max_samples: The number of most recent latencies kept.
+    """
+
+    def __init__(self, max_samples: int = 1000) -> None:
+        self.count = 0
+        self._samples: deque[float] = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self.count += 1
+            self._samples.append(seconds)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return {"count": self.count, "p50_ms": None, "p99_ms": None}
+        p50 = samples[len(samples) // 2]
+        p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+        return {"count": self.count, "p50_ms": p50 * 1000, "p99_ms": p99 * 1000}
@@ -0,0 +1,150 @@
+"""Migrate the vector index of the website documents to the configured vector settings.
+
+Changing the algorithm, distance metric or HNSW parameters rebuilds the index over the stored
+documents. Changing the datatype or the dimensions also rewrites the stored vectors: they are
+converted to the new datatype and truncated to the new dimensions. Vectors can't be lengthened,
+so documents are re-embedded from their text when the dimensions grow or with --reembed.
+
+Searches fail while the index is rebuilt, so run it when the chatbot is idle:
+    python -m app.migrate_index --dry-run
+    python -m app.migrate_index
+"""
+
+import argparse
+import logging
+import time
+
+import numpy as np
+from redisvl.index import SearchIndex
+
+from app.config import (
+    get_embedding_cache_config,
+    get_embedding_executor_config,
+    get_llm_config,
+    get_redis_config,
+    get_vector_index_config,
+)
+from app.llm import create_cached_embeddings
+from app.vector_index import (
+    TunedRedisVectorStore,
+    changed_attributes,
+    existing_vector_attributes,
+    truncate,
+    vector_attributes,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def rewrite_vectors(
+    vector_store: TunedRedisVectorStore,
+    old_datatype: str,
+    reembed: bool,
+    batch_size: int,
+) -> int:
+    """Rewrite the stored vectors in the datatype and dimensions of the vector store.
+
+    Returns:
+        int: The number of vectors rewritten.
+    """
+    client = vector_store.index.client
+    schema = vector_store.index.schema.index
+    content_field = vector_store.config.content_field
+    embedding_field = vector_store.config.embedding_field
+    dimensions = vector_store.config.embedding_dimensions
+
+    def flush(keys: list[bytes]) -> None:
+        pipeline = client.pipeline(transaction=False)
+        for key in keys:
+            pipeline.hmget(key, [content_field, embedding_field])
+        rows = pipeline.execute()
+        if reembed:
+            texts = [(text or b"").decode() for text, _ in rows]
+            vectors = vector_store.embeddings.embed_documents(texts)
+        else:
+            vectors = [
+                truncate(np.frombuffer(vector, dtype=old_datatype).tolist(), dimensions)
+                for _, vector in rows
+            ]
+        for key, vector in zip(keys, vectors):
+            pipeline.hset(key, embedding_field, vector_store.encode(vector))
+        pipeline.execute()
+
+    rewritten = 0
+    batch = []
+    for key in client.scan_iter(match=f"{schema.prefix}{schema.key_separator}*", count=batch_size):
+        batch.append(key)
+        if len(batch) >= batch_size:
+            flush(batch)
+            rewritten += len(batch)
+            logger.info(f"Rewrote {rewritten} vectors")
+            batch = []
+    if batch:
+        flush(batch)
+        rewritten += len(batch)
+    return rewritten
+
+
+def wait_for_indexing(index: SearchIndex, poll_interval: float = 1.0) -> None:
+    """Wait until Redis has indexed the documents of the index in the background."""
+    while True:
+        info = index.info()
+        if not int(info.get("indexing", 0)):
+            logger.info(f"Indexed {info.get('num_docs')} documents")
+            return
+        logger.info(f"Indexed {float(info.get('percent_indexed', 0)):.0%} of the documents")
+        time.sleep(poll_interval)
+
+
+def migrate(dry_run: bool, reembed: bool, batch_size: int) -> None:
+    embeddings = create_cached_embeddings(
+        get_llm_config(), get_embedding_cache_config(), get_embedding_executor_config()
+    )
+    vector_store = TunedRedisVectorStore(embeddings, get_redis_config(), get_vector_index_config())
+    index = vector_store.index
+    existing = existing_vector_attributes(index, vector_store.config.embedding_field)
+    configured = vector_attributes(
+        vector_store.vector_index_config, vector_store.config.embedding_dimensions
+    )
+    if existing is None:
+        # The vector store creates the index when there is none, so it can't be read
+        raise ValueError(f"The vector field of the {index.name} index could not be read")
+    changes = changed_attributes(existing, configured)
+    if not changes and not reembed:
+        logger.info(f"The {index.name} index already has the configured vector settings")
+        return
+
+    for name, (old, new) in sorted(changes.items()):
+        logger.info(f"{name}: {old} -> {new}")
+    old_datatype = existing.get("datatype", "FLOAT32").lower()
+    old_dimensions = int(existing.get("dims", configured["dims"]))
+    reembed = reembed or configured["dims"] > old_dimensions
+    rewrite = reembed or "datatype" in changes or "dims" in changes
+    documents = index.info().get("num_docs")
+    if dry_run:
+        action = "re-embedded" if reembed else "rewritten" if rewrite else "reindexed"
+        logger.info(f"Dry run, the {documents} documents of {index.name} would be {action}")
+        return
+
+    start = time.perf_counter()
+    # Drop the index but keep the documents, which are indexed again by the new index
+    index.delete(drop=False)
+    if rewrite:
+        rewrite_vectors(vector_store, old_datatype, reembed, batch_size)
+    index.create()
+    wait_for_indexing(index)
+    logger.info(f"Migrated {index.name} in {time.perf_counter() - start:.1f}s")
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--dry-run", action="store_true", help="Only log the changes")
+    parser.add_argument("--reembed", action="store_true", help="Re-embed every document")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+    migrate(args.dry_run, args.reembed, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Optional
+
+from langchain_core.embeddings import Embeddings
+from redisvl.extensions.llmcache import SemanticCache
+from redisvl.query.filter import Tag
+from redisvl.utils.vectorize import CustomTextVectorizer
+
+from app.config import ResponseCacheConfig, get_redis_url
+from app.intro_cache import get_index_version
+from app.metrics import register_metrics
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """Caches the answers of standalone questions per hostname and finds them by similarity.
+
+    Answers are stored with the index version of their hostname, so they are no longer found
+    once the website is re-indexed, and expire after the TTL of the semantic cache.
+
+    Init args:
+        semantic_cache: The redisvl SemanticCache to store the answers in. It must have hostname
+            and index_version tag fields.
+        embeddings: The embeddings of the questions.
+    """
+
+    def __init__(self, semantic_cache: SemanticCache, embeddings: Embeddings) -> None:
+        self.semantic_cache = semantic_cache
+        self.embeddings = embeddings
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self.errors = 0
+        self.lookup_seconds = 0.0
+        self.generation_seconds = 0.0
+        self.generations = 0
+        self._lock = threading.Lock()
+
+    def _filter(self, hostname: str, index_version: str) -> Any:  # noqa: ANN401
+        return (Tag("hostname") == hostname) & (Tag("index_version") == index_version)
+
+    async def _index_version(self, hostname: str) -> Optional[str]:
+        return await asyncio.to_thread(get_index_version, hostname)
+
+    def skip(self) -> None:
+        """Count a question that depended on the conversation and was not looked up."""
+        with self._lock:
+            self.skipped += 1
+
+    async def aget(self, hostname: str, question: str) -> Optional[str]:
+        """Get the answer of a similar question of the hostname, if one was cached.
+
+        Errors are logged and count as a miss, so the question is answered by the LLM.
+        """
+        start = time.perf_counter()
+        try:
+            index_version = await self._index_version(hostname)
+            if index_version is None:
+                return None
+            vector = await self.embeddings.aembed_query(question)
+            results = await self.semantic_cache.acheck(
+                vector=vector,
+                num_results=1,
+                return_fields=["response"],
+                filter_expression=self._filter(hostname, index_version),
+            )
+        except Exception as e:
+            logger.warning(f"Response cache lookup failed: {e}")
+            with self._lock:
+                self.errors += 1
+            return None
+
+        with self._lock:
+            self.lookup_seconds += time.perf_counter() - start
+            if results:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return results[0]["response"] if results else None
+
+    async def aset(
+        self, hostname: str, question: str, answer: str, generation_seconds: float
+    ) -> None:
+        """Cache the answer of a question of the hostname.
+
+        Args:
+            hostname: The hostname the question was asked on.
+            question: The standalone question.
+            answer: The answer of the LLM.
+            generation_seconds: How long retrieving and generating the answer took.
+        """
+        with self._lock:
+            self.generation_seconds += generation_seconds
+            self.generations += 1
+        try:
+            index_version = await self._index_version(hostname)
+            if index_version is None:
+                return
+            vector = await self.embeddings.aembed_query(question)
+            await self.semantic_cache.astore(
+                question,
+                answer,
+                vector=vector,
+                filters={"hostname": hostname, "index_version": index_version},
+            )
+        except Exception as e:
+            logger.warning(f"Response cache store failed: {e}")
+            with self._lock:
+                self.errors += 1
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            avg_lookup = self.lookup_seconds / lookups if lookups else 0.0
+            avg_generation = self.generation_seconds / self.generations if self.generations else 0.0
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "skipped": self.skipped,
+                "errors": self.errors,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "avg_lookup_ms": avg_lookup * 1000,
+                "avg_generation_ms": avg_generation * 1000,
+                # Every hit saved a retrieval and generation, minus the lookups
+                "latency_saved_ms": max(
+                    0.0, (self.hits * avg_generation - self.lookup_seconds) * 1000
+                ),
+            }
+
+
+def create_response_cache(
+    response_cache_config: ResponseCacheConfig, embeddings: Embeddings
+) -> Optional[ResponseCache]:
+    """Create the response cache if it is enabled."""
+    if not response_cache_config.enabled:
+        return None
+
+    vectorizer = CustomTextVectorizer(
+        embed=embeddings.embed_query,
+        embed_many=embeddings.embed_documents,
+        aembed=embeddings.aembed_query,
+        aembed_many=embeddings.aembed_documents,
+    )
+    semantic_cache = SemanticCache(
+        name="response_cache",
+        distance_threshold=response_cache_config.distance_threshold,
+        ttl=response_cache_config.ttl,
+        vectorizer=vectorizer,
+        filterable_fields=[
+            {"name": "hostname", "type": "tag"},
+            {"name": "index_version", "type": "tag"},
+        ],
+        redis_url=get_redis_url(),
+    )
+    response_cache = ResponseCache(semantic_cache, embeddings)
+    register_metrics("response_cache", response_cache.stats)
+    return response_cache
@@ -0,0 +1,269 @@
+import asyncio
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Optional, Sequence
+
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+from langchain_redis import RedisVectorStore
+from redis.commands.search.query import Query
+from redisvl.query.filter import Tag
+from redisvl.utils.token_escaper import TokenEscaper
+
+from app.config import RetrievalConfig
+from app.context_packing import terms
+from app.metrics import LatencyRecorder
+
+logger = logging.getLogger(__name__)
+
+RERANKERS = ["none", "lexical", "cross-encoder"]
+
+# Scores documents for a query, higher is more relevant
+Reranker = Callable[[str, Sequence[Document]], list[float]]
+
+
+def document_key(document: Document) -> tuple[Any, str]:
+    return document.metadata.get("source"), document.page_content
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[Sequence[Document]], rrf_k: int = 60
+) -> list[Document]:
+    """Fuse rankings of documents by the sum of 1 / (rrf_k + rank) of each document."""
+    scores: dict[tuple[Any, str], float] = {}
+    documents: dict[tuple[Any, str], Document] = {}
+    for ranking in rankings:
+        for rank, document in enumerate(ranking, start=1):
+            key = document_key(document)
+            scores[key] = scores.get(key, 0.0) + 1 / (rrf_k + rank)
+            documents.setdefault(key, document)
+    return [documents[key] for key in sorted(scores, key=scores.__getitem__, reverse=True)]
+
+
+def lexical_rerank(query: str, documents: Sequence[Document]) -> list[float]:
+    """Score documents by the share of query terms and query bigrams they contain."""
+    words = [word for word in re.findall(r"\w+", query.lower()) if word in terms(query)]
+    bigrams = [f"{a} {b}" for a, b in zip(words, words[1:])]
+    scores = []
+    for document in documents:
+        text = " ".join(re.findall(r"\w+", document.page_content.lower()))
+        document_terms = set(text.split())
+        coverage = sum(word in document_terms for word in words) / len(words) if words else 0.0
+        phrases = sum(bigram in text for bigram in bigrams) / len(bigrams) if bigrams else 0.0
+        scores.append(coverage + 0.5 * phrases)
+    return scores
+
+
+def create_reranker(name: str, model: str) -> Optional[Reranker]:
+    """Create the reranker of the name, or None for "none".
+
+    The cross-encoder reranker needs the optional sentence-transformers package.
+    """
+    if name == "none":
+        return None
+    elif name == "lexical":
+        return lexical_rerank
+    elif name == "cross-encoder":
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError as e:
+            raise ValueError(
+                "The cross-encoder reranker needs the sentence-transformers package"
+            ) from e
+
+        cross_encoder = CrossEncoder(model)
+
+        def cross_encoder_rerank(query: str, documents: Sequence[Document]) -> list[float]:
+            pairs = [(query, document.page_content) for document in documents]
+            return [float(score) for score in cross_encoder.predict(pairs)]
+
+        return cross_encoder_rerank
+    raise ValueError(f"Valid rerankers are {', '.join(RERANKERS)}")
+
+
+class HybridRetriever:
+    """Retrieves the documents of a hostname with vector and full-text search.
+
+    The KNN vector search and a BM25 full-text search over the content field of the RediSearch
+    index each return candidates, which are fused by reciprocal rank fusion. Full-text search
+    needs a RedisVectorStore, other vector stores are only searched by vector. The fused
+    candidates are optionally reranked, unless the reranker takes longer than the rerank budget.
+
+    Init args:
+        vector_store: The vector store to search.
+        k: The number of documents returned.
+        candidates: The number of candidates returned by each search.
+        hybrid: Whether to also search by full-text.
+        reranker: Optional function scoring the fused candidates for the query.
+        rerank_budget: Seconds the reranker may take before the fused order is returned.
+        rrf_k: The rank constant of reciprocal rank fusion.
+    """
+
+    def __init__(
+        self,
+        vector_store: VectorStore,
+        k: int = 4,
+        candidates: int = 20,
+        hybrid: bool = True,
+        reranker: Optional[Reranker] = None,
+        rerank_budget: float = 0.1,
+        rrf_k: int = 60,
+    ) -> None:
+        self.vector_store = vector_store
+        self.k = k
+        self.candidates = max(k, candidates)
+        self.hybrid = hybrid and isinstance(vector_store, RedisVectorStore)
+        self.reranker = reranker
+        self.rerank_budget = rerank_budget
+        self.rrf_k = rrf_k
+
+        self.requests = 0
+        self.text_only = 0
+        self.text_errors = 0
+        self.reranked = 0
+        self.rerank_timeouts = 0
+        self.latency = LatencyRecorder()
+        self._lock = threading.Lock()
+        self._escaper = TokenEscaper()
+        # Rerankers run on their own threads so retrieval can stop waiting for them
+        self._rerank_executor = ThreadPoolExecutor(thread_name_prefix="reranker")
+
+    def _text_query(self, query: str, hostname: str) -> Optional[Query]:
+        query_terms = terms(query)
+        if not query_terms:
+            return None
+        content_field = self.vector_store.config.content_field
+        metadata_fields = [field["name"] for field in self.vector_store.config.metadata_schema]
+        escaped_terms = [self._escaper.escape(term) for term in sorted(query_terms)]
+        text_filter = f"@{content_field}:({'|'.join(escaped_terms)})"
+        return (
+            Query(f"{Tag('hostname') == hostname} {text_filter}")
+            .scorer("BM25")
+            .return_fields(content_field, *metadata_fields)
+            .paging(0, self.candidates)
+            .dialect(2)
+        )
+
+    def text_search(self, query: str, hostname: str) -> list[Document]:
+        """Search the content of the hostname's documents for the terms of the query by BM25."""
+        if not self.hybrid:
+            return []
+        text_query = self._text_query(query, hostname)
+        if text_query is None:
+            return []
+        index = self.vector_store.index
+        content_field = self.vector_store.config.content_field
+        try:
+            results = index.client.ft(index.name).search(text_query)
+        except Exception as e:
+            # Answering from the vector search alone beats failing the answer
+            logger.warning(f"Full-text search failed: {e}")
+            with self._lock:
+                self.text_errors += 1
+            return []
+        documents = []
+        for result in results.docs:
+            fields = result.__dict__
+            metadata = {
+                field["name"]: fields[field["name"]]
+                for field in self.vector_store.config.metadata_schema
+                if field["name"] in fields
+            }
+            documents.append(Document(fields.get(content_field, ""), metadata=metadata))
+        return documents
+
+    @property
+    def _vector_candidates(self) -> int:
+        # Without fusion or reranking, the first k vector results are the result
+        return self.candidates if self.hybrid or self.reranker is not None else self.k
+
+    def _fuse(
+        self, vector_documents: list[Document], text_documents: list[Document]
+    ) -> list[Document]:
+        fused = reciprocal_rank_fusion([vector_documents, text_documents], self.rrf_k)
+        vector_keys = {document_key(document) for document in vector_documents}
+        with self._lock:
+            self.requests += 1
+            self.text_only += sum(
+                document_key(document) not in vector_keys for document in fused[: self.k]
+            )
+        return fused
+
+    def _rerank_order(self, query: str, documents: list[Document]) -> list[Document]:
+        scores = self.reranker(query, documents)
+        order = sorted(range(len(documents)), key=lambda i: (-scores[i], i))
+        return [documents[i] for i in order]
+
+    def retrieve(self, query: str, hostname: str) -> list[Document]:
+        start = time.perf_counter()
+        filter = Tag("hostname") == hostname
+        vector_documents = self.vector_store.similarity_search(
+            query, k=self._vector_candidates, filter=filter
+        )
+        documents = self._fuse(vector_documents, self.text_search(query, hostname))
+        if self.reranker is not None:
+            future = self._rerank_executor.submit(self._rerank_order, query, documents)
+            try:
+                documents = future.result(timeout=self.rerank_budget)
+                with self._lock:
+                    self.reranked += 1
+            except FutureTimeoutError:
+                # Drops the rerank if it is still queued behind slower ones
+                future.cancel()
+                with self._lock:
+                    self.rerank_timeouts += 1
+        self.latency.record(time.perf_counter() - start)
+        return documents[: self.k]
+
+    async def aretrieve(self, query: str, hostname: str) -> list[Document]:
+        start = time.perf_counter()
+        filter = Tag("hostname") == hostname
+        vector_documents, text_documents = await asyncio.gather(
+            self.vector_store.asimilarity_search(query, k=self._vector_candidates, filter=filter),
+            asyncio.to_thread(self.text_search, query, hostname),
+        )
+        documents = self._fuse(vector_documents, text_documents)
+        if self.reranker is not None:
+            try:
+                future = self._rerank_executor.submit(self._rerank_order, query, documents)
+                documents = await asyncio.wait_for(
+                    asyncio.wrap_future(future), timeout=self.rerank_budget
+                )
+                with self._lock:
+                    self.reranked += 1
+            except asyncio.TimeoutError:
+                with self._lock:
+                    self.rerank_timeouts += 1
+        self.latency.record(time.perf_counter() - start)
+        return documents[: self.k]
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "hybrid": self.hybrid,
+                "requests": self.requests,
+                # Documents returned that the vector search alone would have missed
+                "text_only": self.text_only,
+                "text_errors": self.text_errors,
+                "reranked": self.reranked,
+                "rerank_timeouts": self.rerank_timeouts,
+                "latency": self.latency.stats(),
+            }
+
+
+def create_hybrid_retriever(
+    vector_store: VectorStore, retrieval_config: RetrievalConfig
+) -> HybridRetriever:
+    """Create the configured retriever of the vector store."""
+    return HybridRetriever(
+        vector_store,
+        k=retrieval_config.k,
+        candidates=retrieval_config.candidates,
+        hybrid=retrieval_config.mode == "hybrid",
+        reranker=create_reranker(retrieval_config.reranker, retrieval_config.rerank_model),
+        rerank_budget=retrieval_config.rerank_budget,
+    )
@@ -1,53 +1,213 @@
+import asyncio
 import datetime
+import json
 import logging
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
 from uuid import uuid4
 
-from flask import Flask, jsonify, request
 from langchain_core.language_models import LanguageModelLike
 from langchain_redis import RedisVectorStore
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from quart import Quart, Response, jsonify, make_response, request
 
 from app.agents import ChatMessage
 from app.agents.json_sales_agent import JsonSalesAgent
 from app.config import get_passphrases
+from app.crawl_jobs import get_crawl_job
+from app.intro_cache import IntroCache, get_index_version
+from app.metrics import LatencyRecorder, get_metrics, register_metrics
+from app.response_cache import ResponseCache
 from app.url_processor import UrlProcessor
 
 logging.basicConfig()
 logger = logging.getLogger(__name__)
 
 
-def register_endpoints(app: Flask, llm: LanguageModelLike, vector_store: RedisVectorStore) -> None:
+def format_sse(event: str, data: Any) -> str:  # noqa: ANN401
+    """Format a server-sent event with JSON data."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def error_data(e: Exception) -> dict[str, str]:
+    if getattr(e, "status_code", None) == 429 and getattr(e, "type", None) == "insufficient_quota":
+        return {"error": "Unauthorized access", "type": "insufficient_quota"}
+    return {"error": "Internal server error"}
+
+
+def register_endpoints(
+    app: Quart,
+    llm: LanguageModelLike,
+    vector_store: RedisVectorStore,
+    checkpointer: BaseCheckpointSaver,
+    intro_cache: Optional[IntroCache] = None,
+    response_cache: Optional[ResponseCache] = None,
+) -> JsonSalesAgent:
+    """Register the endpoints of the app.
+
+    Returns:
+        JsonSalesAgent: The agent shared by the endpoints.
+    """
+
     def __is_authorized(passphrase: str) -> bool:
         passphrases = get_passphrases()
         if passphrase in passphrases:
             return True
         return False
 
+    # The agent builds its chains and graph once and is shared by every request
+    sales_agent = JsonSalesAgent(llm, vector_store, checkpointer, response_cache=response_cache)
+    register_metrics("intro_structured_output", sales_agent.intro_output.stats)
+    register_metrics("contextualization", sales_agent.contextualization.stats)
+    register_metrics("chat_history", sales_agent.history.stats)
+    register_metrics("context_packing", sales_agent.context_packer.stats)
+    register_metrics("retrieval", sales_agent.hybrid_retriever.stats)
+
+    # Time from receiving a streamed chat request to sending its first token
+    time_to_first_token = LatencyRecorder()
+    register_metrics("chat_stream", time_to_first_token.stats)
+    # Streams keep running when their client disconnects so the answer is still checkpointed
+    stream_tasks: set[asyncio.Task] = set()
+
+    async def __get_cached_intro(hostname: str) -> tuple[Optional[str], Optional[ChatMessage]]:
+        """Get the index version of the hostname and, if it has one, a cached intro."""
+        if intro_cache is None:
+            return None, None
+        index_version = await asyncio.to_thread(get_index_version, hostname)
+        if index_version is None:
+            return None, None
+        return index_version, await intro_cache.get(hostname, index_version)
+
+    async def __cache_intro(
+        hostname: str, index_version: Optional[str], intro: Optional[ChatMessage]
+    ) -> None:
+        """Cache a generated intro and generate the missing ones in the background."""
+        if intro_cache is None or index_version is None:
+            return
+        if intro is not None:
+            await intro_cache.add(hostname, index_version, intro)
+        intro_cache.fill(hostname, index_version, lambda: sales_agent.agenerate_intro(hostname))
+
+    async def __stream_chat(
+        hostname: str,
+        thread_id: str,
+        source: AsyncIterator[tuple[str, Any]],
+        on_answer: Optional[Callable[[ChatMessage], Awaitable[None]]] = None,
+    ) -> Response:
+        """Stream the events of the agent as server-sent events.
+
+        Events are `token` with the next piece of the answer's content, `reset` when the answer
+        is generated again and the content so far should be discarded, `message` with the final
+        answer and `error`.
+
+        Args:
+            hostname: The hostname of the chat.
+            thread_id: The thread id of the chat.
+            source: The events of the agent's astream.
+            on_answer: Optional callback with the final answer.
+        """
+        start = time.perf_counter()
+        queue: asyncio.Queue[tuple[str, Any]] = asyncio.Queue()
+
+        async def produce() -> None:
+            try:
+                async for event in source:
+                    await queue.put(event)
+                    if event[0] == "result" and on_answer is not None:
+                        await on_answer(event[1]["answer"])
+            except Exception as e:
+                logger.warning(e)
+                await queue.put(("error", e))
+
+        task = asyncio.create_task(produce())
+        stream_tasks.add(task)
+        task.add_done_callback(stream_tasks.discard)
+
+        async def events() -> AsyncIterator[str]:
+            first_token = True
+            while True:
+                kind, value = await queue.get()
+                if kind == "token":
+                    if first_token:
+                        first_token = False
+                        time_to_first_token.record(time.perf_counter() - start)
+                    yield format_sse("token", {"content": value})
+                elif kind == "reset":
+                    yield format_sse("reset", {})
+                elif kind == "result":
+                    answer: ChatMessage = value["answer"]
+                    response = {
+                        "status": "ready",
+                        "hostname": hostname,
+                        "thread_id": thread_id,
+                        "message": answer.toDict(),
+                    }
+                    yield format_sse("message", response)
+                    return
+                else:
+                    yield format_sse("error", error_data(value))
+                    return
+
+        response = await make_response(
+            events(),
+            {
+                "Content-Type": "text/event-stream",
+                "Cache-Control": "no-cache",
+                # Stop proxies like nginx from buffering the tokens
+                "X-Accel-Buffering": "no",
+            },
+        )
+        response.timeout = None
+        return response
+
     @app.route("/api/heartbeat", methods=["GET"])
     def get_heartbeat() -> None:
         return jsonify({"server_time": datetime.datetime.now()})
 
+    @app.route("/api/metrics", methods=["GET"])
+    def get_metrics_endpoint() -> None:
+        passphrase = request.args.get("passphrase")
+        if not __is_authorized(passphrase):
+            logger.warning("Unauthorized request")
+            return jsonify({"error": "Unauthorized access"}), 401
+        return jsonify(get_metrics())
+
     @app.route("/api/start_chat", methods=["POST"])
     async def post_start_chat() -> None:
         try:
-            data = request.json
+            data = await request.get_json()
             logger.info({"data": data})
             passphrase = data.get("passphrase")
             if not __is_authorized(passphrase):
                 logger.warning("Unauthorized request")
                 return jsonify({"error": "Unauthorized access"}), 401
 
-            # Scrape website
+            # Scrape website in the background if it was never indexed
             url = data.get("url")
             urlProcessor = UrlProcessor(vector_store)
-            hostname = await urlProcessor.processUrl(url)
-            sales_agent = JsonSalesAgent(llm, vector_store)
+            # The database is queried in a thread to not block other requests
+            hostname, crawl_job = await asyncio.to_thread(urlProcessor.enqueueUrl, url)
+            if crawl_job is not None:
+                response = {"status": "pending", "hostname": hostname, "job": crawl_job.toDict()}
+                return jsonify(response), 202
 
-            # Get initial ai message
+            # Get initial ai message, from the intro cache if the website has one
             thread_id = str(uuid4())
             config = {"configurable": {"thread_id": thread_id}}
-            init_result = await sales_agent.ainvoke(hostname, config, "")
-            answer: ChatMessage = init_result["answer"]
-            response = {"thread_id": thread_id, "message": answer.toDict()}
+            index_version, answer = await __get_cached_intro(hostname)
+            if answer is not None:
+                await sales_agent.astart_with_intro(hostname, config, answer)
+                await __cache_intro(hostname, index_version, None)
+            else:
+                init_result = await sales_agent.ainvoke(hostname, config, "")
+                answer = init_result["answer"]
+                await __cache_intro(hostname, index_version, answer)
+            response = {
+                "status": "ready",
+                "hostname": hostname,
+                "thread_id": thread_id,
+                "message": answer.toDict(),
+            }
             json_result = jsonify(response)
         except Exception as e:
             if e.status_code and e.status_code == 429 and e.type == "insufficient_quota":
@@ -58,10 +218,23 @@ def register_endpoints(app: Flask, llm: LanguageModelLike, vector_store: RedisVe
 
         return json_result
 
+    @app.route("/api/crawl_job_status", methods=["POST"])
+    async def post_crawl_job_status() -> None:
+        data = await request.get_json()
+        passphrase = data.get("passphrase")
+        if not __is_authorized(passphrase):
+            logger.warning("Unauthorized request")
+            return jsonify({"error": "Unauthorized access"}), 401
+
+        crawl_job = await asyncio.to_thread(get_crawl_job, data.get("jobId"))
+        if crawl_job is None:
+            return jsonify({"error": "Crawl job not found"}), 404
+        return jsonify({"job": crawl_job.toDict()})
+
     @app.route("/api/add_chat_message", methods=["POST"])
     async def post_add_chat_message() -> None:
         try:
-            data = request.json
+            data = await request.get_json()
             logger.info({"data": data})
             passphrase = data.get("passphrase")
             if not __is_authorized(passphrase):
@@ -72,7 +245,6 @@ def register_endpoints(app: Flask, llm: LanguageModelLike, vector_store: RedisVe
             thread_id = data.get("threadId")
             message = data.get("message")
 
-            sales_agent = JsonSalesAgent(llm, vector_store)
             config = {"configurable": {"thread_id": thread_id}}
             result = await sales_agent.ainvoke(hostname, config, message)
             answer: ChatMessage = result["answer"]
@@ -86,3 +258,56 @@ def register_endpoints(app: Flask, llm: LanguageModelLike, vector_store: RedisVe
                 logger.error(e)
 
         return json_result
+
+    @app.route("/api/start_chat_stream", methods=["POST"])
+    async def post_start_chat_stream() -> None:
+        data = await request.get_json()
+        logger.info({"data": data})
+        passphrase = data.get("passphrase")
+        if not __is_authorized(passphrase):
+            logger.warning("Unauthorized request")
+            return jsonify({"error": "Unauthorized access"}), 401
+
+        url = data.get("url")
+        urlProcessor = UrlProcessor(vector_store)
+        hostname, crawl_job = await asyncio.to_thread(urlProcessor.enqueueUrl, url)
+        if crawl_job is not None:
+            response = {"status": "pending", "hostname": hostname, "job": crawl_job.toDict()}
+            return jsonify(response), 202
+
+        thread_id = str(uuid4())
+        config = {"configurable": {"thread_id": thread_id}}
+        index_version, intro = await __get_cached_intro(hostname)
+        if intro is not None:
+            await sales_agent.astart_with_intro(hostname, config, intro)
+            await __cache_intro(hostname, index_version, None)
+
+            async def cached_events() -> AsyncIterator[tuple[str, Any]]:
+                yield "token", intro.content
+                yield "result", {"answer": intro}
+
+            return await __stream_chat(hostname, thread_id, cached_events())
+
+        return await __stream_chat(
+            hostname,
+            thread_id,
+            sales_agent.astream(hostname, config, ""),
+            lambda answer: __cache_intro(hostname, index_version, answer),
+        )
+
+    @app.route("/api/add_chat_message_stream", methods=["POST"])
+    async def post_add_chat_message_stream() -> None:
+        data = await request.get_json()
+        logger.info({"data": data})
+        passphrase = data.get("passphrase")
+        if not __is_authorized(passphrase):
+            logger.warning("Unauthorized request")
+            return jsonify({"error": "Unauthorized access"}), 401
+
+        hostname = data.get("hostname")
+        thread_id = data.get("threadId")
+        config = {"configurable": {"thread_id": thread_id}}
+        events = sales_agent.astream(hostname, config, data.get("message"))
+        return await __stream_chat(hostname, thread_id, events)
+
+    return sales_agent
@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import threading
+from collections import Counter
+from typing import Any, Awaitable, Callable, Generic, Optional, TypeVar
+
+from langchain_core.callbacks.manager import adispatch_custom_event
+from langchain_core.language_models import LanguageModelLike
+from langchain_core.runnables.config import RunnableConfig, merge_configs
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# The metadata key holding the attempt number of the runs of an attempt
+ATTEMPT_METADATA_KEY = "structured_output_attempt"
+# The custom event dispatched with {"attempt": ..., "valid": ...} when an attempt is parsed
+ATTEMPT_PARSED_EVENT = "structured_output_attempt_parsed"
+
+
+class StructuredOutputError(Exception):
+    """Raised when no attempt generated a valid structured output."""
+
+
+def with_json_mode(llm: LanguageModelLike) -> LanguageModelLike:
+    """Bind the native JSON mode of the LLM's provider, if it has one.
+
+    The LLM still returns text, so chains parsing and streaming it are unchanged.
+    """
+    llm_type = getattr(llm, "_llm_type", None)
+    if llm_type == "openai-chat":
+        return llm.bind(response_format={"type": "json_object"})
+    elif llm_type == "chat-ollama":
+        return llm.bind(format="json")
+    return llm
+
+
+class StructuredOutputEngine(Generic[T]):
+    """Generates text until it parses into a valid structured output, in bounded hedged attempts.
+
+    An attempt is started, and another one is started whenever an attempt is not valid or none
+    finished within hedge_delay seconds, up to parallel_attempts at a time and max_attempts in
+    total. The first valid output is returned and the other attempts are cancelled. Errors raised
+    while generating, like rate limits, are raised instead of retried.
+
+    Init args:
+        parse: Parses the text of an attempt, raising an exception when it is not valid.
+        repair: Optionally parses the text leniently when parse failed, raising an exception when
+            it is still not valid.
+        max_attempts: The maximum number of attempts per generation.
+        parallel_attempts: The maximum number of attempts running at the same time.
+        hedge_delay: Seconds to wait for an attempt before starting another one in parallel.
+    """
+
+    def __init__(
+        self,
+        parse: Callable[[str], T],
+        repair: Optional[Callable[[str], T]] = None,
+        max_attempts: int = 4,
+        parallel_attempts: int = 2,
+        hedge_delay: float = 5.0,
+    ) -> None:
+        self.parse = parse
+        self.repair = repair
+        self.max_attempts = max(1, max_attempts)
+        self.parallel_attempts = max(1, min(parallel_attempts, self.max_attempts))
+        self.hedge_delay = hedge_delay
+
+        self.generations = 0
+        self.failures = 0
+        self.attempts = 0
+        self.invalid = 0
+        self.repaired = 0
+        self.hedged = 0
+        self.attempts_histogram: Counter[int] = Counter()
+        self._lock = threading.Lock()
+
+    def _parse(self, text: str) -> T:
+        try:
+            return self.parse(text)
+        except Exception as e:
+            if self.repair is None:
+                raise
+            logger.debug(f"Repairing structured output after: {e}")
+        output = self.repair(text)
+        with self._lock:
+            self.repaired += 1
+        return output
+
+    async def agenerate(
+        self,
+        generate: Callable[[RunnableConfig], Awaitable[Any]],
+        get_text: Callable[[Any], str],
+        config: RunnableConfig,
+    ) -> tuple[T, Any]:
+        """Generate until an attempt is valid.
+
+        Args:
+            generate: Runs an attempt with the given config.
+            get_text: Gets the text to parse from the result of an attempt.
+            config: The config of the attempts. The attempt number is added to its metadata.
+
+        Returns:
+            tuple[T, Any]: The parsed output and the result of the attempt it was parsed from.
+
+        Raises:
+            StructuredOutputError: When none of the max_attempts attempts was valid.
+        """
+        tasks: dict[asyncio.Task, int] = {}
+
+        async def attempt(number: int) -> Optional[tuple[T, Any]]:
+            result = await generate(
+                merge_configs(config, {"metadata": {ATTEMPT_METADATA_KEY: number}})
+            )
+            try:
+                output = self._parse(get_text(result))
+            except Exception as e:
+                logger.warning(f"Structured output attempt {number} is not valid: {e}")
+                with self._lock:
+                    self.invalid += 1
+                await self._dispatch_parsed(number, False, config)
+                return None
+            await self._dispatch_parsed(number, True, config)
+            return output, result
+
+        def start() -> asyncio.Task:
+            number = len(tasks) + 1
+            task = asyncio.create_task(attempt(number))
+            tasks[task] = number
+            return task
+
+        pending = {start()}
+        try:
+            while pending:
+                can_start = len(tasks) < self.max_attempts
+                can_hedge = can_start and len(pending) < self.parallel_attempts
+                timeout = self.hedge_delay if can_hedge else None
+                done, pending = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # Hedge a slow attempt
+                    with self._lock:
+                        self.hedged += 1
+                    pending.add(start())
+                    continue
+
+                for task in done:
+                    # Errors generating, unlike invalid outputs, are raised
+                    valid = task.result()
+                    if valid is not None:
+                        self._record(len(tasks), failed=False)
+                        return valid
+
+                # Replace the invalid attempts
+                while len(tasks) < self.max_attempts and len(pending) < self.parallel_attempts:
+                    pending.add(start())
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        self._record(len(tasks), failed=True)
+        raise StructuredOutputError(f"No valid structured output in {len(tasks)} attempts")
+
+    @staticmethod
+    async def _dispatch_parsed(number: int, valid: bool, config: RunnableConfig) -> None:
+        """Tell event streams whether an attempt was valid, so they can follow another one."""
+        try:
+            await adispatch_custom_event(
+                ATTEMPT_PARSED_EVENT, {"attempt": number, "valid": valid}, config=config
+            )
+        except RuntimeError:
+            # Not called from within a run, so nobody is listening
+            pass
+
+    def _record(self, attempts: int, failed: bool) -> None:
+        with self._lock:
+            self.generations += 1
+            self.attempts += attempts
+            self.attempts_histogram[attempts] += 1
+            if failed:
+                self.failures += 1
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "generations": self.generations,
+                "failures": self.failures,
+                "attempts": self.attempts,
+                "avg_attempts": self.attempts / self.generations if self.generations else 0.0,
+                "attempts_histogram": {
+                    str(attempts): count
+                    for attempts, count in sorted(self.attempts_histogram.items())
+                },
+                "invalid": self.invalid,
+                "repaired": self.repaired,
+                "hedged": self.hedged,
+            }
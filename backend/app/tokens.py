@@ -0,0 +1,25 @@
+from functools import lru_cache
+from typing import Callable, Optional
+
+
+@lru_cache(maxsize=1)
+def _get_encode() -> Optional[Callable[[str], list[int]]]:
+    try:
+        import tiktoken
+
+        encoding = tiktoken.get_encoding("cl100k_base")
+        return encoding.encode_ordinary
+    except Exception:
+        # tiktoken is unavailable or its encoding could not be downloaded
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Count the tokens of a text with the cl100k_base encoding.
+
+    Falls back to an estimate of 4 characters per token when tiktoken is unavailable.
+    """
+    encode = _get_encode()
+    if encode is None:
+        return (len(text) + 3) // 4
+    return len(encode(text))
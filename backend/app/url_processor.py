@@ -1,22 +1,45 @@
+import asyncio
+import datetime
+import hashlib
+import logging
 import re
+from collections import deque
 from pathlib import Path
-from typing import (
-    Optional,
-    Union,
-)
+from typing import AsyncIterator, Optional, Sequence
 from urllib.parse import urlparse, urlunparse
 
-import aiohttp
-import requests
-from bs4 import BeautifulSoup
 from langchain.indexes import SQLRecordManager, index
-from langchain_community.document_loaders import RecursiveUrlLoader
+from langchain_core.documents import Document
 from langchain_redis import RedisVectorStore
 
-from app.config import get_config, get_psql_url
-from app.db.db_manager import WebSite
+from app.chunking import chunk_documents, create_text_splitter
+from app.config import (
+    get_chunking_config,
+    get_config,
+    get_crawl_ttl,
+    get_crawler_config,
+    get_extraction_workers,
+    get_psql_url,
+)
+from app.crawl_jobs import enqueue_crawl_job
+from app.crawler import AsyncCrawler, CrawledPage
+from app.db.db_manager import CrawlJob, WebSite
+from app.dedup import (
+    NearDuplicateIndex,
+    canonicalize_url,
+    deduplication_stats,
+    resolve_canonical,
+    simhash,
+)
+from app.extraction import aextract_page, get_extraction_pool
+from app.fetch_states import load_fetch_states, save_fetch_states, to_validators
+from app.frontier import UrlScorer
 
 config = get_config()
+logger = logging.getLogger(__name__)
+
+# Number of chunks indexed together, the chunks of a page are never split across batches
+INDEX_BATCH_SIZE = 100
 
 
 class UrlProcessor:
@@ -31,9 +54,8 @@ class UrlProcessor:
 
     def _normalize_url(self, url: str) -> str:
         """Normalize URL"""
-        parsed = urlparse(url)
-        # Remove any fragments
-        parsed = parsed._replace(fragment="")
+        # Remove any fragments and tracking parameters, and sort the query
+        parsed = urlparse(canonicalize_url(url))
         # Ensure the path doesn't end with a slash unless it's the root
         if parsed.path.endswith("/") and len(parsed.path) > 1:
             parsed = parsed._replace(path=parsed.path.rstrip("/"))
@@ -49,88 +71,408 @@ class UrlProcessor:
         allowed = re.compile("(?!-)[A-Z\d-]{1,63}(?<!-)$", re.IGNORECASE)
         return all(allowed.match(x) for x in hostname.split("."))
 
-    def _bs4_extractor(self, html: str) -> str:
-        """Extract text from html"""
-        soup = BeautifulSoup(html, "lxml")
-        return re.sub(r"\n\n+", "\n\n", soup.text).strip()
-
-    def _metadata_extractor(
-        self, raw_html: str, url: str, response: Union[requests.Response, aiohttp.ClientResponse]
-    ) -> dict:
-        """Extract metadata from raw html using BeautifulSoup."""
-        hostname = urlparse(url).hostname
-        content_type = getattr(response, "headers").get("Content-Type", "")
-        metadata = {"hostname": hostname, "source": url, "content_type": content_type}
-
-        soup = BeautifulSoup(raw_html, "html.parser")
-        if title := soup.find("title"):
-            metadata["title"] = title.get_text()
-        if description := soup.find("meta", attrs={"name": "description"}):
-            metadata["description"] = description.get("content", None)
-        if html := soup.find("html"):
-            metadata["language"] = html.get("lang", "en-US")
-        return metadata
+    async def _extract_pages(self, pages: AsyncIterator[CrawledPage]) -> AsyncIterator[Document]:
+        """Extract crawled pages in the extraction pool, keeping a few pages in flight."""
+        executor = get_extraction_pool(get_extraction_workers())
+        window = max(get_extraction_workers(), 1) * 2
+        in_flight: deque[asyncio.Future] = deque()
 
-    async def processUrl(
-        self, url: str, max_depth: Optional[int] = config["URL_RECURSIVE_MAX_DEPTH"]
-    ) -> str:
-        """Process a URL.
+        async def next_document() -> Document:
+            text, metadata = await in_flight.popleft()
+            return Document(page_content=text, metadata=metadata)
+
+        async for page in pages:
+            in_flight.append(
+                asyncio.ensure_future(
+                    aextract_page(page.html, page.url, page.content_type, executor)
+                )
+            )
+            if len(in_flight) >= window:
+                yield await next_document()
+        while in_flight:
+            yield await next_document()
+
+    def resolveUrl(self, url: str) -> tuple[str, str, str]:
+        """Resolve a user provided URL.
 
         Args:
-            url: The url to to process
-            max_depth: Optional number for the max depth for recursively loading webpages.
+            url: The url to resolve. A missing scheme is assumed to be https, http urls are only
+                supported with CRAWL_ALLOW_HTTP.
 
         Returns:
-            str: The hostname of the url
+            tuple[str, str, str]: The hostname, normalized url and base url
         """
-        # Validate URL
         normalized_url = self._normalize_url(url)
         parsed = urlparse(normalized_url)
 
-        if parsed.scheme == "https":
+        schemes = ["https", "http"] if get_crawler_config().allow_http else ["https"]
+        if parsed.scheme in schemes:
             hostname = parsed.hostname
+            # Credentials of the url are dropped
+            netloc = f"{hostname}:{parsed.port}" if parsed.port else hostname
+            normalized_url = urlunparse(parsed._replace(netloc=netloc))
+            return hostname, normalized_url, f"{parsed.scheme}://{netloc}"
         elif parsed.scheme == "" and self.is_valid_hostname(normalized_url):
             hostname = normalized_url
-            normalized_url = f"https://{normalized_url}"
         elif parsed.scheme == "" and not self.is_valid_hostname(normalized_url):
             path = Path(normalized_url)
             hostname = path.parts[0]
-            normalized_url = f"https://{normalized_url}"
-
         else:
             raise ValueError("Unsupported url schema")
 
         # Assume https
-        base_url = f"https://{hostname}"
+        return hostname, f"https://{normalized_url}", f"https://{hostname}"
+
+    def _get_or_create_website(self, hostname: str, base_url: str) -> WebSite:
+        website = WebSite.get_or_none(WebSite.hostname == hostname)
+        if website is None:
+            website = WebSite.create(hostname=hostname, base_url=base_url)
+        return website
+
+    async def processUrl(
+        self, url: str, max_depth: Optional[int] = config["URL_RECURSIVE_MAX_DEPTH"]
+    ) -> str:
+        """Process a URL, crawling it in the current request if it was never indexed.
+
+        Websites crawled within their TTL are returned right away. Stale websites get a
+        background crawl job while the existing index keeps being served.
+
+        Args:
+            url: The url to to process
+            max_depth: Optional number for the max depth for recursively loading webpages.
+
+        Returns:
+            str: The hostname of the url
+        """
+        hostname, normalized_url, base_url = self.resolveUrl(url)
+        website = self._get_or_create_website(hostname, base_url)
+
+        if self.is_fresh(website):
+            return hostname
+
+        if website.last_crawled_at is not None:
+            # Stale but already indexed, serve the current index while refreshing it
+            enqueue_crawl_job(hostname, normalized_url, max_depth)
+            return hostname
+
+        await self.crawl(hostname, normalized_url, base_url, max_depth)
+        return hostname
+
+    def enqueueUrl(
+        self, url: str, max_depth: Optional[int] = config["URL_RECURSIVE_MAX_DEPTH"]
+    ) -> tuple[str, Optional[CrawlJob]]:
+        """Enqueue a crawl job for a URL unless its website is fresh.
+
+        Args:
+            url: The url to to process
+            max_depth: Optional number for the max depth for recursively loading webpages.
+
+        Returns:
+            tuple[str, Optional[CrawlJob]]: The hostname of the url and, if the website has
+                never been indexed, the job to wait for before chatting.
+        """
+        hostname, normalized_url, base_url = self.resolveUrl(url)
+        website = self._get_or_create_website(hostname, base_url)
 
-        # Create website in db if necessary
-        existing_web_page = WebSite.get_or_none(WebSite.hostname == hostname)
-        if existing_web_page is None:
-            WebSite.create(hostname=hostname, base_url=base_url)
+        if self.is_fresh(website):
+            return hostname, None
 
-        # TODO: Check robots.txt first
-        # TODO: Check Sitemaps if available
-        loader = RecursiveUrlLoader(
-            url=normalized_url,
+        job = enqueue_crawl_job(hostname, normalized_url, max_depth)
+        if website.last_crawled_at is not None:
+            # Stale but already indexed, the chat can start while the job refreshes it
+            return hostname, None
+        return hostname, job
+
+    async def crawlUrl(
+        self,
+        url: str,
+        max_depth: Optional[int] = config["URL_RECURSIVE_MAX_DEPTH"],
+        force: bool = False,
+        concurrency_per_host: Optional[int] = None,
+        ttl: Optional[int] = None,
+    ) -> Optional[AsyncCrawler]:
+        """Crawl and index a URL now, unless its website is fresh.
+
+        Args:
+            url: The url to to process
+            max_depth: Optional number for the max depth for recursively loading webpages.
+            force: Whether to crawl the website even if it is fresh.
+            concurrency_per_host: Optional number of requests in flight at the same time.
+            ttl: Optional seconds the website stays fresh, stored as its override of CRAWL_TTL.
+
+        Returns:
+            Optional[AsyncCrawler]: The crawler, or None if the website was fresh.
+        """
+        hostname, normalized_url, base_url = self.resolveUrl(url)
+        website = self._get_or_create_website(hostname, base_url)
+        if ttl is not None and website.ttl != ttl:
+            website.ttl = ttl
+            website.save()
+
+        if not force and self.is_fresh(website):
+            return None
+        return await self.crawl(hostname, normalized_url, base_url, max_depth, concurrency_per_host)
+
+    def is_fresh(self, website: WebSite) -> bool:
+        """Whether the website was crawled within its TTL.
+
+        Args:
+            website: The website to check.
+        """
+        if website.last_crawled_at is None:
+            return False
+        ttl = website.ttl if website.ttl is not None else get_crawl_ttl()
+        age = datetime.datetime.now() - website.last_crawled_at
+        return age < datetime.timedelta(seconds=ttl)
+
+    async def crawl(
+        self,
+        hostname: str,
+        url: str,
+        base_url: str,
+        max_depth: Optional[int],
+        concurrency_per_host: Optional[int] = None,
+    ) -> AsyncCrawler:
+        """Crawl and index a website, then mark it as freshly crawled.
+
+        Pages are chunked and indexed in batches while the crawl is still fetching the next
+        ones. Pages fetched by a previous crawl are requested conditionally with their ETag and
+        Last-Modified. Pages that were not modified, or whose extracted text has the same hash,
+        are neither extracted nor indexed again, but their records are refreshed as seen. The
+        pages robots.txt disallows are skipped, and the pages of the sitemaps modified since the
+        previous crawl are fetched along with the linked pages. Pages are fetched best first, by
+        the crawl rules of the platform of the website, until the page budget is spent.
+
+        Urls are canonicalized before they are fetched, and pages are indexed under their
+        rel=canonical url, once per crawl. Pages whose SimHash is within a few bits of a page
+        of the website already indexed are near duplicates, and are not embedded. They are
+        downloaded and checked again by every crawl, in case either page changed.
+
+        Args:
+            hostname: The hostname of the website.
+            url: The normalized url to start crawling from.
+            base_url: The base url of the website.
+            max_depth: Optional number for the max depth for recursively loading webpages.
+            concurrency_per_host: Optional number of requests in flight at the same time,
+                CRAWL_CONCURRENCY_PER_HOST by default.
+
+        Returns:
+            AsyncCrawler: The crawler, with the counts of what it fetched.
+        """
+        crawler_config = get_crawler_config()
+        fetch_states = load_fetch_states(hostname)
+        website = WebSite.get_or_none(WebSite.hostname == hostname)
+        platform = crawler_config.platform
+        if platform == "auto" and website is not None and website.platform:
+            # The start page may not be downloaded again to detect it
+            platform = website.platform
+        scorer = UrlScorer(
+            platform, crawler_config.include_patterns, crawler_config.exclude_patterns
+        )
+        crawler = AsyncCrawler(
             base_url=base_url,
             max_depth=max_depth,
-            extractor=self._bs4_extractor,
-            metadata_extractor=self._metadata_extractor,
-            exclude_dirs=(
-                [
-                    f"{base_url}/cart",
-                    f"{base_url}/wp-includes",
-                    f"{base_url}/wp-content",
-                    f"{base_url}/wp-json",
-                    f"{base_url}/xmlrpc.php",
-                ]
+            concurrency_per_host=concurrency_per_host or crawler_config.concurrency_per_host,
+            max_pages=crawler_config.max_pages,
+            max_bytes=crawler_config.max_bytes,
+            max_frontier=crawler_config.max_frontier,
+            timeout=crawler_config.request_timeout,
+            validators=(
+                {page_url: to_validators(state) for page_url, state in fetch_states.items()}
+                if crawler_config.conditional_requests
+                else None
+            ),
+            user_agent=crawler_config.user_agent,
+            respect_robots=crawler_config.respect_robots,
+            crawl_delay=crawler_config.crawl_delay,
+            max_crawl_delay=crawler_config.max_crawl_delay,
+            use_sitemaps=crawler_config.use_sitemaps,
+            # Sitemap pages last modified before the previous crawl are already indexed
+            modified_since=(
+                website.last_crawled_at if website is not None and fetch_states else None
             ),
+            scorer=scorer,
+        )
+        chunking_config = get_chunking_config()
+        text_splitter = create_text_splitter(
+            chunk_size=chunking_config.chunk_size,
+            chunk_overlap=chunking_config.chunk_overlap,
+            strategy=chunking_config.strategy,
+        )
+        record_manager = SQLRecordManager(namespace=f"redis/{hostname}", db_url=get_psql_url())
+
+        # The hash of the text indexed under every source
+        page_hashes: dict[str, Optional[str]] = {}
+        batch: list[Document] = []
+        indexing: Optional[asyncio.Task] = None
+        # The ETag, Last-Modified and links of every fetched page, and the hash of its text
+        fetched: dict[str, tuple[Optional[str], Optional[str], Sequence[str]]] = {}
+        content_hashes = {page_url: state.content_hash for page_url, state in fetch_states.items()}
+        for state in fetch_states.values():
+            # Variants keep the content hash of the canonical url they are indexed under
+            if state.duplicate_of and state.content_hash:
+                content_hashes.setdefault(state.duplicate_of, state.content_hash)
+        unchanged_sources: set[str] = set()
+        unchanged_texts = 0
+        # The SimHash of every page, and the page each near duplicate is a duplicate of
+        simhashes = {page_url: state.simhash for page_url, state in fetch_states.items()}
+        duplicates_of = {page_url: state.duplicate_of for page_url, state in fetch_states.items()}
+        near_duplicates = NearDuplicateIndex(crawler_config.near_duplicate_distance)
+        for page_url, fingerprint in simhashes.items():
+            if fingerprint and not duplicates_of[page_url]:
+                near_duplicates.add(page_url, int(fingerprint, 16))
+        extracted_sources: set[str] = set()
+        # The SimHash and page of the near duplicates, checked again once the crawl is done
+        near_duplicate_pages: dict[str, tuple[int, Document]] = {}
+        pages_extracted = 0
+        canonical_duplicates = 0
+        embeddings_saved = 0
+
+        async def flush(docs: list[Document]) -> None:
+            nonlocal indexing
+            if indexing is not None:
+                await indexing
+            indexing = asyncio.create_task(asyncio.to_thread(self._index, docs, record_manager))
+
+        async def modified_pages() -> AsyncIterator[CrawledPage]:
+            async for page in crawler.crawl(url):
+                fetched[page.url] = (page.etag, page.last_modified, page.links)
+                if page.not_modified:
+                    # Near duplicates have no validators, so a page that was not modified is
+                    # indexed under its own url or the canonical url it declared
+                    source = duplicates_of.get(page.url) or page.url
+                    page_hashes.setdefault(source, content_hashes.get(source))
+                    unchanged_sources.add(source)
+                    continue
+                yield page
+
+        async for doc in self._extract_pages(modified_pages()):
+            pages_extracted += 1
+            page_url = doc.metadata["source"]
+            # Variants of a page are indexed once, under the canonical url they declare
+            source = resolve_canonical(page_url, doc.metadata.pop("canonical", None), base_url)
+            duplicates_of[page_url] = source if source != page_url else None
+            if source in extracted_sources:
+                canonical_duplicates += 1
+                embeddings_saved += len(list(chunk_documents([doc], text_splitter)))
+                continue
+            extracted_sources.add(source)
+            doc.metadata["source"] = source
+            # Links similar to the product and pricing pages indexed so far are fetched first
+            scorer.learn(source, doc.page_content)
+            content_hash = hashlib.sha256(doc.page_content.encode()).hexdigest()
+            page_hashes[source] = content_hash
+            if content_hashes.get(source) == content_hash:
+                unchanged_sources.add(source)
+                unchanged_texts += 1
+                continue
+            content_hashes[source] = content_hash
+            fingerprint = simhash(doc.page_content) if crawler_config.near_duplicates else None
+            duplicate_of = None
+            if fingerprint is not None:
+                duplicate_of = near_duplicates.find(fingerprint, exclude=source)
+            simhashes[source] = f"{fingerprint:016x}" if fingerprint is not None else None
+            duplicates_of[source] = duplicate_of
+            if duplicate_of:
+                # Its chunks would crowd the page it duplicates out of the top results
+                near_duplicate_pages[source] = (fingerprint, doc)
+                continue
+            if fingerprint is not None:
+                near_duplicates.add(source, fingerprint)
+            batch.extend(chunk_documents([doc], text_splitter))
+            if len(batch) >= INDEX_BATCH_SIZE:
+                await flush(batch)
+                batch = []
+
+        # The page a near duplicate was found to duplicate may have changed later in the crawl
+        duplicate_sources = []
+        for source, (fingerprint, doc) in near_duplicate_pages.items():
+            duplicate_of = near_duplicates.find(fingerprint, exclude=source)
+            duplicates_of[source] = duplicate_of
+            if duplicate_of is None:
+                near_duplicates.add(source, fingerprint)
+                batch.extend(chunk_documents([doc], text_splitter))
+                continue
+            # Without a content hash or validators, the next crawl extracts and checks it again
+            # in case either page changed
+            content_hashes[source] = None
+            duplicate_sources.append(source)
+            embeddings_saved += len(list(chunk_documents([doc], text_splitter)))
+
+        await flush(batch)
+        await indexing
+        await asyncio.to_thread(self._touch, sorted(unchanged_sources), record_manager)
+        await asyncio.to_thread(self._forget, duplicate_sources, record_manager)
+        near_duplicate_urls = set(duplicate_sources)
+        for page_url in fetched:
+            if duplicates_of.get(page_url) in near_duplicate_urls:
+                # Variants of a near duplicate page
+                near_duplicate_urls.add(page_url)
+        save_fetch_states(
+            hostname,
+            [
+                (
+                    page_url,
+                    None if page_url in near_duplicate_urls else etag,
+                    None if page_url in near_duplicate_urls else last_modified,
+                    None
+                    if page_url in near_duplicate_urls
+                    else content_hashes.get(duplicates_of.get(page_url) or page_url),
+                    links,
+                    simhashes.get(page_url),
+                    duplicates_of.get(page_url),
+                )
+                for page_url, (etag, last_modified, links) in fetched.items()
+            ],
+        )
+        duplicates = len(duplicate_sources) + canonical_duplicates
+        deduplication_stats.record(
+            pages_extracted, len(duplicate_sources), canonical_duplicates, embeddings_saved
+        )
+        logger.info(
+            f"Crawled {crawler.pages_fetched} pages ({crawler.bytes_fetched} bytes) of {hostname}, "
+            f"{crawler.pages_not_modified} not modified and "
+            f"{unchanged_texts} with unchanged text, "
+            f"{crawler.sitemap_urls} urls from sitemaps, {crawler.urls_disallowed} disallowed, "
+            f"{crawler.urls_excluded} excluded by the {scorer.platform} rules, "
+            f"{len(duplicate_sources)} near duplicates and {canonical_duplicates} canonical "
+            f"duplicates ({duplicates / max(pages_extracted, 1):.0%} of the extracted pages), "
+            f"{embeddings_saved} embeddings saved"
         )
+
+        fingerprint = hashlib.sha256(
+            "\n".join(sorted(f"{source}:{page_hashes[source]}" for source in page_hashes)).encode()
+        ).hexdigest()
+        WebSite.update(
+            last_crawled_at=datetime.datetime.now(),
+            content_fingerprint=fingerprint,
+            platform=scorer.platform,
+        ).where(WebSite.hostname == hostname).execute()
+        return crawler
+
+    def _touch(self, sources: list[str], record_manager: SQLRecordManager) -> None:
+        """Refresh the records of the chunks of unchanged pages, which are not indexed again."""
+        for source in sources:
+            keys = record_manager.list_keys(group_ids=[source])
+            if keys:
+                record_manager.update(keys, group_ids=[source] * len(keys))
+
+    def _forget(self, sources: list[str], record_manager: SQLRecordManager) -> None:
+        """Delete the chunks of pages found to be near duplicates, indexed by a previous crawl."""
+        for source in sources:
+            keys = record_manager.list_keys(group_ids=[source])
+            if keys:
+                self.vector_store.delete(keys)
+                record_manager.delete_keys(keys)
+
+    def _index(self, docs: list[Document], record_manager: SQLRecordManager) -> None:
+        """Index chunks, replacing the previously indexed chunks of their pages."""
+        if not docs:
+            return
         index(
-            loader,
-            SQLRecordManager(namespace=f"redis/{hostname}", db_url=get_psql_url()),
+            docs,
+            record_manager,
             self.vector_store,
             cleanup="incremental",
             source_id_key="source",
         )
-        return hostname
@@ -0,0 +1,247 @@
+import logging
+import math
+from typing import Any, Iterable, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_redis import RedisConfig, RedisVectorStore
+from redisvl.index import SearchIndex
+from redisvl.query import BaseQuery
+from redisvl.query.query import BaseVectorQuery
+from redisvl.schema import IndexSchema
+
+from app.config import VectorIndexConfig
+
+logger = logging.getLogger(__name__)
+
+# The names FT.INFO gives the vector field attributes of the index schema
+INFO_ATTRIBUTES = {
+    "algorithm": "algorithm",
+    "data_type": "datatype",
+    "dim": "dims",
+    "distance_metric": "distance_metric",
+    "m": "m",
+    "ef_construction": "ef_construction",
+    "ef_runtime": "ef_runtime",
+}
+
+
+def truncate(vector: list[float], dimensions: int) -> list[float]:
+    """The first dimensions of the vector, rescaled to unit length."""
+    truncated = vector[:dimensions]
+    norm = math.sqrt(sum(value * value for value in truncated))
+    return [value / norm for value in truncated] if norm else truncated
+
+
+class TruncatedEmbeddings(Embeddings):
+    """Embeddings shortened to their first dimensions and rescaled to unit length.
+
+    Models trained to front-load the meaning of their vectors, like OpenAI's text-embedding-3
+    models, keep most of their retrieval quality when shortened this way, which is what their
+    dimensions parameter does.
+
+    Init args:
+        embeddings: The embeddings model to shorten.
+        dimensions: The number of dimensions kept.
+    """
+
+    def __init__(self, embeddings: Embeddings, dimensions: int) -> None:
+        self.embeddings = embeddings
+        self.dimensions = dimensions
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        vectors = self.embeddings.embed_documents(texts)
+        return [truncate(vector, self.dimensions) for vector in vectors]
+
+    def embed_query(self, text: str) -> list[float]:
+        return truncate(self.embeddings.embed_query(text), self.dimensions)
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        vectors = await self.embeddings.aembed_documents(texts)
+        return [truncate(vector, self.dimensions) for vector in vectors]
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return truncate(await self.embeddings.aembed_query(text), self.dimensions)
+
+
+def vector_attributes(vector_index_config: VectorIndexConfig, dimensions: int) -> dict[str, Any]:
+    """The attributes of the vector field of the configured index."""
+    attributes: dict[str, Any] = {
+        "dims": dimensions,
+        "distance_metric": vector_index_config.distance_metric,
+        "algorithm": vector_index_config.algorithm,
+        "datatype": vector_index_config.datatype,
+    }
+    if vector_index_config.algorithm == "HNSW":
+        attributes["m"] = vector_index_config.m
+        attributes["ef_construction"] = vector_index_config.ef_construction
+        attributes["ef_runtime"] = vector_index_config.ef_runtime
+    return attributes
+
+
+def create_index_schema(
+    redis_config: RedisConfig, vector_index_config: VectorIndexConfig, dimensions: int
+) -> IndexSchema:
+    """The schema langchain-redis creates from the Redis config, with the configured vectors."""
+    fields = [
+        {"name": redis_config.content_field, "type": "text"},
+        {
+            "name": redis_config.embedding_field,
+            "type": "vector",
+            "attrs": vector_attributes(vector_index_config, dimensions),
+        },
+    ]
+    for field in redis_config.metadata_schema or []:
+        if field["type"] == "tag":
+            attrs = {"separator": redis_config.default_tag_separator, **field.get("attrs", {})}
+            field = {**field, "attrs": attrs}
+        fields.append(field)
+    return IndexSchema.from_dict(
+        {
+            "index": {
+                "name": redis_config.index_name,
+                "prefix": redis_config.key_prefix,
+                "storage_type": redis_config.storage_type,
+            },
+            "fields": fields,
+        }
+    )
+
+
+def _text(value: Any) -> str:  # noqa: ANN401
+    return value.decode() if isinstance(value, bytes) else str(value)
+
+
+def existing_vector_attributes(index: SearchIndex, field_name: str) -> Optional[dict[str, str]]:
+    """The attributes of the vector field of the index in Redis, None if there is no index."""
+    if not index.exists():
+        return None
+    for attribute in index.info().get("attributes", []):
+        values = [_text(value) for value in attribute]
+        info = {key.lower(): value for key, value in zip(values[::2], values[1::2])}
+        if info.get("identifier") == field_name:
+            return {name: info[key].upper() for key, name in INFO_ATTRIBUTES.items() if key in info}
+    return None
+
+
+def changed_attributes(
+    existing: dict[str, str], configured: dict[str, Any]
+) -> dict[str, tuple[str, str]]:
+    """The (existing, configured) values of the vector attributes that differ.
+
+    Attributes FT.INFO doesn't report, like the HNSW parameters of older Redis versions, are
+    only compared when the algorithm changes.
+    """
+    changes = {}
+    for name in configured.keys() | existing.keys():
+        if name not in existing and existing.get("algorithm") == configured["algorithm"]:
+            continue
+        old, new = existing.get(name, "-"), str(configured.get(name, "-")).upper()
+        if old != new:
+            changes[name] = (old, new)
+    return changes
+
+
+class DatatypeSearchIndex(SearchIndex):
+    """A SearchIndex encoding the vectors of vector queries in the datatype of the index.
+
+    Init args:
+        schema: The schema of the index.
+        redis_client: The Redis client to use.
+        datatype: The datatype of the vector field, like FLOAT16.
+    """
+
+    def __init__(self, schema: IndexSchema, redis_client: Any, datatype: str) -> None:  # noqa: ANN401
+        super().__init__(schema, redis_client)
+        self.datatype = datatype.lower()
+
+    def _query(self, query: BaseQuery) -> list[dict[str, Any]]:
+        if isinstance(query, BaseVectorQuery):
+            # langchain-redis always queries with float32 vectors
+            query._dtype = self.datatype
+        return super()._query(query)
+
+
+class TunedRedisVectorStore(RedisVectorStore):
+    """A RedisVectorStore with the vector index of the vector index config.
+
+    langchain-redis creates a vector field without HNSW parameters and always writes and queries
+    float32 vectors. This store creates the configured field, writes and queries vectors in its
+    datatype, and truncates the embeddings when the config sets dimensions. An index already in
+    Redis is used as it is, with a warning when it differs from the config.
+
+    Init args:
+        embeddings: The embeddings model.
+        config: The Redis config of the index.
+        vector_index_config: The vector index config.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        config: RedisConfig,
+        vector_index_config: VectorIndexConfig,
+    ) -> None:
+        if vector_index_config.dimensions:
+            embeddings = TruncatedEmbeddings(embeddings, vector_index_config.dimensions)
+        dimensions = config.embedding_dimensions or vector_index_config.dimensions
+        if not dimensions:
+            dimensions = len(embeddings.embed_query("The quick brown fox jumps over the lazy dog"))
+        self.vector_index_config = vector_index_config
+        self.datatype = vector_index_config.datatype.lower()
+        schema = create_index_schema(config, vector_index_config, dimensions)
+        config = config.model_copy(
+            update={
+                "embedding_dimensions": dimensions,
+                "distance_metric": vector_index_config.distance_metric,
+                "indexing_algorithm": vector_index_config.algorithm,
+                "vector_datatype": vector_index_config.datatype,
+                "index_schema": schema,
+            }
+        )
+        super().__init__(embeddings, config=config)
+        self._index = DatatypeSearchIndex(schema, self._index.client, self.datatype)
+
+        existing = existing_vector_attributes(self._index, config.embedding_field)
+        changes = changed_attributes(
+            existing or {}, vector_attributes(vector_index_config, dimensions)
+        )
+        if existing and changes:
+            logger.warning(
+                f"The {config.index_name} index differs from the config in "
+                f"{', '.join(sorted(changes))}, run python -m app.migrate_index to migrate it"
+            )
+
+    def encode(self, vector: list[float]) -> bytes:
+        """The bytes of the vector stored in the index."""
+        return np.array(vector, dtype=self.datatype).tobytes()
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[list[dict]] = None,
+        keys: Optional[list[str]] = None,
+        **kwargs: Any,  # noqa: ANN401
+    ) -> list[str]:
+        if self.datatype == "float32":
+            return super().add_texts(texts, metadatas, keys, **kwargs)
+        # As RedisVectorStore.add_texts, encoding the vectors in the datatype of the index
+        texts = list(texts)
+        vectors = self._embeddings.embed_documents(texts)
+        separator = self.config.default_tag_separator
+        datas = [
+            {
+                self.config.content_field: text,
+                self.config.embedding_field: self.encode(vector),
+                **{
+                    name: separator.join(value) if isinstance(value, list) else value
+                    for name, value in metadata.items()
+                },
+            }
+            for text, vector, metadata in zip(texts, vectors, metadatas or [{}] * len(texts))
+        ]
+        if keys:
+            result = self._index.load(datas, keys=[f"{self.key_prefix}:{key}" for key in keys])
+        else:
+            result = self._index.load(datas)
+        return list(result) if result is not None else []
@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import os
+import threading
+from typing import Callable, Optional
+
+from langchain_redis import RedisVectorStore
+
+from app.agents.json_sales_agent import JsonSalesAgent, intro_few_shot_prompt
+from app.config import (
+    get_config,
+    get_crawl_worker_config,
+    get_embedding_cache_config,
+    get_embedding_executor_config,
+    get_intro_cache_config,
+    get_llm_config,
+    get_redis_config,
+    get_vector_index_config,
+)
+from app.crawl_jobs import claim_next_crawl_job, finish_crawl_job, heartbeat_crawl_job
+from app.db.db_manager import CrawlJob, DbManager, db_proxy
+from app.extraction import shutdown_extraction_pool
+from app.intro_cache import create_intro_cache, create_intro_refresher
+from app.llm import create_cached_embeddings, create_llm
+from app.url_processor import UrlProcessor
+from app.vector_index import TunedRedisVectorStore
+
+logger = logging.getLogger(__name__)
+
+
+class CrawlWorkerPool:
+    """A pool of threads that run crawl jobs from the crawl_jobs table.
+
+    Pools can run in the server process or in separate `python -m app.worker` processes.
+    Jobs are claimed with row locks so any number of pools can share the queue. Running jobs
+    send heartbeats, and jobs whose heartbeats stopped are claimed again.
+
+    Init args:
+        vector_store: The RedisVectorStore to index into.
+        concurrency: The number of jobs to run at the same time.
+        poll_interval: Seconds to wait before polling again when the queue is empty.
+        heartbeat_interval: Seconds between the heartbeats of a running job.
+        job_timeout: Seconds without a heartbeat after which a running job is considered abandoned.
+        on_indexed: Optional callback called with the hostname of every job that succeeded, eg. to
+            generate the intros of the new index.
+    """
+
+    def __init__(
+        self,
+        vector_store: RedisVectorStore,
+        concurrency: int,
+        poll_interval: float,
+        heartbeat_interval: float,
+        job_timeout: int,
+        on_indexed: Optional[Callable[[str], None]] = None,
+    ) -> None:
+        self.vector_store = vector_store
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.job_timeout = job_timeout
+        self.on_indexed = on_indexed
+        self._stop_event = threading.Event()
+        self._threads: list[threading.Thread] = []
+
+    def run_once(self) -> Optional[CrawlJob]:
+        """Claim and run the next crawl job.
+
+        Returns:
+            Optional[CrawlJob]: The finished job or None if the queue was empty.
+        """
+        job = claim_next_crawl_job(self.job_timeout)
+        if job is None:
+            return None
+
+        logger.info(f"Crawling {job.url} for job {job.id}")
+        job_done = threading.Event()
+        heartbeat_thread = threading.Thread(
+            target=self._heartbeat, args=(job, job_done), name=f"crawl-heartbeat-{job.id}"
+        )
+        heartbeat_thread.start()
+        try:
+            urlProcessor = UrlProcessor(self.vector_store)
+            hostname, normalized_url, base_url = urlProcessor.resolveUrl(job.url)
+            asyncio.run(urlProcessor.crawl(hostname, normalized_url, base_url, job.max_depth))
+            finished = finish_crawl_job(job)
+        except Exception as e:
+            logger.error(e)
+            finish_crawl_job(job, error=str(e))
+            return job
+        finally:
+            job_done.set()
+            heartbeat_thread.join()
+
+        # A worker that reclaimed the job refreshes the website once it finishes it
+        if finished and self.on_indexed is not None:
+            try:
+                self.on_indexed(job.hostname)
+            except Exception as e:
+                logger.warning(f"Failed to refresh {job.hostname} after job {job.id}: {e!r}")
+        return job
+
+    def _heartbeat(self, job: CrawlJob, job_done: threading.Event) -> None:
+        """Send the heartbeats of a job until it is done."""
+        try:
+            while not job_done.wait(self.heartbeat_interval):
+                try:
+                    if not heartbeat_crawl_job(job):
+                        logger.warning(f"Crawl job {job.id} was claimed by another worker")
+                        return
+                except Exception as e:
+                    logger.warning(f"Unable to send the heartbeat of crawl job {job.id}: {e!r}")
+        finally:
+            db_proxy.close()
+
+    def _run(self) -> None:
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    job = self.run_once()
+                except Exception as e:
+                    logger.error(e)
+                    job = None
+                if job is None:
+                    self._stop_event.wait(self.poll_interval)
+        finally:
+            db_proxy.close()
+
+    def start(self) -> None:
+        self._stop_event.clear()
+        for i in range(self.concurrency):
+            thread = threading.Thread(target=self._run, name=f"crawl-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop polling and wait for the running jobs to finish."""
+        self._stop_event.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+
+def main() -> None:
+    config = get_config()
+    log_path = os.path.join(config["LOG_FOLDER"], "worker.log")
+    logging.basicConfig(
+        level=(logging.DEBUG if config["IS_DEBUG"] else logging.INFO),
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        handlers=[logging.FileHandler(log_path), logging.StreamHandler()],
+    )
+
+    crawl_worker_config = get_crawl_worker_config()
+    llm_config = get_llm_config()
+    embeddings = create_cached_embeddings(
+        llm_config, get_embedding_cache_config(), get_embedding_executor_config()
+    )
+    vector_store = TunedRedisVectorStore(embeddings, get_redis_config(), get_vector_index_config())
+
+    # The intros of re-indexed websites are generated here when the servers share the cache
+    loop = asyncio.new_event_loop()
+    intro_cache_config = get_intro_cache_config()
+    intro_cache = None
+    on_indexed = None
+    if intro_cache_config.backend == "redis":
+        intro_cache = create_intro_cache(intro_cache_config, intro_few_shot_prompt)
+        sales_agent = JsonSalesAgent(create_llm(llm_config), vector_store)
+        on_indexed = create_intro_refresher(intro_cache, sales_agent.agenerate_intro, loop)
+
+    with DbManager():
+        pool = CrawlWorkerPool(
+            vector_store,
+            concurrency=crawl_worker_config.concurrency,
+            poll_interval=crawl_worker_config.poll_interval,
+            heartbeat_interval=crawl_worker_config.heartbeat_interval,
+            job_timeout=crawl_worker_config.job_timeout,
+            on_indexed=on_indexed,
+        )
+        pool.start()
+        logger.info(f"Crawl worker started with {pool.concurrency} threads")
+        try:
+            loop.run_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            logger.info("Stopping crawl worker")
+            pool.stop()
+            if intro_cache is not None:
+                loop.run_until_complete(intro_cache.aclose())
+            loop.close()
+            shutdown_extraction_pool()
+
+
+if __name__ == "__main__":
+    main()
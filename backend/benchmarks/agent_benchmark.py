@@ -0,0 +1,78 @@
+"""Measure the per-request overhead of the sales agent with a fake LLM and vector store.
+
+Compares building a JsonSalesAgent per request, as routes.py used to, with one agent shared by
+every request. Conversations are checkpointed in memory, so no database is needed.
+
+Usage:
+    python -m benchmarks.agent_benchmark --requests 200
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Awaitable, Callable
+from uuid import uuid4
+
+from langgraph.checkpoint.memory import MemorySaver
+
+from app.agents.json_sales_agent import JsonSalesAgent
+from app.llm import create_fake_llm
+from benchmarks.fakes import FakeVectorStore
+
+HOSTNAME = "acme.test"
+
+
+async def bench(
+    name: str, num_requests: int, invoke: Callable[[dict, str], Awaitable[dict]]
+) -> None:
+    """Time an intro request followed by a message request per conversation."""
+    timings = []
+    for _ in range(num_requests // 2):
+        config = {"configurable": {"thread_id": str(uuid4())}}
+        for input in ["", "Tell me about widgets"]:
+            start = time.perf_counter()
+            await invoke(config, input)
+            timings.append(time.perf_counter() - start)
+
+    timings.sort()
+    mean = sum(timings) / len(timings)
+    p50 = timings[len(timings) // 2]
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    print(f"{name:<24} {mean * 1000:>9.2f} {p50 * 1000:>9.2f} {p99 * 1000:>9.2f}")
+
+
+async def run(num_requests: int) -> None:
+    llm = create_fake_llm()
+    vector_store = FakeVectorStore()
+    checkpointer = MemorySaver()
+
+    start = time.perf_counter()
+    for _ in range(20):
+        JsonSalesAgent(llm, vector_store, checkpointer)
+    print(f"Building an agent takes {(time.perf_counter() - start) / 20 * 1000:.2f} ms\n")
+
+    async def per_request(config: dict, input: str) -> dict:
+        sales_agent = JsonSalesAgent(llm, vector_store, checkpointer)
+        return await sales_agent.ainvoke(HOSTNAME, config, input)
+
+    shared_agent = JsonSalesAgent(llm, vector_store, checkpointer)
+
+    async def shared(config: dict, input: str) -> dict:
+        return await shared_agent.ainvoke(HOSTNAME, config, input)
+
+    # Warm up imports and caches before timing
+    await bench("warmup", 10, shared)
+    print(f"\n{'':<24} {'mean ms':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    await bench("agent per request", num_requests, per_request)
+    await bench("shared agent", num_requests, shared)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""Replay conversations with every contextualization policy and compare their latency and misses.
+
+The conversations in replay_conversations.json are labeled with the standalone question of every
+input. The fake LLM rewrites inputs into them after --rewrite-latency seconds and answers after
+--answer-latency seconds, and the fake vector store retrieves after --retrieval-latency seconds.
+
+A miss is an input that was not rewritten although its standalone question differs from it, so
+the answer may lack context. The "always" policy never misses.
+
+Usage:
+    python -m benchmarks.contextualization_benchmark --rewrite-latency 0.3
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import Any, Optional
+from uuid import uuid4
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.documents import Document
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langgraph.checkpoint.memory import MemorySaver
+
+from app.agents import ChatMessage
+from app.agents.json_sales_agent import JsonSalesAgent
+from app.contextualization import POLICIES, ContextualizationPolicy, is_same_question
+from app.llm import FAKE_ANSWER
+from benchmarks.fakes import FakeVectorStore
+
+REPLAY_CONVERSATIONS = os.path.join(os.path.dirname(__file__), "replay_conversations.json")
+HOSTNAME = "acme.test"
+
+
+class ReplayChatModel(BaseChatModel):
+    """Rewrites inputs into their labeled standalone questions and answers everything else."""
+
+    standalone_questions: dict[str, str]
+    rewrite_latency: float = 0
+    answer_latency: float = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "replay"
+
+    def _respond(self, messages: list[BaseMessage]) -> tuple[str, float]:
+        is_rewrite = isinstance(messages[0], SystemMessage) and "standalone question" in (
+            messages[0].content
+        )
+        if not is_rewrite:
+            return FAKE_ANSWER, self.answer_latency
+        input = [message for message in messages if isinstance(message, HumanMessage)][-1]
+        return self.standalone_questions.get(input.content, input.content), self.rewrite_latency
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,  # noqa: ANN401
+    ) -> ChatResult:
+        text, latency = self._respond(messages)
+        time.sleep(latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(text))])
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,  # noqa: ANN401
+    ) -> ChatResult:
+        text, latency = self._respond(messages)
+        await asyncio.sleep(latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(text))])
+
+
+class SlowVectorStore(FakeVectorStore):
+    def __init__(self, latency: float) -> None:
+        super().__init__()
+        self.latency = latency
+
+    async def asimilarity_search(self, query: str, k: int = 4, **kwargs: object) -> list[Document]:
+        await asyncio.sleep(self.latency)
+        return self.documents[:k]
+
+
+async def replay(
+    policy_name: str,
+    conversations: list[list[dict[str, str]]],
+    llm: ReplayChatModel,
+    vector_store: SlowVectorStore,
+) -> None:
+    policy = ContextualizationPolicy(policy_name)
+    sales_agent = JsonSalesAgent(llm, vector_store, MemorySaver(), contextualization=policy)
+    intro = ChatMessage.model_validate_json(FAKE_ANSWER)
+
+    timings = []
+    misses = 0
+    for turns in conversations:
+        config = {"configurable": {"thread_id": str(uuid4())}}
+        await sales_agent.astart_with_intro(HOSTNAME, config, intro)
+        for turn in turns:
+            rewritten = policy.rewritten
+            start = time.perf_counter()
+            await sales_agent.ainvoke(HOSTNAME, config, turn["input"])
+            timings.append(time.perf_counter() - start)
+            needs_rewrite = not is_same_question(turn["standalone"], turn["input"])
+            if needs_rewrite and policy.rewritten == rewritten:
+                misses += 1
+
+    timings.sort()
+    mean = sum(timings) / len(timings)
+    p50 = timings[len(timings) // 2]
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    stats = policy.stats()
+    print(
+        f"{policy_name:<12} {mean * 1000:>9.1f} {p50 * 1000:>9.1f} {p99 * 1000:>9.1f} "
+        f"{stats['rewritten']:>9} {stats['unchanged']:>9} {stats['speculative_hits']:>9} "
+        f"{misses:>7}"
+    )
+
+
+async def run(rewrite_latency: float, answer_latency: float, retrieval_latency: float) -> None:
+    with open(REPLAY_CONVERSATIONS) as f:
+        conversations = json.load(f)
+    standalone_questions = {
+        turn["input"]: turn["standalone"] for turns in conversations for turn in turns
+    }
+    llm = ReplayChatModel(
+        standalone_questions=standalone_questions,
+        rewrite_latency=rewrite_latency,
+        answer_latency=answer_latency,
+    )
+    vector_store = SlowVectorStore(retrieval_latency)
+
+    turns = sum(len(turns) for turns in conversations)
+    print(f"Replaying {len(conversations)} conversations with {turns} turns\n")
+    print(
+        f"{'policy':<12} {'mean ms':>9} {'p50 ms':>9} {'p99 ms':>9} {'rewrites':>9} "
+        f"{'unchanged':>9} {'spec hits':>9} {'misses':>7}"
+    )
+    for policy_name in POLICIES:
+        await replay(policy_name, conversations, llm, vector_store)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rewrite-latency", type=float, default=0.3)
+    parser.add_argument("--answer-latency", type=float, default=0.5)
+    parser.add_argument("--retrieval-latency", type=float, default=0.05)
+    args = parser.parse_args()
+    asyncio.run(run(args.rewrite_latency, args.answer_latency, args.retrieval_latency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Crawl a locally served synthetic website and report pages/sec.
+
+Usage:
+    python -m benchmarks.crawl_benchmark --pages 5000 --concurrency 1 4 16
+"""
+
+import argparse
+import asyncio
+import time
+
+from aiohttp import web
+
+from app.crawler import AsyncCrawler
+
+LINKS_PER_PAGE = 5
+
+
+def create_site(num_pages: int, latency: float) -> web.Application:
+    """A site where every page links to the next page and a few pseudo random ones."""
+
+    async def page(request: web.Request) -> web.Response:
+        page_id = int(request.match_info["page_id"])
+        if page_id >= num_pages:
+            raise web.HTTPNotFound()
+        if latency:
+            await asyncio.sleep(latency)
+        linked_ids = [(page_id + 1) % num_pages] + [
+            (page_id * 7919 + i * 104729) % num_pages for i in range(LINKS_PER_PAGE)
+        ]
+        links = "".join(f'<a href="/pages/{i}">Page {i}</a>' for i in linked_ids)
+        html = (
+            f"<html><head><title>Page {page_id}</title></head>"
+            f"<body><h1>Page {page_id}</h1><p>{'Lorem ipsum dolor sit amet. ' * 50}</p>"
+            f"<nav>{links}</nav></body></html>"
+        )
+        return web.Response(text=html, content_type="text/html")
+
+    app = web.Application()
+    app.router.add_get("/pages/{page_id}", page)
+    return app
+
+
+async def run(num_pages: int, concurrencies: list[int], latency: float) -> None:
+    runner = web.AppRunner(create_site(num_pages, latency))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    base_url = f"http://127.0.0.1:{port}"
+
+    print(f"{'concurrency':>12} {'pages':>8} {'seconds':>8} {'pages/sec':>10}")
+    try:
+        for concurrency in concurrencies:
+            crawler = AsyncCrawler(
+                base_url=base_url,
+                max_depth=num_pages,
+                concurrency_per_host=concurrency,
+                max_pages=num_pages,
+                max_bytes=10**12,
+                max_frontier=num_pages,
+            )
+            start = time.perf_counter()
+            pages = 0
+            async for _ in crawler.crawl(f"{base_url}/pages/0"):
+                pages += 1
+            elapsed = time.perf_counter() - start
+            print(f"{concurrency:>12} {pages:>8} {elapsed:>8.2f} {pages / elapsed:>10.1f}")
+    finally:
+        await runner.cleanup()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--latency", type=float, default=0.005, help="Seconds per response")
+    args = parser.parse_args()
+    asyncio.run(run(args.pages, args.concurrency, args.latency))
+
+
+if __name__ == "__main__":
+    main()
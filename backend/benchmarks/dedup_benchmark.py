@@ -0,0 +1,223 @@
+"""Crawl a locally served store full of duplicate pages and report the embeddings they cost.
+
+Every product has a page per variant, which declares the product page as its rel=canonical url,
+and a printable page with the same text and no canonical url. The products share their shipping
+and returns paragraphs, like the product pages of most stores. The extracted pages are indexed:
+    urls       every page under its own url, as before
+    canonical  variants under their rel=canonical url, once
+    simhash    also skipping the pages within --distance SimHash bits of a page already indexed
+
+Reports the duplicate rate, the chunks embedded and saved, and the products wrongly found to be
+duplicates of other products.
+
+Usage:
+    python -m benchmarks.dedup_benchmark --products 300 --variants 3
+"""
+
+import argparse
+import asyncio
+import random
+import re
+import time
+from typing import Optional
+
+from aiohttp import web
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from app.chunking import chunk_documents, create_text_splitter
+from app.crawler import AsyncCrawler
+from app.dedup import NearDuplicateIndex, resolve_canonical, simhash
+from app.extraction import aextract_page, get_extraction_pool, shutdown_extraction_pool
+
+PER_PAGE = 20
+COLORS = ["red", "blue", "green", "black", "white", "silver", "orange", "purple"]
+WORDS = (
+    "aluminium steel oak walnut compact portable heavy duty quiet fast precise balanced durable "
+    "waterproof rechargeable modular ergonomic lightweight adjustable foldable insulated "
+    "wireless magnetic reinforced polished brushed matte glossy vintage modern classic premium "
+    "motor blade handle frame base lid strap hinge spring valve filter battery charger cable "
+    "mount bracket sensor dial switch lever wheel gear drum tray basket rack hook clip"
+).split()
+BOILERPLATE = (
+    "Orders placed before noon ship the same business day from our warehouse, and delivery takes "
+    "two to five business days. Returns are free within thirty days of delivery: send the item "
+    "back in its original packaging and the refund is issued once the parcel is inspected. Every "
+    "product comes with a two year warranty covering parts and labour."
+)
+PRODUCT_PATTERN = re.compile(r"/products/p-(\d+)")
+
+
+def product_id(url: str) -> Optional[str]:
+    match = PRODUCT_PATTERN.search(url)
+    return match[1] if match else None
+
+
+def describe(product_id: int) -> str:
+    """The description of a product, a few sentences of random words."""
+    rng = random.Random(product_id)
+    sentences = [
+        " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 14))).capitalize() + "."
+        for _ in range(8)
+    ]
+    return " ".join(sentences)
+
+
+def create_site(num_products: int, num_variants: int, latency: float) -> web.Application:
+    """A store whose products have variant and printable pages."""
+
+    def html(title: str, body: str, canonical: str = "") -> web.Response:
+        link = f'<link rel="canonical" href="{canonical}">' if canonical else ""
+        return web.Response(
+            text=f"<html><head><title>{title}</title>{link}</head><body>"
+            f'<nav><a href="/">Home</a><a href="/collections/all">Shop</a></nav>'
+            f"<h1>{title}</h1>{body}</body></html>",
+            content_type="text/html",
+        )
+
+    async def delay() -> None:
+        if latency:
+            await asyncio.sleep(latency)
+
+    async def home(request: web.Request) -> web.Response:
+        await delay()
+        return html("Home", "<p>Welcome to the store.</p>")
+
+    async def listing(request: web.Request) -> web.Response:
+        await delay()
+        page = int(request.query.get("page", 1))
+        product_ids = range(num_products)[(page - 1) * PER_PAGE :][:PER_PAGE]
+        links = "".join(
+            f'<a href="/products/p-{i}">Product {i}</a>'
+            + "".join(
+                f'<a href="/products/p-{i}?variant={v}">{COLORS[v % len(COLORS)]}</a>'
+                for v in range(num_variants)
+            )
+            for i in product_ids
+        )
+        if page * PER_PAGE < num_products:
+            links += f'<a href="/collections/all?page={page + 1}">Next</a>'
+        return html(f"All products, page {page}", links)
+
+    async def product(request: web.Request) -> web.Response:
+        await delay()
+        product_id = int(request.match_info["product_id"])
+        body = f"<p>{describe(product_id)}</p><p>{BOILERPLATE}</p>"
+        if "variant" in request.query:
+            color = COLORS[int(request.query["variant"]) % len(COLORS)]
+            return html(
+                f"Product {product_id}",
+                f"<p>Color: {color}</p>{body}",
+                canonical=f"/products/p-{product_id}",
+            )
+        printable = f'<a href="/products/p-{product_id}/print">Print</a>'
+        return html(f"Product {product_id}", body + printable)
+
+    async def printable(request: web.Request) -> web.Response:
+        await delay()
+        product_id = int(request.match_info["product_id"])
+        return html(f"Product {product_id}", f"<p>{describe(product_id)}</p><p>{BOILERPLATE}</p>")
+
+    app = web.Application()
+    app.router.add_get("/", home)
+    app.router.add_get("/collections/all", listing)
+    app.router.add_get("/products/p-{product_id}", product)
+    app.router.add_get("/products/p-{product_id}/print", printable)
+    return app
+
+
+async def extract(base_url: str, num_pages: int) -> list[Document]:
+    crawler = AsyncCrawler(
+        base_url=base_url,
+        max_depth=num_pages,
+        max_pages=num_pages,
+        max_frontier=num_pages * 2,
+        respect_robots=False,
+        use_sitemaps=False,
+    )
+    executor = get_extraction_pool(2)
+    extractions = [
+        asyncio.ensure_future(aextract_page(page.html, page.url, page.content_type, executor))
+        async for page in crawler.crawl(base_url)
+    ]
+    return [
+        Document(page_content=text, metadata=metadata)
+        for text, metadata in await asyncio.gather(*extractions)
+    ]
+
+
+def index(
+    docs: list[Document],
+    base_url: str,
+    mode: str,
+    max_distance: int,
+    text_splitter: RecursiveCharacterTextSplitter,
+) -> None:
+    """Count the chunks indexing the pages would embed, like UrlProcessor.crawl."""
+    start = time.perf_counter()
+    near_duplicates = NearDuplicateIndex(max_distance)
+    indexed_sources = set()
+    embedded = saved = duplicates = wrong = 0
+    for doc in docs:
+        page_url = doc.metadata["source"]
+        source = page_url
+        if mode != "urls":
+            source = resolve_canonical(page_url, doc.metadata.get("canonical"), base_url)
+        chunks = len(list(chunk_documents([doc], text_splitter)))
+        duplicate_of = source if source in indexed_sources else None
+        fingerprint = simhash(doc.page_content) if mode == "simhash" else None
+        if duplicate_of is None and fingerprint is not None:
+            duplicate_of = near_duplicates.find(fingerprint, exclude=source)
+        if duplicate_of is not None:
+            duplicates += 1
+            saved += chunks
+            wrong += product_id(page_url) != product_id(duplicate_of)
+            continue
+        indexed_sources.add(source)
+        if fingerprint is not None:
+            near_duplicates.add(source, fingerprint)
+        embedded += chunks
+    elapsed = time.perf_counter() - start
+    print(
+        f"{mode:<10} {len(docs):>6} {duplicates:>11} {duplicates / len(docs):>9.1%} "
+        f"{embedded:>9} {saved:>7} {wrong:>6} {elapsed:>8.2f}"
+    )
+
+
+async def run(num_products: int, num_variants: int, max_distance: int, latency: float) -> None:
+    runner = web.AppRunner(create_site(num_products, num_variants, latency))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    base_url = f"http://127.0.0.1:{port}"
+    num_pages = 2 + num_products // PER_PAGE + num_products * (num_variants + 2)
+    print(f"{num_products} products with {num_variants} variants and a printable page\n")
+
+    try:
+        docs = await extract(base_url, num_pages)
+    finally:
+        await runner.cleanup()
+        shutdown_extraction_pool()
+    # The chunking of the defaults, chunks are embedded one call each
+    text_splitter = create_text_splitter(chunk_size=512, chunk_overlap=64, strategy="headings")
+    print(
+        f"{'mode':<10} {'pages':>6} {'duplicates':>11} {'rate':>9} {'embedded':>9} {'saved':>7} "
+        f"{'wrong':>6} {'seconds':>8}"
+    )
+    for mode in ["urls", "canonical", "simhash"]:
+        index(docs, base_url, mode, max_distance, text_splitter)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--products", type=int, default=300)
+    parser.add_argument("--variants", type=int, default=3, help="Variant pages per product")
+    parser.add_argument("--distance", type=int, default=3, help="Max SimHash bits apart")
+    parser.add_argument("--latency", type=float, default=0.001, help="Seconds per response")
+    args = parser.parse_args()
+    asyncio.run(run(args.products, args.variants, args.distance, args.latency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""Compare discovering the pages of a locally served store by following links and by sitemaps.
+
+The store has category pages paginated 10 products at a time, so most products are several
+links deep, and every page links to the same navigation pages. A sitemap index lists the product
+sitemaps, gzipped, with a lastmod per product. The crawls have the same page budget:
+    links     following links from the home page
+    sitemaps  also fetching the sitemap urls, most recently modified first
+    since     a re-crawl only fetching the sitemap urls modified since the previous crawl
+
+Usage:
+    python -m benchmarks.discovery_benchmark --products 5000 --budget 500
+"""
+
+import argparse
+import asyncio
+import datetime
+import gzip
+import time
+from typing import Optional
+
+from aiohttp import web
+
+from app.crawler import AsyncCrawler
+
+PRODUCTS_PER_PAGE = 10
+PRODUCTS_PER_SITEMAP = 1000
+NAV_PAGES = ["about", "contact", "faq", "shipping", "returns", "terms", "privacy", "careers"]
+
+
+def create_site(
+    num_products: int, num_categories: int, lastmods: list[datetime.datetime], latency: float
+) -> web.Application:
+    """A store whose products are only linked from paginated category pages."""
+    nav = "".join(f'<a href="/pages/{name}">{name}</a>' for name in NAV_PAGES)
+    categories = [list(range(c, num_products, num_categories)) for c in range(num_categories)]
+
+    def html(title: str, body: str) -> web.Response:
+        return web.Response(
+            text=f"<html><head><title>{title}</title></head><body><nav>{nav}</nav>"
+            f"<h1>{title}</h1>{body}<p>{'Lorem ipsum dolor sit amet. ' * 20}</p></body></html>",
+            content_type="text/html",
+        )
+
+    async def delay() -> None:
+        if latency:
+            await asyncio.sleep(latency)
+
+    async def home(request: web.Request) -> web.Response:
+        await delay()
+        links = "".join(
+            f'<a href="/categories/{c}/1">Category {c}</a>' for c in range(num_categories)
+        )
+        return html("Home", links)
+
+    async def nav_page(request: web.Request) -> web.Response:
+        await delay()
+        return html(request.match_info["name"], "")
+
+    async def category(request: web.Request) -> web.Response:
+        await delay()
+        category_id = int(request.match_info["category_id"])
+        page = int(request.match_info["page"])
+        product_ids = categories[category_id][(page - 1) * PRODUCTS_PER_PAGE :][:PRODUCTS_PER_PAGE]
+        links = "".join(f'<a href="/products/{i}">Product {i}</a>' for i in product_ids)
+        if page * PRODUCTS_PER_PAGE < len(categories[category_id]):
+            links += f'<a href="/categories/{category_id}/{page + 1}">Next</a>'
+        return html(f"Category {category_id} page {page}", links)
+
+    async def product(request: web.Request) -> web.Response:
+        await delay()
+        product_id = int(request.match_info["product_id"])
+        return html(f"Product {product_id}", f"<p>Product {product_id} specifications.</p>")
+
+    async def sitemap_index(request: web.Request) -> web.Response:
+        sitemaps = "".join(
+            f"<sitemap><loc>/sitemaps/products-{start}.xml.gz</loc></sitemap>"
+            for start in range(0, num_products, PRODUCTS_PER_SITEMAP)
+        )
+        return web.Response(
+            text=f'<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+            f"{sitemaps}</sitemapindex>",
+            content_type="application/xml",
+        )
+
+    async def sitemap(request: web.Request) -> web.Response:
+        start = int(request.match_info["start"])
+        urls = "".join(
+            f"<url><loc>/products/{i}</loc><lastmod>{lastmods[i].isoformat()}</lastmod></url>"
+            for i in range(start, min(start + PRODUCTS_PER_SITEMAP, num_products))
+        )
+        xml = f'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{urls}</urlset>'
+        return web.Response(body=gzip.compress(xml.encode()), content_type="application/gzip")
+
+    async def robots(request: web.Request) -> web.Response:
+        return web.Response(text="User-agent: *\nDisallow: /cart\nSitemap: /sitemap_index.xml\n")
+
+    app = web.Application()
+    app.router.add_get("/", home)
+    app.router.add_get("/pages/{name}", nav_page)
+    app.router.add_get("/categories/{category_id}/{page}", category)
+    app.router.add_get("/products/{product_id}", product)
+    app.router.add_get("/sitemap_index.xml", sitemap_index)
+    app.router.add_get("/sitemaps/products-{start}.xml.gz", sitemap)
+    app.router.add_get("/robots.txt", robots)
+    return app
+
+
+async def crawl(
+    base_url: str,
+    budget: int,
+    use_sitemaps: bool,
+    modified_since: Optional[datetime.datetime],
+    recent: set[str],
+) -> None:
+    crawler = AsyncCrawler(
+        base_url=base_url,
+        max_depth=budget,
+        max_pages=budget,
+        max_frontier=budget * 20,
+        respect_robots=True,
+        use_sitemaps=use_sitemaps,
+        modified_since=modified_since,
+    )
+    start = time.perf_counter()
+    products = 0
+    recent_products = 0
+    async for page in crawler.crawl(base_url):
+        if "/products/" in page.url:
+            products += 1
+            recent_products += page.url in recent
+    elapsed = time.perf_counter() - start
+    mode = "since" if modified_since else "sitemaps" if use_sitemaps else "links"
+    print(
+        f"{mode:<10} {crawler.pages_fetched:>9} {products:>9} {recent_products:>7} "
+        f"{crawler.bytes_fetched / 2**20:>8.2f} {elapsed:>8.2f}"
+    )
+
+
+async def run(num_products: int, budget: int, recent_share: float, latency: float) -> None:
+    now = datetime.datetime.now(datetime.timezone.utc)
+    num_recent = int(num_products * recent_share)
+    # Spread the recently modified products across the categories and their pages
+    lastmods = [
+        now - datetime.timedelta(hours=i % 24 + 1)
+        if i * 7919 % num_products < num_recent
+        else now - datetime.timedelta(days=30 + i % 300)
+        for i in range(num_products)
+    ]
+    runner = web.AppRunner(
+        create_site(num_products, max(1, num_products // 200), lastmods, latency)
+    )
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    base_url = f"http://127.0.0.1:{port}"
+    recent = {
+        f"{base_url}/products/{i}"
+        for i in range(num_products)
+        if lastmods[i] > now - datetime.timedelta(days=1)
+    }
+    print(
+        f"{num_products} products, {len(recent)} modified in the last day, "
+        f"a budget of {budget} pages\n"
+    )
+
+    try:
+        print(
+            f"{'mode':<10} {'requests':>9} {'products':>9} {'recent':>7} {'MB':>8} {'seconds':>8}"
+        )
+        await crawl(base_url, budget, False, None, recent)
+        await crawl(base_url, budget, True, None, recent)
+        await crawl(base_url, budget, True, now - datetime.timedelta(days=1), recent)
+    finally:
+        await runner.cleanup()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--budget", type=int, default=500, help="Max pages per crawl")
+    parser.add_argument("--recent", type=float, default=0.05, help="Share of modified products")
+    parser.add_argument("--latency", type=float, default=0.002, help="Seconds per response")
+    args = parser.parse_args()
+    asyncio.run(run(args.products, args.budget, args.recent, args.latency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""Embed texts through a local fake embeddings server and report texts/sec.
+
+The server adds latency per request and per text, and answers 429 when more than
+--server-rps requests arrive in a second. Compares sequential fixed size batches with a fixed
+retry delay against the EmbeddingExecutor.
+
+Usage:
+    python -m benchmarks.embedding_benchmark --texts 5000 --server-rps 20 --concurrency 1 4 8
+"""
+
+import argparse
+import asyncio
+import hashlib
+import time
+from collections import deque
+
+import aiohttp
+from aiohttp import web
+from langchain_core.embeddings import Embeddings
+
+from app.embedding_executor import EmbeddingExecutor
+
+DIMENSIONS = 64
+
+
+class HttpError(Exception):
+    def __init__(self, status_code: int) -> None:
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def fake_vector(text: str) -> list[float]:
+    digest = hashlib.sha256(text.encode()).digest()
+    return [digest[i % len(digest)] / 255 for i in range(DIMENSIONS)]
+
+
+def create_server(
+    requests_per_second: int, latency: float, latency_per_text: float
+) -> web.Application:
+    received: deque[float] = deque()
+    stats = {"requests": 0, "rate_limited": 0}
+
+    async def embeddings(request: web.Request) -> web.Response:
+        stats["requests"] += 1
+        now = time.monotonic()
+        while received and received[0] <= now - 1:
+            received.popleft()
+        if len(received) >= requests_per_second:
+            stats["rate_limited"] += 1
+            return web.json_response({"error": "rate_limit_exceeded"}, status=429)
+        received.append(now)
+
+        texts = (await request.json())["input"]
+        await asyncio.sleep(latency + latency_per_text * len(texts))
+        return web.json_response({"data": [fake_vector(text) for text in texts]})
+
+    app = web.Application()
+    app["stats"] = stats
+    app.router.add_post("/embeddings", embeddings)
+    return app
+
+
+class HttpEmbeddings(Embeddings):
+    """Embeddings from the fake server, only the async document method is used."""
+
+    def __init__(self, url: str, session: aiohttp.ClientSession) -> None:
+        self.url = url
+        self.session = session
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        async with self.session.post(self.url, json={"input": texts}) as response:
+            if response.status != 200:
+                raise HttpError(response.status)
+            return (await response.json())["data"]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        raise NotImplementedError
+
+    def embed_query(self, text: str) -> list[float]:
+        raise NotImplementedError
+
+
+async def sequential(embeddings: HttpEmbeddings, texts: list[str], batch_size: int) -> int:
+    """Fixed size batches one at a time, sleeping a second after a 429. Returns the retries."""
+    retries = 0
+    for i in range(0, len(texts), batch_size):
+        while True:
+            try:
+                await embeddings.aembed_documents(texts[i : i + batch_size])
+                break
+            except HttpError:
+                retries += 1
+                await asyncio.sleep(1)
+    return retries
+
+
+async def run(
+    num_texts: int,
+    server_rps: int,
+    latency: float,
+    latency_per_text: float,
+    batch_size: int,
+    concurrencies: list[int],
+) -> None:
+    app = create_server(server_rps, latency, latency_per_text)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    texts = [f"chunk {i} " + "lorem ipsum " * 40 for i in range(num_texts)]
+    stats = app["stats"]
+
+    def report(name: str, start: float, retries: int) -> None:
+        elapsed = time.perf_counter() - start
+        print(
+            f"{name:<28} {elapsed:>8.2f} {num_texts / elapsed:>10.1f} "
+            f"{stats['rate_limited']:>6} {retries:>8}"
+        )
+        stats.update(requests=0, rate_limited=0)
+
+    print(f"{'':<28} {'seconds':>8} {'texts/sec':>10} {'429s':>6} {'retries':>8}")
+    try:
+        async with aiohttp.ClientSession() as session:
+            embeddings = HttpEmbeddings(f"http://127.0.0.1:{port}/embeddings", session)
+
+            start = time.perf_counter()
+            retries = await sequential(embeddings, texts, batch_size)
+            report(f"sequential batch={batch_size}", start, retries)
+
+            for concurrency in concurrencies:
+                executor = EmbeddingExecutor(
+                    embeddings,
+                    max_batch_size=batch_size,
+                    max_concurrency=concurrency,
+                    requests_per_second=server_rps,
+                    base_delay=0.1,
+                )
+                start = time.perf_counter()
+                await executor.aembed_documents(texts)
+                report(f"executor concurrency={concurrency}", start, executor.retries)
+    finally:
+        await runner.cleanup()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--texts", type=int, default=5000)
+    parser.add_argument("--server-rps", type=int, default=20, help="Requests/sec before 429s")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds per request")
+    parser.add_argument("--latency-per-text", type=float, default=0.001, help="Seconds per text")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    args = parser.parse_args()
+    asyncio.run(
+        run(
+            args.texts,
+            args.server_rps,
+            args.latency,
+            args.latency_per_text,
+            args.batch_size,
+            args.concurrency,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
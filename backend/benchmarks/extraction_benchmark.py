@@ -0,0 +1,107 @@
+"""Microbenchmark html extraction over a corpus of saved html pages.
+
+Compares the previous two-parse BeautifulSoup extraction with the single lxml parse, inline
+and in a process pool.
+
+Usage:
+    python -m benchmarks.extraction_benchmark --corpus path/to/html/pages --repeat 20
+"""
+
+import argparse
+import asyncio
+import glob
+import os
+import re
+import time
+from typing import Callable
+
+from app.extraction import aextract_page, extract_page, get_extraction_pool
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(__file__), "..", "tests", "fixtures", "site")
+
+
+def two_parse_extract(html: str, url: str, content_type: str) -> tuple[str, dict]:
+    """The extraction used before, parsing every page with lxml and html.parser."""
+    from bs4 import BeautifulSoup
+
+    text = re.sub(r"\n\n+", "\n\n", BeautifulSoup(html, "lxml").text).strip()
+    metadata = {"source": url, "content_type": content_type}
+    soup = BeautifulSoup(html, "html.parser")
+    if title := soup.find("title"):
+        metadata["title"] = title.get_text()
+    if description := soup.find("meta", attrs={"name": "description"}):
+        metadata["description"] = description.get("content", None)
+    if html_tag := soup.find("html"):
+        metadata["language"] = html_tag.get("lang", "en-US")
+    return text, metadata
+
+
+def load_corpus(corpus: str) -> list[tuple[str, str]]:
+    pages = []
+    for path in sorted(glob.glob(os.path.join(corpus, "**", "*.htm*"), recursive=True)):
+        with open(path, encoding="utf-8", errors="replace") as f:
+            pages.append((f"https://corpus.test/{os.path.relpath(path, corpus)}", f.read()))
+    return pages
+
+
+def bench_inline(
+    name: str, extract: Callable[[str, str, str], tuple[str, dict]], pages: list, repeat: int
+) -> None:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for url, html in pages:
+            extract(html, url, "text/html")
+    report(name, len(pages) * repeat, sum(len(html) for _, html in pages) * repeat, start)
+
+
+async def bench_pool(workers: int, pages: list, repeat: int) -> None:
+    executor = get_extraction_pool(workers)
+    # Start the worker processes before timing
+    await asyncio.gather(*(aextract_page("", "", "", executor) for _ in range(workers)))
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(
+            aextract_page(html, url, "text/html", executor)
+            for _ in range(repeat)
+            for url, html in pages
+        )
+    )
+    report(
+        f"lxml, {workers} processes",
+        len(pages) * repeat,
+        sum(len(html) for _, html in pages) * repeat,
+        start,
+    )
+    executor.shutdown()
+
+
+def report(name: str, num_pages: int, num_bytes: int, start: float) -> None:
+    elapsed = time.perf_counter() - start
+    print(
+        f"{name:<24} {num_pages / elapsed:>10.1f} pages/sec "
+        f"{num_bytes / elapsed / 1_000_000:>8.2f} MB/sec"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="Folder of .html files")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    pages = load_corpus(args.corpus)
+    if not pages:
+        raise SystemExit(f"No html pages found in {args.corpus}")
+    print(f"{len(pages)} pages x {args.repeat}")
+
+    try:
+        bench_inline("bs4 lxml + html.parser", two_parse_extract, pages, args.repeat)
+    except ImportError:
+        print("bs4 is not installed, skipping the two-parse baseline")
+    bench_inline("lxml single parse", extract_page, pages, args.repeat)
+    asyncio.run(bench_pool(args.workers, pages, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""A fake vector store so benchmarks measure the app's overhead. The fake LLM is in app.llm."""
+
+from typing import Iterable, Optional
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+
+class FakeVectorStore(VectorStore):
+    """Returns the same documents for every search, regardless of the filter."""
+
+    def __init__(self, num_documents: int = 4) -> None:
+        self.documents = [
+            Document(
+                f"Acme Widgets page {i}. " + "Widgets are built to last. " * 20,
+                metadata={"source": f"https://acme.test/{i}", "hostname": "acme.test"},
+            )
+            for i in range(num_documents)
+        ]
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return None
+
+    def add_texts(
+        self, texts: Iterable[str], metadatas: Optional[list[dict]] = None, **kwargs: object
+    ) -> list[str]:
+        raise NotImplementedError
+
+    @classmethod
+    def from_texts(
+        cls: type["FakeVectorStore"],
+        texts: list[str],
+        embedding: Embeddings,
+        metadatas: Optional[list[dict]] = None,
+        **kwargs: object,
+    ) -> "FakeVectorStore":
+        raise NotImplementedError
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: object) -> list[Document]:
+        return self.documents[:k]
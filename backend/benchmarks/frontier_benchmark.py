@@ -0,0 +1,151 @@
+"""Compare the sales pages reached within a page budget by breadth first and scored crawls.
+
+The locally served store links every page to a blog of paginated and related posts, to legal
+pages and to categories of products, like most stores do. The blog and legal pages are as easy to
+reach as the products, so a breadth first crawl spends much of its budget on them. Reports the
+share of the product, category and pricing pages fetched by each crawl, and the share of the
+budget spent on them:
+    breadth  fetching urls in the order they were found
+    scored   fetching the urls scored best by the rules of the platform first
+
+Usage:
+    python -m benchmarks.frontier_benchmark --products 2000 --budget 300
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Optional
+
+from aiohttp import web
+
+from app.crawler import AsyncCrawler
+from app.frontier import UrlScorer
+
+PER_PAGE = 10
+LEGAL_PAGES = ["privacy-policy", "terms-of-service", "cookie-policy", "accessibility", "careers"]
+
+
+def create_site(num_products: int, num_posts: int, latency: float) -> web.Application:
+    """A store with products in categories, a blog and legal pages, all linked from every page."""
+    num_categories = max(1, num_products // 100)
+    nav = (
+        '<a href="/">Home</a><a href="/collections/all">Shop</a>'
+        '<a href="/pages/pricing">Pricing</a><a href="/blogs/news">Blog</a>'
+        + "".join(
+            f'<a href="/collections/category-{c}">Category {c}</a>' for c in range(num_categories)
+        )
+        + "".join(f'<a href="/policies/{name}">{name}</a>' for name in LEGAL_PAGES)
+    )
+    # The latest posts are linked from every page, like a blog sidebar
+    sidebar = "".join(f'<a href="/blogs/news/post-{i}">Post {i}</a>' for i in range(10))
+
+    def listing(path: str, title: str, links: list[tuple[str, str]], page: int) -> web.Response:
+        items = links[(page - 1) * PER_PAGE :][:PER_PAGE]
+        body = "".join(f'<a href="{href}">{text}</a>' for href, text in items)
+        if page * PER_PAGE < len(links):
+            body += f'<a href="{path}?page={page + 1}">Next page</a>'
+        return html(title, body)
+
+    def html(title: str, body: str) -> web.Response:
+        return web.Response(
+            text=f'<html><head><script src="//cdn.shopify.com/theme.js"></script>'
+            f"<title>{title}</title></head><body><nav>{nav}</nav><h1>{title}</h1>{body}"
+            f"<aside>{sidebar}</aside><p>{'Lorem ipsum dolor sit amet. ' * 20}</p></body></html>",
+            content_type="text/html",
+        )
+
+    async def page(request: web.Request) -> web.Response:
+        if latency:
+            await asyncio.sleep(latency)
+        path = request.path
+        page_number = int(request.query.get("page", 1))
+        if path == "/":
+            return html("Home", "")
+        if path == "/collections/all":
+            products = [(f"/products/product-{i}", f"Product {i}") for i in range(num_products)]
+            return listing(path, "All products", products, page_number)
+        if path.startswith("/collections/category-"):
+            c = int(path.rsplit("-", 1)[1])
+            products = [
+                (f"/products/product-{i}", f"Product {i}")
+                for i in range(c, num_products, num_categories)
+            ]
+            return listing(path, f"Category {c}", products, page_number)
+        if path == "/blogs/news":
+            posts = [(f"/blogs/news/post-{i}", f"Post {i}") for i in range(num_posts)]
+            return listing(path, "Blog", posts, page_number)
+        if path.startswith("/blogs/news/post-"):
+            i = int(path.rsplit("-", 1)[1])
+            related = "".join(
+                f'<a href="/blogs/news/post-{(i * 31 + j * 97) % num_posts}">Related post</a>'
+                for j in range(1, 6)
+            )
+            return html(f"Post {i}", f"<p>The story of post {i}.</p>{related}")
+        return html(path, f"<p>The content of {path}.</p>")
+
+    app = web.Application()
+    app.router.add_get("/{path:.*}", page)
+    return app
+
+
+def is_sales_page(url: str) -> bool:
+    return any(part in url for part in ["/products/", "/collections/", "/pages/pricing"])
+
+
+async def crawl(base_url: str, budget: int, scorer: Optional[UrlScorer], total: int) -> None:
+    crawler = AsyncCrawler(
+        base_url=base_url,
+        max_depth=budget,
+        max_pages=budget,
+        max_frontier=budget * 100,
+        scorer=scorer,
+    )
+    start = time.perf_counter()
+    sales_pages = set()
+    async for page in crawler.crawl(base_url):
+        if is_sales_page(page.url):
+            sales_pages.add(page.url.split("?")[0])
+    elapsed = time.perf_counter() - start
+    mode = "scored" if scorer else "breadth"
+    print(
+        f"{mode:<8} {crawler.pages_fetched:>9} {len(sales_pages):>12} "
+        f"{len(sales_pages) / total:>9.1%} {len(sales_pages) / crawler.pages_fetched:>9.1%} "
+        f"{crawler.urls_excluded:>9} {elapsed:>8.2f}"
+    )
+
+
+async def run(num_products: int, num_posts: int, budget: int, latency: float) -> None:
+    runner = web.AppRunner(create_site(num_products, num_posts, latency))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    base_url = f"http://127.0.0.1:{port}"
+    # The products, the listings of all products and of each category, and the pricing page
+    total = num_products + 1 + max(1, num_products // 100) + 1
+    print(f"{num_products} products, {num_posts} blog posts, a budget of {budget} pages\n")
+
+    try:
+        print(
+            f"{'mode':<8} {'requests':>9} {'sales pages':>12} {'coverage':>9} {'budget':>9} "
+            f"{'excluded':>9} {'seconds':>8}"
+        )
+        await crawl(base_url, budget, None, total)
+        await crawl(base_url, budget, UrlScorer("auto"), total)
+    finally:
+        await runner.cleanup()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--posts", type=int, default=1000)
+    parser.add_argument("--budget", type=int, default=300, help="Max pages per crawl")
+    parser.add_argument("--latency", type=float, default=0.002, help="Seconds per response")
+    args = parser.parse_args()
+    asyncio.run(run(args.products, args.posts, args.budget, args.latency))
+
+
+if __name__ == "__main__":
+    main()
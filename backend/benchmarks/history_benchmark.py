@@ -0,0 +1,148 @@
+"""Measure the prompt tokens and latency of every turn of long conversations.
+
+Compares putting the whole chat history into the prompts with the token budgeted window and
+rolling summary of HistoryManager. The fake LLM waits --latency seconds plus --token-latency
+seconds per prompt token, like a remote LLM whose time to first token grows with the prompt.
+The summary is extended in the background after an answer, while the customer takes
+--think-time seconds to send the next message, so it only adds to the latency of a turn when it
+takes longer than that.
+
+Usage:
+    python -m benchmarks.history_benchmark --turns 100 --max-tokens 2000
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Any, Optional
+from uuid import uuid4
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langgraph.checkpoint.memory import MemorySaver
+from pydantic import Field
+
+from app.agents import ChatMessage
+from app.agents.json_sales_agent import JsonSalesAgent
+from app.history import HistoryManager, message_tokens
+from app.llm import FAKE_ANSWER
+from benchmarks.fakes import FakeVectorStore
+
+HOSTNAME = "acme.test"
+ANSWER = (
+    "Our widgets are built to last and come in every size. The deluxe widget is our most popular "
+    "choice for kitchens, and the compact one fits small apartments. Would you like to know more?"
+)
+SUMMARY = "The customer is comparing widgets for their home and asked about sizes and rooms."
+
+
+class PromptRecordingChatModel(BaseChatModel):
+    """Answers ANSWER, or SUMMARY when summarizing, and records the prompt tokens of answers."""
+
+    latency: float = 0
+    token_latency: float = 0
+    answer_prompt_tokens: list[int] = Field(default_factory=list)
+
+    @property
+    def _llm_type(self) -> str:
+        return "prompt-recording"
+
+    def _respond(self, messages: list[BaseMessage]) -> tuple[str, float]:
+        tokens = sum(message_tokens(message) for message in messages)
+        if "You keep a summary" in messages[0].content:
+            text = SUMMARY
+        else:
+            text = ANSWER
+            self.answer_prompt_tokens.append(tokens)
+        return text, self.latency + tokens * self.token_latency
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,  # noqa: ANN401
+    ) -> ChatResult:
+        text, latency = self._respond(messages)
+        time.sleep(latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(text))])
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,  # noqa: ANN401
+    ) -> ChatResult:
+        text, latency = self._respond(messages)
+        await asyncio.sleep(latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(text))])
+
+
+async def converse(
+    llm: PromptRecordingChatModel, history: HistoryManager, turns: int, think_time: float
+) -> tuple[list[int], list[float]]:
+    """Run a conversation and return the prompt tokens and latency of every turn."""
+    sales_agent = JsonSalesAgent(llm, FakeVectorStore(), MemorySaver(), history=history)
+    config = {"configurable": {"thread_id": str(uuid4())}}
+    await sales_agent.astart_with_intro(
+        HOSTNAME, config, ChatMessage.model_validate_json(FAKE_ANSWER)
+    )
+
+    llm.answer_prompt_tokens = []
+    latencies = []
+    for i in range(turns):
+        start = time.perf_counter()
+        await sales_agent.ainvoke(
+            HOSTNAME, config, f"What widgets would you recommend for room number {i}?"
+        )
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(think_time)
+    await sales_agent.await_compactions()
+    return llm.answer_prompt_tokens, latencies
+
+
+async def run(
+    turns: int, max_tokens: int, latency: float, token_latency: float, think_time: float
+) -> None:
+    llm = PromptRecordingChatModel(latency=latency, token_latency=token_latency)
+    unbounded_tokens, unbounded_latencies = await converse(
+        llm, HistoryManager(llm, max_tokens=10**9, summarize=False), turns, think_time
+    )
+    history = HistoryManager(llm, max_tokens=max_tokens)
+    bounded_tokens, bounded_latencies = await converse(llm, history, turns, think_time)
+
+    print(f"{'':<6} {'whole history':>27} {f'{max_tokens} token window':>27}")
+    print(f"{'turn':<6} {'tokens':>13} {'ms':>13} {'tokens':>13} {'ms':>13}")
+    for i in range(0, turns, max(1, turns // 10)):
+        print(
+            f"{i + 1:<6} {unbounded_tokens[i]:>13} {unbounded_latencies[i] * 1000:>13.1f} "
+            f"{bounded_tokens[i]:>13} {bounded_latencies[i] * 1000:>13.1f}"
+        )
+    print(
+        f"\nTotal prompt tokens: {sum(unbounded_tokens)} with the whole history, "
+        f"{sum(bounded_tokens)} with the window"
+    )
+    print(
+        f"Slowest turn: {max(unbounded_latencies) * 1000:.1f} ms with the whole history, "
+        f"{max(bounded_latencies) * 1000:.1f} ms with the window"
+    )
+    stats = history.stats()
+    print(f"{stats['summaries']} summaries folded {stats['folded_messages']} messages")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--turns", type=int, default=100)
+    parser.add_argument("--max-tokens", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--token-latency", type=float, default=0.00002)
+    parser.add_argument("--think-time", type=float, default=0.1)
+    args = parser.parse_args()
+    asyncio.run(run(args.turns, args.max_tokens, args.latency, args.token_latency, args.think_time))
+
+
+if __name__ == "__main__":
+    main()
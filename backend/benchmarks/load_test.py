@@ -0,0 +1,202 @@
+"""Load test a running server and report p50/p99 latency and requests/sec per endpoint.
+
+Start the server with the fake LLM first so the test measures the server, and with plain http
+crawls allowed for the local fixture site, ie.
+    LLM=fake LLM_FAKE_LATENCY=0.5 CRAWL_ALLOW_HTTP=true SERVER_MODE=production SERVER_WORKERS=4 \
+        start-flask
+
+Then run from this folder:
+    python -m benchmarks.load_test --passphrase passphrase1 --concurrency 32 --duration 30
+
+Every virtual user starts a chat and sends --messages messages, over and over until the duration
+is over. The website chatted about is tests/fixtures/site served by this script, unless --site-url
+is given. It is crawled and indexed before the test starts.
+"""
+
+import argparse
+import asyncio
+import functools
+import os
+import threading
+import time
+from collections import defaultdict
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+import aiohttp
+
+FIXTURE_SITE = os.path.join(os.path.dirname(__file__), "..", "tests", "fixtures", "site")
+
+
+class QuietHTTPRequestHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format: str, *args: object) -> None:
+        pass
+
+
+def serve_fixture_site() -> str:
+    handler = functools.partial(QuietHTTPRequestHandler, directory=FIXTURE_SITE)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+class Results:
+    def __init__(self) -> None:
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+
+    def report(self, elapsed: float) -> None:
+        print(
+            f"{'endpoint':<20} {'requests':>9} {'errors':>7} {'p50 ms':>9} {'p99 ms':>9} {'rps':>8}"
+        )
+        for endpoint in sorted(set(self.latencies) | set(self.errors)):
+            latencies = sorted(self.latencies[endpoint])
+            p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0
+            p99 = (
+                latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+                if latencies
+                else 0
+            )
+            print(
+                f"{endpoint:<20} {len(latencies):>9} {self.errors[endpoint]:>7} "
+                f"{p50:>9.1f} {p99:>9.1f} {len(latencies) / elapsed:>8.1f}"
+            )
+        total = sum(len(latencies) for latencies in self.latencies.values())
+        print(f"\n{total} requests in {elapsed:.1f}s, {total / elapsed:.1f} requests/sec")
+
+
+async def post(
+    session: aiohttp.ClientSession, url: str, json: dict, results: Results
+) -> tuple[int, dict[str, Any]]:
+    endpoint = url.rsplit("/", 1)[-1]
+    start = time.perf_counter()
+    try:
+        async with session.post(url, json=json) as response:
+            body = await response.json(content_type=None)
+            status = response.status
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+        results.errors[endpoint] += 1
+        return 0, {}
+    if status >= 400 or body is None:
+        results.errors[endpoint] += 1
+    else:
+        results.latencies[endpoint].append(time.perf_counter() - start)
+    return status, body or {}
+
+
+async def index_site(
+    session: aiohttp.ClientSession, server_url: str, passphrase: str, site_url: str
+) -> None:
+    """Start a chat until the website has been indexed."""
+    while True:
+        status, body = await post(
+            session,
+            f"{server_url}/api/start_chat",
+            {"passphrase": passphrase, "url": site_url},
+            Results(),
+        )
+        if status == 200:
+            return
+        if status != 202:
+            raise SystemExit(f"start_chat failed with status {status}: {body}")
+        job = body["job"]
+        print(f"Waiting for crawl job {job['id']} of {job['hostname']}")
+        while job["status"] in ["pending", "running"]:
+            await asyncio.sleep(1)
+            _, body = await post(
+                session,
+                f"{server_url}/api/crawl_job_status",
+                {"passphrase": passphrase, "jobId": job["id"]},
+                Results(),
+            )
+            job = body["job"]
+        if job["status"] == "failed":
+            raise SystemExit(f"Crawl job failed: {job['error']}")
+
+
+async def user(
+    session: aiohttp.ClientSession,
+    server_url: str,
+    passphrase: str,
+    site_url: str,
+    messages: int,
+    deadline: float,
+    results: Results,
+) -> None:
+    while time.monotonic() < deadline:
+        status, chat = await post(
+            session,
+            f"{server_url}/api/start_chat",
+            {"passphrase": passphrase, "url": site_url},
+            results,
+        )
+        if status != 200:
+            await asyncio.sleep(0.1)
+            continue
+        for i in range(messages):
+            if time.monotonic() >= deadline:
+                return
+            await post(
+                session,
+                f"{server_url}/api/add_chat_message",
+                {
+                    "passphrase": passphrase,
+                    "hostname": chat["hostname"],
+                    "threadId": chat["thread_id"],
+                    "message": f"Tell me about your widgets, question {i}",
+                },
+                results,
+            )
+
+
+async def run(
+    server_url: str,
+    passphrase: str,
+    site_url: str,
+    concurrency: int,
+    duration: float,
+    messages: int,
+) -> None:
+    timeout = aiohttp.ClientTimeout(total=120)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        await index_site(session, server_url, passphrase, site_url)
+
+        results = Results()
+        print(f"Running {concurrency} users for {duration:.0f}s against {server_url}\n")
+        start = time.monotonic()
+        deadline = start + duration
+        await asyncio.gather(
+            *(
+                user(session, server_url, passphrase, site_url, messages, deadline, results)
+                for _ in range(concurrency)
+            )
+        )
+        results.report(time.monotonic() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--server-url", default="http://127.0.0.1:5555")
+    parser.add_argument("--passphrase", required=True)
+    parser.add_argument("--site-url", help="Defaults to the fixture site served by this script")
+    parser.add_argument("--concurrency", type=int, default=16, help="Number of virtual users")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to run for")
+    parser.add_argument("--messages", type=int, default=3, help="Messages sent per chat")
+    args = parser.parse_args()
+
+    site_url = args.site_url or serve_fixture_site()
+    asyncio.run(
+        run(
+            args.server_url.rstrip("/"),
+            args.passphrase,
+            site_url,
+            args.concurrency,
+            args.duration,
+            args.messages,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""Re-crawl a locally served website where a share of the pages changed and report the savings.
+
+The site sends an ETag and Last-Modified with every page and answers conditional requests with
+304 Not Modified. After a first crawl, the pages are re-crawled:
+    full         downloading and extracting every page, as before
+    hash         downloading and extracting every page, only indexing pages whose text changed
+    conditional  sending If-None-Match/If-Modified-Since, only extracting modified pages
+
+Usage:
+    python -m benchmarks.recrawl_benchmark --pages 2000 --changed 0.05
+"""
+
+import argparse
+import asyncio
+import hashlib
+import random
+import time
+from email.utils import formatdate
+from typing import Optional
+
+from aiohttp import web
+
+from app.crawler import AsyncCrawler, PageValidators
+from app.extraction import aextract_page, get_extraction_pool, shutdown_extraction_pool
+
+LINKS_PER_PAGE = 5
+PARAGRAPHS_PER_PAGE = 40
+
+
+def create_site(num_pages: int, versions: list[int], latency: float) -> web.Application:
+    """A site of linked pages whose content and validators change with their version."""
+    last_modified = formatdate(time.time() - 86400, usegmt=True)
+
+    async def page(request: web.Request) -> web.Response:
+        page_id = int(request.match_info["page_id"])
+        if page_id >= num_pages:
+            raise web.HTTPNotFound()
+        if latency:
+            await asyncio.sleep(latency)
+        etag = f'"{page_id}-{versions[page_id]}"'
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+
+        linked_ids = [(page_id + 1) % num_pages] + [
+            (page_id * 7919 + i * 104729) % num_pages for i in range(LINKS_PER_PAGE)
+        ]
+        links = "".join(f'<a href="/pages/{i}">Page {i}</a>' for i in linked_ids)
+        paragraphs = "".join(
+            f"<p>Product {page_id} version {versions[page_id]} paragraph {i}. "
+            f"{'Lorem ipsum dolor sit amet. ' * 10}</p>"
+            for i in range(PARAGRAPHS_PER_PAGE)
+        )
+        html = (
+            f"<html><head><title>Page {page_id}</title></head>"
+            f"<body><h1>Page {page_id}</h1>{paragraphs}<nav>{links}</nav></body></html>"
+        )
+        return web.Response(
+            text=html,
+            content_type="text/html",
+            headers={"ETag": etag, "Last-Modified": last_modified},
+        )
+
+    app = web.Application()
+    app.router.add_get("/pages/{page_id}", page)
+    return app
+
+
+async def crawl(
+    base_url: str,
+    num_pages: int,
+    validators: Optional[dict[str, PageValidators]],
+    content_hashes: dict[str, str],
+) -> tuple[AsyncCrawler, int, int, dict[str, PageValidators]]:
+    """Crawl the site like UrlProcessor.crawl.
+
+    Returns:
+        tuple: The crawler, the number of pages extracted and of pages with a new text hash, and
+            the validators of the crawled pages.
+    """
+    crawler = AsyncCrawler(
+        base_url=base_url,
+        max_depth=num_pages,
+        max_pages=num_pages,
+        max_bytes=10**12,
+        max_frontier=num_pages,
+        validators=validators,
+    )
+    executor = get_extraction_pool(2)
+    extractions = []
+    new_validators = {}
+    async for page in crawler.crawl(f"{base_url}/pages/0"):
+        new_validators[page.url] = PageValidators(page.etag, page.last_modified, page.links)
+        if not page.not_modified:
+            extractions.append(
+                asyncio.ensure_future(
+                    aextract_page(page.html, page.url, page.content_type, executor)
+                )
+            )
+
+    changed = 0
+    for text, metadata in await asyncio.gather(*extractions):
+        content_hash = hashlib.sha256(text.encode()).hexdigest()
+        if content_hashes.get(metadata["source"]) != content_hash:
+            changed += 1
+            content_hashes[metadata["source"]] = content_hash
+    return crawler, len(extractions), changed, new_validators
+
+
+async def run(num_pages: int, changed_share: float, latency: float, seed: int) -> None:
+    versions = [0] * num_pages
+    runner = web.AppRunner(create_site(num_pages, versions, latency))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    base_url = f"http://127.0.0.1:{port}"
+
+    try:
+        content_hashes: dict[str, str] = {}
+        _, _, _, validators = await crawl(base_url, num_pages, None, content_hashes)
+        changed_ids = random.Random(seed).sample(range(num_pages), int(num_pages * changed_share))
+        for page_id in changed_ids:
+            versions[page_id] += 1
+        print(f"{num_pages} pages, {len(changed_ids)} changed since the first crawl\n")
+
+        print(
+            f"{'mode':<12} {'requests':>9} {'MB':>8} {'extracted':>10} {'indexed':>8} "
+            f"{'seconds':>8}"
+        )
+        for mode in ["full", "hash", "conditional"]:
+            # Every mode starts from the state of the first crawl
+            hashes = dict(content_hashes)
+            start = time.perf_counter()
+            crawler, extracted, changed, _ = await crawl(
+                base_url, num_pages, validators if mode == "conditional" else None, hashes
+            )
+            elapsed = time.perf_counter() - start
+            indexed = extracted if mode == "full" else changed
+            print(
+                f"{mode:<12} {crawler.pages_fetched:>9} {crawler.bytes_fetched / 2**20:>8.2f} "
+                f"{extracted:>10} {indexed:>8} {elapsed:>8.2f}"
+            )
+    finally:
+        await runner.cleanup()
+        shutdown_extraction_pool()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--changed", type=float, default=0.05, help="Share of changed pages")
+    parser.add_argument("--latency", type=float, default=0.005, help="Seconds per response")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    asyncio.run(run(args.pages, args.changed, args.latency, args.seed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""Compare the retrieval quality and latency of vector, hybrid and reranked hybrid retrieval.
+
+Indexes a generated catalog of products with SKUs into a temporary Redis index and asks
+questions whose relevant products are known: lookups by SKU or product name, and descriptions
+of what a product is for. Reports hit@k, recall@k and MRR per kind of question, and p50/p99
+latency per retrieval mode.
+
+Needs Redis and the embeddings of the LLM environment variable, as fake embeddings make vector
+search random. Run from this folder:
+    python -m benchmarks.retrieval_benchmark --k 4
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from collections import defaultdict
+from typing import Optional
+
+from langchain_redis import RedisVectorStore
+
+from app.config import get_llm_config, get_redis_config
+from app.llm import create_embeddings
+from app.retrieval import HybridRetriever, create_reranker
+
+HOSTNAME = "acme.test"
+INDEX_NAME = "retrieval_benchmark"
+
+CATEGORIES = {
+    "cooler": ("keeps drinks and food cold on trips", "camping"),
+    "lamp": ("lights up a desk for reading at night", "office"),
+    "kettle": ("boils water quickly for tea", "kitchen"),
+    "backpack": ("carries a laptop and books to school", "travel"),
+    "heater": ("warms up a cold room in winter", "home"),
+    "blender": ("makes smoothies and soups", "kitchen"),
+}
+LINES = ["Aurora", "Summit", "Breeze", "Nimbus", "Ember", "Tidal", "Orbit"]
+
+
+def create_catalog(seed: int) -> list[dict]:
+    """Products with a SKU, a name, a category and a description."""
+    rng = random.Random(seed)
+    products = []
+    for category, (purpose, room) in CATEGORIES.items():
+        for line in LINES:
+            sku = f"{category[:2].upper()}-{rng.randint(1000, 9999)}"
+            size = rng.choice(["compact", "standard", "large"])
+            color = rng.choice(["red", "black", "white", "green"])
+            products.append(
+                {
+                    "sku": sku,
+                    "name": f"{line} {category}",
+                    "category": category,
+                    "text": (
+                        f"The {line} {category} (SKU {sku}) is a {size} {color} {category} that "
+                        f"{purpose}. A favourite for the {room}, it comes with a two year "
+                        "warranty and free returns."
+                    ),
+                }
+            )
+    return products
+
+
+def create_questions(products: list[dict], seed: int) -> list[tuple[str, str, set[str]]]:
+    """Questions as (kind, question, SKUs of the relevant products)."""
+    rng = random.Random(seed)
+    questions = []
+    for product in rng.sample(products, 20):
+        questions.append(("sku", f"Do you have {product['sku']} in stock?", {product["sku"]}))
+    for product in rng.sample(products, 20):
+        questions.append(("name", f"How much is the {product['name']}?", {product["sku"]}))
+    for category, (purpose, _) in CATEGORIES.items():
+        relevant = {product["sku"] for product in products if product["category"] == category}
+        questions.append(("description", f"I need something that {purpose}", relevant))
+    return questions
+
+
+async def evaluate(
+    name: str,
+    retriever: HybridRetriever,
+    questions: list[tuple[str, str, set[str]]],
+    sources: dict[str, str],
+) -> None:
+    hits: dict[str, list[float]] = defaultdict(list)
+    recalls: dict[str, list[float]] = defaultdict(list)
+    reciprocal_ranks: dict[str, list[float]] = defaultdict(list)
+    timings = []
+    for kind, question, relevant in questions:
+        start = time.perf_counter()
+        documents = await retriever.aretrieve(question, HOSTNAME)
+        timings.append(time.perf_counter() - start)
+        skus = [sources[document.metadata["source"]] for document in documents]
+        found = [sku in relevant for sku in skus]
+        hits[kind].append(float(any(found)))
+        recalls[kind].append(sum(found) / min(len(relevant), retriever.k))
+        rank = next((i for i, is_relevant in enumerate(found, start=1) if is_relevant), None)
+        reciprocal_ranks[kind].append(1 / rank if rank else 0.0)
+
+    timings.sort()
+    p50 = timings[len(timings) // 2] * 1000
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1000
+    for kind in hits:
+        print(
+            f"{name:<16} {kind:<12} {sum(hits[kind]) / len(hits[kind]):>7.2f} "
+            f"{sum(recalls[kind]) / len(recalls[kind]):>9.2f} "
+            f"{sum(reciprocal_ranks[kind]) / len(reciprocal_ranks[kind]):>6.2f} "
+            f"{p50:>8.1f} {p99:>8.1f}"
+        )
+
+
+async def run(k: int, candidates: int, seed: int, reranker_name: Optional[str]) -> None:
+    redis_config = get_redis_config().model_copy(
+        update={"index_name": INDEX_NAME, "key_prefix": INDEX_NAME}
+    )
+    vector_store = RedisVectorStore(create_embeddings(get_llm_config()), config=redis_config)
+    try:
+        products = create_catalog(seed)
+        sources = {f"https://{HOSTNAME}/{product['sku']}": product["sku"] for product in products}
+        vector_store.add_texts(
+            [product["text"] for product in products],
+            [
+                {"source": f"https://{HOSTNAME}/{product['sku']}", "hostname": HOSTNAME}
+                for product in products
+            ],
+        )
+        questions = create_questions(products, seed)
+        print(f"Indexed {len(products)} products, asking {len(questions)} questions\n")
+
+        retrievers = {
+            "vector": HybridRetriever(vector_store, k=k, candidates=candidates, hybrid=False),
+            "hybrid": HybridRetriever(vector_store, k=k, candidates=candidates),
+            "hybrid+lexical": HybridRetriever(
+                vector_store, k=k, candidates=candidates, reranker=create_reranker("lexical", "")
+            ),
+        }
+        if reranker_name:
+            retrievers[f"hybrid+{reranker_name}"] = HybridRetriever(
+                vector_store,
+                k=k,
+                candidates=candidates,
+                reranker=create_reranker(reranker_name, "cross-encoder/ms-marco-MiniLM-L-6-v2"),
+                rerank_budget=1.0,
+            )
+
+        print(
+            f"{'mode':<16} {'question':<12} {f'hit@{k}':>7} {f'recall@{k}':>9} {'MRR':>6} "
+            f"{'p50 ms':>8} {'p99 ms':>8}"
+        )
+        for name, retriever in retrievers.items():
+            await evaluate(name, retriever, questions, sources)
+    finally:
+        vector_store.index.delete(drop=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--candidates", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--reranker", choices=["cross-encoder"], help="Also benchmark the cross-encoder reranker"
+    )
+    args = parser.parse_args()
+    asyncio.run(run(args.k, args.candidates, args.seed, args.reranker))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""Compare the recall, query latency and memory of vector index settings.
+
+Indexes the same generated vectors into a temporary Redis index per setting: exact FLAT and
+approximate HNSW search, FLOAT32 and FLOAT16 vectors, and vectors truncated to fewer dimensions.
+Queries are filtered by hostname like the chatbot's. Reports recall@k against the exact nearest
+neighbours of the full vectors, p50/p99 query latency, the build time, and the memory of the
+vector index and of Redis as a whole scaled to 100k vectors.
+
+The vectors are clustered like the pages of websites, with their variance front-loaded into the
+first dimensions like text-embedding-3 vectors, so truncating them loses some recall as it would
+with real embeddings. Needs Redis. Run from this folder:
+    python -m benchmarks.vector_index_benchmark --vectors 20000 --dimensions 3072
+"""
+
+import argparse
+import time
+
+import numpy as np
+import redis
+from redisvl.query import VectorQuery
+from redisvl.query.filter import Tag
+
+from app.config import VectorIndexConfig, get_redis_config
+from app.migrate_index import wait_for_indexing
+from app.vector_index import DatatypeSearchIndex, create_index_schema
+
+HOSTNAME = "acme.test"
+INDEX_NAME = "vector_index_benchmark"
+
+
+def create_settings(m: int, ef_construction: int, dimensions: int) -> dict[str, VectorIndexConfig]:
+    def setting(
+        algorithm: str, datatype: str, ef_runtime: int = 10, dims: int = 0
+    ) -> VectorIndexConfig:
+        return VectorIndexConfig(
+            algorithm, "COSINE", m, ef_construction, ef_runtime, datatype, dims
+        )
+
+    return {
+        "FLAT float32": setting("FLAT", "FLOAT32"),
+        "FLAT float16": setting("FLAT", "FLOAT16"),
+        "HNSW float32 ef10": setting("HNSW", "FLOAT32"),
+        "HNSW float32 ef100": setting("HNSW", "FLOAT32", ef_runtime=100),
+        "HNSW float16 ef100": setting("HNSW", "FLOAT16", ef_runtime=100),
+        f"HNSW float16 ef100 {dimensions}d": setting(
+            "HNSW", "FLOAT16", ef_runtime=100, dims=dimensions
+        ),
+    }
+
+
+def create_vectors(count: int, dimensions: int, rng: np.random.Generator) -> np.ndarray:
+    """Unit vectors around 100 cluster centers, with a variance falling along the dimensions."""
+    scale = 1 / np.sqrt(1 + np.arange(dimensions) / 64)
+    centers = rng.standard_normal((100, dimensions)) * scale
+    noise = rng.standard_normal((count, dimensions)) * scale
+    vectors = centers[rng.integers(0, len(centers), count)] + 0.6 * noise
+    return normalize(vectors)
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def nearest_neighbours(vectors: np.ndarray, queries: np.ndarray, k: int) -> list[set[int]]:
+    similarities = queries @ vectors.T
+    return [set(row) for row in np.argpartition(-similarities, k, axis=1)[:, :k].tolist()]
+
+
+def used_memory(client: redis.Redis) -> int:
+    return int(client.info("memory")["used_memory"])
+
+
+def evaluate(
+    name: str,
+    vector_index_config: VectorIndexConfig,
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    truth: list[set[int]],
+    k: int,
+) -> None:
+    if vector_index_config.dimensions:
+        vectors = normalize(vectors[:, : vector_index_config.dimensions])
+        queries = normalize(queries[:, : vector_index_config.dimensions])
+    dtype = vector_index_config.datatype.lower()
+    redis_config = get_redis_config().model_copy(
+        update={"index_name": INDEX_NAME, "key_prefix": INDEX_NAME}
+    )
+    schema = create_index_schema(redis_config, vector_index_config, vectors.shape[1])
+    client = redis_config.redis()
+    index = DatatypeSearchIndex(schema, client, dtype)
+    index.create(overwrite=True, drop=True)
+    try:
+        memory_before = used_memory(client)
+        start = time.perf_counter()
+        for batch_start in range(0, len(vectors), 1000):
+            pipeline = client.pipeline(transaction=False)
+            for i in range(batch_start, min(batch_start + 1000, len(vectors))):
+                pipeline.hset(
+                    f"{INDEX_NAME}:{i}",
+                    mapping={
+                        redis_config.content_field: "",
+                        redis_config.embedding_field: vectors[i].astype(dtype).tobytes(),
+                        "source": str(i),
+                        "hostname": HOSTNAME,
+                    },
+                )
+            pipeline.execute()
+        wait_for_indexing(index, poll_interval=0.1)
+        build_time = time.perf_counter() - start
+        per_100k = 100_000 / len(vectors)
+        index_mb = float(index.info().get("vector_index_sz_mb", 0)) * per_100k
+        redis_mb = (used_memory(client) - memory_before) / 2**20 * per_100k
+
+        recalls = []
+        timings = []
+        for query, relevant in zip(queries, truth):
+            vector_query = VectorQuery(
+                query.tolist(),
+                redis_config.embedding_field,
+                return_fields=["source"],
+                num_results=k,
+                filter_expression=Tag("hostname") == HOSTNAME,
+            )
+            start = time.perf_counter()
+            results = index.query(vector_query)
+            timings.append(time.perf_counter() - start)
+            found = {int(result["source"]) for result in results}
+            recalls.append(len(found & relevant) / k)
+    finally:
+        index.delete(drop=True)
+
+    timings.sort()
+    p50 = timings[len(timings) // 2] * 1000
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1000
+    print(
+        f"{name:<26} {sum(recalls) / len(recalls):>9.3f} {p50:>8.2f} {p99:>8.2f} "
+        f"{build_time:>8.1f} {index_mb:>10.0f} {redis_mb:>10.0f}"
+    )
+
+
+def run(
+    count: int,
+    dimensions: int,
+    truncated: int,
+    query_count: int,
+    k: int,
+    m: int,
+    ef_construction: int,
+    seed: int,
+) -> None:
+    rng = np.random.default_rng(seed)
+    vectors = create_vectors(count + query_count, dimensions, rng)
+    vectors, queries = vectors[:count], vectors[count:]
+    truth = nearest_neighbours(vectors, queries, k)
+    print(f"{count} vectors of {dimensions} dimensions, {query_count} queries\n")
+
+    print(
+        f"{'setting':<26} {f'recall@{k}':>9} {'p50 ms':>8} {'p99 ms':>8} {'build s':>8} "
+        f"{'index MB':>10} {'redis MB':>10}   (MB per 100k vectors)"
+    )
+    for name, vector_index_config in create_settings(m, ef_construction, truncated).items():
+        evaluate(name, vector_index_config, vectors, queries, truth, k)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--vectors", type=int, default=20000)
+    parser.add_argument("--dimensions", type=int, default=1024)
+    parser.add_argument("--truncated", type=int, help="Defaults to a third of the dimensions")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--m", type=int, default=16)
+    parser.add_argument("--ef-construction", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    run(
+        args.vectors,
+        args.dimensions,
+        args.truncated or args.dimensions // 3,
+        args.queries,
+        args.k,
+        args.m,
+        args.ef_construction,
+        args.seed,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,17 @@
 import asyncio
+import functools
 import logging
 import os
 import platform
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator
 
+import pytest
 import pytest_asyncio
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import InMemoryVectorStore
 from langchain_redis import RedisVectorStore
 from psycopg2.errors import DuplicateDatabase
 
@@ -15,6 +23,8 @@ if platform.system() == "Windows":
 
 config = get_config()
 is_debug = config["IS_DEBUG"]
+# The fixture site is served over plain http
+config["CRAWL_ALLOW_HTTP"] = True
 llm_config = get_llm_config()
 
 log_path = os.path.join(config["LOG_FOLDER"], "tests.log")
@@ -50,12 +60,48 @@ asyncio.run(db_manager.setup_db())
 redis_config = get_redis_config()
 vector_store = RedisVectorStore(embeddings, config=redis_config)
 
+
 async def async_reset_dbs_fn() -> RedisVectorStore:
     await db_manager.reset_dbs()
     redis_config = get_redis_config()
     vector_store = RedisVectorStore(embeddings, config=redis_config)
     return vector_store
 
+
 @pytest_asyncio.fixture
 async def async_reset_dbs() -> RedisVectorStore:
     return await async_reset_dbs_fn()
+
+
+class QuietHTTPRequestHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format: str, *args: object) -> None:
+        pass
+
+
+@pytest.fixture(scope="session")
+def fixture_site_url() -> Iterator[str]:
+    """Serve tests/fixtures/site over HTTP on a free local port."""
+    directory = os.path.join(os.path.dirname(__file__), "fixtures", "site")
+    handler = functools.partial(QuietHTTPRequestHandler, directory=directory)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+class RecordingVectorStore(InMemoryVectorStore):
+    """An in memory vector store that records the filter of every search and ignores it."""
+
+    def __init__(self, embedding: Embeddings) -> None:
+        super().__init__(embedding)
+        self.filters: list[str] = []
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: object) -> list[Document]:
+        self.filters.append(str(kwargs.pop("filter", None)))
+        return super().similarity_search(query, k, **kwargs)
+
+    async def asimilarity_search(self, query: str, k: int = 4, **kwargs: object) -> list[Document]:
+        self.filters.append(str(kwargs.pop("filter", None)))
+        return await super().asimilarity_search(query, k, **kwargs)
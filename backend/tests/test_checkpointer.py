@@ -0,0 +1,42 @@
+import asyncio
+from uuid import uuid4
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from app.agents import ChatMessage
+from app.agents.json_sales_agent import JsonSalesAgent
+from app.checkpointer import create_checkpoint_pool, create_checkpointer, get_pool_stats
+from app.config import CheckpointPoolConfig, get_psql_url
+from tests.conftest import RecordingVectorStore
+
+
+async def test_pooled_checkpointer_is_shared_by_conversations() -> None:
+    pool_config = CheckpointPoolConfig(min_size=1, max_size=2, timeout=10, max_idle=60)
+    pool = create_checkpoint_pool(get_psql_url(), pool_config)
+    await pool.open(wait=True)
+    try:
+        vector_store = RecordingVectorStore(DeterministicFakeEmbedding(size=8))
+        vector_store.add_texts(["Acme Widgets sells widgets."])
+        intro = ChatMessage(content="Hi!", mc_options=["A) a", "B) b", "C) c", "D) d"])
+        fake_llm = FakeListChatModel(responses=[intro.toJson()])
+        sales_agent = JsonSalesAgent(fake_llm, vector_store, create_checkpointer(pool))
+
+        async def chat() -> dict:
+            config = {"configurable": {"thread_id": str(uuid4())}}
+            await sales_agent.ainvoke("acme.test", config, "")
+            await sales_agent.ainvoke("acme.test", config, "Lets go with B")
+            return config
+
+        # More conversations than connections
+        configs = await asyncio.gather(*(chat() for _ in range(5)))
+        for config in configs:
+            state = await sales_agent.graph.aget_state(config)
+            assert len(state.values["chat_history"]) == 3
+
+        stats = get_pool_stats(pool)
+        assert stats["pool_size"] <= 2
+        assert stats["requests_num"] > 0
+        assert stats["requests_errors"] == 0
+    finally:
+        await pool.close()
@@ -0,0 +1,37 @@
+from langchain_core.documents import Document
+
+from app.chunking import chunk_documents, chunk_id, create_text_splitter
+
+page = Document(
+    page_content=(
+        "# Pricing\n"
+        "The Classic Widget (SKU AW-100) costs $19.99. "
+        "The Turbo Widget (SKU AW-200) costs $49.99.\n"
+        "## Volume discounts\n"
+        "Orders of 10 or more widgets get 15% off. Orders of 100 or more get 25% off."
+    ),
+    metadata={"hostname": "acme.test", "source": "https://acme.test/pricing"},
+)
+
+
+def test_chunk_documents_splits_on_headings() -> None:
+    text_splitter = create_text_splitter(chunk_size=40, chunk_overlap=0, strategy="headings")
+    chunks = list(chunk_documents([page], text_splitter))
+    assert len(chunks) == 2
+    assert chunks[0].page_content.startswith("# Pricing")
+    assert chunks[1].page_content.startswith("## Volume discounts")
+
+
+def test_chunk_documents_stable_ids() -> None:
+    text_splitter = create_text_splitter(chunk_size=20, chunk_overlap=5, strategy="tokens")
+    chunks = list(chunk_documents([page], text_splitter))
+    assert len(chunks) > 2
+    for chunk in chunks:
+        start_index = chunk.metadata["start_index"]
+        assert page.page_content[start_index:].startswith(chunk.page_content)
+        assert chunk.metadata["source"] == page.metadata["source"]
+        assert chunk.id == chunk_id(page.metadata["source"], start_index)
+        assert chunk.metadata["chunk_id"] == chunk.id
+
+    rechunked = list(chunk_documents([page], text_splitter))
+    assert [chunk.id for chunk in rechunked] == [chunk.id for chunk in chunks]
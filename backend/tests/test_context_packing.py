@@ -0,0 +1,64 @@
+from uuid import uuid4
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langgraph.checkpoint.memory import MemorySaver
+
+from app.agents import ChatMessage
+from app.agents.json_sales_agent import JsonSalesAgent
+from app.context_packing import ContextPacker
+from app.tokens import count_tokens
+from tests.conftest import RecordingVectorStore
+
+filler = "Acme was founded many years ago in a small garage by two friends. " * 30
+shipping = "Shipping to Canada takes five business days and is free over $50."
+
+
+def test_near_duplicates_are_dropped() -> None:
+    packer = ContextPacker(max_tokens=1000)
+    footer = "Contact us at hello@acme.test or call our friendly team any day of the week."
+    documents = [
+        Document(f"Widgets for every room. {footer}", metadata={"source": "a"}),
+        Document(f"Widgets for every room! {footer}", metadata={"source": "b"}),
+        Document(shipping, metadata={"source": "c"}),
+    ]
+
+    packed = packer.pack("widgets", documents)
+    assert [document.metadata["source"] for document in packed] == ["a", "c"]
+    assert packer.stats()["duplicates"] == 1
+
+
+def test_documents_are_trimmed_to_relevant_sentences_within_budget() -> None:
+    packer = ContextPacker(max_tokens=120)
+    documents = [
+        Document(f"{filler} {shipping} {filler}", metadata={"source": "shipping"}),
+        Document(f"Our widgets come in three sizes. {filler}", metadata={"source": "sizes"}),
+    ]
+
+    packed = packer.pack("How long does shipping to Canada take?", documents)
+    assert sum(count_tokens(document.page_content) for document in packed) <= 120
+    assert shipping in packed[0].page_content
+    assert packed[0].metadata == {"source": "shipping"}
+    # The unused share of a short document goes to the others
+    short_packed = packer.pack("sizes", [Document("Three sizes."), documents[0]])
+    assert count_tokens(short_packed[1].page_content) > 60
+
+    stats = packer.stats()
+    assert stats["tokens_saved"] > 0
+    assert stats["tokens_packed"] <= 240
+
+
+async def test_agent_answers_from_packed_context() -> None:
+    vector_store = RecordingVectorStore(DeterministicFakeEmbedding(size=8))
+    vector_store.add_texts([f"{filler} {shipping}"])
+    fake_llm = FakeListChatModel(responses=["Five business days."])
+    sales_agent = JsonSalesAgent(
+        fake_llm, vector_store, MemorySaver(), context_packer=ContextPacker(max_tokens=50)
+    )
+
+    config = {"configurable": {"thread_id": str(uuid4())}}
+    intro = ChatMessage(content="Hi!", mc_options=["A) a", "B) b", "C) c", "D) d"])
+    await sales_agent.astart_with_intro("acme.test", config, intro)
+    result = await sales_agent.ainvoke("acme.test", config, "How long is shipping to Canada?")
+    assert [document.page_content for document in result["context"]] == [shipping]
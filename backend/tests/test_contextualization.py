@@ -0,0 +1,101 @@
+from uuid import uuid4
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage
+from langgraph.checkpoint.memory import MemorySaver
+
+from app.agents import ChatMessage
+from app.agents.json_sales_agent import JsonSalesAgent
+from app.contextualization import ContextualizationPolicy, references_conversation
+from tests.conftest import RecordingVectorStore
+
+intro = ChatMessage(
+    content="Hi! What brings you here?", mc_options=["A) a", "B) b", "C) c", "D) d"]
+)
+
+
+@pytest.mark.parametrize(
+    "input",
+    [
+        "B",
+        "Lets go with C)",
+        "Yes please",
+        "How much does it cost?",
+        "Do they ship to Canada?",
+        "And what about delivery times?",
+        "Can you tell me more?",
+    ],
+)
+def test_references_are_rewritten(input: str) -> None:
+    assert references_conversation(input)
+
+
+@pytest.mark.parametrize(
+    "input",
+    [
+        "What kinds of widgets do you sell?",
+        "Do you ship widgets to Canada?",
+        "A widget for my kitchen please",
+        "How long is the warranty on your widgets?",
+    ],
+)
+def test_standalone_questions_are_not_rewritten(input: str) -> None:
+    assert not references_conversation(input)
+
+
+def test_first_message_and_always_policy() -> None:
+    history = [AIMessage(intro.toJson())]
+    assert not ContextualizationPolicy("heuristic").should_rewrite("Do they ship?", [])
+    assert ContextualizationPolicy("always").should_rewrite("Do you sell widgets?", history)
+    with pytest.raises(ValueError):
+        ContextualizationPolicy("never")
+
+
+async def ask(sales_agent: JsonSalesAgent, input: str) -> str:
+    config = {"configurable": {"thread_id": str(uuid4())}}
+    await sales_agent.astart_with_intro("acme.test", config, intro)
+    result = await sales_agent.ainvoke("acme.test", config, input)
+    return result["answer"].content
+
+
+async def test_standalone_question_skips_the_rewrite() -> None:
+    vector_store = RecordingVectorStore(DeterministicFakeEmbedding(size=8))
+    vector_store.add_texts(["Acme Widgets sells widgets."])
+    fake_llm = FakeListChatModel(responses=["We sell widgets.", "Widgets."])
+    policy = ContextualizationPolicy("heuristic")
+    sales_agent = JsonSalesAgent(fake_llm, vector_store, MemorySaver(), contextualization=policy)
+
+    assert await ask(sales_agent, "What kinds of widgets do you sell?") == "We sell widgets."
+    stats = policy.stats()
+    assert stats["skipped"] == 1
+    assert stats["rewritten"] == 0
+
+
+async def test_speculative_retrieval_is_used_when_rewrite_is_unchanged() -> None:
+    vector_store = RecordingVectorStore(DeterministicFakeEmbedding(size=8))
+    vector_store.add_texts(["Acme Widgets sells widgets."])
+    fake_llm = FakeListChatModel(
+        responses=[
+            "Do you have other colors?",
+            "We do.",
+            "Do Acme widgets ship to Canada?",
+            "They do.",
+        ]
+    )
+    policy = ContextualizationPolicy("speculative")
+    sales_agent = JsonSalesAgent(fake_llm, vector_store, MemorySaver(), contextualization=policy)
+
+    # Rewritten unchanged, so the context retrieved with the input is used
+    assert await ask(sales_agent, "Do you have other colors?") == "We do."
+    assert len(vector_store.filters) == 1
+    # Rewritten, so retrieved again with the standalone question
+    assert await ask(sales_agent, "Do they ship to Canada?") == "They do."
+    assert len(vector_store.filters) == 3
+
+    stats = policy.stats()
+    assert stats["rewritten"] == 2
+    assert stats["unchanged"] == 1
+    assert stats["speculative_hits"] == 1
+    assert stats["speculative_misses"] == 1
@@ -0,0 +1,209 @@
+import asyncio
+import datetime
+import time
+from typing import Optional
+
+import aiohttp
+
+from app.crawler import AsyncCrawler, CrawledPage, PageValidators
+from app.discovery import SitemapReader, discover_urls, fetch_robots
+from app.frontier import UrlScorer
+
+
+async def test_crawl(fixture_site_url: str) -> None:
+    crawler = AsyncCrawler(base_url=fixture_site_url, max_depth=3)
+    urls = {page.url async for page in crawler.crawl(fixture_site_url)}
+    assert f"{fixture_site_url}/products/turbo-widget.html" in urls
+    assert f"{fixture_site_url}/blog/index.html" in urls
+    assert f"{fixture_site_url}/shipping.html" in urls
+
+
+async def test_crawl_max_depth(fixture_site_url: str) -> None:
+    crawler = AsyncCrawler(base_url=fixture_site_url, max_depth=1)
+    urls = [page.url async for page in crawler.crawl(fixture_site_url)]
+    assert urls == [fixture_site_url]
+
+
+async def test_crawl_exclude_dirs(fixture_site_url: str) -> None:
+    crawler = AsyncCrawler(
+        base_url=fixture_site_url, max_depth=3, exclude_dirs=[f"{fixture_site_url}/products"]
+    )
+    async for page in crawler.crawl(fixture_site_url):
+        assert not page.url.startswith(f"{fixture_site_url}/products")
+
+
+async def test_crawl_max_pages(fixture_site_url: str) -> None:
+    crawler = AsyncCrawler(base_url=fixture_site_url, max_depth=3, max_pages=3)
+    pages = [page async for page in crawler.crawl(fixture_site_url)]
+    assert len(pages) == 3
+    assert crawler.pages_fetched == 3
+
+
+async def test_crawl_max_bytes(fixture_site_url: str) -> None:
+    crawler = AsyncCrawler(
+        base_url=fixture_site_url, max_depth=3, concurrency_per_host=1, max_bytes=500
+    )
+    pages = [page async for page in crawler.crawl(fixture_site_url)]
+    # The index page is larger than the budget, its download stops at the budget
+    assert pages == []
+    assert crawler.bytes_fetched == 500
+
+
+async def test_crawl_survives_unexpected_errors(fixture_site_url: str) -> None:
+    class FailingCrawler(AsyncCrawler):
+        async def _fetch(
+            self, session: aiohttp.ClientSession, url: str, depth: int
+        ) -> Optional[CrawledPage]:
+            if url.endswith("/pricing.html"):
+                raise ValueError("Unexpected")
+            return await super()._fetch(session, url, depth)
+
+    crawler = FailingCrawler(base_url=fixture_site_url, max_depth=3, concurrency_per_host=1)
+
+    async def crawl() -> set[str]:
+        return {page.url async for page in crawler.crawl(fixture_site_url)}
+
+    # The worker that failed keeps crawling the other pages
+    urls = await asyncio.wait_for(crawl(), timeout=10)
+    assert f"{fixture_site_url}/pricing.html" not in urls
+    assert f"{fixture_site_url}/shipping.html" in urls
+
+
+async def test_crawl_canonicalizes_urls(fixture_site_url: str) -> None:
+    crawler = AsyncCrawler(base_url=fixture_site_url, max_depth=2)
+    urls = [page.url async for page in crawler.crawl(f"{fixture_site_url}/products/colors.html")]
+    # The newsletter link only differs from the product link by its tracking parameters
+    assert urls.count(f"{fixture_site_url}/products/turbo-widget.html") == 1
+    assert not any("utm_" in url for url in urls)
+
+
+async def test_recrawl_is_conditional(fixture_site_url: str) -> None:
+    crawler = AsyncCrawler(base_url=fixture_site_url, max_depth=3)
+    pages = [page async for page in crawler.crawl(fixture_site_url)]
+    validators = {
+        page.url: PageValidators(page.etag, page.last_modified, page.links) for page in pages
+    }
+    assert all(page.last_modified for page in pages)
+
+    recrawler = AsyncCrawler(base_url=fixture_site_url, max_depth=3, validators=validators)
+    recrawled_pages = [page async for page in recrawler.crawl(fixture_site_url)]
+    # The links of pages that were not modified are still followed
+    assert {page.url for page in recrawled_pages} == {page.url for page in pages}
+    assert all(page.not_modified and not page.html for page in recrawled_pages)
+    assert recrawler.pages_not_modified == len(pages)
+    assert recrawler.bytes_fetched == 0
+
+
+async def test_crawl_respects_robots(fixture_site_url: str) -> None:
+    crawler = AsyncCrawler(base_url=fixture_site_url, max_depth=3, respect_robots=True)
+    urls = {page.url async for page in crawler.crawl(fixture_site_url)}
+    assert f"{fixture_site_url}/products/turbo-widget.html" in urls
+    assert f"{fixture_site_url}/blog/index.html" not in urls
+    assert crawler.urls_disallowed == 1
+    assert crawler.crawl_delay == 0
+
+    slow_crawler = AsyncCrawler(
+        base_url=fixture_site_url,
+        max_depth=2,
+        max_pages=3,
+        respect_robots=True,
+        user_agent="SlowBot",
+        max_crawl_delay=0.2,
+    )
+    start = time.perf_counter()
+    pages = [page async for page in slow_crawler.crawl(fixture_site_url)]
+    # The Crawl-delay of 2.5s, rounded up to 3s, is capped by max_crawl_delay
+    assert slow_crawler.crawl_delay == 0.2
+    assert len(pages) == 3
+    assert time.perf_counter() - start >= 0.4
+
+
+async def test_crawl_sitemaps(fixture_site_url: str) -> None:
+    crawler = AsyncCrawler(
+        base_url=fixture_site_url, max_depth=2, respect_robots=True, use_sitemaps=True
+    )
+    urls = {page.url async for page in crawler.crawl(f"{fixture_site_url}/shipping.html")}
+    # The shipping page only links to the home page. The urls of the sitemap index of robots.txt
+    # and its gzipped sitemap, except the disallowed and external ones, are crawled as if it
+    # linked to them
+    assert urls == {
+        f"{fixture_site_url}/",
+        f"{fixture_site_url}/products/turbo-widget.html",
+        f"{fixture_site_url}/products/index.html",
+        f"{fixture_site_url}/pricing.html",
+        f"{fixture_site_url}/products/classic-widget.html",
+        f"{fixture_site_url}/shipping.html",
+        f"{fixture_site_url}/about.html",
+    }
+    assert crawler.sitemap_urls == 6
+
+    single_page_crawler = AsyncCrawler(base_url=fixture_site_url, max_depth=1, use_sitemaps=True)
+    urls = [page.url async for page in single_page_crawler.crawl(fixture_site_url)]
+    assert urls == [fixture_site_url]
+
+
+async def test_sitemap_urls_are_prioritized_and_limited(fixture_site_url: str) -> None:
+    async with aiohttp.ClientSession() as session:
+        robots, _ = await fetch_robots(session, fixture_site_url)
+        reader = SitemapReader(session, fixture_site_url)
+        sitemap_urls = await discover_urls(
+            reader, [f"{fixture_site_url}/sitemap_index.xml"], robots, "RagAiChatbot", 3
+        )
+        assert [sitemap_url.url for sitemap_url in sitemap_urls] == [
+            f"{fixture_site_url}/products/turbo-widget.html",
+            f"{fixture_site_url}/products/index.html",
+            f"{fixture_site_url}/pricing.html",
+        ]
+        assert reader.sitemaps_fetched == 3
+
+        modified_since = datetime.datetime(2024, 1, 12, tzinfo=datetime.timezone.utc)
+        recent_urls = await discover_urls(
+            SitemapReader(session, fixture_site_url),
+            [f"{fixture_site_url}/sitemap_index.xml"],
+            None,
+            "RagAiChatbot",
+            10,
+            modified_since,
+        )
+        assert len(recent_urls) == 5
+        assert all(sitemap_url.lastmod >= modified_since for sitemap_url in recent_urls)
+
+
+async def test_scored_crawl_fetches_high_value_pages_first(fixture_site_url: str) -> None:
+    crawler = AsyncCrawler(
+        base_url=fixture_site_url,
+        max_depth=3,
+        max_pages=3,
+        concurrency_per_host=1,
+        scorer=UrlScorer(exclude=[r"^/blog/"]),
+    )
+    urls = {page.url async for page in crawler.crawl(fixture_site_url)}
+    # The products and pricing pages, linked as such, beat the other links of the home page
+    assert urls == {
+        fixture_site_url,
+        f"{fixture_site_url}/products/index.html",
+        f"{fixture_site_url}/pricing.html",
+    }
+    assert crawler.urls_excluded == 1
+
+
+async def test_full_frontier_keeps_high_value_pages(fixture_site_url: str) -> None:
+    crawler = AsyncCrawler(
+        base_url=fixture_site_url,
+        max_depth=2,
+        max_frontier=3,
+        concurrency_per_host=1,
+        scorer=UrlScorer(),
+    )
+    urls = {page.url async for page in crawler.crawl(fixture_site_url)}
+    # Links are found in any order, so the last place goes to one of the links scoring 2.5
+    assert len(urls) == 4
+    assert {
+        fixture_site_url,
+        f"{fixture_site_url}/products/index.html",
+        f"{fixture_site_url}/pricing.html",
+    } < urls
+    assert f"{fixture_site_url}/blog/index.html" not in urls
+    assert f"{fixture_site_url}/about.html" not in urls
+    # The 8 links of the home page, / included, competed for 3 places
+    assert crawler.urls_dropped == 5
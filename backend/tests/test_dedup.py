@@ -0,0 +1,73 @@
+from app.dedup import (
+    NearDuplicateIndex,
+    canonicalize_url,
+    hamming_distance,
+    resolve_canonical,
+    simhash,
+)
+
+PRODUCT = (
+    "The Turbo Widget spins twice as fast as the Classic Widget. It is machined from a single "
+    "block of aluminium, balanced by hand and tested for a full day before it leaves the factory. "
+    "Every widget ships in two business days and comes with a five year warranty covering parts "
+    "and labour. Volume discounts start at ten units, and orders of more than a thousand units get "
+    "a dedicated account manager. The widget fits every standard mount, runs on twelve volts and "
+    "draws less than two amps at full speed. Replacement bearings, mounts and cables are sold "
+    "separately and ship from the same warehouse. Customers who bought the Turbo Widget also "
+    "bought the mounting kit, the spare bearing set and the extended warranty."
+)
+
+
+def test_canonicalize_url() -> None:
+    assert canonicalize_url(
+        "HTTPS://Acme.test:443/products/turbo-widget?utm_source=mail&size=l&color=red&gclid=1#reviews"
+    ) == ("https://acme.test/products/turbo-widget?color=red&size=l")
+    assert canonicalize_url("http://acme.test:8080/shop/?b=2&a=1") == (
+        "http://acme.test:8080/shop/?a=1&b=2"
+    )
+    assert canonicalize_url("https://acme.test/") == "https://acme.test/"
+
+
+def test_resolve_canonical() -> None:
+    base_url = "https://acme.test"
+    variant = "https://acme.test/products/turbo-widget?color=red"
+    canonical = "https://acme.test/products/turbo-widget"
+    assert resolve_canonical(variant, canonical, base_url) == canonical
+    assert resolve_canonical(variant, None, base_url) == variant
+    # Other websites and home pages are not trusted as canonical urls
+    assert resolve_canonical(variant, "https://other.test/products/turbo", base_url) == variant
+    assert resolve_canonical(variant, "https://acme.test/", base_url) == variant
+    assert resolve_canonical("https://acme.test/?ref=ad", "https://acme.test/", base_url) == (
+        "https://acme.test/"
+    )
+
+
+def test_simhash_near_duplicates() -> None:
+    # The same product page, with the color of the selected variant
+    variant = f"{PRODUCT} Color: red."
+    other = (
+        "Our shipping policy: orders placed before noon leave the warehouse the same day. "
+        "Returns are free within thirty days, refunds are issued once the parcel is inspected."
+    )
+    assert hamming_distance(simhash(PRODUCT), simhash(PRODUCT)) == 0
+    assert hamming_distance(simhash(PRODUCT), simhash(variant)) <= 3
+    assert hamming_distance(simhash(PRODUCT), simhash(other)) > 10
+    # Too short to compare
+    assert simhash("Out of stock") is None
+
+
+def test_near_duplicate_index() -> None:
+    near_duplicates = NearDuplicateIndex(max_distance=3)
+    near_duplicates.add("https://acme.test/products/turbo-widget", 0xFFFF_0000_FFFF_0000)
+    assert near_duplicates.find(0xFFFF_0000_FFFF_0007) == "https://acme.test/products/turbo-widget"
+    assert near_duplicates.find(0xFFFF_0000_FFFF_000F) is None
+    assert (
+        near_duplicates.find(
+            0xFFFF_0000_FFFF_0000, exclude="https://acme.test/products/turbo-widget"
+        )
+        is None
+    )
+    # Replacing the fingerprint of a page forgets the previous one
+    near_duplicates.add("https://acme.test/products/turbo-widget", 0x0000_FFFF_0000_FFFF)
+    assert near_duplicates.find(0xFFFF_0000_FFFF_0000) is None
+    assert near_duplicates.find(0x0000_FFFF_0000_FFFE) == "https://acme.test/products/turbo-widget"
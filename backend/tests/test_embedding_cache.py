@@ -0,0 +1,84 @@
+import redis
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from app.config import get_redis_url
+from app.embedding_cache import CachedEmbeddings, MemoryEmbeddingStore, RedisEmbeddingStore
+
+
+class CountingFakeEmbedding(DeterministicFakeEmbedding):
+    calls: int = 0
+    texts_embedded: int = 0
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.calls += 1
+        self.texts_embedded += len(texts)
+        return super().embed_documents(texts)
+
+
+def test_embed_documents_hits_cache() -> None:
+    fake_embeddings = CountingFakeEmbedding(size=8)
+    embeddings = CachedEmbeddings(fake_embeddings, MemoryEmbeddingStore(max_entries=100))
+
+    first = embeddings.embed_documents(["shipping", "returns", "shipping"])
+    assert fake_embeddings.texts_embedded == 2
+    assert first[0] == first[2]
+
+    second = embeddings.embed_documents(["returns", "pricing"])
+    assert fake_embeddings.texts_embedded == 3
+    assert second[0] == first[1]
+
+    # Vectors are cached as float32
+    expected = fake_embeddings.embed_documents(["returns"])[0]
+    assert max(abs(a - b) for a, b in zip(second[0], expected)) < 1e-6
+
+    assert embeddings.stats()["hits"] == 2
+    assert embeddings.stats()["misses"] == 3
+    assert embeddings.stats()["hit_rate"] == 0.4
+
+
+def test_model_name_is_part_of_key() -> None:
+    store = MemoryEmbeddingStore(max_entries=100)
+    small = CachedEmbeddings(CountingFakeEmbedding(size=4), store, model_name="small")
+    large = CachedEmbeddings(CountingFakeEmbedding(size=8), store, model_name="large")
+    assert len(small.embed_query("widgets")) == 4
+    assert len(large.embed_query("widgets")) == 8
+
+
+async def test_embed_query_returns_a_vector() -> None:
+    fake_embeddings = CountingFakeEmbedding(size=4)
+    embeddings = CachedEmbeddings(fake_embeddings, MemoryEmbeddingStore(max_entries=100))
+    vector = embeddings.embed_query("widgets")
+    assert len(vector) == 4
+    assert all(isinstance(value, float) for value in vector)
+    # Cached and uncached lookups return the same vector
+    assert embeddings.embed_query("widgets") == vector
+    assert await embeddings.aembed_query("widgets") == vector
+    assert len(await embeddings.aembed_query("pricing")) == 4
+
+
+def test_memory_store_evicts_least_recently_used() -> None:
+    store = MemoryEmbeddingStore(max_entries=2)
+    store.mset([("a", b"1"), ("b", b"2")])
+    store.mget(["a"])
+    store.mset([("c", b"3")])
+    assert store.mget(["a", "b", "c"]) == [b"1", None, b"3"]
+
+
+async def test_aembed_documents() -> None:
+    fake_embeddings = CountingFakeEmbedding(size=8)
+    embeddings = CachedEmbeddings(fake_embeddings, MemoryEmbeddingStore(max_entries=100))
+    vectors = await embeddings.aembed_documents(["shipping", "returns"])
+    assert await embeddings.aembed_documents(["returns"]) == [vectors[1]]
+    assert embeddings.stats()["hits"] == 1
+
+
+def test_redis_store_evicts_least_recently_used() -> None:
+    redis_client = redis.Redis.from_url(get_redis_url())
+    store = RedisEmbeddingStore(redis_client, max_entries=2, namespace="test_embedding_cache")
+    redis_client.delete(store.lru_key, *(f"test_embedding_cache:{key}" for key in "abc"))
+
+    store.mset([("a", b"1")])
+    store.mset([("b", b"2")])
+    store.mset([("c", b"3")])
+    assert store.mget(["a", "b", "c"]) == [None, b"2", b"3"]
+    assert redis_client.zcard(store.lru_key) == 2
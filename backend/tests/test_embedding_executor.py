@@ -0,0 +1,124 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from pydantic import Field
+
+from app.embedding_executor import EmbeddingExecutor, ExecutorEmbeddings, TokenBucket
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+class QuotaError(Exception):
+    status_code = 429
+    code = "insufficient_quota"
+
+
+class RateLimitedFakeEmbedding(DeterministicFakeEmbedding):
+    """Rate limits batches larger than max_batch_size and tracks requests in flight."""
+
+    max_batch_size: int = 1000
+    failures: int = 0
+    batch_sizes: list[int] = Field(default_factory=list)
+    in_flight: int = 0
+    max_in_flight: int = 0
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.01)
+            if self.failures > 0 or len(texts) > self.max_batch_size:
+                self.failures = max(0, self.failures - 1)
+                raise RateLimitError("Too Many Requests")
+            self.batch_sizes.append(len(texts))
+            return self.embed_documents(texts)
+        finally:
+            self.in_flight -= 1
+
+
+def create_executor(embeddings: RateLimitedFakeEmbedding, **kwargs: float) -> EmbeddingExecutor:
+    kwargs = {"requests_per_second": 1000, "base_delay": 0.01, "max_delay": 0.05, **kwargs}
+    return EmbeddingExecutor(embeddings, **kwargs)
+
+
+async def test_embeds_in_order_with_bounded_concurrency() -> None:
+    fake_embeddings = RateLimitedFakeEmbedding(size=8)
+    executor = create_executor(fake_embeddings, max_batch_size=10, max_concurrency=3)
+    texts = [f"text {i}" for i in range(95)]
+
+    vectors = await executor.aembed_documents(texts)
+
+    assert vectors == fake_embeddings.embed_documents(texts)
+    assert fake_embeddings.batch_sizes == [10] * 9 + [5]
+    assert fake_embeddings.max_in_flight == 3
+
+
+async def test_rate_limits_shrink_batches() -> None:
+    fake_embeddings = RateLimitedFakeEmbedding(size=8, max_batch_size=20)
+    executor = create_executor(fake_embeddings, max_batch_size=64, min_batch_size=8)
+    texts = [f"text {i}" for i in range(64)]
+
+    vectors = await executor.aembed_documents(texts)
+
+    assert vectors == fake_embeddings.embed_documents(texts)
+    assert max(fake_embeddings.batch_sizes) <= 20
+    assert executor.stats()["rate_limited"] >= 2
+    assert executor.batch_size < 64
+
+
+async def test_retries_rate_limits_then_gives_up() -> None:
+    fake_embeddings = RateLimitedFakeEmbedding(size=8, failures=2)
+    executor = create_executor(fake_embeddings, max_retries=3)
+    assert len(await executor.aembed_documents(["shipping"])) == 1
+    assert executor.stats()["retries"] == 2
+
+    fake_embeddings.failures = 10
+    with pytest.raises(RateLimitError):
+        await executor.aembed_documents(["returns"])
+
+
+async def test_quota_errors_are_not_retried() -> None:
+    class OutOfQuotaFakeEmbedding(DeterministicFakeEmbedding):
+        async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+            raise QuotaError("You exceeded your current quota")
+
+    executor = EmbeddingExecutor(OutOfQuotaFakeEmbedding(size=8))
+    with pytest.raises(QuotaError):
+        await executor.aembed_documents(["shipping"])
+    assert executor.stats()["retries"] == 0
+
+
+async def test_token_bucket_limits_rate() -> None:
+    bucket = TokenBucket(rate=100, capacity=5)
+    start = time.monotonic()
+    for _ in range(15):
+        await bucket.acquire()
+    assert time.monotonic() - start >= 0.09
+
+
+def test_executor_embeddings_sync() -> None:
+    fake_embeddings = RateLimitedFakeEmbedding(size=8)
+    embeddings = ExecutorEmbeddings(create_executor(fake_embeddings, max_batch_size=2))
+    assert embeddings.embed_documents(["a", "b", "c"]) == fake_embeddings.embed_documents(
+        ["a", "b", "c"]
+    )
+    assert fake_embeddings.batch_sizes == [2, 1]
+
+
+def test_executor_bounds_concurrency_across_threads() -> None:
+    fake_embeddings = RateLimitedFakeEmbedding(size=8)
+    executor = create_executor(fake_embeddings, max_batch_size=2, max_concurrency=2)
+    embeddings = ExecutorEmbeddings(executor)
+    texts = [f"text {i}" for i in range(8)]
+
+    # Crawl workers index from their own threads at the same time
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(embeddings.embed_documents, [texts] * 4))
+
+    assert results == [fake_embeddings.embed_documents(texts)] * 4
+    assert fake_embeddings.max_in_flight == 2
@@ -0,0 +1,61 @@
+import os
+
+from app.extraction import aextract_page, extract_page, get_extraction_pool
+
+fixture_site = os.path.join(os.path.dirname(__file__), "fixtures", "site")
+
+
+def read_fixture(path: str) -> str:
+    with open(os.path.join(fixture_site, path)) as f:
+        return f.read()
+
+
+def test_extract_page() -> None:
+    url = "https://acme.test/pricing.html"
+    text, metadata = extract_page(read_fixture("pricing.html"), url, "text/html")
+    assert metadata == {
+        "hostname": "acme.test",
+        "source": url,
+        "content_type": "text/html",
+        "title": "Pricing - Acme Widgets",
+        "description": "Widget prices and volume discounts.",
+        "language": "en-US",
+    }
+    assert text.startswith("# Pricing\nThe Classic Widget (SKU AW-100) costs $19.99.")
+    assert "\n## Volume discounts\n" in text
+
+
+def test_extract_page_removes_boilerplate() -> None:
+    html = """
+        <html><head><script>var tracking = true;</script><style>p { color: red; }</style></head>
+        <body>
+            <header><a href="/">Logo</a></header>
+            <nav><a href="/cart">Cart</a></nav>
+            <main><header><h1>Turbo Widget</h1></header><p>Spins twice as fast.</p></main>
+            <footer>Copyright</footer>
+        </body></html>
+    """
+    text, _ = extract_page(html, "https://acme.test/", "text/html")
+    assert text == "# Turbo Widget\nSpins twice as fast."
+
+
+def test_extract_page_canonical() -> None:
+    html = """
+        <html><head><link rel="canonical" href="/products/turbo-widget"></head>
+        <body><p>Turbo Widget in red.</p></body></html>
+    """
+    _, metadata = extract_page(html, "https://acme.test/products/turbo-widget?variant=2", "")
+    assert metadata["canonical"] == "https://acme.test/products/turbo-widget"
+
+
+def test_extract_page_invalid_html() -> None:
+    text, metadata = extract_page("", "https://acme.test/", "text/html")
+    assert text == ""
+    assert metadata["source"] == "https://acme.test/"
+
+
+async def test_aextract_page_process_pool() -> None:
+    url = "https://acme.test/about.html"
+    html = read_fixture("about.html")
+    result = await aextract_page(html, url, "text/html", get_extraction_pool(1))
+    assert result == extract_page(html, url, "text/html")
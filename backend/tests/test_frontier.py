@@ -0,0 +1,88 @@
+import asyncio
+
+from app.frontier import Frontier, UrlScorer, detect_platform, extract_anchor_texts
+
+
+def test_platform_rules_exclude_and_rank_urls() -> None:
+    shopify = UrlScorer("shopify")
+    assert shopify.allows("https://acme.test/products/turbo-widget")
+    assert not shopify.allows("https://acme.test/cart")
+    assert not shopify.allows("https://acme.test/collections/widgets/products/turbo-widget")
+    assert not shopify.allows("https://acme.test/products/turbo-widget?variant=123")
+
+    woocommerce = UrlScorer("woocommerce", exclude=[r"^/events/"])
+    assert woocommerce.allows("https://acme.test/product/turbo-widget/")
+    assert not woocommerce.allows("https://acme.test/shop/?add-to-cart=42")
+    assert not woocommerce.allows("https://acme.test/wp-content/uploads/widget.png")
+    assert not woocommerce.allows("https://acme.test/events/launch")
+
+    generic = UrlScorer(include=[r"^/en/"])
+    assert generic.allows("https://acme.test/en/pricing")
+    assert not generic.allows("https://acme.test/fr/pricing")
+
+    scorer = UrlScorer()
+    product = scorer.score("https://acme.test/products/turbo-widget", 1)
+    pricing = scorer.score("https://acme.test/pricing", 1, "See our plans")
+    blog = scorer.score("https://acme.test/blog/launch", 1)
+    privacy = scorer.score("https://acme.test/privacy-policy", 1, "Privacy")
+    assert product > blog > privacy
+    assert pricing > product
+    # Deeper urls and lower sitemap priorities score lower
+    assert scorer.score("https://acme.test/about", 1) > scorer.score("https://acme.test/about", 3)
+    assert scorer.score("https://acme.test/about", 1, sitemap_priority=0.9) > scorer.score(
+        "https://acme.test/about", 1, sitemap_priority=0.2
+    )
+
+
+def test_detect_platform_and_anchor_texts() -> None:
+    assert detect_platform('<script src="//cdn.shopify.com/s/files/theme.js"></script>') == (
+        "shopify"
+    )
+    assert detect_platform('<body class="woocommerce-page">') == "woocommerce"
+    assert detect_platform("<body></body>") == "generic"
+
+    scorer = UrlScorer("auto")
+    assert scorer.platform == "generic"
+    scorer.detect_platform('<div class="shopify-section"></div>')
+    assert scorer.platform == "shopify"
+    assert not scorer.allows("https://acme.test/checkouts/1")
+
+    html = (
+        '<a href="/pricing.html"><span>Pricing</span> &amp; plans</a><a href="/pricing.html">x</a>'
+    )
+    assert extract_anchor_texts(html, "https://acme.test/") == {
+        "https://acme.test/pricing.html": "Pricing  & plans"
+    }
+
+
+def test_links_similar_to_high_value_pages_score_higher() -> None:
+    scorer = UrlScorer()
+    scorer.learn("https://acme.test/products/turbo-widget", "The turbo widget spins fast.")
+    scorer.learn("https://acme.test/products/classic-widget", "The classic widget lasts.")
+    # Low value pages are not learned from
+    scorer.learn("https://acme.test/blog/gardening", "Gardening tips for spring.")
+    assert scorer.pages_learned == 2
+    assert scorer.score("https://acme.test/mini-widget", 1, "Mini widget") > scorer.score(
+        "https://acme.test/gardening", 1, "Gardening"
+    )
+
+
+async def test_full_frontier_keeps_the_best_urls() -> None:
+    frontier = Frontier(maxsize=3)
+    for sequence, (priority, url) in enumerate([(-1, "a"), (-3, "b"), (0, "c")]):
+        assert frontier.put_or_replace((priority, sequence, url, 1)) is None
+    assert frontier.full()
+
+    # A url not better than every queued url is dropped, a better one replaces the worst
+    assert frontier.put_or_replace((0, 3, "d", 1)) == (0, 3, "d", 1)
+    assert frontier.put_or_replace((-2, 4, "e", 1)) == (0, 2, "c", 1)
+    assert frontier.put_or_replace((-4, 5, "f", 1)) == (-1, 0, "a", 1)
+    assert frontier.qsize() == 3
+
+    urls = []
+    while not frontier.empty():
+        urls.append(frontier.get_nowait()[2])
+        frontier.task_done()
+    assert urls == ["f", "b", "e"]
+    # Replacing urls did not count as finishing them
+    await asyncio.wait_for(frontier.join(), timeout=1)
@@ -0,0 +1,81 @@
+import time
+from uuid import uuid4
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langgraph.checkpoint.memory import MemorySaver
+
+from app.agents import ChatMessage
+from app.agents.json_sales_agent import JsonSalesAgent
+from app.history import HistoryManager, message_tokens
+from tests.conftest import RecordingVectorStore
+
+
+def test_window_keeps_newest_messages_within_budget() -> None:
+    chat_history = [HumanMessage(f"Message number {i} about widgets") for i in range(10)]
+    history = HistoryManager(FakeListChatModel(responses=[""]), max_tokens=30)
+
+    window = history.window(chat_history)
+    assert window == chat_history[-len(window) :]
+    assert sum(message_tokens(message) for message in window) <= 30
+    # The last message is kept even if it is over the budget
+    assert HistoryManager(history.llm, max_tokens=1).window(chat_history) == chat_history[-1:]
+
+    messages = history.prompt_messages(chat_history, "Wants widgets")
+    assert isinstance(messages[0], SystemMessage)
+    assert "Wants widgets" in messages[0].content
+    assert messages[1:] == window
+
+
+async def test_long_conversation_is_folded_into_summary() -> None:
+    vector_store = RecordingVectorStore(DeterministicFakeEmbedding(size=8))
+    vector_store.add_texts(["Acme Widgets sells widgets."])
+    fake_llm = FakeListChatModel(responses=["We sell all kinds of widgets for every room."])
+    summary_llm = FakeListChatModel(responses=["The customer wants widgets."])
+    history = HistoryManager(summary_llm, max_tokens=100)
+    sales_agent = JsonSalesAgent(fake_llm, vector_store, MemorySaver(), history=history)
+
+    config = {"configurable": {"thread_id": str(uuid4())}}
+    intro = ChatMessage(content="Hi!", mc_options=["A) a", "B) b", "C) c", "D) d"])
+    await sales_agent.astart_with_intro("acme.test", config, intro)
+    for i in range(20):
+        await sales_agent.ainvoke("acme.test", config, f"What widgets do you sell for room {i}?")
+    await sales_agent.await_compactions()
+
+    state = await sales_agent.graph.aget_state(config)
+    chat_history = state.values["chat_history"]
+    assert state.values["summary"] == "The customer wants widgets."
+    assert sum(message_tokens(message) for message in chat_history) <= 100
+    # The newest messages are kept as is
+    assert chat_history[-1] == AIMessage(
+        "We sell all kinds of widgets for every room.", id=chat_history[-1].id
+    )
+    assert chat_history[-2].content == "What widgets do you sell for room 19?"
+
+    stats = history.stats()
+    assert stats["summaries"] > 1
+    assert stats["folded_messages"] == 41 - len(chat_history)
+
+
+async def test_answers_do_not_wait_for_the_summary() -> None:
+    vector_store = RecordingVectorStore(DeterministicFakeEmbedding(size=8))
+    vector_store.add_texts(["Acme Widgets sells widgets."])
+    fake_llm = FakeListChatModel(responses=["We sell all kinds of widgets for every room."])
+    summary_llm = FakeListChatModel(responses=["The customer wants widgets."], sleep=0.5)
+    history = HistoryManager(summary_llm, max_tokens=20)
+    sales_agent = JsonSalesAgent(fake_llm, vector_store, MemorySaver(), history=history)
+
+    config = {"configurable": {"thread_id": str(uuid4())}}
+    intro = ChatMessage(content="Hi!", mc_options=["A) a", "B) b", "C) c", "D) d"])
+    await sales_agent.astart_with_intro("acme.test", config, intro)
+    start = time.perf_counter()
+    await sales_agent.ainvoke("acme.test", config, "What widgets do you sell?")
+    assert time.perf_counter() - start < 0.4
+    state = await sales_agent.graph.aget_state(config)
+    assert "summary" not in state.values
+
+    await sales_agent.await_compactions()
+    state = await sales_agent.graph.aget_state(config)
+    assert state.values["summary"] == "The customer wants widgets."
+    assert history.stats()["summaries"] == 1
@@ -0,0 +1,67 @@
+from pathlib import Path
+
+from langchain_redis import RedisVectorStore
+
+from app.db.schema import IngestItem, IngestStatus, WebSite
+from app.ingest import BulkIngestor, checkpoint_urls, read_urls, summarize
+from app.url_processor import UrlProcessor
+
+
+async def test_ingest_resumes_a_run(
+    async_reset_dbs: RedisVectorStore, fixture_site_url: str, tmp_path: Path
+) -> None:
+    vector_store = async_reset_dbs
+    path = tmp_path / "urls.txt"
+    path.write_text(
+        f"# Acme\n{fixture_site_url}\n\n{fixture_site_url}/about.html\nftp://acme.test\n"
+        f"{fixture_site_url}\n"
+    )
+    urls = read_urls(str(path))
+    assert urls == [fixture_site_url, f"{fixture_site_url}/about.html", "ftp://acme.test"]
+
+    items = checkpoint_urls("acme", urls, retry_failed=False)
+    ingestor = BulkIngestor(UrlProcessor(vector_store), 2, 2, max_depth=2)
+    await ingestor.ingest(items)
+    statuses = {item.url: item.status for item in IngestItem.select()}
+    assert statuses == {
+        fixture_site_url: IngestStatus.DONE,
+        # Crawled after the home page of the same website, which made it fresh
+        f"{fixture_site_url}/about.html": IngestStatus.FRESH,
+        "ftp://acme.test": IngestStatus.FAILED,
+    }
+    assert WebSite.get(WebSite.hostname == "127.0.0.1").last_crawled_at
+    done = IngestItem.get(IngestItem.url == fixture_site_url)
+    assert done.pages > 1
+    assert done.hostname == "127.0.0.1"
+
+    summary = summarize("acme", ingestor.ingested, 1.0)
+    assert "1 websites crawled" in summary
+    assert "1 done, 1 failed, 1 fresh" in summary
+    assert "Unsupported url schema" in summary
+
+    # Resuming only ingests the urls a killed run left running, and the failed ones on demand
+    IngestItem.update(status=IngestStatus.RUNNING).where(
+        IngestItem.url == f"{fixture_site_url}/about.html"
+    ).execute()
+    assert [item.url for item in checkpoint_urls("acme", urls, retry_failed=False)] == [
+        f"{fixture_site_url}/about.html"
+    ]
+    assert [item.url for item in checkpoint_urls("acme", urls, retry_failed=True)] == [
+        f"{fixture_site_url}/about.html",
+        "ftp://acme.test",
+    ]
+
+
+async def test_ingest_sets_the_ttl_of_websites(
+    async_reset_dbs: RedisVectorStore, fixture_site_url: str
+) -> None:
+    vector_store = async_reset_dbs
+    items = checkpoint_urls("acme", [fixture_site_url], retry_failed=False)
+    await BulkIngestor(UrlProcessor(vector_store), 1, 2, max_depth=1, ttl=0).ingest(items)
+    website = WebSite.get(WebSite.hostname == "127.0.0.1")
+    assert website.ttl == 0
+
+    # Websites with a TTL of 0 are never fresh
+    items = checkpoint_urls("acme-again", [fixture_site_url], retry_failed=False)
+    await BulkIngestor(UrlProcessor(vector_store), 1, 2, max_depth=1).ingest(items)
+    assert IngestItem.get(IngestItem.run == "acme-again").status == IngestStatus.DONE
@@ -0,0 +1,120 @@
+import asyncio
+import threading
+from uuid import uuid4
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.prompts import PromptTemplate
+from langchain_redis import RedisVectorStore
+from langgraph.checkpoint.memory import MemorySaver
+
+from app.agents import ChatMessage
+from app.agents.json_sales_agent import JsonSalesAgent
+from app.db.schema import WebSite
+from app.intro_cache import (
+    IntroCache,
+    MemoryIntroStore,
+    create_intro_refresher,
+    prompt_version,
+)
+from tests.conftest import RecordingVectorStore
+
+
+def create_intro(i: int) -> ChatMessage:
+    return ChatMessage(content=f"Hi {i}!", mc_options=["A) a", "B) b", "C) c", "D) d"])
+
+
+async def test_intros_are_rotated_and_filled_in_the_background() -> None:
+    intro_cache = IntroCache(MemoryIntroStore(), prompt_version="v1", variants=3)
+    assert await intro_cache.get("acme.test", "index1") is None
+
+    await intro_cache.add("acme.test", "index1", create_intro(0))
+    generated = iter(range(1, 10))
+
+    async def generate() -> ChatMessage:
+        return create_intro(next(generated))
+
+    intro_cache.fill("acme.test", "index1", generate)
+    await asyncio.gather(*intro_cache._tasks)
+
+    intros = [await intro_cache.get("acme.test", "index1") for _ in range(6)]
+    assert {intro.content for intro in intros} == {"Hi 0!", "Hi 1!", "Hi 2!"}
+    # Every visitor gets the next variant
+    assert intros[:3] == intros[3:]
+
+    stats = intro_cache.stats()
+    assert stats["generated"] == 2
+    assert stats["hits"] == 6
+    assert stats["misses"] == 1
+
+
+async def test_previous_index_version_is_served_until_regenerated() -> None:
+    intro_cache = IntroCache(MemoryIntroStore(), prompt_version="v1", variants=1)
+    await intro_cache.add("acme.test", "index1", create_intro(1))
+
+    # Re-indexed
+    assert await intro_cache.get("acme.test", "index2") == create_intro(1)
+
+    async def generate() -> ChatMessage:
+        return create_intro(2)
+
+    intro_cache.fill("acme.test", "index2", generate)
+    await asyncio.gather(*intro_cache._tasks)
+    assert await intro_cache.get("acme.test", "index2") == create_intro(2)
+    assert intro_cache.stats()["stale_hits"] == 1
+
+    # Intros of another prompt version are never served
+    other_prompt_cache = IntroCache(intro_cache.store, prompt_version="v2")
+    assert await other_prompt_cache.get("acme.test", "index2") is None
+
+
+async def test_intros_are_refreshed_once_reindexed(async_reset_dbs: RedisVectorStore) -> None:
+    WebSite.create(hostname="acme.test", base_url="https://acme.test", content_fingerprint="index1")
+    intro_cache = IntroCache(MemoryIntroStore(), prompt_version="v1", variants=2)
+    hostnames = []
+
+    async def generate_intro(hostname: str) -> ChatMessage:
+        hostnames.append(hostname)
+        return create_intro(len(hostnames))
+
+    # Crawl workers call the refresher from their own threads
+    refresh = create_intro_refresher(intro_cache, generate_intro, asyncio.get_running_loop())
+    thread = threading.Thread(target=refresh, args=("acme.test",))
+    thread.start()
+    await asyncio.to_thread(thread.join)
+    for _ in range(100):
+        if intro_cache._tasks:
+            break
+        await asyncio.sleep(0.01)
+    await asyncio.gather(*intro_cache._tasks)
+
+    assert hostnames == ["acme.test", "acme.test"]
+    assert await intro_cache.get("acme.test", "index1") is not None
+    assert intro_cache.stats()["misses"] == 0
+
+
+def test_prompt_version_changes_with_prompt() -> None:
+    prompt = PromptTemplate.from_template("Introduce yourself. {context}")
+    assert prompt_version(prompt) == prompt_version(prompt)
+    edited_prompt = PromptTemplate.from_template("Introduce yourself briefly. {context}")
+    assert prompt_version(prompt) != prompt_version(edited_prompt)
+
+
+async def test_chat_starts_with_cached_intro() -> None:
+    vector_store = RecordingVectorStore(DeterministicFakeEmbedding(size=8))
+    vector_store.add_texts(["Acme Widgets sells widgets."])
+    fake_llm = FakeListChatModel(responses=["Question about widgets", "We sell widgets."])
+    sales_agent = JsonSalesAgent(fake_llm, vector_store, MemorySaver())
+
+    config = {"configurable": {"thread_id": str(uuid4())}}
+    await sales_agent.astart_with_intro("acme.test", config, create_intro(1))
+    # No retrieval or generation for the intro
+    assert vector_store.filters == []
+
+    result = await sales_agent.ainvoke("acme.test", config, "Lets go with B")
+    assert result["answer"].content == "We sell widgets."
+    assert [message.content for message in result["chat_history"]] == [
+        create_intro(1).toJson(),
+        "Lets go with B",
+        "We sell widgets.",
+    ]
@@ -1,11 +1,18 @@
+import asyncio
+import time
 from uuid import uuid4
 
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
 from langchain_redis import RedisVectorStore
+from langgraph.checkpoint.memory import MemorySaver
+from redisvl.query.filter import Tag
 
 from app.agents import ChatMessage
 from app.agents.json_sales_agent import JsonSalesAgent
+from app.llm import SlowFakeChatModel
 from app.url_processor import UrlProcessor
-from tests.conftest import llm
+from tests.conftest import RecordingVectorStore, llm
 
 
 async def test_initiate_chat_and_add_message(async_reset_dbs: RedisVectorStore) -> None:
@@ -38,3 +45,50 @@ async def test_initiate_chat_and_add_message(async_reset_dbs: RedisVectorStore)
         assert document.metadata["hostname"] == hostname
     second_message: ChatMessage = second_result["answer"]
     assert second_message.content
+
+
+async def test_agent_is_shared_between_hostnames() -> None:
+    vector_store = RecordingVectorStore(DeterministicFakeEmbedding(size=8))
+    vector_store.add_texts(["Acme Widgets sells widgets."])
+    intro = ChatMessage(content="Hi!", mc_options=["A) a", "B) b", "C) c", "D) d"])
+    fake_llm = FakeListChatModel(responses=[intro.toJson()])
+    sales_agent = JsonSalesAgent(fake_llm, vector_store, MemorySaver())
+
+    config = {"configurable": {"thread_id": str(uuid4())}}
+    intro_result = await sales_agent.ainvoke("acme.test", config, "")
+    assert intro_result["answer"] == intro
+    second_result = await sales_agent.ainvoke("acme.test", config, "Lets go with B")
+    assert len(second_result["chat_history"]) == 3
+
+    other_config = {"configurable": {"thread_id": str(uuid4())}}
+    await sales_agent.ainvoke("other.test", other_config, "")
+    assert vector_store.filters == [
+        str(Tag("hostname") == "acme.test"),
+        str(Tag("hostname") == "acme.test"),
+        str(Tag("hostname") == "other.test"),
+    ]
+
+
+async def test_concurrent_chats_do_not_block_each_other() -> None:
+    vector_store = RecordingVectorStore(DeterministicFakeEmbedding(size=8))
+    vector_store.add_texts(["Acme Widgets sells widgets."])
+    intro = ChatMessage(content="Hi!", mc_options=["A) a", "B) b", "C) c", "D) d"])
+    latency = 0.5
+    slow_llm = SlowFakeChatModel(responses=[intro.toJson()], latency=latency)
+    sales_agent = JsonSalesAgent(slow_llm, vector_store, MemorySaver())
+
+    async def chat() -> None:
+        config = {"configurable": {"thread_id": str(uuid4())}}
+        intro_result = await sales_agent.ainvoke("acme.test", config, "")
+        assert intro_result["answer"] == intro
+
+    start = time.perf_counter()
+    await chat()
+    single_elapsed = time.perf_counter() - start
+    assert single_elapsed >= latency
+
+    start = time.perf_counter()
+    await asyncio.gather(*(chat() for _ in range(20)))
+    concurrent_elapsed = time.perf_counter() - start
+    # 20 chats finish in about the time of one instead of 20 times as long
+    assert concurrent_elapsed < single_elapsed * 2
@@ -0,0 +1,106 @@
+from typing import Any, Optional
+from uuid import uuid4
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langgraph.checkpoint.memory import MemorySaver
+from redisvl.query.filter import Tag
+
+from app.agents import ChatMessage
+from app.agents.json_sales_agent import JsonSalesAgent
+from app.response_cache import ResponseCache
+from tests.conftest import RecordingVectorStore
+
+
+class FakeSemanticCache:
+    """An in memory stand-in of the redisvl SemanticCache that only finds identical vectors."""
+
+    def __init__(self) -> None:
+        self.entries: list[tuple[list[float], str, str]] = []
+
+    async def acheck(
+        self,
+        vector: list[float],
+        num_results: int,
+        return_fields: list[str],
+        filter_expression: Any,  # noqa: ANN401
+    ) -> list[dict]:
+        return [
+            {"response": response}
+            for entry_vector, filters, response in self.entries
+            if entry_vector == vector and filters == str(filter_expression)
+        ][:num_results]
+
+    async def astore(
+        self, prompt: str, response: str, vector: list[float], filters: dict[str, str]
+    ) -> None:
+        filter_expression = (Tag("hostname") == filters["hostname"]) & (
+            Tag("index_version") == filters["index_version"]
+        )
+        self.entries.append((vector, str(filter_expression), response))
+
+
+class FixedIndexResponseCache(ResponseCache):
+    def __init__(self) -> None:
+        super().__init__(FakeSemanticCache(), DeterministicFakeEmbedding(size=8))
+        self.index_version = "index1"
+
+    async def _index_version(self, hostname: str) -> Optional[str]:
+        return self.index_version
+
+
+def create_intro() -> ChatMessage:
+    return ChatMessage(content="Hi!", mc_options=["A) a", "B) b", "C) c", "D) d"])
+
+
+async def ask(sales_agent: JsonSalesAgent, question: str) -> str:
+    config = {"configurable": {"thread_id": str(uuid4())}}
+    await sales_agent.astart_with_intro("acme.test", config, create_intro())
+    result = await sales_agent.ainvoke("acme.test", config, question)
+    return result["answer"].content
+
+
+async def test_standalone_questions_are_answered_from_cache() -> None:
+    vector_store = RecordingVectorStore(DeterministicFakeEmbedding(size=8))
+    vector_store.add_texts(["Acme Widgets sells widgets."])
+    # Standalone questions are not contextualized
+    fake_llm = FakeListChatModel(responses=["We sell widgets.", "Not cached."])
+    response_cache = FixedIndexResponseCache()
+    sales_agent = JsonSalesAgent(
+        fake_llm, vector_store, MemorySaver(), response_cache=response_cache
+    )
+
+    assert await ask(sales_agent, "What do you sell?") == "We sell widgets."
+    assert await ask(sales_agent, "What do you sell?") == "We sell widgets."
+    # Retrieved and generated once
+    assert len(vector_store.filters) == 1
+
+    stats = response_cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_ratio"] == 0.5
+
+    # Answers of the previous index version are not served after re-indexing
+    response_cache.index_version = "index2"
+    fake_llm.i = 1
+    assert await ask(sales_agent, "What do you sell?") == "Not cached."
+
+
+async def test_questions_depending_on_the_conversation_are_not_cached() -> None:
+    vector_store = RecordingVectorStore(DeterministicFakeEmbedding(size=8))
+    vector_store.add_texts(["Acme Widgets sells widgets."])
+    # The contextualizer rewrites the question with the conversation
+    fake_llm = FakeListChatModel(responses=["What does Acme Widgets sell?", "Widgets."])
+    response_cache = FixedIndexResponseCache()
+    sales_agent = JsonSalesAgent(
+        fake_llm, vector_store, MemorySaver(), response_cache=response_cache
+    )
+
+    assert await ask(sales_agent, "What do they sell?") == "Widgets."
+    assert await ask(sales_agent, "What do they sell?") == "Widgets."
+    assert len(vector_store.filters) == 2
+
+    stats = response_cache.stats()
+    assert stats["skipped"] == 2
+    assert stats["hits"] == 0
+    assert response_cache.semantic_cache.entries == []
@@ -0,0 +1,85 @@
+import time
+from types import SimpleNamespace
+from typing import Sequence
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_redis import RedisVectorStore
+
+from app.retrieval import HybridRetriever, lexical_rerank, reciprocal_rank_fusion
+from tests.conftest import RecordingVectorStore
+
+
+def create_document(text: str) -> Document:
+    return Document(text, metadata={"source": f"https://acme.test/{text}", "hostname": "acme.test"})
+
+
+def test_reciprocal_rank_fusion_favors_documents_found_by_both() -> None:
+    a, b, c, d = [create_document(text) for text in "abcd"]
+    fused = reciprocal_rank_fusion([[a, b, c], [c, d]])
+    assert fused == [c, a, b, d]
+
+
+def test_lexical_rerank_favors_query_terms_and_phrases() -> None:
+    documents = [
+        create_document("Our widgets are blue."),
+        create_document("The deluxe widget WX-2040 ships today."),
+        create_document("The WX-2040 deluxe widget ships today."),
+    ]
+    scores = lexical_rerank("Is the WX-2040 deluxe in stock?", documents)
+    assert scores[0] < scores[1] < scores[2]
+
+
+async def test_slow_reranker_is_skipped() -> None:
+    vector_store = RecordingVectorStore(DeterministicFakeEmbedding(size=8))
+    vector_store.add_texts(["Widgets", "Gadgets", "Gizmos"])
+
+    def slow_rerank(query: str, documents: Sequence[Document]) -> list[float]:
+        time.sleep(0.5)
+        return list(range(len(documents)))
+
+    retriever = HybridRetriever(vector_store, k=2, reranker=slow_rerank, rerank_budget=0.05)
+    start = time.perf_counter()
+    documents = await retriever.aretrieve("Widgets", "acme.test")
+    assert time.perf_counter() - start < 0.4
+    assert len(documents) == 2
+    # Only searched by vector as the vector store is not a RedisVectorStore
+    assert retriever.stats()["hybrid"] is False
+    assert retriever.stats()["rerank_timeouts"] == 1
+
+    # The budget also applies to the sync path
+    start = time.perf_counter()
+    assert len(retriever.retrieve("Widgets", "acme.test")) == 2
+    assert time.perf_counter() - start < 0.4
+    assert retriever.stats()["rerank_timeouts"] == 2
+
+
+def test_text_query_escapes_terms() -> None:
+    vector_store = RecordingVectorStore(DeterministicFakeEmbedding(size=8))
+    vector_store.config = SimpleNamespace(
+        content_field="text", metadata_schema=[{"name": "source"}, {"name": "hostname"}]
+    )
+    retriever = HybridRetriever(vector_store)
+    text_query = retriever._text_query("what's the price of sku-12 (blue)?", "acme.test")
+    assert text_query.query_string() == "@hostname:{acme\\.test} @text:(12|blue|price|s|sku)"
+    assert retriever._text_query("the?! (of) -", "acme.test") is None
+
+
+async def test_product_codes_are_found_by_full_text_search(
+    async_reset_dbs: RedisVectorStore,
+) -> None:
+    vector_store = async_reset_dbs
+    texts = [f"Acme sells widget model number {i} in many colors." for i in range(30)]
+    texts.append("Spare parts: the WX-2040 hinge fits every deluxe cabinet.")
+    vector_store.add_texts(texts, [{"source": str(i), "hostname": "acme.test"} for i in range(31)])
+
+    retriever = HybridRetriever(vector_store, k=4)
+    documents = await retriever.aretrieve("Do you have the WX-2040?", "acme.test")
+    assert "WX-2040" in documents[0].page_content
+    assert documents[0].metadata["hostname"] == "acme.test"
+    assert not await retriever.aretrieve("Do you have the WX-2040?", "other.test")
+
+    # Punctuation of the question is not parsed as query syntax
+    documents = await retriever.aretrieve("what's the price of wx-2040 (deluxe)?", "acme.test")
+    assert "WX-2040" in documents[0].page_content
+    assert retriever.stats()["text_errors"] == 0
@@ -0,0 +1,19 @@
+from app.config import get_passphrases
+from app.main import create_app
+
+
+async def test_app_serves_api_with_pooled_resources() -> None:
+    app = create_app()
+    async with app.test_app() as test_app:
+        client = test_app.test_client()
+
+        response = await client.get("/api/heartbeat")
+        assert response.status_code == 200
+
+        response = await client.post("/api/start_chat", json={"passphrase": "wrong"})
+        assert response.status_code == 401
+
+        passphrase = get_passphrases()[0]
+        response = await client.get(f"/api/metrics?passphrase={passphrase}")
+        metrics = await response.get_json()
+        assert metrics["checkpoint_pool"]["pool_size"] >= 1
@@ -0,0 +1,115 @@
+import json
+from uuid import uuid4
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langgraph.checkpoint.memory import MemorySaver
+from quart import Quart
+
+from app.agents import ChatMessage
+from app.agents.json_sales_agent import JsonSalesAgent
+from app.config import StructuredOutputConfig, get_passphrases
+from app.routes import register_endpoints
+from tests.conftest import RecordingVectorStore
+
+intro = ChatMessage(content="Hi there!", mc_options=["A) a", "B) b", "C) c", "D) d"])
+
+
+def create_vector_store() -> RecordingVectorStore:
+    vector_store = RecordingVectorStore(DeterministicFakeEmbedding(size=8))
+    vector_store.add_texts(["Acme Widgets sells widgets."])
+    return vector_store
+
+
+async def test_tokens_are_streamed_and_answer_is_checkpointed() -> None:
+    # The fake model streams its responses one character at a time
+    fake_llm = FakeListChatModel(
+        responses=[intro.toJson(), "Question about widgets", "We sell widgets."]
+    )
+    sales_agent = JsonSalesAgent(fake_llm, create_vector_store(), MemorySaver())
+    config = {"configurable": {"thread_id": str(uuid4())}}
+
+    events = [event async for event in sales_agent.astream("acme.test", config, "")]
+    tokens = [value for kind, value in events if kind == "token"]
+    assert len(tokens) > 1
+    # Only the content of the JSON intro is streamed
+    assert "".join(tokens) == intro.content
+    assert events[-1] == ("result", events[-1][1])
+    assert events[-1][1]["answer"] == intro
+
+    events = [event async for event in sales_agent.astream("acme.test", config, "B")]
+    tokens = [value for kind, value in events if kind == "token"]
+    # The contextualized question is not streamed
+    assert "".join(tokens) == "We sell widgets."
+
+    state = await sales_agent.graph.aget_state(config)
+    assert len(state.values["chat_history"]) == 3
+    assert state.values["chat_history"][-1].content == "We sell widgets."
+
+
+async def test_invalid_intro_attempt_is_reset() -> None:
+    invalid_intro = ChatMessage(content="Oops")
+    fake_llm = FakeListChatModel(responses=[invalid_intro.toJson(), intro.toJson()])
+    structured_output_config = StructuredOutputConfig(
+        max_attempts=2, parallel_attempts=1, hedge_delay=10
+    )
+    sales_agent = JsonSalesAgent(
+        fake_llm, create_vector_store(), MemorySaver(), structured_output_config
+    )
+    config = {"configurable": {"thread_id": str(uuid4())}}
+
+    events = [event async for event in sales_agent.astream("acme.test", config, "")]
+    kinds = [kind for kind, _ in events]
+    reset = kinds.index("reset")
+    assert "".join(value for kind, value in events[:reset] if kind == "token") == "Oops"
+    assert "".join(value for kind, value in events[reset:] if kind == "token") == intro.content
+    assert events[-1][1]["answer"] == intro
+
+
+async def test_add_chat_message_stream_sends_server_sent_events() -> None:
+    app = Quart(__name__)
+    vector_store = create_vector_store()
+    checkpointer = MemorySaver()
+    fake_llm = FakeListChatModel(responses=["Question about widgets", "We sell widgets."])
+    register_endpoints(app, fake_llm, vector_store, checkpointer)
+    client = app.test_client()
+
+    # Start the chat with the intro
+    thread_id = str(uuid4())
+    intro_llm = FakeListChatModel(responses=[intro.toJson()])
+    intro_agent = JsonSalesAgent(intro_llm, vector_store, checkpointer)
+    await intro_agent.ainvoke("acme.test", {"configurable": {"thread_id": thread_id}}, "")
+
+    response = await client.post(
+        "/api/add_chat_message_stream",
+        json={
+            "passphrase": get_passphrases()[0],
+            "hostname": "acme.test",
+            "threadId": thread_id,
+            "message": "Tell me more about them",
+        },
+    )
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == "text/event-stream"
+
+    body = await response.get_data(as_text=True)
+    events = []
+    for chunk in body.strip().split("\n\n"):
+        event, data = chunk.split("\n")
+        events.append((event.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+
+    tokens = [data["content"] for event, data in events if event == "token"]
+    assert "".join(tokens) == "We sell widgets."
+    assert events[-1] == (
+        "message",
+        {
+            "status": "ready",
+            "hostname": "acme.test",
+            "thread_id": thread_id,
+            "message": {"content": "We sell widgets.", "mc_options": None},
+        },
+    )
+
+    response = await client.get(f"/api/metrics?passphrase={get_passphrases()[0]}")
+    metrics = await response.get_json()
+    assert metrics["chat_stream"]["count"] == 1
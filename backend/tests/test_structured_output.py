@@ -0,0 +1,119 @@
+import asyncio
+import random
+import time
+from typing import Any, Optional
+from uuid import uuid4
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models import SimpleChatModel
+from langchain_core.messages import BaseMessage
+from langgraph.checkpoint.memory import MemorySaver
+from pydantic import PrivateAttr
+
+from app.agents import ChatMessage
+from app.agents.json_sales_agent import JsonSalesAgent, parse_intro, repair_intro
+from app.config import StructuredOutputConfig
+from app.structured_output import StructuredOutputEngine, StructuredOutputError
+from tests.conftest import RecordingVectorStore
+
+intro = ChatMessage(content="Hi there!", mc_options=["A) a", "B) b", "C) c", "D) d"])
+
+
+class FlakyJsonChatModel(SimpleChatModel):
+    """Answers with the intro, or with text that is not JSON malformed_rate of the time."""
+
+    malformed_rate: float
+    seed: int = 0
+    calls: int = 0
+    _random: random.Random = PrivateAttr()
+
+    def model_post_init(self, __context: Any) -> None:  # noqa: ANN401
+        self._random = random.Random(self.seed)
+
+    def _call(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[Any] = None,  # noqa: ANN401
+        **kwargs: Any,  # noqa: ANN401
+    ) -> str:
+        self.calls += 1
+        if self._random.random() < self.malformed_rate:
+            return "Hi there! How can I help you today?"
+        return intro.toJson()
+
+    @property
+    def _llm_type(self) -> str:
+        return "flaky-json-chat-model"
+
+
+def create_agent(llm: SimpleChatModel, max_attempts: int) -> JsonSalesAgent:
+    vector_store = RecordingVectorStore(DeterministicFakeEmbedding(size=8))
+    vector_store.add_texts(["Acme Widgets sells widgets."])
+    structured_output_config = StructuredOutputConfig(
+        max_attempts=max_attempts, parallel_attempts=2, hedge_delay=10
+    )
+    return JsonSalesAgent(llm, vector_store, MemorySaver(), structured_output_config)
+
+
+async def test_intro_is_generated_from_malformed_outputs() -> None:
+    flaky_llm = FlakyJsonChatModel(malformed_rate=0.3)
+    sales_agent = create_agent(flaky_llm, max_attempts=10)
+
+    for _ in range(10):
+        config = {"configurable": {"thread_id": str(uuid4())}}
+        result = await sales_agent.ainvoke("acme.test", config, "")
+        assert result["answer"] == intro
+
+    stats = sales_agent.intro_output.stats()
+    assert stats["generations"] == 10
+    assert stats["failures"] == 0
+    assert stats["invalid"] > 0
+    assert stats["avg_attempts"] > 1
+    assert sum(stats["attempts_histogram"].values()) == 10
+
+
+async def test_intro_attempts_are_bounded() -> None:
+    flaky_llm = FlakyJsonChatModel(malformed_rate=1.0)
+    sales_agent = create_agent(flaky_llm, max_attempts=3)
+
+    config = {"configurable": {"thread_id": str(uuid4())}}
+    with pytest.raises(StructuredOutputError):
+        await sales_agent.ainvoke("acme.test", config, "")
+
+    assert flaky_llm.calls == 3
+    stats = sales_agent.intro_output.stats()
+    assert stats["failures"] == 1
+    assert stats["attempts_histogram"] == {"3": 1}
+
+
+async def test_slow_attempt_is_hedged() -> None:
+    latencies = [1.0, 0.0]
+
+    async def generate(config: dict) -> str:
+        await asyncio.sleep(latencies.pop(0))
+        return intro.toJson()
+
+    engine = StructuredOutputEngine(
+        parse_intro, max_attempts=2, parallel_attempts=2, hedge_delay=0.1
+    )
+    start = time.perf_counter()
+    output, _ = await engine.agenerate(generate, str, {})
+    assert time.perf_counter() - start < 0.5
+    assert output == intro
+    assert engine.stats()["hedged"] == 1
+
+
+def test_repair_intro() -> None:
+    text = (
+        'Sure! Here it is: {"content": "Hi there!", '
+        '"mc_options": ["A) a", "B) b", "C) c", "D) d",],} Enjoy!'
+    )
+    assert repair_intro(text) == intro
+
+    options_in_content = '{"content": "Hi there!\\nA) a\\nB) b\\nC) c\\nD) d"}'
+    assert repair_intro(options_in_content) == intro
+
+    truncated = '{"content": "Hi there!", "mc_options": ["A) a", "B) b", "C) c", "D) d"'
+    assert repair_intro(truncated) == intro
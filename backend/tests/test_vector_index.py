@@ -0,0 +1,77 @@
+import math
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from redisvl.query.filter import Tag
+
+from app.config import VectorIndexConfig, get_redis_config
+from app.vector_index import (
+    TruncatedEmbeddings,
+    TunedRedisVectorStore,
+    changed_attributes,
+    create_index_schema,
+    vector_attributes,
+)
+
+hnsw_config = VectorIndexConfig(
+    algorithm="HNSW",
+    distance_metric="COSINE",
+    m=8,
+    ef_construction=100,
+    ef_runtime=50,
+    datatype="FLOAT16",
+    dimensions=16,
+)
+
+
+def test_embeddings_are_truncated_to_unit_length() -> None:
+    embeddings = TruncatedEmbeddings(DeterministicFakeEmbedding(size=64), dimensions=16)
+    full = DeterministicFakeEmbedding(size=64).embed_query("Widgets")
+    vector = embeddings.embed_query("Widgets")
+    assert len(vector) == 16
+    assert math.isclose(sum(value * value for value in vector), 1.0)
+    # Truncation keeps the direction of the first dimensions
+    assert math.isclose(vector[0] / vector[1], full[0] / full[1])
+
+
+def test_index_schema_has_the_configured_vector_field() -> None:
+    schema = create_index_schema(get_redis_config(), hnsw_config, 16).to_dict()
+    fields = {field["name"]: field for field in schema["fields"]}
+    assert fields["embedding"]["attrs"]["algorithm"] == "hnsw"
+    assert fields["embedding"]["attrs"]["datatype"] == "float16"
+    assert fields["embedding"]["attrs"]["dims"] == 16
+    assert fields["embedding"]["attrs"]["m"] == 8
+    assert fields["embedding"]["attrs"]["ef_runtime"] == 50
+    # The fields langchain-redis creates from the Redis config are kept
+    assert fields["text"]["type"] == "text"
+    assert fields["hostname"]["attrs"]["separator"] == "|"
+
+    existing = {
+        "algorithm": "FLAT",
+        "datatype": "FLOAT32",
+        "dims": "64",
+        "distance_metric": "COSINE",
+    }
+    changes = changed_attributes(existing, vector_attributes(hnsw_config, 16))
+    assert changes["datatype"] == ("FLOAT32", "FLOAT16")
+    assert changes["dims"] == ("64", "16")
+    assert "distance_metric" not in changes
+
+
+def test_float16_hnsw_index_is_searched() -> None:
+    redis_config = get_redis_config().model_copy(
+        update={"index_name": "test_vector_index", "key_prefix": "test_vector_index"}
+    )
+    vector_store = TunedRedisVectorStore(
+        DeterministicFakeEmbedding(size=64), redis_config, hnsw_config
+    )
+    vector_store.index.create(overwrite=True, drop=True)
+    try:
+        texts = ["Widgets", "Gadgets", "Gizmos"]
+        vector_store.add_texts(texts, [{"source": text, "hostname": "acme.test"} for text in texts])
+        documents = vector_store.similarity_search(
+            "Gadgets", k=1, filter=Tag("hostname") == "acme.test"
+        )
+        assert documents[0].page_content == "Gadgets"
+        assert vector_store.config.embedding_dimensions == 16
+    finally:
+        vector_store.index.delete(drop=True)
@@ -0,0 +1,134 @@
+import datetime
+import time
+
+import redis
+from langchain_redis import RedisVectorStore
+
+from app.config import get_redis_config
+from app.crawl_jobs import (
+    claim_next_crawl_job,
+    enqueue_crawl_job,
+    finish_crawl_job,
+    get_active_crawl_job,
+    get_crawl_job,
+    heartbeat_crawl_job,
+)
+from app.db.schema import CrawlJob, CrawlJobStatus, WebSite
+from app.url_processor import UrlProcessor
+from app.worker import CrawlWorkerPool
+
+redis_config = get_redis_config()
+redis_client = redis.Redis.from_url(redis_config.redis_url)
+
+
+async def test_enqueueUrl_dedupes_jobs(
+    async_reset_dbs: RedisVectorStore, fixture_site_url: str
+) -> None:
+    vector_store = async_reset_dbs
+    urlProcessor = UrlProcessor(vector_store)
+
+    hostname, job = urlProcessor.enqueueUrl(fixture_site_url)
+    assert hostname == "127.0.0.1"
+    assert job.status == CrawlJobStatus.PENDING
+
+    _, duplicate_job = urlProcessor.enqueueUrl(f"{fixture_site_url}/about.html")
+    assert duplicate_job.id == job.id
+
+
+async def test_run_once(async_reset_dbs: RedisVectorStore, fixture_site_url: str) -> None:
+    vector_store = async_reset_dbs
+    urlProcessor = UrlProcessor(vector_store)
+    hostname, job = urlProcessor.enqueueUrl(fixture_site_url)
+
+    indexed_hostnames = []
+    pool = CrawlWorkerPool(
+        vector_store,
+        concurrency=1,
+        poll_interval=0.1,
+        heartbeat_interval=1,
+        job_timeout=60,
+        on_indexed=indexed_hostnames.append,
+    )
+    finished_job = pool.run_once()
+    assert finished_job.id == job.id
+    assert get_crawl_job(job.id).status == CrawlJobStatus.DONE
+    assert pool.run_once() is None
+    # Called once the index is committed, eg. to generate its intros
+    assert indexed_hostnames == [hostname]
+
+    website = WebSite.get(WebSite.hostname == hostname)
+    assert website.last_crawled_at
+    assert redis_client.dbsize() > 1
+
+    # The website is ready so no new job is needed
+    _, new_job = urlProcessor.enqueueUrl(fixture_site_url)
+    assert new_job is None
+
+
+async def test_pool(async_reset_dbs: RedisVectorStore, fixture_site_url: str) -> None:
+    vector_store = async_reset_dbs
+    urlProcessor = UrlProcessor(vector_store)
+    _, job = urlProcessor.enqueueUrl(fixture_site_url)
+
+    pool = CrawlWorkerPool(
+        vector_store, concurrency=2, poll_interval=0.1, heartbeat_interval=1, job_timeout=60
+    )
+    pool.start()
+    try:
+        deadline = time.monotonic() + 60
+        while get_crawl_job(job.id).status != CrawlJobStatus.DONE:
+            assert time.monotonic() < deadline
+            time.sleep(0.1)
+    finally:
+        pool.stop()
+
+
+async def test_reclaim_on_stale_heartbeat(
+    async_reset_dbs: RedisVectorStore, fixture_site_url: str
+) -> None:
+    urlProcessor = UrlProcessor(async_reset_dbs)
+    _, job = urlProcessor.enqueueUrl(fixture_site_url)
+    claimed_job = claim_next_crawl_job(job_timeout=60)
+    assert claimed_job.id == job.id
+
+    # A long crawl whose worker sends heartbeats is not claimed again
+    an_hour_ago = datetime.datetime.now() - datetime.timedelta(hours=1)
+    CrawlJob.update(started_at=an_hour_ago).where(CrawlJob.id == job.id).execute()
+    claimed_job.started_at = an_hour_ago
+    assert heartbeat_crawl_job(claimed_job)
+    assert claim_next_crawl_job(job_timeout=60) is None
+
+    # Once the heartbeats stop, it is
+    CrawlJob.update(heartbeat_at=an_hour_ago).where(CrawlJob.id == job.id).execute()
+    reclaimed_job = claim_next_crawl_job(job_timeout=60)
+    assert reclaimed_job.id == job.id
+    assert not heartbeat_crawl_job(claimed_job)
+    assert heartbeat_crawl_job(reclaimed_job)
+
+
+async def test_reclaimed_job_is_not_finished_by_the_old_worker(
+    async_reset_dbs: RedisVectorStore, fixture_site_url: str
+) -> None:
+    urlProcessor = UrlProcessor(async_reset_dbs)
+    hostname, job = urlProcessor.enqueueUrl(fixture_site_url)
+    claimed_job = claim_next_crawl_job(job_timeout=60)
+
+    an_hour_ago = datetime.datetime.now() - datetime.timedelta(hours=1)
+    CrawlJob.update(started_at=an_hour_ago, heartbeat_at=an_hour_ago).where(
+        CrawlJob.id == job.id
+    ).execute()
+    claimed_job.started_at = an_hour_ago
+    reclaimed_job = claim_next_crawl_job(job_timeout=60)
+    assert reclaimed_job.id == job.id
+
+    # The old worker finishing its crawl leaves the job running for the new one
+    assert not finish_crawl_job(claimed_job)
+    assert not finish_crawl_job(claimed_job, error="Failed")
+    running_job = get_crawl_job(job.id)
+    assert running_job.status == CrawlJobStatus.RUNNING
+    assert running_job.started_at == reclaimed_job.started_at
+    assert get_active_crawl_job(hostname).id == job.id
+    assert enqueue_crawl_job(hostname, job.url, job.max_depth).id == job.id
+
+    assert finish_crawl_job(reclaimed_job)
+    assert get_crawl_job(job.id).status == CrawlJobStatus.DONE
@@ -3,7 +3,10 @@ import { useForm, Controller } from 'react-hook-form'
 import FormControl from '@mui/material/FormControl'
 import TextField from '@mui/material/TextField'
 import urlSafe from 'url-regex-safe'
-import { useStartChatMutation } from '../store/apiSlice'
+import {
+  useCrawlJobStatusMutation,
+  useStartChatMutation,
+} from '../store/apiSlice'
 import { useDispatch } from 'react-redux'
 import { startChat, StartChatPayloadType } from '../store/chatSlice'
 import { LoadingButton } from '@mui/lab'
@@ -32,6 +35,7 @@ export default function AppForm({}) {
 
   const dispatch = useDispatch()
   const [startChatMutation] = useStartChatMutation()
+  const [crawlJobStatusMutation] = useCrawlJobStatusMutation()
 
   const validUrlText = 'Enter a valid URL ie. https://holoinvites.com'
   const validateUrl = (value: string) => {
@@ -48,7 +52,19 @@ export default function AppForm({}) {
       const url = values.url.trim()
       const passphrase = values.passphrase
       if (isValid) {
-        const response = await startChatMutation({ url, passphrase }).unwrap()
+        let response = await startChatMutation({ url, passphrase }).unwrap()
+
+        // Wait for the website to be crawled
+        while (response.status === 'pending') {
+          let job = response.job
+          while (job.status === 'pending' || job.status === 'running') {
+            await new Promise((resolve) => setTimeout(resolve, 2000))
+            if (!isMountedRef.current) return
+            job = (await crawlJobStatusMutation({ passphrase, jobId: job.id }).unwrap()).job
+          }
+          if (job.status === 'failed') throw new Error(job.error ?? 'Crawl failed')
+          response = await startChatMutation({ url, passphrase }).unwrap()
+        }
 
         // Do nothing if unmounted
         if (!isMountedRef.current) return
@@ -5,7 +5,21 @@ export type StartChatQueryType = {
     url: string
     passphrase: string
   }
-export type StartChatReturnType = {thread_id: string, message: ChatMessageBase}
+export type CrawlJobType = {
+  id: number
+  hostname: string
+  status: 'pending' | 'running' | 'done' | 'failed'
+  error: string | null
+}
+export type StartChatReturnType =
+  | { status: 'ready'; hostname: string; thread_id: string; message: ChatMessageBase }
+  | { status: 'pending'; hostname: string; job: CrawlJobType }
+
+export type CrawlJobStatusQueryType = {
+  passphrase: string
+  jobId: number
+}
+export type CrawlJobStatusReturnType = { job: CrawlJobType }
 
 export type AddMessageQueryType = {
   passphrase: string
@@ -27,6 +41,13 @@ export const apiSlice = createApi({
         body: startChatDto,
       }),
     }),
+    crawlJobStatus: builder.mutation<CrawlJobStatusReturnType, CrawlJobStatusQueryType>({
+      query: (crawlJobStatusDto) => ({
+        url: '/api/crawl_job_status',
+        method: 'POST',
+        body: crawlJobStatusDto,
+      }),
+    }),
     addMessage: builder.mutation<AddMessageReturnType, AddMessageQueryType>({
       query: (addMessageDto) => ({
         url: '/api/add_chat_message',
@@ -37,4 +58,5 @@ export const apiSlice = createApi({
   }),
 })
 
-export const {  useStartChatMutation, useAddMessageMutation } = apiSlice
+export const { useStartChatMutation, useCrawlJobStatusMutation, useAddMessageMutation } =
+  apiSlice